@@ -0,0 +1,259 @@
+"""
+ETSI QKD 014 load generator for a running topology (used by the manager `bench` command).
+
+Each operation is a key pair: an ETSI Get Key (enc_keys) call on the client of the master encryptor,
+followed by an ETSI Get Key with Key IDs (dec_keys) call on the client of the slave encryptor. The
+operations are spread round-robin over the given encryptor pairs. The load is either closed-loop (a
+fixed number of concurrent operations) or open-loop (operations are started at a fixed rate, up to
+a maximum number of concurrent operations).
+"""
+
+import asyncio
+import dataclasses
+import subprocess
+import time
+import httpx
+from common.node import Node
+
+_SCHEMA_VERSION = 1
+"""
+The version of the format of the results. Increment it when the format changes in a way that makes
+results incomparable.
+"""
+
+
+@dataclasses.dataclass
+class EncryptorPair:
+    """
+    A master encryptor and a slave encryptor, and the clients (KMEs) that they are attached to.
+    """
+
+    master_sae_id: str
+    slave_sae_id: str
+    master_kme_node: Node
+    slave_kme_node: Node
+
+
+def percentiles(latencies: list[float]) -> dict:
+    """
+    Get the p50, p99, and p999 latency (nearest rank) and the maximum latency, in milliseconds.
+    """
+    if not latencies:
+        return {"p50": None, "p99": None, "p999": None, "max": None}
+    ordered = sorted(latencies)
+
+    def rank(fraction: float) -> float:
+        index = min(len(ordered) - 1, max(0, int(fraction * len(ordered) + 0.5) - 1))
+        return ordered[index] * 1000.0
+
+    return {
+        "p50": rank(0.50),
+        "p99": rank(0.99),
+        "p999": rank(0.999),
+        "max": ordered[-1] * 1000.0,
+    }
+
+
+def source_version() -> str | None:
+    """
+    Get the git version of the code that is benchmarked (None if it is not known).
+    """
+    try:
+        result = subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            check=True,
+            text=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+class LoadGenerator:
+    """
+    Drives ETSI QKD 014 key pairs against the clients of a running topology and collects the
+    results.
+    """
+
+    _pairs: list[EncryptorPair]
+    _client_nodes: list[Node]
+    _size: int | None
+    _timeout: float
+    _transport: httpx.AsyncBaseTransport | None
+    _http_client: httpx.AsyncClient | None
+    _next_pair_index: int
+    _enc_latencies: list[float]
+    _dec_latencies: list[float]
+    _pair_latencies: list[float]
+    _errors: dict[str, int]  # Indexed by error description
+
+    def __init__(
+        self,
+        pairs: list[EncryptorPair],
+        client_nodes: list[Node],
+        size: int | None,
+        timeout: float,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        assert pairs
+        self._pairs = pairs
+        self._client_nodes = client_nodes
+        self._size = size
+        self._timeout = timeout
+        self._transport = transport
+        self._http_client = None
+        self._next_pair_index = 0
+        self._enc_latencies = []
+        self._dec_latencies = []
+        self._pair_latencies = []
+        self._errors = {}
+
+    def _record_error(self, description: str) -> None:
+        self._errors[description] = self._errors.get(description, 0) + 1
+
+    async def _call(
+        self, description: str, url: str, params: dict, sae_id: str
+    ) -> dict | None:
+        """
+        Make one ETSI call. Returns the decoded response, or None (after recording the error) if the
+        call failed.
+        """
+        try:
+            response = await self._http_client.get(
+                url, params=params, headers={"Authorization": sae_id}
+            )
+        except httpx.HTTPError as exc:
+            self._record_error(f"{description} {type(exc).__name__}")
+            return None
+        if response.status_code != 200:
+            self._record_error(f"{description} {response.status_code}")
+            return None
+        return response.json()
+
+    async def run_one_pair(self) -> None:
+        """
+        Run one operation: get a key on the master side, and get the same key on the slave side.
+        """
+        pair = self._pairs[self._next_pair_index]
+        self._next_pair_index = (self._next_pair_index + 1) % len(self._pairs)
+        start_time = time.perf_counter()
+        params = {} if self._size is None else {"size": self._size}
+        url = (
+            f"{pair.master_kme_node.base_url}/etsi/api/v1/keys/"
+            f"{pair.slave_sae_id}/enc_keys"
+        )
+        enc_response = await self._call("enc_keys", url, params, pair.master_sae_id)
+        if enc_response is None:
+            return
+        enc_time = time.perf_counter()
+        self._enc_latencies.append(enc_time - start_time)
+        key = enc_response["keys"]
+        url = (
+            f"{pair.slave_kme_node.base_url}/etsi/api/v1/keys/"
+            f"{pair.master_sae_id}/dec_keys"
+        )
+        params = {"key_ID": key["key_ID"]}
+        dec_response = await self._call("dec_keys", url, params, pair.slave_sae_id)
+        if dec_response is None:
+            return
+        end_time = time.perf_counter()
+        self._dec_latencies.append(end_time - enc_time)
+        if dec_response["keys"][0]["key"] != key["key"]:
+            self._record_error("key mismatch")
+            return
+        self._pair_latencies.append(end_time - start_time)
+
+    async def _run_closed_loop(self, concurrency: int, deadline: float) -> None:
+        async def worker():
+            while time.monotonic() < deadline:
+                await self.run_one_pair()
+
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+    async def _run_open_loop(
+        self, rate: float, max_concurrency: int, deadline: float
+    ) -> None:
+        tasks = set()
+        interval = 1.0 / rate
+        next_start = time.monotonic()
+        while next_start < deadline:
+            await asyncio.sleep(max(0.0, next_start - time.monotonic()))
+            next_start += interval
+            if len(tasks) >= max_concurrency:
+                self._record_error("skipped (concurrency limit)")
+                continue
+            task = asyncio.create_task(self.run_one_pair())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def _nr_consumed_psrd_bytes(self) -> int | None:
+        """
+        Get the total number of PSRD bytes that all clients have consumed (None if a client does
+        not report it).
+        """
+        total = 0
+        for node in self._client_nodes:
+            try:
+                response = await self._http_client.get(
+                    f"{node.base_url}/mgmt/v1/summary"
+                )
+                total += response.json()["psrd_accounting"]["nr_consumed_psrd_bytes"]
+            except (httpx.HTTPError, ValueError, KeyError):
+                return None
+        return total
+
+    async def run(
+        self, duration: float, concurrency: int, rate: float | None = None
+    ) -> dict:
+        """
+        Run the load for `duration` seconds, and return the results. With a `rate` (key pairs per
+        second), the load is open-loop with at most `concurrency` operations in flight; without it,
+        the load is closed-loop with `concurrency` operations in flight.
+        """
+        limits = httpx.Limits(max_connections=2 * concurrency)
+        async with httpx.AsyncClient(
+            limits=limits, timeout=self._timeout, transport=self._transport
+        ) as client:
+            self._http_client = client
+            consumed_before = await self._nr_consumed_psrd_bytes()
+            start_time = time.monotonic()
+            deadline = start_time + duration
+            if rate is None:
+                await self._run_closed_loop(concurrency, deadline)
+            else:
+                await self._run_open_loop(rate, concurrency, deadline)
+            elapsed = time.monotonic() - start_time
+            consumed_after = await self._nr_consumed_psrd_bytes()
+            self._http_client = None
+        nr_keys = len(self._pair_latencies)
+        psrd_bytes_per_key = None
+        if consumed_before is not None and consumed_after is not None and nr_keys > 0:
+            psrd_bytes_per_key = (consumed_after - consumed_before) / nr_keys
+        return {
+            "schema_version": _SCHEMA_VERSION,
+            "source_version": source_version(),
+            "config": {
+                "duration": duration,
+                "mode": "closed-loop" if rate is None else "open-loop",
+                "concurrency": concurrency,
+                "rate": rate,
+                "size": self._size,
+                "pairs": [
+                    f"{pair.master_sae_id}->{pair.slave_sae_id}" for pair in self._pairs
+                ],
+            },
+            "elapsed": elapsed,
+            "nr_keys": nr_keys,
+            "keys_per_second": nr_keys / elapsed,
+            "latency_ms": {
+                "enc_keys": percentiles(self._enc_latencies),
+                "dec_keys": percentiles(self._dec_latencies),
+                "pair": percentiles(self._pair_latencies),
+            },
+            "nr_errors": sum(self._errors.values()),
+            "errors": dict(sorted(self._errors.items())),
+            "psrd_bytes_per_key": psrd_bytes_per_key,
+        }
@@ -0,0 +1,172 @@
+"""
+Benchmark: how does the key share throughput of a hub scale with the number of worker processes?
+
+For each worker count, this starts a hub, registers a number of simulated clients with it, and lets
+each client post key shares to the hub as fast as it can for a fixed duration. The simulated
+clients use the real client code (class PeerHub), so each share POST is encrypted and signed in
+exactly the same way as in a real topology.
+
+Usage: python -m benchmarks.hub_workers [--workers 1 2 4] [--clients 8] [--duration 10]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from uuid import uuid4
+import httpx
+from client import peer_hub
+from client.peer_hub import PeerHub
+from common.share import Share
+
+_HUB_NAME = "bench"
+_SHARE_SIZE = 16
+_CONCURRENCY_PER_CLIENT = 4
+
+
+class BenchmarkClient:
+    """
+    The minimal subset of class Client that is needed by class PeerHub.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.encryptor_names = [f"{name}-sae"]
+
+
+def parse_command_line_arguments():
+    """
+    Parse command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Hub worker scaling benchmark")
+    parser.add_argument(
+        "--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts"
+    )
+    parser.add_argument("--clients", type=int, default=8, help="Number of clients")
+    parser.add_argument(
+        "--duration", type=float, default=10.0, help="Seconds per worker count"
+    )
+    parser.add_argument("--port", type=int, default=8300, help="Hub port number")
+    return parser.parse_args()
+
+
+def start_hub(port: int, nr_workers: int, share_store_file: str) -> subprocess.Popen:
+    """
+    Start a hub process with the given number of workers.
+    """
+    if os.path.exists(share_store_file):
+        os.remove(share_store_file)
+    command = [sys.executable, "-m", "hub", _HUB_NAME, "--port", str(port)]
+    command += ["--share-store", "sqlite", "--share-store-file", share_store_file]
+    command += ["--workers", str(nr_workers)]
+    # pylint: disable=consider-using-with
+    return subprocess.Popen(
+        command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+async def wait_for_hub_started(base_url: str) -> None:
+    """
+    Wait until the hub answers management requests.
+    """
+    async with httpx.AsyncClient() as client:
+        for _ in range(600):
+            try:
+                await client.get(f"{base_url}/mgmt/v1/status")
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError("Hub did not start")
+
+
+async def wait_for_pools_filled(peer_hubs: list[PeerHub]) -> None:
+    """
+    Wait until the PSRD pools of all simulated clients have been filled.
+    """
+    while True:
+        if all(
+            pool.nr_unused_bytes >= peer_hub.STOP_REQUEST_PSRD_THRESHOLD
+            for ph in peer_hubs
+            for pool in (ph.local_pool, ph.peer_pool)
+        ):
+            return
+        await asyncio.sleep(0.1)
+
+
+async def post_shares_until(ph: PeerHub, client_name: str, deadline: float) -> list:
+    """
+    Post shares to the hub until the deadline. Returns [nr_posted, nr_failed].
+    """
+    counts = [0, 0]
+    while time.monotonic() < deadline:
+        share = Share(
+            master_sae_id=f"{client_name}-sae",
+            slave_sae_id="slave-sae",
+            user_key_id=uuid4(),
+            share_index=1,
+            value=os.urandom(_SHARE_SIZE),
+        )
+        try:
+            await ph.post_share(share.master_sae_id, share.slave_sae_id, share)
+            counts[0] += 1
+        except Exception:  # pylint: disable=broad-except
+            counts[1] += 1
+    return counts
+
+
+async def run_one(port: int, nr_workers: int, nr_clients: int, duration: float):
+    """
+    Measure the share throughput for one worker count.
+    """
+    base_url = f"http://127.0.0.1:{port}/hub/{_HUB_NAME}"
+    process = start_hub(port, nr_workers, f"/tmp/dske-bench-{nr_workers}.db")
+    try:
+        await wait_for_hub_started(base_url)
+        peer_hubs = []
+        for client_index in range(nr_clients):
+            ph = PeerHub(BenchmarkClient(f"client{client_index}"), base_url)
+            ph.start_register_task()
+            peer_hubs.append(ph)
+        await wait_for_pools_filled(peer_hubs)
+        start = time.monotonic()
+        deadline = start + duration
+        results = await asyncio.gather(
+            *[
+                post_shares_until(ph, f"client{index}", deadline)
+                for index, ph in enumerate(peer_hubs)
+                for _ in range(_CONCURRENCY_PER_CLIENT)
+            ]
+        )
+        elapsed = time.monotonic() - start
+    finally:
+        process.terminate()
+        process.wait()
+    nr_posted = sum(result[0] for result in results)
+    nr_failed = sum(result[1] for result in results)
+    return (nr_posted / elapsed, nr_failed)
+
+
+def main():
+    """
+    Main entry point for the benchmark.
+    """
+    args = parse_command_line_arguments()
+    # Use large PSRD blocks so that the benchmark measures share posting and not PSRD refilling.
+    peer_hub.GET_PSRD_BLOCK_SIZE = 50_000
+    peer_hub.START_REQUEST_PSRD_THRESHOLD = 100_000
+    peer_hub.STOP_REQUEST_PSRD_THRESHOLD = 200_000
+    print(f"{'workers':>8} {'shares/s':>10} {'speedup':>8} {'failed':>7}")
+    baseline = None
+    for nr_workers in args.workers:
+        rate, nr_failed = asyncio.run(
+            run_one(args.port, nr_workers, args.clients, args.duration)
+        )
+        if baseline is None:
+            baseline = rate
+        print(f"{nr_workers:>8} {rate:>10.1f} {rate / baseline:>8.2f} {nr_failed:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark: how many key pairs and protocol exchanges per second does a topology deliver when all
+of its nodes run in one process (see in_process/topology.py)?
+
+This runs the ETSI QKD 014 load of the manager `bench` command (see benchmarks/etsi_load.py)
+against an in-process topology, so it measures the CPU cost of the protocol code without processes,
+sockets, or TCP. Each HTTP request between nodes (or from the load generator to a client) counts as
+one protocol exchange. With --profile, the run is profiled with cProfile, and the functions with the
+most cumulative time are printed (and the statistics are saved for e.g. snakeviz). The tracing
+options are those of the nodes (e.g. --trace-buffer-size 0 to measure without tracing).
+
+Usage: python -m benchmarks.in_process_topology [topology.yaml] [--duration 10] [--concurrency 8]
+                                                [--profile FILE] [--trace-buffer-size N]
+"""
+
+import argparse
+import asyncio
+import cProfile
+import itertools
+import json
+import pstats
+from common import configuration
+from common import tracing
+from common.node import NodeType
+from in_process.topology import InProcessTopology
+from .etsi_load import EncryptorPair, LoadGenerator
+
+
+def parse_command_line_arguments():
+    """
+    Parse command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="In-process topology benchmark")
+    parser.add_argument(
+        "configfile",
+        nargs="?",
+        default=configuration.DEFAULT_CONFIGURATION_FILE,
+        help="Configuration filename",
+    )
+    parser.add_argument(
+        "--duration", type=float, default=10.0, help="Duration in seconds"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="Number of concurrent key pairs"
+    )
+    parser.add_argument("--size", type=int, help="Key size in bits")
+    parser.add_argument("--profile", help="Profile, and save the statistics to FILE")
+    tracing.add_command_line_arguments(parser)
+    return parser.parse_args()
+
+
+async def run(args) -> dict:
+    """
+    Start the in-process topology, run the load, and return the results.
+    """
+    nodes = configuration.parse_configuration_file(args.configfile).nodes
+    client_nodes = [node for node in nodes if node.type == NodeType.CLIENT]
+    pairs = [
+        EncryptorPair(master_sae_id, slave_sae_id, master_node, slave_node)
+        for master_node, slave_node in itertools.permutations(client_nodes, 2)
+        for master_sae_id in master_node.encryptor_names
+        for slave_sae_id in slave_node.encryptor_names
+    ]
+    async with InProcessTopology(nodes) as topology:
+        generator = LoadGenerator(
+            pairs, client_nodes, args.size, timeout=10.0, transport=topology.transport
+        )
+        nr_requests_before = topology.transport.nr_requests
+        results = await generator.run(args.duration, args.concurrency)
+        nr_requests = topology.transport.nr_requests - nr_requests_before
+    results["exchanges_per_second"] = nr_requests / results["elapsed"]
+    return results
+
+
+def main():
+    """
+    Main entry point for the benchmark.
+    """
+    args = parse_command_line_arguments()
+    tracing.configure_from_command_line_arguments(args)
+    if args.profile is None:
+        results = asyncio.run(run(args))
+    else:
+        profiler = cProfile.Profile()
+        results = profiler.runcall(asyncio.run, run(args))
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(30)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Micro-benchmark: what does logging cost per key exchange?
+
+This makes the log calls of one key exchange (on the master client, the slave client, and the
+hubs) with the uvicorn logging configuration of the nodes, writing to a file, in three ways:
+
+ * sync: the log calls as they were before queued logging, i.e. f-strings that are formatted
+   eagerly, and records that are written synchronously on the calling thread.
+
+ * queued: lazy %-style log calls, and records that are formatted and written by the background
+   thread of queued logging.
+
+ * rate-limited: same as queued, but with the default rate limit of the per-request log categories.
+
+For each way, it reports the CPU time per key exchange of the calling thread (i.e. of the event
+loop), and the elapsed time per key exchange in total (including draining the queue in the
+background thread, which competes for the CPU).
+
+Usage: python -m benchmarks.logging_overhead [--exchanges 20000] [--hubs 5]
+"""
+
+import argparse
+import logging.config
+import tempfile
+import time
+from uuid import uuid4
+import uvicorn.config
+from common import logging as dske_logging
+from common.logging import ACCESS_LOGGER, HTTP_LOGGER, KEY_LOGGER, LOGGER
+
+
+def parse_command_line_arguments():
+    """
+    Parse command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Logging overhead benchmark")
+    parser.add_argument(
+        "--exchanges", type=int, default=20_000, help="Number of key exchanges per way"
+    )
+    parser.add_argument(
+        "--hubs", type=int, default=5, help="Number of hubs in the topology"
+    )
+    return parser.parse_args()
+
+
+def log_access(method: str, path: str) -> None:
+    """
+    Make the access log call of uvicorn for a request.
+    """
+    ACCESS_LOGGER.info(
+        '%s - "%s %s HTTP/%s" %d', "127.0.0.1:50000", method, path, "1.1", 200
+    )
+
+
+def log_key_exchange_sync(nr_hubs: int) -> None:
+    """
+    Make the log calls of one key exchange, as they were before queued logging.
+    """
+    key_id = uuid4()
+    log_access("GET", "/client/carol/etsi/api/v1/keys/serena/enc_keys")
+    for hub_index in range(nr_hubs):
+        url = f"http://127.0.0.1:{8100 + hub_index}/hub/hub-{hub_index}/dske/api/v1/key-share"
+        log_access("POST", "/dske/api/v1/key-share")
+        LOGGER.info(f"Call POST {url} 200")
+    LOGGER.info(
+        f"Successfully scattered {nr_hubs} out of {nr_hubs} shares for key ID {key_id}"
+    )
+    log_access("GET", f"/client/celia/etsi/api/v1/keys/sam/dec_keys?key_ID={key_id}")
+    for hub_index in range(nr_hubs):
+        url = f"http://127.0.0.1:{8100 + hub_index}/hub/hub-{hub_index}/dske/api/v1/key-share"
+        log_access("GET", f"/dske/api/v1/key-share?key_id={key_id}")
+        LOGGER.info(f"Call GET {url}?key_id={key_id} 200")
+    LOGGER.info(
+        f"Successfully gathered {nr_hubs} shares out of {nr_hubs} attempted for key ID {key_id}"
+    )
+
+
+def log_key_exchange_lazy(nr_hubs: int) -> None:
+    """
+    Make the log calls of one key exchange, as they are now.
+    """
+    key_id = uuid4()
+    log_access("GET", "/client/carol/etsi/api/v1/keys/serena/enc_keys")
+    for hub_index in range(nr_hubs):
+        url = f"http://127.0.0.1:{8100 + hub_index}/hub/hub-{hub_index}/dske/api/v1/key-share"
+        log_access("POST", "/dske/api/v1/key-share")
+        HTTP_LOGGER.info("Call %s %s %s", "POST", url, 200)
+    KEY_LOGGER.info(
+        "Successfully scattered %s out of %s shares for key ID %s",
+        nr_hubs,
+        nr_hubs,
+        key_id,
+    )
+    log_access("GET", f"/client/celia/etsi/api/v1/keys/sam/dec_keys?key_ID={key_id}")
+    for hub_index in range(nr_hubs):
+        url = f"http://127.0.0.1:{8100 + hub_index}/hub/hub-{hub_index}/dske/api/v1/key-share"
+        log_access("GET", f"/dske/api/v1/key-share?key_id={key_id}")
+        HTTP_LOGGER.info("Call GET %s?key_id=%s %s", url, key_id, 200)
+    KEY_LOGGER.info(
+        "Successfully gathered %s shares out of %s attempted for key ID %s",
+        nr_hubs,
+        nr_hubs,
+        key_id,
+    )
+
+
+def run_one(way: str, nr_exchanges: int, nr_hubs: int) -> dict:
+    """
+    Make the log calls of `nr_exchanges` key exchanges in the given way ("sync", "queued", or
+    "rate-limited"). The ways must be run in this order, because the queued ways omit unused log
+    record attributes for the rest of the process.
+    """
+    with tempfile.TemporaryFile("w") as log_file:
+        logging.config.dictConfig(uvicorn.config.LOGGING_CONFIG)
+        for logger_name in ["uvicorn", "uvicorn.access"]:
+            for handler in logging.getLogger(logger_name).handlers:
+                handler.setStream(log_file)
+        rate_limit = dske_logging.DEFAULT_RATE_LIMIT if way == "rate-limited" else None
+        dske_logging.configure({}, rate_limit)
+        if way != "sync":
+            dske_logging.omit_unused_record_attributes()
+            dske_logging.start_queued_logging()
+        log_key_exchange = (
+            log_key_exchange_sync if way == "sync" else log_key_exchange_lazy
+        )
+        start_time = time.perf_counter()
+        start_thread_time = time.thread_time()
+        for _ in range(nr_exchanges):
+            log_key_exchange(nr_hubs)
+        calling_thread_time = time.thread_time() - start_thread_time
+        dske_logging.stop_queued_logging()
+        total_time = time.perf_counter() - start_time
+        nr_bytes_written = log_file.tell()
+    return {
+        "calling_thread_us_per_exchange": calling_thread_time / nr_exchanges * 1e6,
+        "total_us_per_exchange": total_time / nr_exchanges * 1e6,
+        "bytes_per_exchange": nr_bytes_written / nr_exchanges,
+    }
+
+
+def main():
+    """
+    Main entry point for the benchmark.
+    """
+    args = parse_command_line_arguments()
+    print(
+        f"{'way':>12} {'event loop us/exchange':>23} {'total us/exchange':>18} "
+        f"{'bytes/exchange':>15}"
+    )
+    for way in ["sync", "queued", "rate-limited"]:
+        result = run_one(way, args.exchanges, args.hubs)
+        print(
+            f"{way:>12} {result['calling_thread_us_per_exchange']:>23.1f} "
+            f"{result['total_us_per_exchange']:>18.1f} "
+            f"{result['bytes_per_exchange']:>15.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
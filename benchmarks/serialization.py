@@ -0,0 +1,144 @@
+"""
+Micro-benchmark: how long does it take to encode and decode each DSKE API message type?
+
+For each message type, this compares the codec (common/codec.py) with the way the messages used to
+be encoded and decoded: with model_dump and the json module in the HTTP client, with FastAPI's
+response serialization and JSONResponse in the hub, and with the json module and model_validate
+for decoding.
+
+Usage: python -m benchmarks.serialization [--iterations 20000]
+"""
+
+import argparse
+import json
+import os
+import timeit
+from uuid import uuid4
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from common import codec
+from common.block import APIBlock
+from common.registration_api import (
+    APIPutRegistrationRequest,
+    APIPutRegistrationResponse,
+)
+from common.share_api import APIGetShareResponse, APIPostShareRequest
+from common.utils import bytes_to_str
+
+
+def parse_command_line_arguments():
+    """
+    Parse command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Serialization benchmark")
+    parser.add_argument(
+        "--iterations", type=int, default=20_000, help="Iterations per measurement"
+    )
+    return parser.parse_args()
+
+
+def example_messages() -> dict:
+    """
+    Get an example of each message type, with realistic sizes (a 32-byte share and a 2000-byte
+    PSRD block).
+    """
+    return {
+        "APIPostShareRequest": APIPostShareRequest(
+            master_client_name="carol",
+            master_sae_id="sam",
+            slave_sae_id="serena",
+            user_key_id=str(uuid4()),
+            share_index=1,
+            encryption_key_allocation=f"{uuid4()}:0:32",
+            encrypted_share_value=bytes_to_str(os.urandom(32)),
+        ),
+        "APIGetShareResponse": APIGetShareResponse(
+            share_index=1,
+            encryption_key_allocation=f"{uuid4()}:0:32",
+            encrypted_share_value=bytes_to_str(os.urandom(32)),
+        ),
+        "APIBlock": APIBlock(
+            block_uuid=str(uuid4()), data=bytes_to_str(os.urandom(2000))
+        ),
+        "APIPutRegistrationRequest": APIPutRegistrationRequest(
+            client_name="carol", encryptor_names=["sam", "sid"]
+        ),
+        "APIPutRegistrationResponse": APIPutRegistrationResponse(hub_name="hank"),
+    }
+
+
+def measure(function, nr_iterations: int) -> float:
+    """
+    Measure the time that one call of the function takes, in microseconds (best of 3).
+    """
+    return (
+        min(timeit.repeat(function, number=nr_iterations, repeat=3))
+        / nr_iterations
+        * 1e6
+    )
+
+
+def run_coroutine(coroutine):
+    """
+    Run a coroutine that never waits, without the overhead of an event loop.
+    """
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("Coroutine waited")
+
+
+def fastapi_encode(obj, response_field) -> bytes:
+    """
+    Encode a response in the same way as FastAPI does for a route that returns a model.
+    """
+    content = run_coroutine(
+        serialize_response(
+            field=response_field, response_content=obj, is_coroutine=True
+        )
+    )
+    return JSONResponse(content).body
+
+
+def measure_message(obj, nr_iterations: int) -> list[float]:
+    """
+    Measure the encoding and decoding times of one message: the client and hub encoding that were
+    used before, the codec encoding, the json module decoding, and the codec decoding.
+    """
+    model_class = type(obj)
+    data = codec.encode(obj)
+    response_field = create_model_field("Response", model_class, mode="serialization")
+    functions = [
+        lambda: json.dumps(obj.model_dump()).encode(),
+        lambda: fastapi_encode(obj, response_field),
+        lambda: codec.encode(obj),
+        lambda: model_class.model_validate(json.loads(data)),
+        lambda: codec.decode(data, model_class),
+    ]
+    return [measure(function, nr_iterations) for function in functions]
+
+
+def main():
+    """
+    Main entry point for the benchmark.
+    """
+    args = parse_command_line_arguments()
+    print(
+        f"{'message':>27} {'bytes':>6} "
+        f"{'client enc':>11} {'hub enc':>8} {'codec enc':>10} "
+        f"{'json dec':>9} {'codec dec':>10}"
+    )
+    for name, obj in example_messages().items():
+        times = measure_message(obj, args.iterations)
+        print(
+            f"{name:>27} {len(codec.encode(obj)):>6} "
+            f"{times[0]:>11.2f} {times[1]:>8.2f} {times[2]:>10.2f} "
+            f"{times[3]:>9.2f} {times[4]:>10.2f}"
+        )
+    print("(times in microseconds per message)")
+
+
+if __name__ == "__main__":
+    main()
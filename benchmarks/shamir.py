@@ -0,0 +1,94 @@
+"""
+Micro-benchmark: what does it cost to split a key into shares, and to reconstruct it, per field?
+
+This splits a key into _n_ shares and reconstructs it from the minimum number of shares, in GF(256)
+(which supports at most 16 shares) and in GF(2^16) (which supports many more shares). It reports
+the split time and the reconstruct time per key, for 16, 32, 64, and 128 shares by default.
+
+Usage: python -m benchmarks.shamir [--keys 200] [--key-size 32] [--min-nr-shares 3]
+                                   [--nr-shares 16 32 64 128]
+"""
+
+import argparse
+import time
+from os import urandom
+from random import sample
+from common import shamir
+
+
+def parse_command_line_arguments():
+    """
+    Parse command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Shamir secret sharing benchmark")
+    parser.add_argument(
+        "--keys", type=int, default=200, help="Number of keys per measurement"
+    )
+    parser.add_argument("--key-size", type=int, default=32, help="Key size in bytes")
+    parser.add_argument(
+        "--min-nr-shares",
+        type=int,
+        default=3,
+        help="Minimum number of shares to reconstruct a key",
+    )
+    parser.add_argument(
+        "--nr-shares",
+        type=int,
+        nargs="+",
+        default=[16, 32, 64, 128],
+        help="Numbers of shares to measure",
+    )
+    return parser.parse_args()
+
+
+def run_one(
+    field: shamir.Field, nr_keys: int, key_size: int, nr_shares: int, min_nr_shares: int
+) -> dict:
+    """
+    Split `nr_keys` keys into `nr_shares` shares each, and reconstruct each key from a random
+    selection of `min_nr_shares` of its shares.
+    """
+    split_time = 0.0
+    reconstruct_time = 0.0
+    for _ in range(nr_keys):
+        key = urandom(key_size)
+        start_time = time.perf_counter()
+        shares = shamir.split_binary_secret_into_shares(
+            key, nr_shares, min_nr_shares, field
+        )
+        split_time += time.perf_counter() - start_time
+        selected_shares = sample(shares, min_nr_shares)
+        start_time = time.perf_counter()
+        reconstructed_key = shamir.reconstruct_binary_secret_from_shares(
+            min_nr_shares, selected_shares
+        )
+        reconstruct_time += time.perf_counter() - start_time
+        assert reconstructed_key == key
+    return {
+        "split_us_per_key": split_time / nr_keys * 1e6,
+        "reconstruct_us_per_key": reconstruct_time / nr_keys * 1e6,
+    }
+
+
+def main():
+    """
+    Main entry point for the benchmark.
+    """
+    args = parse_command_line_arguments()
+    print(f"{'field':>8} {'shares':>7} {'split us/key':>13} {'reconstruct us/key':>19}")
+    for nr_shares in args.nr_shares:
+        for field in shamir.Field:
+            if field == shamir.Field.GF256 and nr_shares > shamir.MAX_SHARE_COUNT:
+                continue
+            result = run_one(
+                field, args.keys, args.key_size, nr_shares, args.min_nr_shares
+            )
+            print(
+                f"{field.value:>8} {nr_shares:>7} "
+                f"{result['split_us_per_key']:>13.1f} "
+                f"{result['reconstruct_us_per_key']:>19.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Micro-benchmark: what does it cost to allocate the encryption keys for key shares, per share?
+
+This compares allocating each share encryption key separately from the pool (`Pool.allocate`) with
+carving it from a contiguous extent (`Pool.allocate_from_extent`), on a pool that is refilled with
+PSRD blocks in the same way as the pools of a client. Each share encryption key is followed by a
+signing key from the same pool, as for a real share message. For each method, it reports the
+allocation time, the number of fragments, and the size of the encoded allocation in the share
+message (for separate allocations, the list of fragment objects that share messages used to carry;
+for the extent, the encoded string that they carry now).
+
+Usage: python -m benchmarks.share_encryption [--shares 20000] [--share-size 32]
+"""
+
+import argparse
+import json
+import time
+from client import peer_hub
+from common.block import Block
+from common.pool import MESSAGE_SIGNING_KEY, SHARE_ENCRYPTION_KEY, Pool
+from common.signing_key import SIGNING_KEY_SIZE
+
+
+def parse_command_line_arguments():
+    """
+    Parse command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Share encryption key benchmark")
+    parser.add_argument(
+        "--shares", type=int, default=20_000, help="Number of shares per method"
+    )
+    parser.add_argument(
+        "--share-size", type=int, default=32, help="Share size in bytes"
+    )
+    return parser.parse_args()
+
+
+def refill_pool_if_needed(pool: Pool, nr_bytes_needed: int) -> None:
+    """
+    Add PSRD blocks to the pool when a client would request them (see PeerHub).
+    """
+    if (
+        pool.nr_unused_bytes >= peer_hub.START_REQUEST_PSRD_THRESHOLD
+        and pool.nr_unused_bytes >= nr_bytes_needed
+    ):
+        return
+    while pool.nr_unused_bytes < max(
+        peer_hub.STOP_REQUEST_PSRD_THRESHOLD, nr_bytes_needed
+    ):
+        pool.add_block(Block.new_with_random_data(peer_hub.GET_PSRD_BLOCK_SIZE))
+
+
+def run_one(method: str, nr_shares: int, share_size: int) -> dict:
+    """
+    Allocate the keys for `nr_shares` shares with the given method ("allocate" or "extent").
+    """
+    pool = Pool("bench", Pool.Owner.LOCAL)
+    nr_bytes_needed = (
+        pool.nr_bytes_needed(share_size, SHARE_ENCRYPTION_KEY) + SIGNING_KEY_SIZE
+    )
+    allocate = pool.allocate if method == "allocate" else pool.allocate_from_extent
+    allocations = []
+    allocation_time = 0.0
+    for _ in range(nr_shares):
+        refill_pool_if_needed(pool, nr_bytes_needed)
+        start_time = time.perf_counter()
+        allocation = allocate(share_size, SHARE_ENCRYPTION_KEY)
+        allocation_time += time.perf_counter() - start_time
+        allocations.append(allocation)
+        pool.allocate(SIGNING_KEY_SIZE, MESSAGE_SIGNING_KEY)
+        pool.retire_fully_used_blocks()
+    nr_fragments = sum(len(allocation.fragments) for allocation in allocations)
+    if method == "allocate":
+        payload = [
+            json.dumps(allocation.to_api().model_dump()) for allocation in allocations
+        ]
+    else:
+        payload = [json.dumps(allocation.to_enc_str()) for allocation in allocations]
+    return {
+        "us_per_share": allocation_time / nr_shares * 1e6,
+        "fragments_per_share": nr_fragments / nr_shares,
+        "payload_bytes_per_share": sum(len(item) for item in payload) / nr_shares,
+    }
+
+
+def main():
+    """
+    Main entry point for the benchmark.
+    """
+    args = parse_command_line_arguments()
+    print(
+        f"{'method':>9} {'us/share':>9} {'fragments/share':>16} {'payload bytes':>14}"
+    )
+    for method in ["allocate", "extent"]:
+        result = run_one(method, args.shares, args.share_size)
+        print(
+            f"{method:>9} {result['us_per_share']:>9.2f} "
+            f"{result['fragments_per_share']:>16.3f} "
+            f"{result['payload_bytes_per_share']:>14.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,19 @@ Main module for a DSKE client.
 """
 
 import argparse
-import contextlib
-import os
-import signal
-from typing import Annotated
-import fastapi
 import uvicorn
+from common import authenticator
 from common import configuration
+from common import crypto_executor
+from common import logging
+from common import profiler
+from common import psrd_generator
+from common import tracing
 from common import utils
-from common.exceptions import DSKEException, MissingAuthorizationHeaderError
+from . import admission_control
+from . import gathered_key_cache
+from . import peer_hub
+from .app import create_app
 from .client import Client
 
 
@@ -36,11 +40,41 @@ def parse_command_line_arguments():
         type=str,
         help="Names (SAE IDs) of encryptors consuming keys from this client (KME).",
     )
+    parser.add_argument(
+        "--dec-key-cache-ttl",
+        type=float,
+        default=gathered_key_cache.DEFAULT_TTL,
+        help=f"Seconds to keep a key that was gathered for Get Key with Key IDs, to serve retries "
+        f"without contacting the hubs again; 0 disables the cache "
+        f"(default: {gathered_key_cache.DEFAULT_TTL})",
+    )
+    parser.add_argument(
+        "--ready-psrd-bytes",
+        type=int,
+        default=peer_hub.DEFAULT_READY_PSRD_BYTES,
+        help=f"The client is ready once it is registered with all hubs and both pools of each hub "
+        f"hold at least this many bytes of PSRD (default: {peer_hub.DEFAULT_READY_PSRD_BYTES})",
+    )
+    admission_control.add_command_line_arguments(parser)
+    authenticator.add_command_line_arguments(parser)
+    crypto_executor.add_command_line_arguments(parser)
+    logging.add_command_line_arguments(parser)
+    profiler.add_command_line_arguments(parser)
+    psrd_generator.add_command_line_arguments(parser)
+    tracing.add_command_line_arguments(parser)
     args = parser.parse_args()
+    if args.profiling_sampling_interval <= 0:
+        parser.error("--profiling-sampling-interval must be positive")
+    if args.ready_psrd_bytes < 0:
+        parser.error("--ready-psrd-bytes must not be negative")
     return args
 
 
 _ARGS = parse_command_line_arguments()
+crypto_executor.configure_from_command_line_arguments(_ARGS)
+profiler.configure_from_command_line_arguments(_ARGS)
+psrd_generator.configure_from_command_line_arguments(_ARGS)
+tracing.configure_from_command_line_arguments(_ARGS)
 peer_hub_urls = _ARGS.hubs
 if peer_hub_urls is None:
     peer_hub_urls = []
@@ -48,111 +82,18 @@ if _ARGS.encryptors is None:
     encryptor_names = []
 else:
     encryptor_names = _ARGS.encryptors
-_CLIENT = Client(_ARGS.name, encryptor_names, peer_hub_urls)
-
-
-@contextlib.asynccontextmanager
-async def lifespan(_app: fastapi.FastAPI):
-    """
-    Do the things that need to be done just after startup and just before shutdown.
-    """
-    _CLIENT.start_all_peer_hubs()
-    yield
-    # We currently do not have any shutdown actions.
-
-
-_APP = fastapi.FastAPI(lifespan=lifespan)
-
-
-@_APP.exception_handler(DSKEException)
-async def dske_exception_handler(_request: fastapi.Request, exc: DSKEException):
-    """
-    Handle DSKE exceptions.
-    """
-    return fastapi.responses.JSONResponse(
-        status_code=exc.status_code,
-        content={"message": exc.message, "details": exc.details},
-    )
-
-
-@_APP.get(f"/client/{_CLIENT.name}/etsi/api/v1/keys/{{slave_sae_id}}/status")
-async def get_etsi_status(
-    slave_sae_id: str,
-    authorization: Annotated[str | None, fastapi.Header()] = None,
-):
-    """
-    ETSI QKD 014 API: Status.
-    """
-    master_sae_id = calling_sae_id(authorization)
-    return await _CLIENT.etsi_status(master_sae_id, slave_sae_id)
+_CLIENT = Client(
+    _ARGS.name,
+    encryptor_names,
+    peer_hub_urls,
+    _ARGS.dec_key_cache_ttl,
+    admission_control.from_command_line_arguments(_ARGS),
+    _ARGS.authentication_modes,
+    _ARGS.ready_psrd_bytes,
+)
 
 
-@_APP.get(f"/client/{_CLIENT.name}/etsi/api/v1/keys/{{slave_sae_id}}/enc_keys")
-async def get_etsi_get_key(
-    slave_sae_id: str,
-    size: int | None = None,
-    authorization: Annotated[str | None, fastapi.Header()] = None,
-):
-    """
-    ETSI QKD 014 API: Get Key.
-    """
-    master_sae_id = calling_sae_id(authorization)
-    return await _CLIENT.etsi_get_key(master_sae_id, slave_sae_id, size)
-
-
-@_APP.get(f"/client/{_CLIENT.name}/etsi/api/v1/keys/{{master_sae_id}}/dec_keys")
-async def get_eti_get_key_with_key_ids(
-    master_sae_id: str,
-    key_ID: str,
-    authorization: Annotated[str | None, fastapi.Header()] = None,
-):
-    """
-    ETSI QKD 014 API: Get Key with Key IDs.
-    """
-    # ETSI QKD 014 says that ID in key_ID has to be upper case, which lint doesn't like.
-    # pylint: disable=invalid-name
-    slave_sae_id = calling_sae_id(authorization)
-    return await _CLIENT.etsi_get_key_with_key_ids(master_sae_id, slave_sae_id, key_ID)
-
-
-@_APP.get(f"/client/{_CLIENT.name}/mgmt/v1/status")
-async def get_mgmt_status():
-    """
-    Management: Get status.
-    """
-    return _CLIENT.to_mgmt()
-
-
-@_APP.post(f"/client/{_CLIENT.name}/mgmt/v1/stop")
-async def post_mgmt_stop():
-    """
-    Management: Post stop.
-    """
-    utils.delete_pid_file("client", _CLIENT.name)
-    os.kill(os.getpid(), signal.SIGTERM)
-    return {"result": "Client stopped"}
-
-
-def calling_sae_id(authorization_header: str | None) -> str:
-    """
-    Get the SAE ID of the calling entity from the request headers.
-    """
-    if authorization_header is None:
-        if len(_CLIENT.encryptor_names) == 1:
-            # If the client has exactly one encryptor, we assume that this is the one.
-            # This makes it easier for users to use curl for testing in simple topologies.
-            # It's okay because we only implement a subset of ETSI QKD 014: we are not really
-            # authenticating the clients, we are just using the Authorization header to
-            # determine which encryptor is calling.
-            master_sae_id = _CLIENT.encryptor_names[0]
-        else:
-            # There is more than one encryptor, so we cannot guess which one is calling.
-            raise MissingAuthorizationHeaderError(
-                client_name=_CLIENT.name,
-            )
-    else:
-        master_sae_id = authorization_header.strip()
-    return master_sae_id
+_APP = create_app(_CLIENT)
 
 
 def main():
@@ -161,6 +102,7 @@ def main():
     """
     utils.create_pid_file("client", _CLIENT.name)
     config = uvicorn.Config(app=_APP, port=_ARGS.port)
+    logging.configure_from_command_line_arguments(_ARGS)
     server = uvicorn.Server(config)
     server.run()
 
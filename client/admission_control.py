@@ -0,0 +1,275 @@
+"""
+Admission control for the ETSI QKD 014 API requests of a client.
+"""
+
+import argparse
+import asyncio
+import collections
+import contextlib
+import math
+from common import exceptions
+from common.metrics import REGISTRY
+
+DEFAULT_MAX_NR_CONCURRENT_REQUESTS = 64
+"""
+The default maximum number of ETSI requests that are processed concurrently (for all encryptors).
+"""
+
+DEFAULT_MAX_NR_CONCURRENT_REQUESTS_PER_SAE = 16
+"""
+The default maximum number of ETSI requests of one encryptor that are processed or waiting
+concurrently.
+"""
+
+DEFAULT_MAX_NR_WAITING_REQUESTS = 128
+"""
+The default maximum number of ETSI requests that wait for one of the concurrent processing slots.
+"""
+
+DEFAULT_MAX_WAIT_TIME = 1.0
+"""
+The default maximum number of seconds that an ETSI request waits for a processing slot.
+"""
+
+_ADMISSION_REQUESTS = REGISTRY.counter(
+    "dske_client_admission_requests_total",
+    "ETSI requests by admission control result: admitted (immediately or after waiting), or "
+    "rejected because of the per-encryptor limit (sae_limit), because the wait queue was full "
+    "(queue_full), because the request waited too long (wait_timeout), or because too few peer "
+    "hubs have enough PSRD (no_psrd)",
+    ("result",),
+)
+_ADMITTED = _ADMISSION_REQUESTS.labels("admitted")
+_ADMITTED_AFTER_WAIT = _ADMISSION_REQUESTS.labels("admitted_after_wait")
+_REJECTED_SAE_LIMIT = _ADMISSION_REQUESTS.labels("sae_limit")
+_REJECTED_QUEUE_FULL = _ADMISSION_REQUESTS.labels("queue_full")
+_REJECTED_WAIT_TIMEOUT = _ADMISSION_REQUESTS.labels("wait_timeout")
+_REJECTED_NO_PSRD = _ADMISSION_REQUESTS.labels("no_psrd")
+_ACTIVE_REQUESTS = REGISTRY.gauge(
+    "dske_client_admission_active_requests",
+    "ETSI requests that are being processed",
+    ("client",),
+)
+_WAITING_REQUESTS = REGISTRY.gauge(
+    "dske_client_admission_waiting_requests",
+    "ETSI requests that are waiting for a processing slot",
+    ("client",),
+)
+
+
+class AdmissionController:
+    """
+    Limits the number of ETSI requests that are processed concurrently, so that under overload
+    some requests are rejected quickly instead of all requests becoming slow and draining the PSRD
+    pools of all peer hubs at the same time.
+
+    There is a global limit on the number of requests that are processed concurrently. A request
+    that arrives when all processing slots are taken waits in a bounded first-in first-out queue
+    for a limited time. There is also a limit on the number of requests of one encryptor (SAE) that
+    are processed or waiting, so that one encryptor cannot take all processing slots.
+
+    Rejected requests get a 429 (per-encryptor limit) or 503 (overload) response with a Retry-After
+    header.
+    """
+
+    _client_name: str
+    _max_nr_concurrent_requests: int
+    _max_nr_concurrent_requests_per_sae: int
+    _max_nr_waiting_requests: int
+    _max_wait_time: float
+    _nr_active_requests: int
+    _nr_requests_per_sae: dict[str, int]  # Active and waiting, indexed by SAE ID
+    _waiters: collections.deque  # Of asyncio.Future, first-in first-out
+    _nr_admitted: int
+    _nr_rejected: int
+
+    def __init__(
+        self,
+        client_name: str,
+        max_nr_concurrent_requests: int = DEFAULT_MAX_NR_CONCURRENT_REQUESTS,
+        max_nr_concurrent_requests_per_sae: int = DEFAULT_MAX_NR_CONCURRENT_REQUESTS_PER_SAE,
+        max_nr_waiting_requests: int = DEFAULT_MAX_NR_WAITING_REQUESTS,
+        max_wait_time: float = DEFAULT_MAX_WAIT_TIME,
+    ):
+        assert max_nr_concurrent_requests > 0
+        assert max_nr_concurrent_requests_per_sae > 0
+        assert max_nr_waiting_requests >= 0
+        assert max_wait_time >= 0
+        self._client_name = client_name
+        self._max_nr_concurrent_requests = max_nr_concurrent_requests
+        self._max_nr_concurrent_requests_per_sae = max_nr_concurrent_requests_per_sae
+        self._max_nr_waiting_requests = max_nr_waiting_requests
+        self._max_wait_time = max_wait_time
+        self._nr_active_requests = 0
+        self._nr_requests_per_sae = {}
+        self._waiters = collections.deque()
+        self._nr_admitted = 0
+        self._nr_rejected = 0
+        _ACTIVE_REQUESTS.labels(client_name).set_function(
+            lambda: self._nr_active_requests
+        )
+        _WAITING_REQUESTS.labels(client_name).set_function(lambda: len(self._waiters))
+
+    @property
+    def retry_after(self) -> int:
+        """
+        The number of seconds that a rejected request is asked to wait before it retries.
+        """
+        return max(1, math.ceil(self._max_wait_time))
+
+    @property
+    def nr_active_requests(self) -> int:
+        """
+        Get the number of requests that are being processed.
+        """
+        return self._nr_active_requests
+
+    @property
+    def nr_waiting_requests(self) -> int:
+        """
+        Get the number of requests that are waiting for a processing slot.
+        """
+        return len(self._waiters)
+
+    def reject_no_psrd(
+        self, nr_peer_hubs_with_psrd: int, nr_required_peer_hubs: int
+    ) -> None:
+        """
+        Reject a request because too few peer hubs have enough PSRD to process it.
+        """
+        self._nr_rejected += 1
+        _REJECTED_NO_PSRD.inc()
+        raise exceptions.NotEnoughPeerHubsWithPSRDError(
+            nr_peer_hubs_with_psrd, nr_required_peer_hubs, self.retry_after
+        )
+
+    @contextlib.asynccontextmanager
+    async def admit(self, sae_id: str):
+        """
+        Admit a request of encryptor `sae_id` for the duration of the context: wait for a processing
+        slot if needed, or raise TooManyRequestsError or OverloadedError if the request is rejected.
+        """
+        nr_sae_requests = self._nr_requests_per_sae.get(sae_id, 0)
+        if nr_sae_requests >= self._max_nr_concurrent_requests_per_sae:
+            self._nr_rejected += 1
+            _REJECTED_SAE_LIMIT.inc()
+            raise exceptions.TooManyRequestsError(
+                sae_id, self._max_nr_concurrent_requests_per_sae, self.retry_after
+            )
+        self._nr_requests_per_sae[sae_id] = nr_sae_requests + 1
+        try:
+            await self._acquire_slot()
+            try:
+                yield
+            finally:
+                self._release_slot()
+        finally:
+            self._nr_requests_per_sae[sae_id] -= 1
+            if self._nr_requests_per_sae[sae_id] == 0:
+                del self._nr_requests_per_sae[sae_id]
+
+    async def _acquire_slot(self) -> None:
+        if self._nr_active_requests < self._max_nr_concurrent_requests:
+            self._nr_active_requests += 1
+            self._nr_admitted += 1
+            _ADMITTED.inc()
+            return
+        if len(self._waiters) >= self._max_nr_waiting_requests:
+            self._nr_rejected += 1
+            _REJECTED_QUEUE_FULL.inc()
+            raise exceptions.OverloadedError("Wait queue is full", self.retry_after)
+        # A released slot is handed over to the first waiter (see _release_slot) without
+        # decrementing the number of active requests.
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait([waiter], timeout=self._max_wait_time)
+        except asyncio.CancelledError:
+            if waiter.done():
+                # The slot was handed over, but this request was cancelled.
+                self._release_slot()
+            else:
+                self._waiters.remove(waiter)
+                waiter.cancel()
+            raise
+        if not waiter.done():
+            self._waiters.remove(waiter)
+            waiter.cancel()
+            self._nr_rejected += 1
+            _REJECTED_WAIT_TIMEOUT.inc()
+            raise exceptions.OverloadedError(
+                "Timed out waiting for a processing slot", self.retry_after
+            )
+        self._nr_admitted += 1
+        _ADMITTED_AFTER_WAIT.inc()
+
+    def _release_slot(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._nr_active_requests -= 1
+
+    def to_mgmt(self) -> dict:
+        """
+        Get the management status.
+        """
+        return {
+            "max_nr_concurrent_requests": self._max_nr_concurrent_requests,
+            "max_nr_concurrent_requests_per_sae": self._max_nr_concurrent_requests_per_sae,
+            "max_nr_waiting_requests": self._max_nr_waiting_requests,
+            "max_wait_time": self._max_wait_time,
+            "nr_active_requests": self._nr_active_requests,
+            "nr_waiting_requests": len(self._waiters),
+            "nr_admitted": self._nr_admitted,
+            "nr_rejected": self._nr_rejected,
+        }
+
+
+def add_command_line_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the command line arguments for configuring admission control.
+    """
+    parser.add_argument(
+        "--max-concurrent-requests",
+        type=int,
+        default=DEFAULT_MAX_NR_CONCURRENT_REQUESTS,
+        help=f"Maximum number of ETSI requests that are processed concurrently "
+        f"(default: {DEFAULT_MAX_NR_CONCURRENT_REQUESTS})",
+    )
+    parser.add_argument(
+        "--max-concurrent-requests-per-sae",
+        type=int,
+        default=DEFAULT_MAX_NR_CONCURRENT_REQUESTS_PER_SAE,
+        help=f"Maximum number of ETSI requests of one encryptor that are processed or waiting "
+        f"concurrently; more are rejected with 429 Too Many Requests "
+        f"(default: {DEFAULT_MAX_NR_CONCURRENT_REQUESTS_PER_SAE})",
+    )
+    parser.add_argument(
+        "--max-waiting-requests",
+        type=int,
+        default=DEFAULT_MAX_NR_WAITING_REQUESTS,
+        help=f"Maximum number of ETSI requests that wait for a processing slot; more are rejected "
+        f"with 503 Service Unavailable (default: {DEFAULT_MAX_NR_WAITING_REQUESTS})",
+    )
+    parser.add_argument(
+        "--max-request-wait-time",
+        type=float,
+        default=DEFAULT_MAX_WAIT_TIME,
+        help=f"Maximum number of seconds that an ETSI request waits for a processing slot "
+        f"(default: {DEFAULT_MAX_WAIT_TIME})",
+    )
+
+
+def from_command_line_arguments(args: argparse.Namespace) -> AdmissionController:
+    """
+    Create an admission controller from the parsed command line arguments.
+    """
+    return AdmissionController(
+        args.name,
+        args.max_concurrent_requests,
+        args.max_concurrent_requests_per_sae,
+        args.max_waiting_requests,
+        args.max_request_wait_time,
+    )
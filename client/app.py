@@ -0,0 +1,221 @@
+"""
+The FastAPI application of a DSKE client.
+"""
+
+import contextlib
+import os
+import signal
+from typing import Annotated
+import fastapi
+from common import crypto_executor
+from common import metrics
+from common import profiler
+from common import psrd_generator
+from common import tracing
+from common import utils
+from common.block_reaper import BLOCK_REAPER
+from common.event_loop_monitor import EVENT_LOOP_MONITOR
+from common.exceptions import DSKEException, MissingAuthorizationHeaderError
+from common.profiler import PROFILER, Profiler
+from common.tracing import TRACER
+from .client import Client
+
+
+def calling_sae_id(client: Client, authorization_header: str | None) -> str:
+    """
+    Get the SAE ID of the calling entity from the request headers.
+    """
+    if authorization_header is None:
+        if len(client.encryptor_names) == 1:
+            # If the client has exactly one encryptor, we assume that this is the one.
+            # This makes it easier for users to use curl for testing in simple topologies.
+            # It's okay because we only implement a subset of ETSI QKD 014: we are not really
+            # authenticating the clients, we are just using the Authorization header to
+            # determine which encryptor is calling.
+            master_sae_id = client.encryptor_names[0]
+        else:
+            # There is more than one encryptor, so we cannot guess which one is calling.
+            raise MissingAuthorizationHeaderError(
+                client_name=client.name,
+            )
+    else:
+        master_sae_id = authorization_header.strip()
+    return master_sae_id
+
+
+def create_app(client: Client) -> fastapi.FastAPI:
+    """
+    Create the FastAPI application for a client. The lifespan of the application starts the peer
+    hubs and the background services of the process; it is run by uvicorn, but not by an in-process
+    ASGI transport (see in_process.topology).
+    """
+    # Each route handler is a local variable.
+    # pylint: disable=too-many-locals
+
+    @contextlib.asynccontextmanager
+    async def lifespan(_app: fastapi.FastAPI):
+        """
+        Do the things that need to be done just after startup and just before shutdown.
+        """
+        EVENT_LOOP_MONITOR.start()
+        BLOCK_REAPER.start()
+        client.start_all_peer_hubs()
+        yield
+        client.stop_all_peer_hubs()
+        BLOCK_REAPER.stop()
+        EVENT_LOOP_MONITOR.stop()
+        crypto_executor.CRYPTO_EXECUTOR.shutdown()
+        psrd_generator.PSRD_GENERATOR.shutdown()
+
+    app = fastapi.FastAPI(lifespan=lifespan)
+
+    @app.middleware("http")
+    async def trace_etsi_requests(request: fastapi.Request, call_next):
+        """
+        Trace ETSI QKD 014 requests, each of which starts a new trace (or continues the trace of
+        the caller, if the caller propagates its trace context).
+        """
+        if "/etsi/" not in request.url.path:
+            return await call_next(request)
+        return await tracing.trace_request(request, call_next, client.name)
+
+    @app.exception_handler(DSKEException)
+    async def dske_exception_handler(_request: fastapi.Request, exc: DSKEException):
+        """
+        Handle DSKE exceptions.
+        """
+        return fastapi.responses.JSONResponse(
+            status_code=exc.status_code,
+            content={"message": exc.message, "details": exc.details},
+            headers=exc.headers,
+        )
+
+    @app.get(f"/client/{client.name}/etsi/api/v1/keys/{{slave_sae_id}}/status")
+    async def get_etsi_status(
+        slave_sae_id: str,
+        authorization: Annotated[str | None, fastapi.Header()] = None,
+    ):
+        """
+        ETSI QKD 014 API: Status.
+        """
+        master_sae_id = calling_sae_id(client, authorization)
+        return await client.etsi_status(master_sae_id, slave_sae_id)
+
+    @app.get(f"/client/{client.name}/etsi/api/v1/keys/{{slave_sae_id}}/enc_keys")
+    async def get_etsi_get_key(
+        slave_sae_id: str,
+        size: int | None = None,
+        authorization: Annotated[str | None, fastapi.Header()] = None,
+    ):
+        """
+        ETSI QKD 014 API: Get Key.
+        """
+        master_sae_id = calling_sae_id(client, authorization)
+        return await client.etsi_get_key(master_sae_id, slave_sae_id, size)
+
+    @app.get(f"/client/{client.name}/etsi/api/v1/keys/{{master_sae_id}}/dec_keys")
+    async def get_eti_get_key_with_key_ids(
+        master_sae_id: str,
+        key_ID: str,
+        authorization: Annotated[str | None, fastapi.Header()] = None,
+    ):
+        """
+        ETSI QKD 014 API: Get Key with Key IDs.
+        """
+        # ETSI QKD 014 says that ID in key_ID has to be upper case, which lint doesn't like.
+        # pylint: disable=invalid-name
+        slave_sae_id = calling_sae_id(client, authorization)
+        return await client.etsi_get_key_with_key_ids(
+            master_sae_id, slave_sae_id, key_ID
+        )
+
+    @app.get(f"/client/{client.name}/mgmt/v1/status")
+    async def get_mgmt_status():
+        """
+        Management: Get status.
+        """
+        return client.to_mgmt()
+
+    @app.get(f"/client/{client.name}/mgmt/v1/summary")
+    async def get_mgmt_summary():
+        """
+        Management: Get summary of status.
+        """
+        return client.to_mgmt_summary()
+
+    @app.get(f"/client/{client.name}/mgmt/v1/ready")
+    async def get_mgmt_ready():
+        """
+        Management: Get readiness (status code 200 if the client is ready to deliver keys, 503 if
+        not).
+        """
+        status_code = 200 if client.is_ready else 503
+        return fastapi.responses.JSONResponse(
+            client.to_mgmt_ready(), status_code=status_code
+        )
+
+    @app.get(f"/client/{client.name}/mgmt/v1/blocks")
+    async def get_mgmt_blocks(
+        hub_name: str,
+        pool_owner: str,
+        cursor: int | None = None,
+        limit: Annotated[
+            int, fastapi.Query(ge=1, le=utils.MAX_PAGE_SIZE)
+        ] = utils.DEFAULT_PAGE_SIZE,
+    ):
+        """
+        Management: Get one page of the blocks in a pool for a peer hub.
+        """
+        return client.to_mgmt_blocks_page(hub_name, pool_owner, cursor, limit)
+
+    @app.get(f"/client/{client.name}/mgmt/v1/metrics")
+    async def get_mgmt_metrics():
+        """
+        Management: Get metrics (in the Prometheus text format).
+        """
+        return fastapi.responses.PlainTextResponse(
+            metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE
+        )
+
+    @app.get(f"/client/{client.name}/mgmt/v1/traces")
+    async def get_mgmt_traces(
+        trace_id: str | None = None,
+        limit: Annotated[
+            int, fastapi.Query(ge=1, le=utils.MAX_PAGE_SIZE)
+        ] = utils.DEFAULT_PAGE_SIZE,
+    ):
+        """
+        Management: Get the most recent trace spans (optionally only those of one trace).
+        """
+        return TRACER.to_mgmt(trace_id, limit)
+
+    @app.post(f"/client/{client.name}/mgmt/v1/profile")
+    async def post_mgmt_profile(
+        mode: Profiler.Mode = Profiler.Mode.SAMPLING,
+        duration: Annotated[
+            float, fastapi.Query(gt=0, le=profiler.MAX_DURATION)
+        ] = profiler.DEFAULT_DURATION,
+        sort: Profiler.Sort = Profiler.Sort.CUMULATIVE,
+        limit: Annotated[
+            int, fastapi.Query(ge=1, le=utils.MAX_PAGE_SIZE)
+        ] = profiler.DEFAULT_NR_FUNCTIONS,
+    ):
+        """
+        Management: Profile the client for `duration` seconds, and get the collapsed stacks (in
+        sampling mode) or the pstats report of the `limit` functions with the most time by `sort`
+        (in cprofile mode). Only if the client was started with --enable-profiling.
+        """
+        return fastapi.responses.PlainTextResponse(
+            await PROFILER.profile(mode, duration, sort, limit)
+        )
+
+    @app.post(f"/client/{client.name}/mgmt/v1/stop")
+    async def post_mgmt_stop():
+        """
+        Management: Post stop.
+        """
+        utils.delete_pid_file("client", client.name)
+        os.kill(os.getpid(), signal.SIGTERM)
+        return {"result": "Client stopped"}
+
+    return app
@@ -4,17 +4,36 @@ A DSKE client, or just client for short.
 
 import asyncio
 from uuid import UUID
+import httpx
 from common import exceptions
 from common import shamir
 from common import utils
-from common.logging import LOGGER
+from common.crypto_executor import CRYPTO_EXECUTOR
+from common.block_reaper import BLOCK_REAPER
+from common.event_loop_monitor import EVENT_LOOP_MONITOR
+from common.logging import KEY_LOGGER, LOGGER
+from common.psrd_generator import PSRD_GENERATOR
+from common.metrics import REGISTRY
+from common.pool import Pool
+from common.share import Share
+from common.tracing import TRACER
 from common.user_key import UserKey
-from .peer_hub import PeerHub
+from . import gathered_key_cache
+from .admission_control import AdmissionController
+from .gathered_key_cache import GatheredKeyCache
+from .peer_hub import DEFAULT_READY_PSRD_BYTES, PeerHub
 
 # TODO: Make this configurable
-# TODO: The Shamir code also has a max (is that really needed?)
 _MIN_NR_SHARES = 3  # The minimum number of key shares required to reconstruct the key.
 
+_KEYS_DELIVERED = REGISTRY.counter(
+    "dske_client_keys_delivered_total",
+    "Keys delivered to encryptors over the ETSI QKD 014 API",
+    ("api",),
+)
+_ENC_KEYS_DELIVERED = _KEYS_DELIVERED.labels("enc_keys")
+_DEC_KEYS_DELIVERED = _KEYS_DELIVERED.labels("dec_keys")
+
 
 class Client:
     """
@@ -30,13 +49,33 @@ class Client:
     _name: str
     _encryptor_names: list[str]
     _peer_hubs: list[PeerHub]
+    _gathered_key_cache: GatheredKeyCache
+    _admission_controller: AdmissionController
+    _nr_delivered_keys: int
 
-    def __init__(self, name: str, encryptor_names: list[str], peer_hub_urls: list[str]):
+    def __init__(
+        self,
+        name: str,
+        encryptor_names: list[str],
+        peer_hub_urls: list[str],
+        gathered_key_cache_ttl: float = gathered_key_cache.DEFAULT_TTL,
+        admission_controller: AdmissionController | None = None,
+        authentication_modes: list[str] | None = None,
+        ready_psrd_bytes: int = DEFAULT_READY_PSRD_BYTES,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
         self._name = name
         self._encryptor_names = encryptor_names
+        self._gathered_key_cache = GatheredKeyCache(gathered_key_cache_ttl)
+        if admission_controller is None:
+            admission_controller = AdmissionController(name)
+        self._admission_controller = admission_controller
+        self._nr_delivered_keys = 0
         self._peer_hubs = []
         for peer_hub_url in peer_hub_urls:
-            peer_hub = PeerHub(self, peer_hub_url)
+            peer_hub = PeerHub(
+                self, peer_hub_url, authentication_modes, ready_psrd_bytes, transport
+            )
             self._peer_hubs.append(peer_hub)
 
     @property
@@ -53,6 +92,24 @@ class Client:
         """
         return self._encryptor_names
 
+    @property
+    def is_ready(self) -> bool:
+        """
+        Check whether the client is ready to deliver keys: all peer hubs are ready (registered, and
+        their pools filled with the initial PSRD).
+        """
+        return all(peer_hub.is_ready for peer_hub in self._peer_hubs)
+
+    def to_mgmt_ready(self) -> dict:
+        """
+        Get the management readiness status.
+        """
+        return {
+            "name": self._name,
+            "ready": self.is_ready,
+            "peer_hubs": [peer_hub.to_mgmt_ready() for peer_hub in self._peer_hubs],
+        }
+
     def to_mgmt(self):
         """
         Get the management status.
@@ -62,8 +119,67 @@ class Client:
             "name": self._name,
             "encryptor_names": self._encryptor_names,
             "peer_hubs": peer_hubs_status,
+            "crypto_executor": CRYPTO_EXECUTOR.to_mgmt(),
+            "psrd_generator": PSRD_GENERATOR.to_mgmt(),
+            "event_loop": EVENT_LOOP_MONITOR.to_mgmt(),
+            "block_reaper": BLOCK_REAPER.to_mgmt(),
+            "gathered_key_cache": self._gathered_key_cache.to_mgmt(),
+            "admission_control": self._admission_controller.to_mgmt(),
+            "psrd_accounting": self.to_mgmt_psrd_accounting(),
+        }
+
+    def to_mgmt_psrd_accounting(self) -> dict:
+        """
+        Get the PSRD consumption (from the pools of all peer hubs) per key delivered to an
+        encryptor, in total and for message authentication only.
+        """
+        nr_consumed_bytes = 0
+        nr_authentication_bytes = 0
+        for peer_hub in self._peer_hubs:
+            nr_consumed_bytes += peer_hub.local_pool.nr_consumed_bytes
+            nr_consumed_bytes += peer_hub.peer_pool.nr_consumed_bytes
+            nr_authentication_bytes += peer_hub.authenticator.to_mgmt()["nr_psrd_bytes"]
+        nr_keys = self._nr_delivered_keys
+        return {
+            "nr_delivered_keys": nr_keys,
+            "nr_consumed_psrd_bytes": nr_consumed_bytes,
+            "nr_authentication_psrd_bytes": nr_authentication_bytes,
+            "nr_psrd_bytes_per_key": nr_consumed_bytes / nr_keys if nr_keys else None,
+            "nr_authentication_psrd_bytes_per_key": (
+                nr_authentication_bytes / nr_keys if nr_keys else None
+            ),
+        }
+
+    def to_mgmt_summary(self):
+        """
+        Get a summary of the management status: aggregate counts per pool instead of the details
+        of every block. This is cheap enough to be polled frequently.
+        """
+        return {
+            "name": self._name,
+            "encryptor_names": self._encryptor_names,
+            "peer_hubs": [peer_hub.to_mgmt_summary() for peer_hub in self._peer_hubs],
+            "crypto_executor": CRYPTO_EXECUTOR.to_mgmt(),
+            "psrd_generator": PSRD_GENERATOR.to_mgmt(),
+            "event_loop": EVENT_LOOP_MONITOR.to_mgmt(),
+            "block_reaper": BLOCK_REAPER.to_mgmt(),
+            "admission_control": self._admission_controller.to_mgmt(),
+            "psrd_accounting": self.to_mgmt_psrd_accounting(),
         }
 
+    def to_mgmt_blocks_page(
+        self, hub_name: str, pool_owner_str: str, cursor: int | None, limit: int
+    ) -> dict:
+        """
+        Get the management status for one page of the blocks in the pool for a peer hub.
+        """
+        pool_owner = Pool.Owner.from_str(pool_owner_str)
+        for peer_hub in self._peer_hubs:
+            if peer_hub.local_pool.name == hub_name:
+                return peer_hub.pool(pool_owner).to_mgmt_blocks_page(cursor, limit)
+        LOGGER.warning(f"Peer hub '{hub_name}' not found")
+        raise exceptions.HubNotKnownError(hub_name)
+
     async def etsi_status(self, master_sae_id: str, slave_sae_id: str):
         """
         ETSI QKD 014 V1.1.1 Status API.
@@ -106,8 +222,12 @@ class Client:
                 size, self._min_key_size_in_bits, self._max_key_size_in_bits
             )
         size_in_bytes = size // 8
-        key = UserKey.create_random_key(size_in_bytes)
-        await self.scatter_key_amongst_peer_hubs(master_sae_id, slave_sae_id, key)
+        async with self._admission_controller.admit(master_sae_id):
+            self.check_enough_peer_hubs_with_psrd(size_in_bytes)
+            key = await UserKey.create_random_key(size_in_bytes)
+            await self.scatter_key_amongst_peer_hubs(master_sae_id, slave_sae_id, key)
+        _ENC_KEYS_DELIVERED.inc()
+        self._nr_delivered_keys += 1
         return {
             "keys": {
                 "key_ID": key.key_id,
@@ -125,7 +245,17 @@ class Client:
             key_id = UUID(key_id)
         except ValueError as exc:
             raise exceptions.InvalidKeyIDError(key_id) from exc
-        key = await self.gather_key_from_peer_hubs(master_sae_id, slave_sae_id, key_id)
+        async with self._admission_controller.admit(slave_sae_id):
+            key = await self._gathered_key_cache.get(
+                key_id,
+                master_sae_id,
+                slave_sae_id,
+                lambda: self.gather_key_from_peer_hubs(
+                    master_sae_id, slave_sae_id, key_id
+                ),
+            )
+        _DEC_KEYS_DELIVERED.inc()
+        self._nr_delivered_keys += 1
         return {
             "keys": [
                 {
@@ -135,6 +265,22 @@ class Client:
             ]
         }
 
+    def check_enough_peer_hubs_with_psrd(self, share_size: int) -> None:
+        """
+        Reject a request up front if fewer than the minimum number of peer hubs have enough PSRD for
+        it (see PeerHub.has_psrd_for_request), rather than failing halfway through scattering or
+        gathering the key shares.
+        """
+        nr_peer_hubs_with_psrd = sum(
+            1
+            for peer_hub in self._peer_hubs
+            if peer_hub.has_psrd_for_request(share_size)
+        )
+        if nr_peer_hubs_with_psrd < _MIN_NR_SHARES:
+            self._admission_controller.reject_no_psrd(
+                nr_peer_hubs_with_psrd, _MIN_NR_SHARES
+            )
+
     def start_all_peer_hubs(self) -> None:
         """
         Start all peer hubs.
@@ -142,6 +288,13 @@ class Client:
         for peer_hub in self._peer_hubs:
             peer_hub.start_register_task()
 
+    def stop_all_peer_hubs(self) -> None:
+        """
+        Stop the background tasks of all peer hubs.
+        """
+        for peer_hub in self._peer_hubs:
+            peer_hub.stop()
+
     async def scatter_key_amongst_peer_hubs(
         self,
         master_sae_id: str,
@@ -151,31 +304,34 @@ class Client:
         """
         Split the key into key shares, and send each key share to a peer hub.
         """
-        nr_shares = len(self._peer_hubs)
-        shares = key.split_into_shares(
-            master_sae_id, slave_sae_id, nr_shares, _MIN_NR_SHARES
-        )
-        assert len(shares) == nr_shares
-        coroutines = [
-            peer_hub.post_share(master_sae_id, slave_sae_id, share)
-            for peer_hub, share in zip(self._peer_hubs, shares)
-        ]
-        results = await asyncio.gather(*coroutines, return_exceptions=True)
-        success_results = [
-            result for result in results if not isinstance(result, Exception)
-        ]
-        nr_shares_successfully_scattered = len(success_results)
-        LOGGER.info(
-            f"Successfully scattered {nr_shares_successfully_scattered} out of {nr_shares} shares "
-            f"for key ID {key.key_id}"
-        )
-        if nr_shares_successfully_scattered < _MIN_NR_SHARES:
-            causes = [
-                str(result) for result in results if isinstance(result, Exception)
+        with TRACER.span("scatter key", key_id=str(key.key_id)):
+            nr_shares = len(self._peer_hubs)
+            shares = await key.split_into_shares(
+                master_sae_id, slave_sae_id, nr_shares, _MIN_NR_SHARES
+            )
+            assert len(shares) == nr_shares
+            coroutines = [
+                peer_hub.post_share(master_sae_id, slave_sae_id, share)
+                for peer_hub, share in zip(self._peer_hubs, shares)
             ]
-            raise exceptions.CouldNotScatterEnoughSharesError(
-                key.key_id, nr_shares_successfully_scattered, _MIN_NR_SHARES, causes
+            results = await asyncio.gather(*coroutines, return_exceptions=True)
+            success_results = [
+                result for result in results if not isinstance(result, Exception)
+            ]
+            nr_shares_successfully_scattered = len(success_results)
+            KEY_LOGGER.info(
+                "Successfully scattered %s out of %s shares for key ID %s",
+                nr_shares_successfully_scattered,
+                nr_shares,
+                key.key_id,
             )
+            if nr_shares_successfully_scattered < _MIN_NR_SHARES:
+                causes = [
+                    str(result) for result in results if isinstance(result, Exception)
+                ]
+                raise exceptions.CouldNotScatterEnoughSharesError(
+                    key.key_id, nr_shares_successfully_scattered, _MIN_NR_SHARES, causes
+                )
 
     async def gather_key_from_peer_hubs(
         self,
@@ -185,34 +341,63 @@ class Client:
     ) -> UserKey:
         """
         Gather key shares from the peer hubs, and reconstruct the key out of (a subset of)
-        the key shares.
+        the key shares. Bad key shares are excluded, as long as enough good key shares remain.
         """
-        nr_shares_attempted_to_gather = len(self._peer_hubs)
-        coroutines = [
-            peer_hub.get_share(master_sae_id, slave_sae_id, key_id)
-            for peer_hub in self._peer_hubs
-        ]
-        results = await asyncio.gather(*coroutines, return_exceptions=True)
-        shares = [result for result in results if not isinstance(result, Exception)]
-        nr_shares_successfully_gathered = len(shares)
-        LOGGER.info(
-            f"Successfully gathered {nr_shares_successfully_gathered} shares "
-            f"out of {nr_shares_attempted_to_gather} attempted "
-            f"for key ID {key_id}"
-        )
-        if nr_shares_successfully_gathered < _MIN_NR_SHARES:
-            causes = [
-                str(result) for result in results if isinstance(result, Exception)
+        with TRACER.span("gather key", key_id=str(key_id)):
+            # The shares are encrypted by the peer hubs, so only signing keys are needed here.
+            self.check_enough_peer_hubs_with_psrd(0)
+            nr_shares_attempted_to_gather = len(self._peer_hubs)
+            coroutines = [
+                peer_hub.get_share(master_sae_id, slave_sae_id, key_id)
+                for peer_hub in self._peer_hubs
             ]
-            raise exceptions.CouldNotGatherEnoughSharesError(
-                key_id, nr_shares_successfully_gathered, _MIN_NR_SHARES, causes
+            results = await asyncio.gather(*coroutines, return_exceptions=True)
+            peer_hubs_and_shares = [
+                (peer_hub, result)
+                for peer_hub, result in zip(self._peer_hubs, results)
+                if not isinstance(result, Exception)
+            ]
+            shares = [share for (_peer_hub, share) in peer_hubs_and_shares]
+            nr_shares_successfully_gathered = len(shares)
+            KEY_LOGGER.info(
+                "Successfully gathered %s shares out of %s attempted for key ID %s",
+                nr_shares_successfully_gathered,
+                nr_shares_attempted_to_gather,
+                key_id,
             )
+            if nr_shares_successfully_gathered < _MIN_NR_SHARES:
+                causes = [
+                    str(result) for result in results if isinstance(result, Exception)
+                ]
+                raise exceptions.CouldNotGatherEnoughSharesError(
+                    key_id, nr_shares_successfully_gathered, _MIN_NR_SHARES, causes
+                )
+            return await self._reconstruct_key(key_id, peer_hubs_and_shares)
+
+    async def _reconstruct_key(
+        self, key_id: UUID, peer_hubs_and_shares: list[tuple[PeerHub, Share]]
+    ) -> UserKey:
+        """
+        Reconstruct the key out of the gathered key shares, excluding bad key shares (and recording
+        them against the peer hub that the key share was gathered from).
+        """
+        shares = [share for (_peer_hub, share) in peer_hubs_and_shares]
         shamir_input = [(share.share_index, share.value) for share in shares]
         try:
-            key_value = shamir.reconstruct_binary_secret_from_shares(
-                _MIN_NR_SHARES, shamir_input
-            )
+            with TRACER.span("reconstruct key", nr_shares=len(shares)) as span:
+                key_value, bad_share_positions = await CRYPTO_EXECUTOR.run(
+                    shares[0].size,
+                    shamir.reconstruct_binary_secret_excluding_bad_shares,
+                    _MIN_NR_SHARES,
+                    shamir_input,
+                    cpu_bound=True,
+                )
+                if span is not None:
+                    span.attributes["nr_bad_shares"] = len(bad_share_positions)
         except ValueError as exc:
             raise exceptions.ShamirReconstructError(key_id, str(exc)) from exc
+        for position in bad_share_positions:
+            peer_hub, _share = peer_hubs_and_shares[position]
+            peer_hub.record_bad_share(key_id)
         key = UserKey(key_id, key_value)
         return key
@@ -0,0 +1,129 @@
+"""
+De-duplication of concurrent and repeated gathers of the same key.
+"""
+
+import asyncio
+import collections
+import functools
+from typing import Awaitable, Callable
+from uuid import UUID
+from common.metrics import REGISTRY
+from common.user_key import UserKey
+
+DEFAULT_TTL = 5.0
+"""
+How many seconds a gathered key is kept in the cache.
+"""
+
+DEFAULT_MAX_NR_ENTRIES = 1000
+"""
+The maximum number of gathered keys in the cache.
+"""
+
+_GATHER_REQUESTS = REGISTRY.counter(
+    "dske_client_gather_requests_total",
+    "Requests to gather a key, by whether they were served from the cache (hit), joined a gather "
+    "that was already in flight (coalesced), or started a new gather (miss)",
+    ("result",),
+)
+_HITS = _GATHER_REQUESTS.labels("hit")
+_COALESCED = _GATHER_REQUESTS.labels("coalesced")
+_MISSES = _GATHER_REQUESTS.labels("miss")
+
+_CacheKey = tuple[UUID, str, str]  # (key ID, master SAE ID, slave SAE ID)
+
+
+class GatheredKeyCache:
+    """
+    Single-flight de-duplication and a short-lived cache for gathering keys from the peer hubs.
+
+    Concurrent requests for the same key share one gather, and a request that is repeated shortly
+    after a successful gather (e.g. a retry) is served from the cache without contacting the hubs.
+    Both are keyed by the key ID as well as the master and slave SAE IDs, so a gather that was
+    started by one encryptor is never shared with another encryptor. Failed gathers are not cached.
+
+    Each cached key is removed by its own event loop timer when its time to live has passed, so
+    keys don't stay in memory when no more requests arrive.
+    """
+
+    _ttl: float
+    _max_nr_entries: int
+    _in_flight: dict[_CacheKey, asyncio.Task]
+    # The expiry timer and the key, oldest first
+    _cache: collections.OrderedDict[_CacheKey, tuple[asyncio.TimerHandle, UserKey]]
+    _nr_hits: int
+    _nr_coalesced: int
+    _nr_misses: int
+
+    def __init__(
+        self, ttl: float = DEFAULT_TTL, max_nr_entries: int = DEFAULT_MAX_NR_ENTRIES
+    ):
+        assert ttl >= 0
+        assert max_nr_entries >= 0
+        self._ttl = ttl
+        self._max_nr_entries = max_nr_entries
+        self._in_flight = {}
+        self._cache = collections.OrderedDict()
+        self._nr_hits = 0
+        self._nr_coalesced = 0
+        self._nr_misses = 0
+
+    async def get(
+        self,
+        key_id: UUID,
+        master_sae_id: str,
+        slave_sae_id: str,
+        gather: Callable[[], Awaitable[UserKey]],
+    ) -> UserKey:
+        """
+        Get a key: from the cache, by joining a gather that is in flight, or by calling `gather`.
+        """
+        cache_key = (key_id, master_sae_id, slave_sae_id)
+        entry = self._cache.get(cache_key)
+        if entry is not None:
+            self._nr_hits += 1
+            _HITS.inc()
+            return entry[1]
+        task = self._in_flight.get(cache_key)
+        if task is None:
+            self._nr_misses += 1
+            _MISSES.inc()
+            task = asyncio.create_task(gather())
+            task.add_done_callback(functools.partial(self._gather_done, cache_key))
+            self._in_flight[cache_key] = task
+        else:
+            self._nr_coalesced += 1
+            _COALESCED.inc()
+        # If this request is cancelled, the gather continues for the other requests.
+        return await asyncio.shield(task)
+
+    def _gather_done(self, cache_key: _CacheKey, task: asyncio.Task) -> None:
+        del self._in_flight[cache_key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        if self._ttl > 0 and self._max_nr_entries > 0:
+            self._remove(cache_key)
+            timer = asyncio.get_running_loop().call_later(
+                self._ttl, self._remove, cache_key
+            )
+            self._cache[cache_key] = (timer, task.result())
+            while len(self._cache) > self._max_nr_entries:
+                self._remove(next(iter(self._cache)))
+
+    def _remove(self, cache_key: _CacheKey) -> None:
+        entry = self._cache.pop(cache_key, None)
+        if entry is not None:
+            entry[0].cancel()
+
+    def to_mgmt(self) -> dict:
+        """
+        Get the management status.
+        """
+        return {
+            "ttl": self._ttl,
+            "nr_cached_keys": len(self._cache),
+            "nr_in_flight": len(self._in_flight),
+            "nr_hits": self._nr_hits,
+            "nr_coalesced": self._nr_coalesced,
+            "nr_misses": self._nr_misses,
+        }
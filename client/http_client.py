@@ -1,23 +1,24 @@
 """
-HTTP client for issuing HTTP requests and decoding the response using Pydantic.
+HTTP client for issuing HTTP requests and decoding the response using the codec.
 """
 
 import httpx
 import pydantic
+from common import codec
 from common import exceptions
-from common.allocation import Allocation
 from common.exceptions import InvalidSignatureError
-from common.logging import LOGGER
-from common.signature import Signature
-from common.signing_key import SigningKey
-from common.pool import Pool
+from common.logging import HTTP_LOGGER
+from common.signature import SIGNATURE_FAILURES, Signature
+from common.authenticator import Authenticator
+from common import tracing
+from common.tracing import TRACER
 
 
 class HttpClient:
     """
     An asynchronous HTTP client that:
       - Uses httpx to make requests.
-      - Uses Pydantic to encode/decode request/response data.
+      - Uses the codec to encode/decode request/response data.
       - Takes care of request authentication using a signing key from a pool.
     """
 
@@ -27,17 +28,21 @@ class HttpClient:
 
     class Auth(httpx.Auth):
         """
-        An httpx Auth class that uses a signing key from a pool to sign requests and to validate
-        signatures on responses.
+        An httpx Auth class that uses an authenticator to sign requests (with a key from the local
+        pool) and to validate signatures on responses (with a key from the peer pool).
         """
 
-        def __init__(self, local_pool, peer_pool):
-            self._local_pool = local_pool
-            self._peer_pool = peer_pool
+        def __init__(self, authenticator: Authenticator):
+            self._authenticator = authenticator
+            self._signature_failures_metric = SIGNATURE_FAILURES.labels(
+                authenticator.peer_name
+            )
 
         async def async_auth_flow(self, request):
-            signing_key = SigningKey.from_pool(self._local_pool)
-            signature = signing_key.sign([request.url.query, request.content])
+            signing_key = self._authenticator.signing_key()
+            signature = await signing_key.sign_async(
+                [request.url.query, request.content]
+            )
             signature.add_to_headers(request.headers)
             response = yield request
             received_signature = Signature.from_headers(response.headers)
@@ -45,24 +50,37 @@ class HttpClient:
                 # If the signature is missing on an error response, keep the original error response
                 # instead of raising an InvalidSignatureError which wipes out any useful error info.
                 if response.status_code < 400:
+                    self._signature_failures_metric.inc()
                     raise InvalidSignatureError()
                 return
-            allocation = Allocation.from_enc_str(
-                received_signature.signing_key_allocation_enc_str, self._peer_pool
-            )
-            signing_key = SigningKey(allocation)
+            # The signing key stays consumed even if the signature is invalid (see
+            # PeerClient.check_request_signature in the hub). Only the response content is read
+            # before taking the key.
             await response.aread()
             content = response.content
-            computed_signature = signing_key.sign([content])
-            signature_ok = received_signature.same_as(computed_signature)
-            if not signature_ok:
-                # TODO: Give allocation back to pool
-                raise InvalidSignatureError()
+            with TRACER.span("check response signature"):
+                try:
+                    signing_key = self._authenticator.verification_key(
+                        received_signature
+                    )
+                except InvalidSignatureError:
+                    self._signature_failures_metric.inc()
+                    raise
+                computed_signature = await signing_key.sign_async([content])
+                signature_ok = received_signature.same_as(computed_signature)
+                if not signature_ok:
+                    self._signature_failures_metric.inc()
+                    raise InvalidSignatureError()
 
-    def __init__(self, local_pool: Pool, peer_pool: Pool):
+    def __init__(
+        self,
+        authenticator: Authenticator,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
         super().__init__()
-        self._httpx_client = httpx.AsyncClient()
-        self._auth = self.Auth(local_pool, peer_pool)
+        # The transport is only set for an in-process topology (see in_process.topology).
+        self._httpx_client = httpx.AsyncClient(transport=transport)
+        self._auth = self.Auth(authenticator)
 
     async def get(
         self,
@@ -74,14 +92,26 @@ class HttpClient:
         """
         Send a HTTP GET request return the parsed response (if any).
         """
+        with TRACER.span("http GET", url=url):
+            return await self._get(url, params, api_response_class, authentication)
+
+    async def _get(
+        self,
+        url: str,
+        params: str,
+        api_response_class: APIClass | None,
+        authentication: bool,
+    ) -> APIObject | None:
         if authentication:
             auth = self._auth
         else:
             auth = None
         try:
-            response = await self._httpx_client.get(url, params=params, auth=auth)
+            response = await self._httpx_client.get(
+                url, params=params, headers=tracing.propagation_headers(), auth=auth
+            )
         except httpx.HTTPError as exc:
-            LOGGER.error(f"Call GET {exc.request.url} exception {str(exc)}")
+            HTTP_LOGGER.error("Call GET %s exception %s", exc.request.url, exc)
             raise exceptions.HTTPError(
                 method="GET",
                 url=url,
@@ -90,7 +120,9 @@ class HttpClient:
                 exception=str(exc),
             ) from exc
         if response.status_code != 200:
-            LOGGER.error(f"Call GET {response.request.url} {response.status_code}")
+            HTTP_LOGGER.error(
+                "Call GET %s %s", response.request.url, response.status_code
+            )
             raise exceptions.HTTPError(
                 method="GET",
                 url=url,
@@ -99,12 +131,12 @@ class HttpClient:
                 status_code=response.status_code,
                 response=response.content,
             )
-        LOGGER.info(f"Call GET {response.request.url} {response.status_code}")
+        HTTP_LOGGER.info("Call GET %s %s", response.request.url, response.status_code)
         if api_response_class is None:
             return None
         try:
-            obj = api_response_class.model_validate(response.json())
-        except pydantic.ValidationError as exc:
+            obj = codec.decode(response.content, api_response_class)
+        except ValueError as exc:
             raise exceptions.HTTPError(
                 method="GET",
                 url=url,
@@ -151,52 +183,75 @@ class HttpClient:
         authentication: bool = False,
     ) -> APIObject:
         """
-        Send a HTTP PUT or POST request. Use Pydantic to encode the request data and to decode the
+        Send a HTTP PUT or POST request. Use the codec to encode the request data and to decode the
         response data.
         """
-        async with httpx.AsyncClient() as httpx_client:
-            json = api_request_obj.model_dump()
-            if authentication:
-                auth = self._auth
-            else:
-                auth = None
-            try:
-                response = await httpx_client.request(method, url, json=json, auth=auth)
-            except httpx.HTTPError as exc:
-                LOGGER.error(f"Call {method} {url} exception {str(exc)}")
-                raise exceptions.HTTPError(
-                    method=method,
-                    url=url,
-                    reason="Exception raised",
-                    data=api_request_obj,
-                    exception=str(exc),
-                ) from exc
-            if response.status_code != 200:
-                message = ""
-                try:
-                    message = " " + response.json().get("message")
-                except Exception:  # pylint: disable=broad-except
-                    pass
-                LOGGER.error(f"Call {method} {url} {response.status_code}{message}")
-                raise exceptions.HTTPError(
-                    method=method,
-                    url=url,
-                    reason="Status code not OK",
-                    data=api_request_obj,
-                    status_code=response.status_code,
-                    response=response.content,
-                )
-            LOGGER.info(f"Call {method} {url} {response.status_code}")
-            if api_response_class is None:
-                return None
+        with TRACER.span(f"http {method}", url=url):
+            return await self._send(
+                method, url, api_request_obj, api_response_class, authentication
+            )
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        api_request_obj: APIObject,
+        api_response_class: APIClass | None,
+        authentication: bool,
+    ) -> APIObject:
+        content = codec.encode(api_request_obj)
+        if authentication:
+            auth = self._auth
+        else:
+            auth = None
+        try:
+            response = await self._httpx_client.request(
+                method,
+                url,
+                content=content,
+                headers={
+                    "Content-Type": codec.MEDIA_TYPE,
+                    **tracing.propagation_headers(),
+                },
+                auth=auth,
+            )
+        except httpx.HTTPError as exc:
+            HTTP_LOGGER.error("Call %s %s exception %s", method, url, exc)
+            raise exceptions.HTTPError(
+                method=method,
+                url=url,
+                reason="Exception raised",
+                data=api_request_obj,
+                exception=str(exc),
+            ) from exc
+        if response.status_code != 200:
+            message = ""
             try:
-                obj = api_response_class.model_validate(response.json())
-            except pydantic.ValidationError as exc:
-                raise exceptions.HTTPError(
-                    method=method,
-                    url=url,
-                    reason="Response validation error",
-                    data=api_request_obj,
-                    exception=str(exc),
-                ) from exc
-            return obj
+                message = " " + response.json().get("message")
+            except Exception:  # pylint: disable=broad-except
+                pass
+            HTTP_LOGGER.error(
+                "Call %s %s %s%s", method, url, response.status_code, message
+            )
+            raise exceptions.HTTPError(
+                method=method,
+                url=url,
+                reason="Status code not OK",
+                data=api_request_obj,
+                status_code=response.status_code,
+                response=response.content,
+            )
+        HTTP_LOGGER.info("Call %s %s %s", method, url, response.status_code)
+        if api_response_class is None:
+            return None
+        try:
+            obj = codec.decode(response.content, api_response_class)
+        except ValueError as exc:
+            raise exceptions.HTTPError(
+                method=method,
+                url=url,
+                reason="Response validation error",
+                data=api_request_obj,
+                exception=str(exc),
+            ) from exc
+        return obj
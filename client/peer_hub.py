@@ -3,19 +3,26 @@ A peer hub.
 """
 
 import asyncio
+import time
+from typing import assert_never
 from uuid import UUID
+import httpx
 from common import exceptions
-from common.allocation import Allocation
+from common.allocation import Allocation, AllocationTransaction
+from common.authenticator import AUTHENTICATION_MODES, HMAC_SHA256, Authenticator
 from common.block import APIBlock, Block
+from common.crypto_executor import CRYPTO_EXECUTOR
 from common.encryption_key import EncryptionKey
-from common.logging import LOGGER
-from common.pool import Pool
+from common.logging import KEY_LOGGER, LOGGER
+from common.metrics import REGISTRY, CounterChild, HistogramChild
+from common.pool import MESSAGE_SIGNING_KEY, SHARE_ENCRYPTION_KEY, Pool
 from common.registration_api import (
     APIPutRegistrationRequest,
     APIPutRegistrationResponse,
 )
 from common.share import Share
 from common.share_api import APIPostShareRequest, APIGetShareResponse
+from common.tracing import TRACER
 from common.utils import bytes_to_str, str_to_bytes
 from .http_client import HttpClient
 
@@ -33,7 +40,8 @@ threshold.
 STOP_REQUEST_PSRD_THRESHOLD = 2000
 """
 Stop requesting more PSRD blocks from the hub when the amount of PSRD in the pool rises above or
-equal to this threshold.
+equal to this threshold (or above or equal to the amount that is needed for a request that was
+rejected for lack of PSRD, if that is more).
 """
 
 GET_PSRD_BLOCK_SIZE = 2000
@@ -41,11 +49,51 @@ GET_PSRD_BLOCK_SIZE = 2000
 When requesting more PSRD blocks from the hub, request blocks of this size.
 """
 
+DEFAULT_READY_PSRD_BYTES = STOP_REQUEST_PSRD_THRESHOLD
+"""
+By default, the peer hub is ready once the client is registered with it and both pools hold at
+least this many unused bytes of PSRD.
+"""
+
 _GET_PSRD_RETRY_DELAY = 1.0
 """
 If a get PSRD request to the hub fails, wait this many seconds before retrying.
 """
 
+_MIN_REGISTER_RETRY_DELAY = 0.1
+"""
+If a registration request to the hub fails, wait this many seconds before retrying. The delay
+doubles after each failure, up to _GET_PSRD_RETRY_DELAY, so that a client that is started at the
+same time as its hubs registers soon after the hubs are up.
+"""
+
+
+_SHARES_POSTED = REGISTRY.counter(
+    "dske_client_shares_posted_total",
+    "Key shares successfully posted to a peer hub",
+    ("hub",),
+)
+_SHARES_FETCHED = REGISTRY.counter(
+    "dske_client_shares_fetched_total",
+    "Key shares successfully fetched from a peer hub",
+    ("hub",),
+)
+_SHARE_FAILURES = REGISTRY.counter(
+    "dske_client_share_failures_total",
+    "Key share requests to a peer hub that failed",
+    ("hub", "operation"),
+)
+_BAD_SHARES = REGISTRY.counter(
+    "dske_client_bad_shares_total",
+    "Key shares fetched from a peer hub that were excluded from key reconstruction as bad",
+    ("hub",),
+)
+_HUB_REQUEST_DURATION = REGISTRY.histogram(
+    "dske_client_hub_request_duration_seconds",
+    "Duration of key share requests to a peer hub (including encryption and signing)",
+    ("hub", "operation"),
+)
+
 
 class PeerHub:
     """
@@ -54,29 +102,76 @@ class PeerHub:
 
     _client: "Client"  # type: ignore
     _http_client: HttpClient
-    _base_url: str
+    _hub_url: str
+    _base_url: (
+        str  # The hub URL, or the worker URL for a multi-worker hub (once registered)
+    )
     _registered: bool
+    _ready: bool  # Once ready, the peer hub stays ready
+    _ready_psrd_bytes: int
     _local_pool: Pool
     _peer_pool: Pool
+    _authentication_modes: list[str]  # Offered to the hub at registration
+    _authenticator: Authenticator
     _register_task: asyncio.Task | None = None
     _local_pool_request_psrd_task: asyncio.Task | None = None
     _peer_pool_request_psrd_task: asyncio.Task | None = None
+    _local_pool_request_psrd_target: (
+        int  # Request PSRD until this many bytes are unused
+    )
+    _peer_pool_request_psrd_target: int  # Request PSRD until this many bytes are unused
     _hub_name: None | str  # Set after registration
+    _shares_posted_metric: CounterChild
+    _shares_fetched_metric: CounterChild
+    _post_share_failures_metric: CounterChild
+    _get_share_failures_metric: CounterChild
+    _post_share_duration_metric: HistogramChild
+    _get_share_duration_metric: HistogramChild
 
-    def __init__(self, client, base_url):
+    def __init__(
+        self,
+        client,
+        base_url,
+        authentication_modes: list[str] | None = None,
+        ready_psrd_bytes: int = DEFAULT_READY_PSRD_BYTES,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
         self._client = client
-        self._base_url = base_url
-        if self._base_url.endswith("/"):
-            self._base_url = self._base_url[:-1]
+        self._hub_url = base_url
+        if self._hub_url.endswith("/"):
+            self._hub_url = self._hub_url[:-1]
+        self._base_url = self._hub_url
         self._registered = False
+        self._ready = False
+        self._ready_psrd_bytes = ready_psrd_bytes
         hub_name = base_url.split("/")[-1]
         self._local_pool = Pool(hub_name, Pool.Owner.LOCAL)
         self._peer_pool = Pool(hub_name, Pool.Owner.PEER)
+        if authentication_modes is None:
+            authentication_modes = AUTHENTICATION_MODES
+        self._authentication_modes = authentication_modes
+        # The authentication mode is set when it has been negotiated at registration.
+        self._authenticator = Authenticator(
+            HMAC_SHA256, self._local_pool, self._peer_pool
+        )
         self._register_task = None
         self._local_pool_request_psrd_task = None
         self._peer_pool_request_psrd_task = None
+        self._local_pool_request_psrd_target = STOP_REQUEST_PSRD_THRESHOLD
+        self._peer_pool_request_psrd_target = STOP_REQUEST_PSRD_THRESHOLD
         self._hub_name = None
-        self._http_client = HttpClient(self._local_pool, self._peer_pool)
+        self._http_client = HttpClient(self._authenticator, transport)
+        self._shares_posted_metric = _SHARES_POSTED.labels(hub_name)
+        self._shares_fetched_metric = _SHARES_FETCHED.labels(hub_name)
+        self._post_share_failures_metric = _SHARE_FAILURES.labels(hub_name, "post")
+        self._get_share_failures_metric = _SHARE_FAILURES.labels(hub_name, "get")
+        self._bad_shares_metric = _BAD_SHARES.labels(hub_name)
+        self._post_share_duration_metric = _HUB_REQUEST_DURATION.labels(
+            hub_name, "post_share"
+        )
+        self._get_share_duration_metric = _HUB_REQUEST_DURATION.labels(
+            hub_name, "get_share"
+        )
 
     @property
     def local_pool(self) -> Pool:
@@ -92,6 +187,38 @@ class PeerHub:
         """
         return self._peer_pool
 
+    @property
+    def authenticator(self) -> Authenticator:
+        """
+        Get the authenticator for the messages exchanged with the peer hub.
+        """
+        return self._authenticator
+
+    @property
+    def is_ready(self) -> bool:
+        """
+        Check whether the peer hub is ready: the client has registered with it, and both pools have
+        been filled with the initial PSRD (at least the ready PSRD bytes). Once the peer hub is
+        ready, it stays ready (even if the pools are drained later).
+        """
+        if not self._ready:
+            self._ready = (
+                self._registered
+                and self._local_pool.nr_unused_bytes >= self._ready_psrd_bytes
+                and self._peer_pool.nr_unused_bytes >= self._ready_psrd_bytes
+            )
+        return self._ready
+
+    def to_mgmt_ready(self) -> dict:
+        """
+        Get the management readiness status.
+        """
+        return {
+            "hub_name": self._hub_name,
+            "registered": self._registered,
+            "ready": self.is_ready,
+        }
+
     def to_mgmt(self) -> dict:
         """
         Get the management status.
@@ -99,10 +226,66 @@ class PeerHub:
         return {
             "hub_name": self._hub_name,
             "registered": self._registered,
+            "ready": self.is_ready,
+            "authentication": self._authenticator.to_mgmt(),
             "local_pool": self._local_pool.to_mgmt(),
             "peer_pool": self._peer_pool.to_mgmt(),
         }
 
+    def to_mgmt_summary(self) -> dict:
+        """
+        Get a summary of the management status.
+        """
+        return {
+            "hub_name": self._hub_name,
+            "registered": self._registered,
+            "ready": self.is_ready,
+            "local_pool": self._local_pool.to_mgmt_summary(),
+            "peer_pool": self._peer_pool.to_mgmt_summary(),
+        }
+
+    def pool(self, pool_owner: Pool.Owner) -> Pool:
+        """
+        Get the pool with the given owner.
+        """
+        match pool_owner:
+            case Pool.Owner.LOCAL:
+                return self._local_pool
+            case Pool.Owner.PEER:
+                return self._peer_pool
+            case _:
+                assert_never("Invalid pool owner")
+
+    def has_psrd_for_request(self, share_size: int) -> bool:
+        """
+        Check whether the peer hub is registered and its pools have enough unused PSRD for a
+        request: a signing key (and an encryption key for a share of `share_size` bytes, if not
+        zero) from the local pool, and a key to verify the response from the peer pool. If not,
+        start requesting at least as much PSRD as the request needs, so that a retry of the request
+        can succeed (even if the pool is above the start request PSRD threshold, or if the request
+        needs more than the stop request PSRD threshold).
+        """
+        if not self._registered:
+            return False
+        local_purpose = SHARE_ENCRYPTION_KEY if share_size > 0 else MESSAGE_SIGNING_KEY
+        # The number of unused bytes needed includes the reserve for the purpose (see
+        # DEFAULT_RESERVED_BYTES), which can be more than the start request PSRD threshold.
+        nr_local_bytes_needed = self._local_pool.nr_bytes_needed(
+            share_size + self._authenticator.nr_signing_bytes_needed(), local_purpose
+        )
+        nr_peer_bytes_needed = self._peer_pool.nr_bytes_needed(
+            self._authenticator.nr_verification_bytes_needed(), MESSAGE_SIGNING_KEY
+        )
+        if (
+            self._local_pool.nr_unused_bytes >= nr_local_bytes_needed
+            and self._peer_pool.nr_unused_bytes >= nr_peer_bytes_needed
+        ):
+            return True
+        self.start_request_psrd_task_if_needed(
+            nr_local_bytes_needed, nr_peer_bytes_needed
+        )
+        return False
+
     def start_register_task(self) -> None:
         """
         Create a register task, running in the background, for the peer hub.
@@ -110,22 +293,39 @@ class PeerHub:
         assert self._register_task is None
         self._register_task = asyncio.create_task(self.register_task())
 
+    def stop(self) -> None:
+        """
+        Cancel the register task and the request PSRD tasks (if they are running).
+        """
+        for task in [
+            self._register_task,
+            self._local_pool_request_psrd_task,
+            self._peer_pool_request_psrd_task,
+        ]:
+            if task is not None:
+                task.cancel()
+
     async def register_task(self) -> None:
         """
         Task to register this client with the hub (periodically retrying if it fails). Once
-        registered, it starts the request PSRD task.
+        registered, it starts the request PSRD tasks, which fill both pools with at least the ready
+        PSRD bytes.
         """
         task_name = f"register task for peer hub {self._hub_name}"
         LOGGER.info(f"Begin {task_name}")
         try:
+            delay = _MIN_REGISTER_RETRY_DELAY
             while not await self.attempt_registration():
-                await asyncio.sleep(_GET_PSRD_RETRY_DELAY)
+                await asyncio.sleep(delay)
+                delay = min(2 * delay, _GET_PSRD_RETRY_DELAY)
         except asyncio.CancelledError:
             self._register_task = None
             LOGGER.info(f"Cancel {task_name}")
         else:
             LOGGER.info(f"Finish {task_name}")
-            self.start_request_psrd_task_if_needed()
+            self.start_request_psrd_task_if_needed(
+                self._ready_psrd_bytes, self._ready_psrd_bytes
+            )
         finally:
             self._register_task = None
 
@@ -133,9 +333,11 @@ class PeerHub:
         """
         Attempt to register this client with the peer hub. Returns true if successful.
         """
-        url = f"{self._base_url}/dske/oob/v1/registration"
+        url = f"{self._hub_url}/dske/oob/v1/registration"
         data = APIPutRegistrationRequest(
-            client_name=self._client.name, encryptor_names=self._client.encryptor_names
+            client_name=self._client.name,
+            encryptor_names=self._client.encryptor_names,
+            authentication_modes=self._authentication_modes,
         )
         try:
             registration = await self._http_client.put(
@@ -143,28 +345,65 @@ class PeerHub:
             )
         except exceptions.HTTPError:
             LOGGER.error(
-                f"Failed to register client {self._client.name} with peer hub at {self._base_url}"
+                f"Failed to register client {self._client.name} with peer hub at {self._hub_url}"
             )
             return False
         self._hub_name = registration.hub_name
+        self._authenticator.set_mode(registration.authentication_mode)
+        if registration.worker_url is not None:
+            LOGGER.info(
+                f"Peer hub {self._hub_name} assigned worker at {registration.worker_url}"
+            )
+            self._base_url = registration.worker_url
+        else:
+            self._base_url = self._hub_url
         self._registered = True
         return True
 
-    def start_request_psrd_task_if_needed(self) -> None:
+    def start_request_psrd_task_if_needed(
+        self, nr_local_bytes_needed: int = 0, nr_peer_bytes_needed: int = 0
+    ) -> None:
         """
-        Start request PSRD task(s) if needed.
+        Start request PSRD task(s) if needed: if the number of unused bytes in a pool is below the
+        start request PSRD threshold, or below the number of bytes that is needed for a request.
         """
+        self._local_pool_request_psrd_target = max(
+            self._local_pool_request_psrd_target, nr_local_bytes_needed
+        )
+        self._peer_pool_request_psrd_target = max(
+            self._peer_pool_request_psrd_target, nr_peer_bytes_needed
+        )
         if self._local_pool_request_psrd_task is None:
-            if self._local_pool.nr_unused_bytes < START_REQUEST_PSRD_THRESHOLD:
+            nr_unused_bytes = self._local_pool.nr_unused_bytes
+            if (
+                nr_unused_bytes < START_REQUEST_PSRD_THRESHOLD
+                or nr_unused_bytes < nr_local_bytes_needed
+            ):
                 self._local_pool_request_psrd_task = asyncio.create_task(
                     self.request_psrd_task(self._local_pool)
                 )
         if self._peer_pool_request_psrd_task is None:
-            if self._peer_pool.nr_unused_bytes < START_REQUEST_PSRD_THRESHOLD:
+            nr_unused_bytes = self._peer_pool.nr_unused_bytes
+            if (
+                nr_unused_bytes < START_REQUEST_PSRD_THRESHOLD
+                or nr_unused_bytes < nr_peer_bytes_needed
+            ):
                 self._peer_pool_request_psrd_task = asyncio.create_task(
                     self.request_psrd_task(self._peer_pool)
                 )
 
+    def request_psrd_target(self, pool: Pool) -> int:
+        """
+        Get the number of unused bytes in the pool at which the request PSRD task stops.
+        """
+        match pool.owner:
+            case Pool.Owner.LOCAL:
+                return self._local_pool_request_psrd_target
+            case Pool.Owner.PEER:
+                return self._peer_pool_request_psrd_target
+            case _:
+                assert_never("Invalid pool owner")
+
     async def request_psrd_task(self, pool: Pool) -> None:
         """
         Task for requesting Pre-Shared Random Data (PSRD) from the peer hub for a specific pool.
@@ -172,7 +411,7 @@ class PeerHub:
         task_name = f"request PSRD task for peer hub {self._hub_name} and pool owner {pool.owner}"
         LOGGER.info(f"Begin {task_name}")
         try:
-            while pool.nr_unused_bytes < STOP_REQUEST_PSRD_THRESHOLD:
+            while pool.nr_unused_bytes < self.request_psrd_target(pool):
                 if not await self.attempt_request_psrd(pool):
                     await asyncio.sleep(_GET_PSRD_RETRY_DELAY)
         except asyncio.CancelledError:
@@ -183,8 +422,10 @@ class PeerHub:
             match pool.owner:
                 case Pool.Owner.LOCAL:
                     self._local_pool_request_psrd_task = None
+                    self._local_pool_request_psrd_target = STOP_REQUEST_PSRD_THRESHOLD
                 case Pool.Owner.PEER:
                     self._peer_pool_request_psrd_task = None
+                    self._peer_pool_request_psrd_target = STOP_REQUEST_PSRD_THRESHOLD
 
     async def attempt_request_psrd(self, pool: Pool) -> bool:
         """
@@ -220,27 +461,49 @@ class PeerHub:
         """
         Post a key share to the peer hub.
         """
-        try:
-            url = f"{self._base_url}/dske/api/v1/key-share"
-            encryption_key = EncryptionKey.from_pool(self._local_pool, share.size)
-            request = APIPostShareRequest(
-                master_client_name=self._client.name,
-                master_sae_id=master_sae_id,
-                slave_sae_id=slave_sae_id,
-                user_key_id=str(share.user_key_id),
-                share_index=share.share_index,
-                encryption_key_allocation=encryption_key.allocation.to_api(),
-                encrypted_share_value=bytes_to_str(encryption_key.encrypt(share.value)),
-            )
-            await self._http_client.post(
-                url=url,
-                api_request_obj=request,
-                api_response_class=None,
-                authentication=True,
-            )
-        finally:
-            self.delete_fully_used_blocks()
-            self.start_request_psrd_task_if_needed()
+        with TRACER.span("post share", hub=self._local_pool.name):
+            start_time = time.perf_counter()
+            try:
+                url = f"{self._base_url}/dske/api/v1/key-share"
+                # If preparing the request fails, the encryption key has not been used yet and it is
+                # given back to the pool. Once the request has been (attempted to be) sent, the
+                # encryption key must never be used again.
+                with AllocationTransaction() as transaction:
+                    encryption_key = EncryptionKey.from_pool(
+                        self._local_pool, share.size
+                    )
+                    transaction.add(encryption_key.allocation)
+                    encrypted_share_value = await encryption_key.encrypt_async(
+                        share.value
+                    )
+                    encoded_share_value = await CRYPTO_EXECUTOR.run(
+                        share.size, bytes_to_str, encrypted_share_value
+                    )
+                    request = APIPostShareRequest(
+                        master_client_name=self._client.name,
+                        master_sae_id=master_sae_id,
+                        slave_sae_id=slave_sae_id,
+                        user_key_id=str(share.user_key_id),
+                        share_index=share.share_index,
+                        encryption_key_allocation=encryption_key.allocation.to_enc_str(),
+                        encrypted_share_value=encoded_share_value,
+                    )
+                await self._http_client.post(
+                    url=url,
+                    api_request_obj=request,
+                    api_response_class=None,
+                    authentication=True,
+                )
+            except Exception:
+                self._post_share_failures_metric.inc()
+                raise
+            else:
+                self._shares_posted_metric.inc()
+            finally:
+                self._post_share_duration_metric.observe(
+                    time.perf_counter() - start_time
+                )
+                self.start_request_psrd_task_if_needed()
 
     async def get_share(
         self, master_sae_id: str, slave_sae_id: str, key_id: UUID
@@ -248,41 +511,59 @@ class PeerHub:
         """
         Get a key share from the peer hub.
         """
-        try:
-            url = f"{self._base_url}/dske/api/v1/key-share"
-            params = {
-                "client_name": self._client.name,
-                "master_sae_id": master_sae_id,
-                "slave_sae_id": slave_sae_id,
-                "key_id": str(key_id),
-            }
-            response = await self._http_client.get(
-                url=url,
-                params=params,
-                api_response_class=APIGetShareResponse,
-                authentication=True,
-            )
-            encryption_key_allocation = Allocation.from_api(
-                response.encryption_key_allocation, self._peer_pool
-            )
-            encryption_key = EncryptionKey.from_allocation(encryption_key_allocation)
-            encrypted_share_value = str_to_bytes(response.encrypted_share_value)
-            share_value = encryption_key.decrypt(encrypted_share_value)
-            share = Share(
-                master_sae_id=master_sae_id,
-                slave_sae_id=slave_sae_id,
-                user_key_id=key_id,
-                share_index=response.share_index,
-                value=share_value,
-            )
-            return share
-        finally:
-            self.delete_fully_used_blocks()
-            self.start_request_psrd_task_if_needed()
+        with TRACER.span("get share", hub=self._local_pool.name):
+            start_time = time.perf_counter()
+            try:
+                url = f"{self._base_url}/dske/api/v1/key-share"
+                params = {
+                    "client_name": self._client.name,
+                    "master_sae_id": master_sae_id,
+                    "slave_sae_id": slave_sae_id,
+                    "key_id": str(key_id),
+                }
+                response = await self._http_client.get(
+                    url=url,
+                    params=params,
+                    api_response_class=APIGetShareResponse,
+                    authentication=True,
+                )
+                encryption_key_allocation = Allocation.from_enc_str(
+                    response.encryption_key_allocation, self._peer_pool
+                )
+                encryption_key = EncryptionKey.from_allocation(
+                    encryption_key_allocation
+                )
+                encrypted_share_value = await CRYPTO_EXECUTOR.run(
+                    len(response.encrypted_share_value),
+                    str_to_bytes,
+                    response.encrypted_share_value,
+                )
+                share_value = await encryption_key.decrypt_async(encrypted_share_value)
+                share = Share(
+                    master_sae_id=master_sae_id,
+                    slave_sae_id=slave_sae_id,
+                    user_key_id=key_id,
+                    share_index=response.share_index,
+                    value=share_value,
+                )
+            except Exception:
+                self._get_share_failures_metric.inc()
+                raise
+            else:
+                self._shares_fetched_metric.inc()
+                return share
+            finally:
+                self._get_share_duration_metric.observe(
+                    time.perf_counter() - start_time
+                )
+                self.start_request_psrd_task_if_needed()
 
-    def delete_fully_used_blocks(self) -> None:
+    def record_bad_share(self, key_id: UUID) -> None:
         """
-        Delete fully used PSRD blocks from the pools.
+        Record that a key share that was fetched from the peer hub was bad (the key could only be
+        reconstructed without it).
         """
-        for pool in (self._local_pool, self._peer_pool):
-            pool.delete_fully_used_blocks()
+        KEY_LOGGER.warning(
+            "Bad key share from hub %s for key ID %s", self._base_url, key_id
+        )
+        self._bad_shares_metric.inc()
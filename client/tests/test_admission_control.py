@@ -0,0 +1,196 @@
+"""
+Unit tests for admission control.
+"""
+
+import asyncio
+import pytest
+from client import admission_control
+from client.admission_control import AdmissionController
+from client.client import Client
+from common import exceptions
+
+
+async def hold_slot(
+    controller: AdmissionController, sae_id: str, release: asyncio.Event
+):
+    """
+    Process a request of encryptor `sae_id` that finishes when `release` is set.
+    """
+    async with controller.admit(sae_id):
+        await release.wait()
+
+
+def test_requests_wait_for_a_slot_in_order():
+    """
+    Requests beyond the concurrency limit wait in the queue and get the released slots first come,
+    first served.
+    """
+
+    async def run():
+        controller = AdmissionController("carol", max_nr_concurrent_requests=1)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold_slot(controller, "sam", release))
+        await asyncio.sleep(0)
+        order = []
+
+        async def wait_for_slot(name):
+            async with controller.admit(name):
+                order.append(name)
+
+        waiters = [
+            asyncio.create_task(wait_for_slot(name)) for name in ["sofia", "serena"]
+        ]
+        await asyncio.sleep(0)
+        assert controller.nr_active_requests == 1
+        assert controller.nr_waiting_requests == 2
+        release.set()
+        await asyncio.gather(holder, *waiters)
+        assert order == ["sofia", "serena"]
+        assert controller.nr_active_requests == 0
+        assert controller.nr_waiting_requests == 0
+        assert controller.to_mgmt()["nr_admitted"] == 3
+
+    asyncio.run(run())
+
+
+def test_per_sae_limit_rejects_with_429():
+    """
+    An encryptor that has too many requests in progress is rejected with 429 and Retry-After,
+    while other encryptors are still admitted.
+    """
+
+    async def run():
+        controller = AdmissionController("carol", max_nr_concurrent_requests_per_sae=1)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold_slot(controller, "sam", release))
+        await asyncio.sleep(0)
+        with pytest.raises(exceptions.TooManyRequestsError) as exc_info:
+            async with controller.admit("sam"):
+                pass
+        assert exc_info.value.status_code == 429
+        assert exc_info.value.headers == {"Retry-After": "1"}
+        async with controller.admit("sofia"):
+            pass
+        release.set()
+        await holder
+        async with controller.admit("sam"):
+            pass
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("max_nr_waiting_requests", [0, 1])
+def test_overload_rejects_with_503(max_nr_waiting_requests):
+    """
+    A request is rejected with 503 and Retry-After if the wait queue is full, or if it waited too
+    long for a slot. Rejected requests don't hold on to a slot.
+    """
+
+    async def run():
+        controller = AdmissionController(
+            "carol",
+            max_nr_concurrent_requests=1,
+            max_nr_waiting_requests=max_nr_waiting_requests,
+            max_wait_time=0.01,
+        )
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold_slot(controller, "sam", release))
+        await asyncio.sleep(0)
+        with pytest.raises(exceptions.OverloadedError) as exc_info:
+            async with controller.admit("sofia"):
+                pass
+        assert exc_info.value.status_code == 503
+        assert exc_info.value.headers == {"Retry-After": "1"}
+        assert controller.nr_waiting_requests == 0
+        release.set()
+        await holder
+        assert controller.nr_active_requests == 0
+        assert controller.to_mgmt()["nr_rejected"] == 1
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    """
+    A request that is cancelled while it waits for a slot leaves the queue, and does not keep a
+    slot that was handed over to it.
+    """
+
+    async def run():
+        controller = AdmissionController("carol", max_nr_concurrent_requests=1)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold_slot(controller, "sam", release))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold_slot(controller, "sofia", asyncio.Event()))
+        await asyncio.sleep(0)
+        assert controller.nr_waiting_requests == 1
+        # Hand over the slot to the waiter and cancel it before it runs.
+        release.set()
+        await holder
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert controller.nr_waiting_requests == 0
+        assert controller.nr_active_requests == 0
+
+    asyncio.run(run())
+
+
+def test_not_enough_peer_hubs_with_psrd_rejects_with_503():
+    """
+    A Get key request is rejected with 503 and Retry-After, before any key share is sent, if fewer
+    than the minimum number of peer hubs have enough PSRD for it (here: none is registered yet).
+    """
+
+    async def run():
+        controller = AdmissionController("carol")
+        peer_hub_urls = [
+            f"http://127.0.0.1:{port}/hub/{name}"
+            for port, name in [(8100, "hank"), (8101, "helen"), (8102, "hilary")]
+        ]
+        client = Client(
+            "carol", ["sam"], peer_hub_urls, admission_controller=controller
+        )
+        with pytest.raises(exceptions.NotEnoughPeerHubsWithPSRDError) as exc_info:
+            await client.etsi_get_key("sam", "serena", 256)
+        assert exc_info.value.status_code == 503
+        assert exc_info.value.headers == {"Retry-After": "1"}
+        assert exc_info.value.details == {
+            "nr_peer_hubs_with_psrd": 0,
+            "nr_required_peer_hubs": 3,
+        }
+        mgmt = controller.to_mgmt()
+        assert mgmt["nr_rejected"] == 1
+        assert mgmt["nr_active_requests"] == 0
+
+    asyncio.run(run())
+
+
+def test_gauges_per_client():
+    """
+    The active and waiting request gauges are reported per client, so that several clients in one
+    process do not overwrite each other's gauges.
+    """
+
+    async def run():
+        carol = AdmissionController("carol", max_nr_concurrent_requests=1)
+        celia = AdmissionController("celia", max_nr_concurrent_requests=1)
+        release = asyncio.Event()
+        holders = [
+            asyncio.create_task(hold_slot(carol, "sam", release)),
+            asyncio.create_task(hold_slot(carol, "sam", release)),
+            asyncio.create_task(hold_slot(celia, "sam", release)),
+        ]
+        await asyncio.sleep(0)
+        # pylint: disable=protected-access
+        active = admission_control._ACTIVE_REQUESTS.render()
+        waiting = admission_control._WAITING_REQUESTS.render()
+        release.set()
+        await asyncio.gather(*holders)
+        return (active, waiting)
+
+    (active, waiting) = asyncio.run(run())
+    assert 'dske_client_admission_active_requests{client="carol"} 1\n' in active
+    assert 'dske_client_admission_active_requests{client="celia"} 1\n' in active
+    assert 'dske_client_admission_waiting_requests{client="carol"} 1\n' in waiting
+    assert 'dske_client_admission_waiting_requests{client="celia"} 0\n' in waiting
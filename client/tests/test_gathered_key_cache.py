@@ -0,0 +1,138 @@
+"""
+Unit tests for the gathered key cache.
+"""
+
+import asyncio
+from uuid import uuid4
+import pytest
+from client.gathered_key_cache import GatheredKeyCache
+from common.user_key import UserKey
+
+
+class GatherStub:
+    """
+    Stands in for gathering a key from the peer hubs: counts the gathers, and waits until it is
+    released before returning the key (or raising an exception).
+    """
+
+    def __init__(self, key: UserKey, exception: Exception | None = None):
+        self.key = key
+        self.exception = exception
+        self.nr_gathers = 0
+        self.release = asyncio.Event()
+
+    async def gather(self) -> UserKey:
+        """
+        Gather the key.
+        """
+        self.nr_gathers += 1
+        await self.release.wait()
+        if self.exception is not None:
+            raise self.exception
+        return self.key
+
+
+def test_concurrent_requests_are_coalesced():
+    """
+    Concurrent requests for the same key share one gather, and a repeated request is served from
+    the cache.
+    """
+
+    async def run():
+        cache = GatheredKeyCache()
+        key = UserKey(uuid4(), b"0123456789")
+        stub = GatherStub(key)
+        tasks = [
+            asyncio.create_task(cache.get(key.key_id, "sam", "serena", stub.gather))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        stub.release.set()
+        assert await asyncio.gather(*tasks) == [key, key, key]
+        assert await cache.get(key.key_id, "sam", "serena", stub.gather) is key
+        assert stub.nr_gathers == 1
+        mgmt = cache.to_mgmt()
+        assert mgmt["nr_misses"] == 1
+        assert mgmt["nr_coalesced"] == 2
+        assert mgmt["nr_hits"] == 1
+
+    asyncio.run(run())
+
+
+def test_other_encryptor_is_not_served_from_cache():
+    """
+    A request from another encryptor for the same key ID does not share the gather or the cache.
+    """
+
+    async def run():
+        cache = GatheredKeyCache()
+        key = UserKey(uuid4(), b"0123456789")
+        stub = GatherStub(key)
+        stub.release.set()
+        await cache.get(key.key_id, "sam", "serena", stub.gather)
+        await cache.get(key.key_id, "sam", "mallory", stub.gather)
+        assert stub.nr_gathers == 2
+
+    asyncio.run(run())
+
+
+def test_failure_is_shared_but_not_cached():
+    """
+    A failed gather fails all concurrent requests, and the next request gathers again.
+    """
+
+    async def run():
+        cache = GatheredKeyCache()
+        key = UserKey(uuid4(), b"0123456789")
+        stub = GatherStub(key, exception=RuntimeError("hubs down"))
+        tasks = [
+            asyncio.create_task(cache.get(key.key_id, "sam", "serena", stub.gather))
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        stub.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        stub.exception = None
+        assert await cache.get(key.key_id, "sam", "serena", stub.gather) is key
+        assert stub.nr_gathers == 2
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("ttl", [0.0, 0.01])
+def test_expiry(ttl):
+    """
+    Cached keys expire after the time to live (a time to live of zero disables the cache).
+    """
+
+    async def run():
+        cache = GatheredKeyCache(ttl=ttl)
+        key = UserKey(uuid4(), b"0123456789")
+        stub = GatherStub(key)
+        stub.release.set()
+        await cache.get(key.key_id, "sam", "serena", stub.gather)
+        await asyncio.sleep(0.02)
+        await cache.get(key.key_id, "sam", "serena", stub.gather)
+        assert stub.nr_gathers == 2
+        assert cache.to_mgmt()["nr_cached_keys"] == (1 if ttl > 0 else 0)
+
+    asyncio.run(run())
+
+
+def test_expiry_without_further_requests():
+    """
+    A cached key is removed when its time to live has passed, also if no other request arrives.
+    """
+
+    async def run():
+        cache = GatheredKeyCache(ttl=0.01)
+        key = UserKey(uuid4(), b"0123456789")
+        stub = GatherStub(key)
+        stub.release.set()
+        await cache.get(key.key_id, "sam", "serena", stub.gather)
+        assert cache.to_mgmt()["nr_cached_keys"] == 1
+        await asyncio.sleep(0.02)
+        assert cache.to_mgmt()["nr_cached_keys"] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,84 @@
+"""
+Unit tests for the peer hub.
+"""
+
+import asyncio
+import pytest
+from client import peer_hub
+from client.peer_hub import PeerHub
+from common.block import Block
+
+
+class StubClient:
+    """
+    The minimal subset of class Client that is needed by class PeerHub.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.encryptor_names = [f"{name}-sae"]
+
+
+class StubPeerHub(PeerHub):
+    """
+    A peer hub that is registered without contacting the hub, and that gets PSRD blocks without
+    contacting the hub.
+    """
+
+    def __init__(self, nr_local_bytes: int, nr_peer_bytes: int):
+        super().__init__(StubClient("carol"), "http://127.0.0.1:8100/hub/hank")
+        self._registered = True
+        self._hub_name = "hank"
+        self.nr_psrd_requests = 0
+        self.local_pool.add_block(Block.new_with_random_data(nr_local_bytes))
+        self.peer_pool.add_block(Block.new_with_random_data(nr_peer_bytes))
+
+    async def attempt_request_psrd(self, pool) -> bool:
+        self.nr_psrd_requests += 1
+        pool.add_block(Block.new_with_random_data(peer_hub.GET_PSRD_BLOCK_SIZE))
+        return True
+
+
+@pytest.mark.parametrize(
+    "nr_local_bytes, share_size", [(600, 600), (600, 3000), (520, 256)]
+)
+def test_rejected_request_starts_refill(nr_local_bytes, share_size):
+    """
+    A request that is rejected for lack of PSRD starts a refill that provides at least the PSRD that
+    the request needs (including the reserve for share encryption keys), also if the pool is above
+    the start request PSRD threshold or if the request needs more than the stop request PSRD
+    threshold.
+    """
+
+    async def run():
+        stub = StubPeerHub(
+            nr_local_bytes=nr_local_bytes,
+            nr_peer_bytes=peer_hub.STOP_REQUEST_PSRD_THRESHOLD,
+        )
+        assert not stub.has_psrd_for_request(share_size)
+        # Let the request PSRD tasks run (the stub gets each block without waiting).
+        await asyncio.sleep(0.01)
+        assert stub.nr_psrd_requests > 0
+        assert stub.has_psrd_for_request(share_size)
+
+    asyncio.run(run())
+
+
+def test_ready_after_initial_psrd():
+    """
+    A peer hub is ready once the client is registered with it and both pools hold the ready PSRD
+    bytes, and it stays ready when the pools are drained later.
+    """
+    hub = PeerHub(
+        StubClient("carol"), "http://127.0.0.1:8100/hub/hank", ready_psrd_bytes=1000
+    )
+    assert not hub.is_ready
+    hub.local_pool.add_block(Block.new_with_random_data(1000))
+    hub.peer_pool.add_block(Block.new_with_random_data(1000))
+    # Not registered yet
+    assert not hub.is_ready
+    hub._registered = True  # pylint: disable=protected-access
+    assert hub.is_ready
+    hub.local_pool.allocate(600, "test")
+    assert hub.is_ready
+    assert hub.to_mgmt_ready() == {"hub_name": None, "registered": True, "ready": True}
@@ -2,6 +2,7 @@
 A PSRD allocation.
 """
 
+import enum
 import pydantic
 from .fragment import APIFragment, Fragment
 
@@ -20,13 +21,28 @@ class Allocation:
     """
 
     _fragments: list[Fragment]
+    _pool: "Pool | None"  # type: ignore
 
-    def __init__(self, fragments: list[Fragment]):
+    def __init__(
+        self,
+        fragments: list[Fragment],
+        pool: "Pool | None" = None,  # type: ignore
+    ):
         # Don't call this directly. Instead use one of the following:
         #   Pool.allocate
         #   Allocation.from_api
         #   Allocation.from_enc_str
         self._fragments = fragments
+        self._pool = pool
+        if pool is not None:
+            pool.record_consumed_bytes(self.size)
+
+    @property
+    def size(self) -> int:
+        """
+        Get the size in bytes.
+        """
+        return sum(fragment.size for fragment in self._fragments)
 
     @property
     def fragments(self) -> list[Fragment] | None:
@@ -49,6 +65,8 @@ class Allocation:
         """
         Give the allocation back to the pool it was taken from.
         """
+        if self._pool is not None:
+            self._pool.record_returned_bytes(self.size)
         for fragment in self._fragments:
             fragment.give_back()
         self._fragments = []
@@ -87,7 +105,7 @@ class Allocation:
             for fragment in fragments:
                 fragment.give_back()
             raise exc
-        return Allocation(fragments=fragments)
+        return Allocation(fragments=fragments, pool=pool)
 
     def to_enc_str(self) -> str:
         """
@@ -115,4 +133,90 @@ class Allocation:
             for fragment in fragments:
                 fragment.give_back()
             raise exc
-        return Allocation(fragments=fragments)
+        return Allocation(fragments=fragments, pool=pool)
+
+
+class AllocationTransaction:
+    """
+    A transaction that groups the PSRD allocations that are needed for one operation (for example,
+    the encryption key and the signing key for a message). Allocations are reserved in the
+    transaction. If the operation completes, the transaction is committed and the allocations are
+    consumed. If the operation fails before the PSRD has been exposed to the peer, the transaction
+    is rolled back and all reserved allocations are given back to the pools they were taken from.
+
+    The transaction can be used as a context manager: it is committed when the `with` block exits
+    normally, and rolled back when the `with` block raises an exception.
+    """
+
+    class State(enum.Enum):
+        """
+        The state of the transaction.
+        """
+
+        OPEN = 1
+        COMMITTED = 2
+        ROLLED_BACK = 3
+
+    _allocations: list[Allocation]
+    _state: State
+
+    def __init__(self):
+        self._allocations = []
+        self._state = self.State.OPEN
+
+    @property
+    def state(self) -> State:
+        """
+        Get the state of the transaction.
+        """
+        return self._state
+
+    def reserve(
+        self,
+        pool: "Pool",  # type: ignore
+        size: int,
+        purpose: str,
+    ) -> Allocation:
+        """
+        Allocate `size` bytes from the pool as part of this transaction.
+        """
+        return self.add(pool.allocate(size, purpose))
+
+    def add(self, allocation: Allocation) -> Allocation:
+        """
+        Add an existing allocation (for example one that was taken from the pool on behalf of the
+        peer) to this transaction.
+        """
+        assert self._state == self.State.OPEN
+        self._allocations.append(allocation)
+        return allocation
+
+    def commit(self) -> None:
+        """
+        Commit the transaction: the reserved allocations are consumed.
+        """
+        assert self._state == self.State.OPEN
+        self._allocations = []
+        self._state = self.State.COMMITTED
+
+    def rollback(self) -> None:
+        """
+        Roll back the transaction: give all reserved allocations back to their pools.
+        """
+        assert self._state == self.State.OPEN
+        # Give back in reverse order of allocation.
+        for allocation in reversed(self._allocations):
+            allocation.give_back()
+        self._allocations = []
+        self._state = self.State.ROLLED_BACK
+
+    def __enter__(self) -> "AllocationTransaction":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self._state != self.State.OPEN:
+            return
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
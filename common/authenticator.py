@@ -0,0 +1,223 @@
+"""
+Message authentication modes for DSKE in-band protocol messages, and the authenticator that signs
+and verifies messages for one peer.
+"""
+
+import argparse
+import collections
+from .allocation import Allocation
+from .exceptions import InvalidSignatureError
+from .logging import REQUEST_LOGGER
+from .pool import MESSAGE_SIGNING_KEY, Pool
+from .signature import Signature
+from .signing_key import (
+    HASH_KEY_SIZE,
+    ONE_TIME_PAD_SIZE,
+    SIGNING_KEY_SIZE,
+    HashKey,
+    SigningKey,
+)
+
+HMAC_SHA256 = "hmac-sha256"
+"""
+Authentication mode: HMAC-SHA256 with a fresh 32-byte PSRD key for every message.
+"""
+
+WEGMAN_CARTER = "wegman-carter"
+"""
+Authentication mode: a Wegman-Carter tag, which is a polynomial hash of the message under a
+long-lived PSRD hash key, masked with a fresh 16-byte PSRD one-time pad for every message.
+"""
+
+AUTHENTICATION_MODES = [WEGMAN_CARTER, HMAC_SHA256]
+"""
+All supported authentication modes, in order of preference.
+"""
+
+HASH_KEY_MAX_NR_USES = 10_000
+"""
+The number of messages that are signed with one Wegman-Carter hash key before a new hash key is
+taken from the pool.
+"""
+
+_MAX_NR_PEER_HASH_KEYS = 4
+"""
+The number of hash keys of the peer that are remembered for verifying messages. More than one is
+needed because messages that were signed before the peer switched to a new hash key may still be in
+flight.
+"""
+
+
+class Authenticator:
+    """
+    Signs the messages that are sent to one peer, using keys from the local pool, and verifies the
+    signature on the messages that are received from that peer, using keys from the peer pool. The
+    authentication mode is negotiated with the peer at registration.
+
+    In Wegman-Carter mode, the signer takes a hash key from the local pool and uses it for up to
+    HASH_KEY_MAX_NR_USES messages. Every signature refers to the allocation of its hash key; the
+    first time the verifier sees a hash key, it takes it from the peer pool and remembers it.
+    """
+
+    _mode: str
+    _local_pool: Pool
+    _peer_pool: Pool
+    _hash_key: HashKey | None
+    _hash_key_nr_uses: int
+    _peer_hash_keys: collections.OrderedDict[str, HashKey]  # Oldest first
+    _nr_signed_messages: int
+    _nr_verified_messages: int
+    _nr_psrd_bytes: int  # Used for signing and verifying
+
+    def __init__(self, mode: str, local_pool: Pool, peer_pool: Pool):
+        assert mode in AUTHENTICATION_MODES
+        self._mode = mode
+        self._local_pool = local_pool
+        self._peer_pool = peer_pool
+        self._hash_key = None
+        self._hash_key_nr_uses = 0
+        self._peer_hash_keys = collections.OrderedDict()
+        self._nr_signed_messages = 0
+        self._nr_verified_messages = 0
+        self._nr_psrd_bytes = 0
+
+    @property
+    def mode(self) -> str:
+        """
+        Get the authentication mode.
+        """
+        return self._mode
+
+    def set_mode(self, mode: str) -> None:
+        """
+        Set the authentication mode (after it has been negotiated with the peer).
+        """
+        assert mode in AUTHENTICATION_MODES
+        self._mode = mode
+        self._hash_key = None
+        self._hash_key_nr_uses = 0
+        self._peer_hash_keys.clear()
+
+    @property
+    def peer_name(self) -> str:
+        """
+        Get the name of the peer (which is the name of its pools).
+        """
+        return self._peer_pool.name
+
+    def nr_signing_bytes_needed(self) -> int:
+        """
+        Get the number of PSRD bytes that signing the next message takes from the local pool.
+        """
+        if self._mode == HMAC_SHA256:
+            return SIGNING_KEY_SIZE
+        if self._hash_key is None or self._hash_key_nr_uses >= HASH_KEY_MAX_NR_USES:
+            return HASH_KEY_SIZE + ONE_TIME_PAD_SIZE
+        return ONE_TIME_PAD_SIZE
+
+    def nr_verification_bytes_needed(self) -> int:
+        """
+        Get the number of PSRD bytes that verifying a message usually takes from the peer pool.
+        """
+        if self._mode == HMAC_SHA256:
+            return SIGNING_KEY_SIZE
+        return ONE_TIME_PAD_SIZE
+
+    def signing_key(self) -> SigningKey:
+        """
+        Allocate the key for signing one message from the local pool.
+        """
+        self._nr_signed_messages += 1
+        if self._mode == HMAC_SHA256:
+            self._nr_psrd_bytes += SIGNING_KEY_SIZE
+            return SigningKey(
+                self._local_pool.allocate(SIGNING_KEY_SIZE, MESSAGE_SIGNING_KEY)
+            )
+        if self._hash_key is None or self._hash_key_nr_uses >= HASH_KEY_MAX_NR_USES:
+            allocation = self._local_pool.allocate(HASH_KEY_SIZE, MESSAGE_SIGNING_KEY)
+            self._hash_key = HashKey(allocation.to_enc_str(), allocation.data)
+            self._hash_key_nr_uses = 0
+            self._nr_psrd_bytes += HASH_KEY_SIZE
+        self._hash_key_nr_uses += 1
+        self._nr_psrd_bytes += ONE_TIME_PAD_SIZE
+        one_time_pad = self._local_pool.allocate(ONE_TIME_PAD_SIZE, MESSAGE_SIGNING_KEY)
+        return SigningKey(one_time_pad, self._hash_key)
+
+    def verification_key(self, received_signature: Signature) -> SigningKey:
+        """
+        Take the key for verifying the signature on one received message from the peer pool. Raises
+        InvalidSignatureError if the signature does not use the negotiated authentication mode.
+        """
+        hash_key_enc_str = received_signature.hash_key_allocation_enc_str
+        if (hash_key_enc_str is None) != (self._mode == HMAC_SHA256):
+            REQUEST_LOGGER.warning(
+                "Signature does not use authentication mode %s (pool %s)",
+                self._mode,
+                self._peer_pool.name,
+            )
+            raise InvalidSignatureError()
+        self._nr_verified_messages += 1
+        hash_key = None
+        if hash_key_enc_str is not None:
+            hash_key = self._peer_hash_keys.get(hash_key_enc_str)
+            if hash_key is None:
+                allocation = Allocation.from_enc_str(hash_key_enc_str, self._peer_pool)
+                if allocation.size != HASH_KEY_SIZE:
+                    raise InvalidSignatureError()
+                self._nr_psrd_bytes += HASH_KEY_SIZE
+                hash_key = HashKey(hash_key_enc_str, allocation.data)
+                self._peer_hash_keys[hash_key_enc_str] = hash_key
+                while len(self._peer_hash_keys) > _MAX_NR_PEER_HASH_KEYS:
+                    self._peer_hash_keys.popitem(last=False)
+        allocation = Allocation.from_enc_str(
+            received_signature.signing_key_allocation_enc_str, self._peer_pool
+        )
+        self._nr_psrd_bytes += allocation.size
+        return SigningKey(allocation, hash_key)
+
+    def to_mgmt(self) -> dict:
+        """
+        Get the management status.
+        """
+        nr_messages = self._nr_signed_messages + self._nr_verified_messages
+        return {
+            "mode": self._mode,
+            "nr_signed_messages": self._nr_signed_messages,
+            "nr_verified_messages": self._nr_verified_messages,
+            "nr_psrd_bytes": self._nr_psrd_bytes,
+            "nr_psrd_bytes_per_message": (
+                self._nr_psrd_bytes / nr_messages if nr_messages > 0 else None
+            ),
+        }
+
+
+def negotiate_mode(offered_modes: list[str], supported_modes: list[str]) -> str | None:
+    """
+    Pick the first authentication mode offered by the peer that is also supported locally. Returns
+    None if there is no such mode.
+    """
+    for mode in offered_modes:
+        if mode in supported_modes:
+            return mode
+    return None
+
+
+def add_command_line_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the command line arguments for configuring the authentication modes.
+    """
+    parser.add_argument(
+        "--authentication-modes",
+        nargs="+",
+        choices=AUTHENTICATION_MODES,
+        default=AUTHENTICATION_MODES,
+        help=f"Supported message authentication modes, in order of preference "
+        f"(default: {' '.join(AUTHENTICATION_MODES)})",
+    )
+
+
+def command_line_arguments(args: argparse.Namespace) -> list[str]:
+    """
+    Get the command line arguments for starting another process with the same authentication modes.
+    """
+    return ["--authentication-modes"] + args.authentication_modes
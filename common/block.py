@@ -2,12 +2,13 @@
 A Pre-Shared Random Data (PSRD) block.
 """
 
+import threading
 from uuid import UUID, uuid4
-from os import urandom
-from typing import Tuple
+from typing import Callable, Tuple
 import pydantic
 from bitarray import bitarray
 from common.fragment import Fragment
+from common.psrd_generator import PSRD_GENERATOR
 from common.utils import bytes_to_str, str_to_bytes
 from common.exceptions import (
     InvalidBlockUUIDError,
@@ -26,21 +27,39 @@ class APIBlock(pydantic.BaseModel):
     data: str
 
 
+_MGMT_DATA_PREVIEW_SIZE = 11
+
+
 class Block:
     """
     A Pre-Shared Random Data (PSRD) block.
+
+    The block keeps count of its used bytes, so that it can tell in constant time whether it is
+    fully used. When the last unused byte of the block is used, the block calls its fully used
+    callback (if any), which is how a pool learns that the block can be retired.
     """
 
     _block_uuid: UUID
     _size: int  # In bytes
-    _data: bytes
+    _data: bytearray
     _used: bitarray
+    _nr_used_bytes: int
+    _retired: bool
+    _fully_used_callback: Callable[["Block"], None] | None
+    _lock: threading.Lock  # Protects _data, _used, _nr_used_bytes, and _retired
 
-    def __init__(self, block_uuid: UUID, data: bytes):
+    def __init__(self, block_uuid: UUID, data: bytes | bytearray):
         self._block_uuid = block_uuid
         self._size = len(data)
-        self._data = data
+        # A bytearray (e.g. from the PSRD generator) is taken over without copying it, which
+        # matters for large blocks. The caller must not use it anymore.
+        self._data = data if isinstance(data, bytearray) else bytearray(data)
         self._used = bitarray(self._size)
+        self._used.setall(False)
+        self._nr_used_bytes = 0
+        self._retired = False
+        self._fully_used_callback = None
+        self._lock = threading.Lock()
 
     @property
     def uuid(self):
@@ -61,30 +80,50 @@ class Block:
         """
         The data of the block.
         """
-        return self._data
+        with self._lock:
+            return bytes(self._data)
 
     @property
     def nr_used_bytes(self):
         """
         Return the number of used bytes.
         """
-        return self._used.count()
+        return self._nr_used_bytes
 
     @property
     def nr_unused_bytes(self):
         """
         Return the number of unused bytes.
         """
-        return self._size - self.nr_used_bytes
+        return self._size - self._nr_used_bytes
+
+    @property
+    def retired(self) -> bool:
+        """
+        Has the block been retired (see retire)?
+        """
+        return self._retired
+
+    def set_fully_used_callback(self, callback: Callable[["Block"], None]) -> None:
+        """
+        Set the function that is called (with the block as argument) when the last unused byte of
+        the block is used. The callback may be called from any thread, and it may be called more
+        than once if data is given back to a fully used block.
+        """
+        self._fully_used_callback = callback
 
     def to_mgmt(self):
         """
         Get the management status.
         """
+        # Only copy the part of the data that is shown (one byte more than the truncated length,
+        # so that the truncation is still shown), not the whole block.
+        with self._lock:
+            data_preview = bytes(self._data[:_MGMT_DATA_PREVIEW_SIZE])
         return {
             "uuid": str(self._block_uuid),
             "size": self._size,
-            "data": bytes_to_str(self._data, truncate=True),
+            "data": bytes_to_str(data_preview, truncate=True),
             "nr_used_bytes": self.nr_used_bytes,
             "nr_unused_bytes": self.nr_unused_bytes,
         }
@@ -95,9 +134,7 @@ class Block:
         Create a block, containing `size` random bytes.
         """
         assert size > 0
-        uuid = uuid4()
-        data = urandom(size)
-        return Block(uuid, data)
+        return Block(uuid4(), PSRD_GENERATOR.generate(size))
 
     def allocate_fragment(self, desired_size: int) -> Fragment | None:
         """
@@ -124,24 +161,52 @@ class Block:
         block. We use the first gap of unused bytes in the block (i.e. we don't try look for best
         fit or anything like that). If there is no unused data left in the block, we return None.
         """
-        try:
+        with self._lock:
+            if self._nr_used_bytes == self._size:
+                return None
             start = self._used.index(False)
-        except ValueError:
-            return None
-        try:
-            end = self._used.index(True, start)
-        except ValueError:
-            end = self._size
-        size = end - start
-        if size > desired_size:
-            end = start + desired_size
-            size = desired_size
-        data = self._data[start:end]
-        self._used[start:end] = True
-        # Zero out allocated bytes in block
-        self._data = self._data[:start] + b"\x00" * size + self._data[end:]
+            try:
+                end = self._used.index(True, start)
+            except ValueError:
+                end = self._size
+            size = end - start
+            if size > desired_size:
+                end = start + desired_size
+                size = desired_size
+            data = self._use(start, end)
+        self._call_fully_used_callback_if_needed()
         return (start, size, data)
 
+    def allocate_contiguous_fragment(
+        self, min_size: int, desired_size: int
+    ) -> Fragment | None:
+        """
+        Allocate a fragment of at least `min_size` and at most `desired_size` bytes from the first
+        gap of unused bytes in the block that is at least `min_size` bytes long. If there is no such
+        gap, None is returned.
+        """
+        assert 0 < min_size <= desired_size
+        with self._lock:
+            if self._size - self._nr_used_bytes < min_size:
+                return None
+            start = 0
+            while True:
+                try:
+                    start = self._used.index(False, start)
+                except ValueError:
+                    return None
+                try:
+                    end = self._used.index(True, start)
+                except ValueError:
+                    end = self._size
+                if end - start >= min_size:
+                    break
+                start = end
+            end = min(end, start + desired_size)
+            data = self._use(start, end)
+        self._call_fully_used_callback_if_needed()
+        return Fragment(block=self, start=start, size=end - start, data=data)
+
     def take_data(self, start: int, size: int) -> bytes:
         """
         Take data from the block at the specified start byte and size.
@@ -149,17 +214,32 @@ class Block:
         end = start + size
         if start < 0 or end > self._size:
             raise InvalidPSRDIndex(self._block_uuid, start)
-        if self._used[start:end].any():
-            raise PSRDDataAlreadyUsedError(self._block_uuid, start, size)
+        with self._lock:
+            # All bytes of a retired block have been used (and its data has been released).
+            if self._retired or self._used[start:end].any():
+                raise PSRDDataAlreadyUsedError(self._block_uuid, start, size)
+            data = self._use(start, end)
+        self._call_fully_used_callback_if_needed()
+        return data
+
+    def _use(self, start: int, end: int) -> bytes:
+        # Caller must hold self._lock
+        data = bytes(self._data[start:end])
         self._used[start:end] = True
-        data = self._data[start:end]
-        # Zero out taken bytes in block
-        self._data = self._data[:start] + b"\x00" * size + self._data[end:]
+        self._nr_used_bytes += end - start
+        # Zero out used bytes in block
+        self._data[start:end] = bytes(end - start)
         return data
 
+    def _call_fully_used_callback_if_needed(self) -> None:
+        # Called without holding self._lock, so that the callback can take other locks.
+        if self._nr_used_bytes == self._size and self._fully_used_callback is not None:
+            self._fully_used_callback(self)
+
     def give_back_data(self, start: int, data: bytes):
         """
-        Give back previously taken data to the block.
+        Give back previously taken data to the block. Data that is given back to a retired block is
+        dropped: the block has been removed from its pool, so the data cannot be used anymore.
         """
         # Giving back data is only used internally; the parameters are decided by the outside world.
         # Thus, if there is a problem with the parameters it is a bug: we assert rather than raise.
@@ -167,15 +247,36 @@ class Block:
         assert size > 0
         assert size <= self._size
         end = start + size
-        assert self._used[start:end].all()
-        self._used[start:end] = False
-        self._data = self._data[:start] + data + self._data[end:]
+        with self._lock:
+            if self._retired:
+                return
+            assert self._used[start:end].all()
+            self._used[start:end] = False
+            self._nr_used_bytes -= size
+            self._data[start:end] = data
 
     def is_fully_used(self):
         """
         Check if all bytes in the block have been used.
         """
-        return self._used.all()
+        return self._nr_used_bytes == self._size
+
+    def retire(self) -> bool:
+        """
+        Retire the block if it is fully used: zeroize and release its data. Returns whether the
+        block was retired. A block that is not fully used (because data was given back after the
+        block became fully used) is not retired.
+        """
+        with self._lock:
+            if self._retired or self._nr_used_bytes != self._size:
+                return False
+            # The used bytes have already been zeroed out when they were used, but we zeroize again
+            # to be on the safe side before releasing the memory.
+            self._data[:] = bytes(self._size)
+            self._data = bytearray()
+            self._used = bitarray()
+            self._retired = True
+            return True
 
     @classmethod
     def from_api(cls, api_block: APIBlock) -> "Block":
@@ -198,5 +299,5 @@ class Block:
         """
         return APIBlock(
             block_uuid=str(self._block_uuid),
-            data=bytes_to_str(self._data),
+            data=bytes_to_str(self.data),
         )
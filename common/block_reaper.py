@@ -0,0 +1,97 @@
+"""
+Background retirement of fully used PSRD blocks.
+"""
+
+import asyncio
+import collections
+from .metrics import REGISTRY
+
+DEFAULT_REAP_INTERVAL = 1.0
+"""
+How often (in seconds) the block reaper retires the fully used blocks.
+"""
+
+_RETIRED_BLOCKS = REGISTRY.counter(
+    "dske_psrd_retired_blocks_total",
+    "Fully used PSRD blocks that were removed from their pool and zeroized",
+)
+
+
+class BlockReaper:
+    """
+    Retires fully used PSRD blocks in a background task.
+
+    When the last unused byte of a block is used, the pool of the block puts the block in its
+    retire queue and notifies the reaper (this is constant work, and it may happen in a crypto
+    executor thread). The reaper periodically asks each notified pool to retire the blocks in its
+    retire queue: to remove them from the pool, and to zeroize and release their data. This
+    replaces scanning all blocks of both pools after every key share request.
+    """
+
+    _reap_interval: float
+    _task: asyncio.Task | None
+    _notified_pools: collections.deque  # Of Pool; appending and popping is thread-safe
+    _nr_retired_blocks: int
+
+    def __init__(self, reap_interval: float = DEFAULT_REAP_INTERVAL):
+        assert reap_interval > 0
+        self._reap_interval = reap_interval
+        self._task = None
+        self._notified_pools = collections.deque()
+        self._nr_retired_blocks = 0
+
+    def notify(self, pool) -> None:
+        """
+        Notify the reaper that a pool has blocks in its retire queue.
+        """
+        self._notified_pools.append(pool)
+
+    def reap(self) -> int:
+        """
+        Retire the queued blocks of all notified pools now. Returns the number of retired blocks.
+        """
+        nr_retired_blocks = 0
+        while True:
+            try:
+                pool = self._notified_pools.popleft()
+            except IndexError:
+                break
+            nr_retired_blocks += pool.retire_fully_used_blocks()
+        self._nr_retired_blocks += nr_retired_blocks
+        _RETIRED_BLOCKS.inc(nr_retired_blocks)
+        return nr_retired_blocks
+
+    def start(self) -> None:
+        """
+        Start retiring blocks in a background task.
+        """
+        assert self._task is None
+        self._task = asyncio.create_task(self._reap_task())
+
+    def stop(self) -> None:
+        """
+        Stop retiring blocks.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _reap_task(self) -> None:
+        while True:
+            await asyncio.sleep(self._reap_interval)
+            self.reap()
+
+    def to_mgmt(self) -> dict:
+        """
+        Get the management status.
+        """
+        return {
+            "nr_notified_pools": len(self._notified_pools),
+            "nr_retired_blocks": self._nr_retired_blocks,
+        }
+
+
+BLOCK_REAPER = BlockReaper()
+"""
+The block reaper for all pools in this process.
+"""
@@ -0,0 +1,76 @@
+"""
+Encoding and decoding of DSKE API messages.
+
+The messages are pydantic models. They are encoded with the pre-built serializer of the model (in
+pydantic-core), and decoded with orjson and the pre-built validator of the model. This is much
+faster than going through Python dicts and the json module, and than the FastAPI default response
+encoding (see benchmarks/serialization.py).
+"""
+
+import typing
+import fastapi
+import orjson
+import pydantic
+from .exceptions import InvalidRequestBodyError
+
+MEDIA_TYPE = "application/json"
+"""
+The media type of encoded messages.
+"""
+
+Model = typing.TypeVar("Model", bound=pydantic.BaseModel)
+
+
+def encode(obj: pydantic.BaseModel) -> bytes:
+    """
+    Encode a message as JSON.
+    """
+    return obj.__pydantic_serializer__.to_json(obj)
+
+
+def decode(data: bytes, model_class: type[Model]) -> Model:
+    """
+    Decode a JSON message. Raises ValueError if the data is not valid JSON, or does not match the
+    model (pydantic.ValidationError is a ValueError).
+    """
+    data = orjson.loads(data)  # pylint: disable=no-member
+    try:
+        return model_class.__pydantic_validator__.validate_python(data)
+    except TypeError as exc:
+        # The validator calls the custom __init__ of the model (if any), which raises a TypeError
+        # for missing fields.
+        raise ValueError(str(exc)) from exc
+
+
+async def decode_request(request: fastapi.Request, model_class: type[Model]) -> Model:
+    """
+    Decode the body of a request. Raises InvalidRequestBodyError if the body cannot be decoded.
+    """
+    try:
+        return decode(await request.body(), model_class)
+    except ValueError as exc:
+        raise InvalidRequestBodyError(model_class.__name__, str(exc)) from exc
+
+
+def response(
+    obj: pydantic.BaseModel, headers: typing.Mapping[str, str] | None = None
+) -> fastapi.Response:
+    """
+    Create a response that holds the encoded message. FastAPI does not encode (or validate) a
+    response that is returned as a fastapi.Response, so declare the model as the `response_model`
+    of the route for the OpenAPI docs.
+    """
+    return fastapi.Response(content=encode(obj), media_type=MEDIA_TYPE, headers=headers)
+
+
+def request_body_openapi(model_class: type[pydantic.BaseModel]) -> dict:
+    """
+    Get the `openapi_extra` for a route that decodes its request body with decode_request (instead
+    of declaring it as a parameter), so that the OpenAPI docs still describe the request body.
+    """
+    return {
+        "requestBody": {
+            "content": {MEDIA_TYPE: {"schema": model_class.model_json_schema()}},
+            "required": True,
+        }
+    }
@@ -0,0 +1,214 @@
+"""
+Executor for CPU-heavy cryptographic operations (Shamir secret sharing, one-time-pad encryption,
+HMAC signing, and base64 encoding of large values).
+
+Running these operations inline on the asyncio event loop stalls all other requests while a large
+key is being processed. The crypto executor runs operations on large payloads in a thread pool or a
+process pool instead, so that the event loop stays responsive. Operations on small payloads are
+still run inline because the overhead of handing them off to an executor would dominate.
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import enum
+import multiprocessing
+from typing import Any, Callable
+
+DEFAULT_OFFLOAD_THRESHOLD = 65_536
+"""
+Operations on payloads of this many bytes or more are offloaded to the executor.
+"""
+
+
+class CryptoExecutor:
+    """
+    Executor for CPU-heavy cryptographic operations.
+
+    In THREAD mode, offloaded operations run in a thread pool. This works well for operations that
+    release the Global Interpreter Lock (GIL), such as HMAC on large messages, and it keeps the
+    event loop responsive for all other operations, because the GIL is periodically handed back to
+    the event loop thread.
+
+    In PROCESS mode, offloaded CPU-bound operations that hold the GIL for a long time (i.e. Shamir
+    secret sharing, which is implemented in pure Python) run in a process pool, so that they can
+    run in parallel with the event loop. Other offloaded operations still run in the thread pool,
+    since copying their arguments to another process costs more than the operation itself.
+
+    In INLINE mode, all operations run directly on the event loop.
+    """
+
+    class Mode(enum.Enum):
+        """
+        Where to run offloaded operations.
+        """
+
+        INLINE = "inline"
+        THREAD = "thread"
+        PROCESS = "process"
+
+        def __str__(self):
+            return self.value
+
+    _mode: Mode
+    _max_workers: int | None
+    _offload_threshold: int
+    _thread_pool: concurrent.futures.ThreadPoolExecutor | None
+    _process_pool: concurrent.futures.ProcessPoolExecutor | None
+    _nr_inline: int
+    _nr_thread: int
+    _nr_process: int
+
+    def __init__(
+        self,
+        mode: Mode = Mode.THREAD,
+        max_workers: int | None = None,
+        offload_threshold: int = DEFAULT_OFFLOAD_THRESHOLD,
+    ):
+        self._thread_pool = None
+        self._process_pool = None
+        self.configure(mode, max_workers, offload_threshold)
+
+    @property
+    def mode(self) -> Mode:
+        """
+        Get the mode.
+        """
+        return self._mode
+
+    @property
+    def offload_threshold(self) -> int:
+        """
+        Get the payload size (in bytes) at or above which operations are offloaded.
+        """
+        return self._offload_threshold
+
+    def configure(
+        self,
+        mode: Mode,
+        max_workers: int | None = None,
+        offload_threshold: int = DEFAULT_OFFLOAD_THRESHOLD,
+    ) -> None:
+        """
+        (Re-)configure the executor. Any existing pools are shut down; new pools are created on
+        demand.
+        """
+        assert max_workers is None or max_workers > 0
+        assert offload_threshold >= 0
+        self.shutdown(wait=False)
+        self._mode = mode
+        self._max_workers = max_workers
+        self._offload_threshold = offload_threshold
+        self._nr_inline = 0
+        self._nr_thread = 0
+        self._nr_process = 0
+
+    async def run(
+        self, size: int, func: Callable, *args, cpu_bound: bool = False
+    ) -> Any:
+        """
+        Run `func(*args)` and return the result. The `size` is the size of the payload in bytes; it
+        determines whether the operation is offloaded. Set `cpu_bound` for pure Python operations
+        that hold the GIL for a long time; in PROCESS mode they are run in the process pool, which
+        requires `func` and `args` to be picklable.
+        """
+        if self._mode == self.Mode.INLINE or size < self._offload_threshold:
+            self._nr_inline += 1
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        if cpu_bound and self._mode == self.Mode.PROCESS:
+            if self._process_pool is None:
+                # Use spawn rather than fork: forked workers would inherit the listening socket and
+                # the signal handlers of the uvicorn server.
+                self._process_pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self._max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            self._nr_process += 1
+            return await loop.run_in_executor(self._process_pool, func, *args)
+        if self._thread_pool is None:
+            self._thread_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self._max_workers, thread_name_prefix="crypto"
+            )
+        self._nr_thread += 1
+        return await loop.run_in_executor(self._thread_pool, func, *args)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Shut down the thread pool and the process pool (if they were created). If `wait` is set,
+        wait until the worker threads and processes have exited.
+        """
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=wait, cancel_futures=True)
+            self._thread_pool = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=wait, cancel_futures=True)
+            self._process_pool = None
+
+    def to_mgmt(self) -> dict:
+        """
+        Get the management status.
+        """
+        return {
+            "mode": str(self._mode),
+            "max_workers": self._max_workers,
+            "offload_threshold": self._offload_threshold,
+            "nr_inline_operations": self._nr_inline,
+            "nr_thread_operations": self._nr_thread,
+            "nr_process_operations": self._nr_process,
+        }
+
+
+CRYPTO_EXECUTOR = CryptoExecutor()
+"""
+The crypto executor that is used by all cryptographic operations in this process. It is configured
+from the command line arguments of the client or hub.
+"""
+
+
+def add_command_line_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the command line arguments for configuring the crypto executor.
+    """
+    parser.add_argument(
+        "--crypto-executor",
+        type=str,
+        choices=[str(mode) for mode in CryptoExecutor.Mode],
+        default=str(CryptoExecutor.Mode.THREAD),
+        help="Where to run cryptographic operations on large payloads (default: thread)",
+    )
+    parser.add_argument(
+        "--crypto-workers",
+        type=int,
+        help="Maximum number of crypto executor threads or processes (default: Python default)",
+    )
+    parser.add_argument(
+        "--crypto-offload-threshold",
+        type=int,
+        default=DEFAULT_OFFLOAD_THRESHOLD,
+        help=f"Payload size in bytes at or above which cryptographic operations are offloaded "
+        f"(default: {DEFAULT_OFFLOAD_THRESHOLD})",
+    )
+
+
+def configure_from_command_line_arguments(args: argparse.Namespace) -> None:
+    """
+    Configure the crypto executor from the parsed command line arguments.
+    """
+    CRYPTO_EXECUTOR.configure(
+        CryptoExecutor.Mode(args.crypto_executor),
+        args.crypto_workers,
+        args.crypto_offload_threshold,
+    )
+
+
+def command_line_arguments(args: argparse.Namespace) -> list[str]:
+    """
+    Convert the parsed crypto executor command line arguments back into a list of command line
+    arguments (to pass them on to a child process).
+    """
+    result = ["--crypto-executor", args.crypto_executor]
+    if args.crypto_workers is not None:
+        result += ["--crypto-workers", str(args.crypto_workers)]
+    result += ["--crypto-offload-threshold", str(args.crypto_offload_threshold)]
+    return result
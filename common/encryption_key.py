@@ -3,7 +3,18 @@ The key that is used to encrypt key shares in DSKE in-band protocol messages.
 """
 
 from .allocation import Allocation
-from .pool import Pool
+from .crypto_executor import CRYPTO_EXECUTOR
+from .pool import Pool, SHARE_ENCRYPTION_KEY
+
+
+def xor_bytes(data: bytes, key: bytes) -> bytes:
+    """
+    XOR two byte strings of the same length.
+    """
+    assert len(key) == len(data)
+    # Converting to big integers does the XOR in C, which is much faster than XOR-ing byte by byte.
+    result = int.from_bytes(data, "big") ^ int.from_bytes(key, "big")
+    return result.to_bytes(len(data), "big")
 
 
 class EncryptionKey:
@@ -27,9 +38,10 @@ class EncryptionKey:
     @classmethod
     def from_pool(cls, pool: Pool, key_size: int):
         """
-        Allocate a new EncryptionKey from the given pool.
+        Allocate a new EncryptionKey from the given pool. The key is carved from the extent that the
+        pool reserves for share encryption keys, so it is a single fragment.
         """
-        allocation = pool.allocate(key_size, "share-encryption-key")
+        allocation = pool.allocate_from_extent(key_size, SHARE_ENCRYPTION_KEY)
         return EncryptionKey(allocation)
 
     @classmethod
@@ -43,14 +55,7 @@ class EncryptionKey:
         """
         Encrypt data and return the encrypted data.
         """
-        encryption_key = self._allocation.data
-        assert len(encryption_key) == len(data)
-        encrypted_byte_list = [
-            data_byte ^ encryption_key_byte
-            for data_byte, encryption_key_byte in zip(data, encryption_key)
-        ]
-        encrypted_value = bytes(encrypted_byte_list)
-        return encrypted_value
+        return xor_bytes(data, self._allocation.data)
 
     def decrypt(self, encrypted_data: bytes) -> bytes:
         """
@@ -58,3 +63,19 @@ class EncryptionKey:
         """
         # Since we do XOR encryption, encryption and decryption are the same operation.
         return self.encrypt(encrypted_data)
+
+    async def encrypt_async(self, data: bytes) -> bytes:
+        """
+        Encrypt data and return the encrypted data. Large data is encrypted in the crypto executor.
+        """
+        # Get the key data from the pool here, on the event loop, and not in the executor thread.
+        return await CRYPTO_EXECUTOR.run(
+            len(data), xor_bytes, data, self._allocation.data
+        )
+
+    async def decrypt_async(self, encrypted_data: bytes) -> bytes:
+        """
+        Decrypt encrypted data and return the decrypted data. Large data is decrypted in the crypto
+        executor.
+        """
+        return await self.encrypt_async(encrypted_data)
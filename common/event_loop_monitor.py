@@ -0,0 +1,122 @@
+"""
+Monitoring of the responsiveness of the asyncio event loop.
+"""
+
+import asyncio
+from .metrics import REGISTRY
+
+DEFAULT_PROBE_INTERVAL = 0.1
+"""
+How often (in seconds) the event loop lag is measured.
+"""
+
+
+class EventLoopMonitor:
+    """
+    Measures the event loop lag: how much later than scheduled a sleeping task is woken up. A large
+    lag means that something is running on the event loop without yielding (for example a
+    cryptographic operation on a large payload), which delays all other requests.
+    """
+
+    _probe_interval: float
+    _task: asyncio.Task | None
+    _nr_probes: int
+    _last_lag: float
+    _max_lag: float
+    _total_lag: float
+
+    def __init__(self, probe_interval: float = DEFAULT_PROBE_INTERVAL):
+        assert probe_interval > 0
+        self._probe_interval = probe_interval
+        self._task = None
+        self.reset()
+
+    @property
+    def last_lag(self) -> float:
+        """
+        Get the most recently measured lag in seconds.
+        """
+        return self._last_lag
+
+    @property
+    def max_lag(self) -> float:
+        """
+        Get the maximum measured lag in seconds.
+        """
+        return self._max_lag
+
+    @property
+    def mean_lag(self) -> float:
+        """
+        Get the mean measured lag in seconds.
+        """
+        if self._nr_probes == 0:
+            return 0.0
+        return self._total_lag / self._nr_probes
+
+    def reset(self) -> None:
+        """
+        Reset the measurements.
+        """
+        self._nr_probes = 0
+        self._last_lag = 0.0
+        self._max_lag = 0.0
+        self._total_lag = 0.0
+
+    def record_lag(self, lag: float) -> None:
+        """
+        Record one lag measurement.
+        """
+        lag = max(lag, 0.0)
+        self._nr_probes += 1
+        self._last_lag = lag
+        self._max_lag = max(self._max_lag, lag)
+        self._total_lag += lag
+
+    def start(self) -> None:
+        """
+        Start measuring the event loop lag in a background task.
+        """
+        assert self._task is None
+        self._task = asyncio.create_task(self._probe_task())
+
+    def stop(self) -> None:
+        """
+        Stop measuring the event loop lag.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _probe_task(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + self._probe_interval
+            await asyncio.sleep(self._probe_interval)
+            self.record_lag(loop.time() - scheduled)
+
+    def to_mgmt(self) -> dict:
+        """
+        Get the management status.
+        """
+        return {
+            "nr_probes": self._nr_probes,
+            "last_lag": self._last_lag,
+            "max_lag": self._max_lag,
+            "mean_lag": self.mean_lag,
+        }
+
+
+EVENT_LOOP_MONITOR = EventLoopMonitor()
+"""
+The event loop monitor for the event loop of this process.
+"""
+
+_EVENT_LOOP_LAG = REGISTRY.gauge(
+    "dske_event_loop_lag_seconds",
+    "Event loop lag: how much later than scheduled a sleeping task was woken up",
+    ("statistic",),
+)
+_EVENT_LOOP_LAG.labels("last").set_function(lambda: EVENT_LOOP_MONITOR.last_lag)
+_EVENT_LOOP_LAG.labels("max").set_function(lambda: EVENT_LOOP_MONITOR.max_lag)
+_EVENT_LOOP_LAG.labels("mean").set_function(lambda: EVENT_LOOP_MONITOR.mean_lag)
@@ -12,11 +12,18 @@ class DSKEException(Exception):
     Base class for all exceptions in the DSKE module.
     """
 
-    def __init__(self, status_code: int, message: str, details: dict | None = None):
+    def __init__(
+        self,
+        status_code: int,
+        message: str,
+        details: dict | None = None,
+        headers: dict[str, str] | None = None,
+    ):
         super().__init__(message)
         self.status_code = status_code
         self.message = message
         self.details = details
+        self.headers = headers
 
 
 class ClientNotRegisteredError(DSKEException):
@@ -33,6 +40,19 @@ class ClientNotRegisteredError(DSKEException):
         )
 
 
+class HubNotKnownError(DSKEException):
+    """
+    Exception raised when a hub is not one of the peer hubs of the client.
+    """
+
+    def __init__(self, hub_name: str):
+        super().__init__(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            message="Hub is not known.",
+            details={"hub_name": hub_name},
+        )
+
+
 class InvalidPoolOwnerError(DSKEException):
     """
     Exception raised when an invalid pool owner is specified.
@@ -335,6 +355,42 @@ class EncryptorNotRegisteredForClientError(DSKEException):
         )
 
 
+class NoCommonAuthenticationModeError(DSKEException):
+    """
+    Exception raised when a client registers with a hub, and the hub supports none of the message
+    authentication modes that the client offered.
+    """
+
+    def __init__(
+        self, client_name: str, offered_modes: list[str], supported_modes: list[str]
+    ):
+        super().__init__(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            message="No common message authentication mode.",
+            details={
+                "client_name": client_name,
+                "offered_modes": offered_modes,
+                "supported_modes": supported_modes,
+            },
+        )
+
+
+class InvalidRequestBodyError(DSKEException):
+    """
+    Exception raised when the body of a DSKE API request cannot be decoded.
+    """
+
+    def __init__(self, message_type: str, reason: str):
+        super().__init__(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            message="Invalid request body.",
+            details={
+                "message_type": message_type,
+                "reason": reason,
+            },
+        )
+
+
 class MissingAuthorizationHeaderError(DSKEException):
     """
     Exception raised when the Authorization header is missing.
@@ -348,3 +404,81 @@ class MissingAuthorizationHeaderError(DSKEException):
                 "client_name": client_name,
             },
         )
+
+
+class TooManyRequestsError(DSKEException):
+    """
+    Exception raised when an encryptor has too many concurrent requests in progress.
+    """
+
+    def __init__(self, sae_id: str, max_nr_requests: int, retry_after: int):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            message="Too many concurrent requests for encryptor.",
+            details={
+                "sae_id": sae_id,
+                "max_nr_requests": max_nr_requests,
+            },
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class OverloadedError(DSKEException):
+    """
+    Exception raised when a request is rejected because the node is overloaded: the maximum number
+    of concurrent requests are in progress and the wait queue is full (or the request waited too
+    long in the queue).
+    """
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            message="Overloaded.",
+            details={"reason": reason},
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class NotEnoughPeerHubsWithPSRDError(DSKEException):
+    """
+    Exception raised when a request is rejected up front because too few peer hubs have enough
+    Pre-Shared Random Data (PSRD) to authenticate (and encrypt) the requests to them.
+    """
+
+    def __init__(
+        self, nr_peer_hubs_with_psrd: int, nr_required_peer_hubs: int, retry_after: int
+    ):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            message="Not enough peer hubs with Pre-Shared Random Data (PSRD).",
+            details={
+                "nr_peer_hubs_with_psrd": nr_peer_hubs_with_psrd,
+                "nr_required_peer_hubs": nr_required_peer_hubs,
+            },
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class ProfilingDisabledError(DSKEException):
+    """
+    Exception raised when a profile is requested from a node that was not started with on-demand
+    profiling enabled.
+    """
+
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_403_FORBIDDEN,
+            message="Profiling is disabled (start the node with --enable-profiling).",
+        )
+
+
+class ProfilingInProgressError(DSKEException):
+    """
+    Exception raised when a profile is requested while another profile is being taken.
+    """
+
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_409_CONFLICT,
+            message="Another profile is being taken.",
+        )
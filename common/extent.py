@@ -0,0 +1,69 @@
+"""
+A PSRD extent: a contiguous range of bytes within one PSRD block that is reserved for many small
+allocations.
+"""
+
+from .fragment import Fragment
+
+
+class Extent:
+    """
+    A contiguous range of bytes within one PSRD block that a pool has reserved for many small
+    allocations (e.g. the encryption keys for many key shares). Allocations are carved from the
+    extent in order, so each one is a single fragment in the same block, and carving one does not
+    have to search the blocks of the pool.
+
+    The reserved bytes are marked as used in the block, but they are not consumed until they are
+    carved from the extent. Bytes that are never carved are given back to the block when the extent
+    is released.
+    """
+
+    _reserved_fragment: Fragment
+    _offset: int  # Within the reserved fragment, of the first byte that has not been carved yet
+
+    def __init__(self, reserved_fragment: Fragment):
+        self._reserved_fragment = reserved_fragment
+        self._offset = 0
+
+    @property
+    def block(self) -> "Block":  # type: ignore
+        """
+        Get the block that the extent was reserved in.
+        """
+        return self._reserved_fragment.block
+
+    @property
+    def nr_unused_bytes(self) -> int:
+        """
+        Get the number of bytes that have not been carved from the extent yet.
+        """
+        return self._reserved_fragment.size - self._offset
+
+    def carve(self, size: int) -> Fragment | None:
+        """
+        Carve a fragment of `size` bytes from the extent. Returns None if the extent does not have
+        `size` unused bytes left.
+        """
+        assert size > 0
+        if self.nr_unused_bytes < size:
+            return None
+        reserved = self._reserved_fragment
+        start = self._offset
+        self._offset += size
+        return Fragment(
+            block=reserved.block,
+            start=reserved.start + start,
+            size=size,
+            data=reserved.data[start : self._offset],
+        )
+
+    def release(self) -> None:
+        """
+        Give the bytes that have not been carved from the extent back to the block.
+        """
+        if self.nr_unused_bytes > 0:
+            reserved = self._reserved_fragment
+            reserved.block.give_back_data(
+                reserved.start + self._offset, reserved.data[self._offset :]
+            )
+            self._offset = reserved.size
@@ -1,8 +1,279 @@
 """
 Logging.
+
+The log records of a node are divided into categories, which are child loggers of LOGGER (and the
+uvicorn access log), each with its own level. The categories of per-request events are rate-limited.
+
+Once a node is configured (see `configure`), the log handlers that uvicorn installed are moved
+behind a queue: the event loop only puts the log records on the queue, and a background thread
+formats and writes them. Log calls on hot paths use lazy %-style formatting, so a message is only
+formatted if its record is written, and then in the background thread.
 """
 
+import argparse
+import atexit
 import logging
+import logging.handlers
+import queue
+import time
 
 LOGGER = logging.getLogger("uvicorn.dske")
 LOGGER.setLevel(logging.DEBUG)
+
+HTTP_LOGGER = LOGGER.getChild("http")
+"""Calls from the client to the hubs."""
+
+KEY_LOGGER = LOGGER.getChild("key")
+"""Scattering and gathering key shares."""
+
+POOL_LOGGER = LOGGER.getChild("pool")
+"""Allocating PSRD from pools."""
+
+REQUEST_LOGGER = LOGGER.getChild("request")
+"""Rejected requests (unknown peers, invalid signatures, unknown keys, etc.)."""
+
+ACCESS_LOGGER = logging.getLogger("uvicorn.access")
+"""The access log of uvicorn (one record per request)."""
+
+CATEGORIES = {
+    "dske": LOGGER,
+    "http": HTTP_LOGGER,
+    "key": KEY_LOGGER,
+    "pool": POOL_LOGGER,
+    "request": REQUEST_LOGGER,
+    "access": ACCESS_LOGGER,
+}
+"""
+The log categories, indexed by name. The level of category "dske" is inherited by the other
+categories, except "access", unless they have their own level.
+"""
+
+PER_REQUEST_CATEGORIES = ["http", "key", "pool", "request", "access"]
+"""The log categories of per-request events, which are rate-limited."""
+
+DEFAULT_RATE_LIMIT = 100.0
+"""By default, write at most this many log records per second in each per-request category."""
+
+_QUEUED_LOGGER_NAMES = ["uvicorn", "uvicorn.access"]
+"""The loggers that uvicorn installs handlers on (the other uvicorn loggers propagate to them)."""
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most `rate` log records per second on average (in bursts of at most `rate`
+    records), and drop the others. When records are let through again after some were dropped,
+    a warning on LOGGER reports how many. (The dropped records are not counted in the record that
+    is let through, because the uvicorn access log formatter needs its original arguments.)
+    """
+
+    _category: str
+    _rate: float
+    _tokens: float
+    _last_time: float
+    _nr_dropped: int
+
+    def __init__(self, category: str, rate: float):
+        super().__init__()
+        self._category = category
+        self._rate = rate
+        self._tokens = rate
+        self._last_time = time.monotonic()
+        self._nr_dropped = 0
+
+    @property
+    def nr_dropped(self) -> int:
+        """
+        Get the number of records that were dropped since the last record that was let through.
+        """
+        return self._nr_dropped
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        now = time.monotonic()
+        self._tokens = min(
+            self._rate, self._tokens + (now - self._last_time) * self._rate
+        )
+        self._last_time = now
+        if self._tokens < 1.0:
+            self._nr_dropped += 1
+            return False
+        self._tokens -= 1.0
+        if self._nr_dropped > 0:
+            LOGGER.warning(
+                "Dropped %s log records in category %s (rate limit %s per second)",
+                self._nr_dropped,
+                self._category,
+                self._rate,
+            )
+            self._nr_dropped = 0
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    A queue handler that leaves formatting the record to the handlers in the background thread.
+    (The standard queue handler formats the record before putting it on the queue, which would
+    format it on the event loop.) The arguments of the log calls are values that are not modified
+    after the call (strings, numbers, UUIDs, URLs, exceptions), so it is safe to format them later.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class _QueuedLogger:
+    """
+    A logger whose handlers were moved behind a queue.
+    """
+
+    _logger: logging.Logger
+    _handlers: list[logging.Handler]
+    _queue_handler: _QueueHandler
+    _listener: logging.handlers.QueueListener
+
+    def __init__(self, logger: logging.Logger):
+        self._logger = logger
+        self._handlers = list(logger.handlers)
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._queue_handler = _QueueHandler(log_queue)
+        self._listener = logging.handlers.QueueListener(
+            log_queue, *self._handlers, respect_handler_level=True
+        )
+
+    def start(self) -> None:
+        """
+        Start writing the log records of the logger in the background thread.
+        """
+        for handler in self._handlers:
+            self._logger.removeHandler(handler)
+        self._logger.addHandler(self._queue_handler)
+        self._listener.start()
+
+    def stop(self) -> None:
+        """
+        Write the log records that are still in the queue, and give the handlers back to the
+        logger.
+        """
+        self._logger.removeHandler(self._queue_handler)
+        self._listener.stop()
+        for handler in self._handlers:
+            self._logger.addHandler(handler)
+
+
+_QUEUED_LOGGERS: list[_QueuedLogger] = []
+
+
+def start_queued_logging() -> None:
+    """
+    Move the handlers of the uvicorn loggers behind a queue that is written by a background thread.
+    Call this after uvicorn has configured logging (i.e. after creating the uvicorn.Config). The
+    queue is drained when the process exits.
+    """
+    if _QUEUED_LOGGERS:
+        return
+    for logger_name in _QUEUED_LOGGER_NAMES:
+        logger = logging.getLogger(logger_name)
+        if logger.handlers:
+            queued_logger = _QueuedLogger(logger)
+            queued_logger.start()
+            _QUEUED_LOGGERS.append(queued_logger)
+    atexit.register(stop_queued_logging)
+
+
+def stop_queued_logging() -> None:
+    """
+    Write the log records that are still in the queue, stop the background threads, and write
+    later log records directly again.
+    """
+    while _QUEUED_LOGGERS:
+        _QUEUED_LOGGERS.pop().stop()
+
+
+def omit_unused_record_attributes() -> None:
+    """
+    Don't collect the attributes of log records that the uvicorn formatters don't use: the caller
+    (file, line, and function), the thread, and the process. This is the optimization that the
+    documentation of the logging package recommends, and it saves about a third of the cost of
+    creating a log record.
+    """
+    # pylint: disable=protected-access
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+
+def configure(
+    levels: dict[str, int],
+    rate_limit: float | None = DEFAULT_RATE_LIMIT,
+) -> None:
+    """
+    Set the levels of the given log categories, and rate-limit the per-request categories to
+    `rate_limit` records per second (None means no rate limit).
+    """
+    for category, level in levels.items():
+        CATEGORIES[category].setLevel(level)
+    for category in PER_REQUEST_CATEGORIES:
+        logger = CATEGORIES[category]
+        for log_filter in list(logger.filters):
+            if isinstance(log_filter, RateLimitFilter):
+                logger.removeFilter(log_filter)
+        if rate_limit is not None:
+            logger.addFilter(RateLimitFilter(category, rate_limit))
+
+
+def _parse_log_level(value: str) -> tuple[str, int]:
+    category, _, level_name = value.rpartition("=")
+    if category == "":
+        category = "dske"
+    if category not in CATEGORIES:
+        raise argparse.ArgumentTypeError(f"unknown log category '{category}'")
+    level = logging.getLevelName(level_name.upper())
+    if not isinstance(level, int):
+        raise argparse.ArgumentTypeError(f"unknown log level '{level_name}'")
+    return (category, level)
+
+
+def add_command_line_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the command line arguments for configuring logging.
+    """
+    parser.add_argument(
+        "--log-level",
+        type=_parse_log_level,
+        action="append",
+        default=[],
+        metavar="[CATEGORY=]LEVEL",
+        help=f"Log level (e.g. info, warning) of a log category (one of "
+        f"{', '.join(CATEGORIES)}; default: dske); can be repeated",
+    )
+    parser.add_argument(
+        "--log-rate-limit",
+        type=float,
+        default=DEFAULT_RATE_LIMIT,
+        help=f"Maximum number of log records per second in each per-request log category "
+        f"({', '.join(PER_REQUEST_CATEGORIES)}); 0 disables the rate limit "
+        f"(default: {DEFAULT_RATE_LIMIT:g})",
+    )
+
+
+def configure_from_command_line_arguments(args: argparse.Namespace) -> None:
+    """
+    Configure logging from the parsed command line arguments, and start queued logging. Call this
+    after uvicorn has configured logging (i.e. after creating the uvicorn.Config).
+    """
+    rate_limit = args.log_rate_limit if args.log_rate_limit > 0 else None
+    configure(dict(args.log_level), rate_limit)
+    omit_unused_record_attributes()
+    start_queued_logging()
+
+
+def command_line_arguments(args: argparse.Namespace) -> list[str]:
+    """
+    Convert the parsed logging command line arguments back into a list of command line arguments
+    (to pass them on to a child process).
+    """
+    result = []
+    for category, level in args.log_level:
+        result += ["--log-level", f"{category}={logging.getLevelName(level).lower()}"]
+    result += ["--log-rate-limit", str(args.log_rate_limit)]
+    return result
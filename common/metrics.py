@@ -0,0 +1,384 @@
+"""
+Metrics (counters, gauges, and histograms) that are exposed in the Prometheus text format.
+
+Instrumentation is designed to be cheap when nobody is scraping the metrics: the code that is
+instrumented keeps a reference to a labeled metric child (looked up once, e.g. when a pool is
+created), and updating a child is a single attribute update (plus a bisect for histograms). All
+the formatting work is done when the metrics are scraped.
+
+Updates are not protected by a lock. Under the Global Interpreter Lock, a concurrent update from a
+crypto executor thread can very occasionally be lost, which is acceptable for metrics.
+"""
+
+import bisect
+from typing import Callable, Iterator
+
+DEFAULT_LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+"""
+Default histogram buckets (upper bounds in seconds) for latencies.
+"""
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+"""
+The content type of the Prometheus text format.
+"""
+
+
+def _format_labels(label_names: tuple[str, ...], label_values: tuple[str, ...]) -> str:
+    if not label_names:
+        return ""
+    pairs = [
+        f'{name}="{_escape_label_value(value)}"'
+        for name, value in zip(label_names, label_values)
+    ]
+    return "{" + ",".join(pairs) + "}"
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    """
+    Base class for metrics. A metric has a name, a help text, and optionally label names. A metric
+    with labels has one child per combination of label values; a metric without labels has exactly
+    one child.
+    """
+
+    type_name: str = "untyped"
+
+    _name: str
+    _help: str
+    _label_names: tuple[str, ...]
+    _children: dict[tuple[str, ...], object]
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...] = ()):
+        self._name = name
+        self._help = help_text
+        self._label_names = tuple(label_names)
+        self._children = {}
+
+    @property
+    def name(self) -> str:
+        """
+        Get the name.
+        """
+        return self._name
+
+    def labels(self, *label_values: str):
+        """
+        Get the child for the given label values (creating it if needed). Callers on a hot path
+        should look up the child once and keep a reference to it.
+        """
+        assert len(label_values) == len(self._label_names)
+        label_values = tuple(str(value) for value in label_values)
+        child = self._children.get(label_values)
+        if child is None:
+            child = self._new_child()
+            self._children[label_values] = child
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> Iterator[tuple[str, str, float]]:
+        """
+        Generate (sample name, formatted labels, value) tuples.
+        """
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """
+        Render the metric in the Prometheus text format.
+        """
+        lines = [
+            f"# HELP {self._name} {self._help}",
+            f"# TYPE {self._name} {self.type_name}",
+        ]
+        for sample_name, labels, value in self._samples():
+            lines.append(f"{sample_name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class CounterChild:
+    """
+    A counter for one combination of label values.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int | float = 1) -> None:
+        """
+        Increase the counter.
+        """
+        self.value += amount
+
+
+class Counter(Metric):
+    """
+    A counter: a value that only goes up.
+    """
+
+    type_name = "counter"
+
+    def _new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def inc(self, amount: int | float = 1) -> None:
+        """
+        Increase the counter (only for counters without labels).
+        """
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for label_values, child in list(self._children.items()):
+            labels = _format_labels(self._label_names, label_values)
+            yield (self._name, labels, child.value)
+
+
+class GaugeChild:
+    """
+    A gauge for one combination of label values.
+    """
+
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value: int | float) -> None:
+        """
+        Set the gauge.
+        """
+        self.value = value
+
+    def set_function(self, function: Callable[[], int | float]) -> None:
+        """
+        Compute the value of the gauge by calling `function` when the metrics are scraped.
+        """
+        self.function = function
+
+
+class Gauge(Metric):
+    """
+    A gauge: a value that can go up and down. The value is either set explicitly or computed by a
+    function when the metrics are scraped (which costs nothing when nobody is scraping).
+    """
+
+    type_name = "gauge"
+
+    def _new_child(self) -> GaugeChild:
+        return GaugeChild()
+
+    def set(self, value: int | float) -> None:
+        """
+        Set the gauge (only for gauges without labels).
+        """
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], int | float]) -> None:
+        """
+        Compute the gauge with a function (only for gauges without labels).
+        """
+        self.labels().set_function(function)
+
+    def _samples(self):
+        for label_values, child in list(self._children.items()):
+            labels = _format_labels(self._label_names, label_values)
+            value = child.value if child.function is None else child.function()
+            yield (self._name, labels, value)
+
+
+class HistogramChild:
+    """
+    A histogram for one combination of label values.
+    """
+
+    __slots__ = ("upper_bounds", "bucket_counts", "count", "sum")
+
+    def __init__(self, upper_bounds: tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        self.bucket_counts = [0] * (len(upper_bounds) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """
+        Record an observation.
+        """
+        self.bucket_counts[bisect.bisect_left(self.upper_bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Histogram(Metric):
+    """
+    A histogram: counts observations (e.g. latencies) in buckets.
+    """
+
+    type_name = "histogram"
+
+    _upper_bounds: tuple[float, ...]
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help_text, label_names)
+        self._upper_bounds = tuple(sorted(buckets))
+
+    def _new_child(self) -> HistogramChild:
+        return HistogramChild(self._upper_bounds)
+
+    def observe(self, value: float) -> None:
+        """
+        Record an observation (only for histograms without labels).
+        """
+        self.labels().observe(value)
+
+    def _samples(self):
+        for label_values, child in list(self._children.items()):
+            cumulative_count = 0
+            upper_bounds = child.upper_bounds + (float("inf"),)
+            for upper_bound, bucket_count in zip(upper_bounds, child.bucket_counts):
+                cumulative_count += bucket_count
+                labels = _format_labels(
+                    self._label_names + ("le",),
+                    label_values + (_format_value(upper_bound),),
+                )
+                yield (f"{self._name}_bucket", labels, cumulative_count)
+            labels = _format_labels(self._label_names, label_values)
+            yield (f"{self._name}_count", labels, child.count)
+            yield (f"{self._name}_sum", labels, child.sum)
+
+
+class Registry:
+    """
+    A collection of metrics that are rendered together.
+    """
+
+    _metrics: dict[str, Metric]
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            # Registering the same metric twice (e.g. when a module is imported twice under
+            # different names) returns the existing metric. Two different definitions with the same
+            # name are a bug: a metric must be defined once and imported where it is used.
+            # pylint: disable=protected-access
+            assert type(existing) is type(metric)
+            assert existing._help == metric._help
+            assert existing._label_names == metric._label_names
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self, name: str, help_text: str, label_names: tuple[str, ...] = ()
+    ) -> Counter:
+        """
+        Create and register a counter.
+        """
+        return self._register(Counter(name, help_text, label_names))
+
+    def gauge(
+        self, name: str, help_text: str, label_names: tuple[str, ...] = ()
+    ) -> Gauge:
+        """
+        Create and register a gauge.
+        """
+        return self._register(Gauge(name, help_text, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+    ) -> Histogram:
+        """
+        Create and register a histogram.
+        """
+        return self._register(Histogram(name, help_text, label_names, buckets))
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text format.
+        """
+        return "".join(metric.render() for metric in self._metrics.values())
+
+
+REGISTRY = Registry()
+"""
+The registry for all metrics in this process.
+"""
+
+
+def combine_rendered_metrics(rendered_metrics: list[str], label_name: str) -> str:
+    """
+    Combine metrics that were rendered in the Prometheus text format by several processes (e.g. the
+    workers of a hub) into one text. Each sample gets an additional label `label_name` whose value
+    is the index of the process in `rendered_metrics`. The samples of each metric are kept together
+    under a single HELP and TYPE line, as required by the format.
+    """
+    families: dict[str, tuple[list[str], list[str]]] = (
+        {}
+    )  # Name -> (header lines, samples)
+    for index, text in enumerate(rendered_metrics):
+        label = f'{label_name}="{index}"'
+        header_lines = None
+        sample_lines = None
+        for line in text.splitlines():
+            if line.startswith("# HELP "):
+                name = line.split(" ", 3)[2]
+                if name not in families:
+                    families[name] = ([], [])
+                (header_lines, sample_lines) = families[name]
+                if not header_lines:
+                    header_lines.append(line)
+            elif line.startswith("# TYPE "):
+                if len(header_lines) < 2:
+                    header_lines.append(line)
+            elif line and not line.startswith("#") and sample_lines is not None:
+                sample, value = line.rsplit(" ", 1)
+                if sample.endswith("}"):
+                    sample = f"{sample[:-1]},{label}}}"
+                else:
+                    sample = f"{sample}{{{label}}}"
+                sample_lines.append(f"{sample} {value}")
+    lines = []
+    for header_lines, sample_lines in families.values():
+        lines += header_lines + sample_lines
+    return "\n".join(lines) + "\n"
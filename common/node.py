@@ -6,6 +6,7 @@ import errno
 import dataclasses
 import enum
 import socket
+import httpx
 
 
 class NodeType(enum.IntEnum):
@@ -48,11 +49,18 @@ class Node:
     port: None | int = None
     base_url: None | str = None
 
-    def is_started(self) -> bool:
+    async def is_ready(self) -> bool:
         """
-        Check if the node has been started and is ready to accept API calls.
+        Check if the node has been started and is ready (see the /mgmt/v1/ready management API): a
+        hub is ready as soon as it serves requests, a client once it has registered with all hubs
+        and received its initial PSRD.
         """
-        return self.is_port_in_use()
+        try:
+            async with httpx.AsyncClient(timeout=1.0) as http_client:
+                response = await http_client.get(f"{self.base_url}/mgmt/v1/ready")
+        except httpx.HTTPError:
+            return False
+        return response.status_code == 200
 
     def is_stopped(self) -> bool:
         """
@@ -66,6 +74,9 @@ class Node:
         it means the DSKE node cannot be started on that port)?
         """
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Nodes (uvicorn) bind their port with SO_REUSEADDR, so connections to the port of a stopped
+        # node that are still in the TIME_WAIT state do not stop the node from being restarted.
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         try:
             sock.bind(("", self.port))
         except OSError as error:
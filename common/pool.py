@@ -2,18 +2,87 @@
 A pool of blocks.
 """
 
+import bisect
+import collections
 import enum
+import threading
 from uuid import UUID
 from pydantic import PositiveInt
 from .allocation import Allocation
 from .block import Block
-from .logging import LOGGER
-from .exceptions import OutOfPreSharedRandomDataError, InvalidBlockUUIDError
+from .block_reaper import BLOCK_REAPER
+from .extent import Extent
+from .logging import POOL_LOGGER
+from .metrics import REGISTRY, CounterChild
+from .tracing import TRACER
+from .exceptions import (
+    OutOfPreSharedRandomDataError,
+    InvalidBlockUUIDError,
+    InvalidPoolOwnerError,
+)
+
+MESSAGE_SIGNING_KEY = "message-signing-key"
+"""
+The purpose of allocations for keys that sign DSKE in-band protocol messages.
+"""
+
+SHARE_ENCRYPTION_KEY = "share-encryption-key"
+"""
+The purpose of allocations for keys that encrypt key shares.
+"""
+
+DEFAULT_RESERVED_BYTES = {
+    MESSAGE_SIGNING_KEY: 0,
+    SHARE_ENCRYPTION_KEY: 256,
+}
+"""
+For each purpose, the number of unused bytes that must remain in a pool after an allocation for
+that purpose. Signing keys are small and every request and response needs one, so they can use the
+last bytes of a pool. Share encryption keys can be large, so they must leave room for at least
+eight signing keys: a burst of large keys cannot starve the signatures of the requests that are in
+progress. Purposes that are not listed have no reserve.
+"""
+
+EXTENT_SIZE = 1024
+"""
+The number of bytes that allocate_from_extent reserves at once (if the pool has that much
+available).
+"""
+
+_POOL_LABELS = ("pool", "owner")
+
+_PSRD_CONSUMED_BYTES = REGISTRY.counter(
+    "dske_psrd_consumed_bytes_total",
+    "PSRD bytes consumed from a pool (allocated locally or taken on behalf of the peer)",
+    _POOL_LABELS,
+)
+_PSRD_RETURNED_BYTES = REGISTRY.counter(
+    "dske_psrd_returned_bytes_total",
+    "PSRD bytes given back to a pool after an allocation was rolled back",
+    _POOL_LABELS,
+)
+_PSRD_REFILLED_BYTES = REGISTRY.counter(
+    "dske_psrd_refilled_bytes_total",
+    "PSRD bytes added to a pool in new blocks",
+    _POOL_LABELS,
+)
+_PSRD_ALLOCATION_FAILURES = REGISTRY.counter(
+    "dske_psrd_allocation_failures_total",
+    "PSRD allocations that failed because there was not enough unused PSRD in a pool (beyond the "
+    "bytes reserved for higher priority purposes)",
+    _POOL_LABELS + ("purpose",),
+)
 
 
 class Pool:
     """
     A pool of blocks.
+
+    A pool is shared by many concurrent coroutines (e.g. scattering a key to multiple hubs, the PSRD
+    refill tasks, and signature checks), and allocations may be made from crypto executor threads.
+    All operations on the list of blocks are done while holding the pool lock, and each block
+    has its own lock that protects its data and used map. When both locks are needed, the pool lock
+    is taken first.
     """
 
     class Owner(enum.Enum):
@@ -29,14 +98,63 @@ class Pool:
         def __str__(self):
             return self.name.lower()
 
+        @classmethod
+        def from_str(cls, owner_str: str) -> "Pool.Owner":
+            """
+            Parse a pool owner ("local" or "peer", as used in the management status).
+            """
+            match owner_str.lower():
+                case "local":
+                    return cls.LOCAL
+                case "peer":
+                    return cls.PEER
+            raise InvalidPoolOwnerError(owner_str)
+
     _name: str
-    _blocks: list[Block]
+    # Indexed by sequence number, in the order in which the blocks were added
+    _blocks: dict[int, Block]
+    _block_sequence_numbers: dict[UUID, int]  # Indexed by block UUID
+    _next_block_sequence_number: int
+    _retire_queue: collections.deque  # Of fully used blocks; appending is thread-safe
     _owner: Owner
+    _reserved_bytes: dict[str, int]  # Indexed by purpose
+    _extents: dict[str, Extent]  # Indexed by purpose
+    _lock: (
+        threading.RLock
+    )  # Protects _blocks, _block_sequence_numbers, the next number, and _extents
+    _nr_consumed_bytes: int  # Consumed and not given back
+    _consumed_bytes_metric: CounterChild
+    _returned_bytes_metric: CounterChild
+    _refilled_bytes_metric: CounterChild
+    _allocation_failures_metrics: dict[str, CounterChild]  # Indexed by purpose
 
-    def __init__(self, name: str, owner: Owner):
+    def __init__(
+        self, name: str, owner: Owner, reserved_bytes: dict[str, int] | None = None
+    ):
         self._name = name
-        self._blocks = []
+        self._blocks = {}
+        self._block_sequence_numbers = {}
+        self._next_block_sequence_number = 0
+        self._retire_queue = collections.deque()
         self._owner = owner
+        if reserved_bytes is None:
+            reserved_bytes = DEFAULT_RESERVED_BYTES
+        self._reserved_bytes = reserved_bytes
+        self._extents = {}
+        self._lock = threading.RLock()
+        labels = (name, str(owner))
+        self._nr_consumed_bytes = 0
+        self._consumed_bytes_metric = _PSRD_CONSUMED_BYTES.labels(*labels)
+        self._returned_bytes_metric = _PSRD_RETURNED_BYTES.labels(*labels)
+        self._refilled_bytes_metric = _PSRD_REFILLED_BYTES.labels(*labels)
+        self._allocation_failures_metrics = {}
+
+    @property
+    def name(self) -> str:
+        """
+        Get the name of the pool (the name of the peer node).
+        """
+        return self._name
 
     @property
     def owner(self) -> Owner:
@@ -48,85 +166,327 @@ class Pool:
     @property
     def nr_used_bytes(self):
         """
-        Return the total number of used bytes in the pool.
+        Return the total number of used bytes in the pool. Bytes that are reserved in an extent but
+        not carved from it yet count as unused.
         """
-        return sum(block.nr_used_bytes for block in self._blocks)
+        with self._lock:
+            return (
+                sum(block.nr_used_bytes for block in self._blocks.values())
+                - self._nr_unused_extent_bytes()
+            )
 
     @property
     def nr_unused_bytes(self):
         """
-        Return the total number of unused bytes in the pool.
+        Return the total number of unused bytes in the pool, including the bytes that are reserved
+        in an extent but not carved from it yet.
+        """
+        with self._lock:
+            return self._nr_unused_block_bytes() + self._nr_unused_extent_bytes()
+
+    def _nr_unused_block_bytes(self) -> int:
+        # Caller must hold self._lock
+        return sum(block.nr_unused_bytes for block in self._blocks.values())
+
+    def _nr_unused_extent_bytes(self) -> int:
+        # Caller must hold self._lock
+        return sum(extent.nr_unused_bytes for extent in self._extents.values())
+
+    def _blocks_to_mgmt(self, blocks: list[Block]) -> list[dict]:
+        """
+        Get the management status of blocks of the pool. The bytes that are reserved in an extent
+        but have not been carved from it yet count as unused.
         """
-        return sum(block.nr_unused_bytes for block in self._blocks)
+        with self._lock:
+            extents = list(self._extents.values())
+        block_statuses = []
+        for block in blocks:
+            block_status = block.to_mgmt()
+            nr_unused_extent_bytes = sum(
+                extent.nr_unused_bytes for extent in extents if extent.block is block
+            )
+            block_status["nr_used_bytes"] -= nr_unused_extent_bytes
+            block_status["nr_unused_bytes"] += nr_unused_extent_bytes
+            block_statuses.append(block_status)
+        return block_statuses
 
     def to_mgmt(self) -> dict:
         """
         Get the management status.
         """
+        with self._lock:
+            blocks = list(self._blocks.values())
         return {
-            "blocks": [block.to_mgmt() for block in self._blocks],
+            "blocks": self._blocks_to_mgmt(blocks),
             "owner": str(self._owner),
         }
 
+    def to_mgmt_summary(self) -> dict:
+        """
+        Get a summary of the management status: aggregate counts instead of the details of every
+        block.
+        """
+        with self._lock:
+            blocks = list(self._blocks.values())
+            nr_unused_extent_bytes = self._nr_unused_extent_bytes()
+        nr_used_bytes = (
+            sum(block.nr_used_bytes for block in blocks) - nr_unused_extent_bytes
+        )
+        size = sum(block.size for block in blocks)
+        return {
+            "owner": str(self._owner),
+            "nr_blocks": len(blocks),
+            "size": size,
+            "nr_used_bytes": nr_used_bytes,
+            "nr_unused_bytes": size - nr_used_bytes,
+        }
+
+    def blocks_page(
+        self, cursor: int | None, limit: PositiveInt
+    ) -> tuple[list[Block], int | None]:
+        """
+        Get one page of the blocks in the pool, in the order in which they were added. The `cursor`
+        is None for the first page, and the cursor that was returned with the previous page for the
+        next pages. Returns the blocks and the cursor for the next page (None if this is the last
+        page). Blocks that are deleted or added between pages don't cause other blocks to be skipped
+        or repeated.
+        """
+        with self._lock:
+            sequence_numbers = list(self._blocks)
+            start = (
+                0 if cursor is None else bisect.bisect_right(sequence_numbers, cursor)
+            )
+            page_sequence_numbers = sequence_numbers[start : start + limit]
+            blocks = [self._blocks[number] for number in page_sequence_numbers]
+        if start + limit < len(sequence_numbers):
+            next_cursor = page_sequence_numbers[-1]
+        else:
+            next_cursor = None
+        return (blocks, next_cursor)
+
+    def to_mgmt_blocks_page(self, cursor: int | None, limit: PositiveInt) -> dict:
+        """
+        Get the management status for one page of blocks (see blocks_page).
+        """
+        (blocks, next_cursor) = self.blocks_page(cursor, limit)
+        return {
+            "blocks": self._blocks_to_mgmt(blocks),
+            "next_cursor": next_cursor,
+        }
+
     def add_block(self, block: Block):
         """
         Add a block to the pool.
         """
-        self._blocks.append(block)
+        block.set_fully_used_callback(self._block_fully_used)
+        with self._lock:
+            self._blocks[self._next_block_sequence_number] = block
+            self._block_sequence_numbers[block.uuid] = self._next_block_sequence_number
+            self._next_block_sequence_number += 1
+        self._refilled_bytes_metric.inc(block.size)
+
+    @property
+    def nr_consumed_bytes(self) -> int:
+        """
+        Get the number of PSRD bytes that were consumed from this pool (allocated locally or taken
+        on behalf of the peer, and not given back).
+        """
+        return self._nr_consumed_bytes
 
     def get_block(self, block_uuid: UUID) -> Block:
         """
         Get a block by block UUID.
         """
-        for block in self._blocks:
-            if block.uuid == block_uuid:
-                return block
+        with self._lock:
+            sequence_number = self._block_sequence_numbers.get(block_uuid)
+            if sequence_number is not None:
+                return self._blocks[sequence_number]
         raise InvalidBlockUUIDError(block_uuid=str(block_uuid))
 
+    def nr_bytes_needed(self, size: PositiveInt, purpose: str) -> int:
+        """
+        Get the number of unused bytes that the pool needs for an allocation of `size` bytes for
+        `purpose` to succeed: the size plus the reserve for the purpose.
+        """
+        return size + self._reserved_bytes.get(purpose, 0)
+
+    def can_allocate(self, size: PositiveInt, purpose: str) -> bool:
+        """
+        Check whether an allocation of `size` bytes for `purpose` would currently succeed.
+        """
+        return self.nr_unused_bytes >= self.nr_bytes_needed(size, purpose)
+
     def allocate(self, size: PositiveInt, purpose: str) -> Allocation:
         """
         Allocate an allocation from the pool. An allocation consists of one or more fragments.
         This either returns an Allocation object for the full requested `size`. Raises exception
-        OutOfPreSharedRandomDataError if not enough unused bytes are available in the pool.
+        OutOfPreSharedRandomDataError if not enough unused bytes are available in the pool, taking
+        into account that the bytes that are reserved for `purpose` (see DEFAULT_RESERVED_BYTES)
+        must remain unused after the allocation.
         """
-        available = self.nr_unused_bytes
+        with self._span("allocate", size, purpose), self._lock:
+            self._check_available(size, purpose)
+            if self._nr_unused_block_bytes() < size:
+                # Some of the available bytes are reserved in extents.
+                self._release_extents()
+            fragments = []
+            try:
+                remaining_size = size
+                for block in self._blocks.values():
+                    while remaining_size > 0:
+                        fragment = block.allocate_fragment(remaining_size)
+                        if fragment is None:
+                            # The current block is exhausted, move on to the next block, if any.
+                            break
+                        fragments.append(fragment)
+                        remaining_size -= fragment.size
+                    if remaining_size == 0:
+                        # We have allocated the full desired size; no need to look at any more
+                        # blocks.
+                        break
+                assert (
+                    remaining_size == 0
+                )  # We checked availability at the top of the method.
+                return Allocation(fragments, pool=self)
+            # As far as we know because of the check at the top, there is currently no way to
+            # reach this. This is just defensive programming.
+            except Exception as exc:  # pragma: no cover
+                # Allocation failed halfway; give back any fragments that were taken.
+                for fragment in fragments:
+                    fragment.give_back()
+                raise exc
+
+    def allocate_from_extent(self, size: PositiveInt, purpose: str) -> Allocation:
+        """
+        Allocate an allocation of `size` bytes that consists of a single fragment. The fragment is
+        carved from an extent: a contiguous range of up to EXTENT_SIZE bytes in one block that
+        the pool reserves for `purpose`, and that is used for the following allocations for the
+        same purpose until it is used up. This is cheaper than `allocate` for many small
+        allocations. If no block has `size` contiguous unused bytes, this falls back to `allocate`.
+        Raises exception OutOfPreSharedRandomDataError in the same cases as `allocate`.
+        """
+        with self._span("allocate from extent", size, purpose), self._lock:
+            extent = self._extents.get(purpose)
+            if extent is None or extent.nr_unused_bytes < size:
+                extent = self._reserve_extent(size, purpose)
+                if extent is None:
+                    return self.allocate(size, purpose)
+            return Allocation([extent.carve(size)], pool=self)
+
+    def _span(self, name: str, size: PositiveInt, purpose: str):
+        return TRACER.span(
+            f"pool {name}",
+            pool=self._name,
+            owner=str(self._owner),
+            purpose=purpose,
+            size=size,
+        )
+
+    def _reserve_extent(self, size: PositiveInt, purpose: str) -> Extent | None:
+        # Caller must hold self._lock
+        extent = self._extents.pop(purpose, None)
+        if extent is not None:
+            self._release_extent(extent)
+        available = self._check_available(size, purpose)
+        extent_size = max(size, min(EXTENT_SIZE, available))
+        if self._extents and self._nr_unused_block_bytes() < extent_size:
+            self._release_extents()
+        for block in self._blocks.values():
+            fragment = block.allocate_contiguous_fragment(size, extent_size)
+            if fragment is not None:
+                extent = Extent(fragment)
+                self._extents[purpose] = extent
+                return extent
+        return None
+
+    def _release_extents(self) -> None:
+        # Caller must hold self._lock
+        for extent in self._extents.values():
+            self._release_extent(extent)
+        self._extents.clear()
+
+    def _release_extent(self, extent: Extent) -> None:
+        # Caller must hold self._lock
+        extent.release()
+        # The block was not retired while it held the extent (see retire_fully_used_blocks).
+        if extent.block.is_fully_used():
+            self._block_fully_used(extent.block)
+
+    def _check_available(self, size: PositiveInt, purpose: str) -> int:
+        # Caller must hold self._lock. Returns the number of available bytes.
+        available = self.nr_unused_bytes - self._reserved_bytes.get(purpose, 0)
         if available < size:
-            LOGGER.error(
-                f"PSRD allocation failed: pool={self._name} owner={self._owner} purpose={purpose} "
-                f"size={size} available={available}"
+            self._allocation_failure_metric(purpose).inc()
+            POOL_LOGGER.error(
+                "PSRD allocation failed: pool=%s owner=%s purpose=%s size=%s available=%s",
+                self._name,
+                self._owner,
+                purpose,
+                size,
+                available,
             )
             raise OutOfPreSharedRandomDataError(
-                f"{self._name} {self._owner}", purpose, size, available
+                f"{self._name} {self._owner}", purpose, size, max(available, 0)
             )
-        fragments = []
-        try:
-            remaining_size = size
-            for block in self._blocks:
-                while remaining_size > 0:
-                    fragment = block.allocate_fragment(remaining_size)
-                    if fragment is None:
-                        # The current block is exhausted, move on to the next block, if any.
-                        break
-                    fragments.append(fragment)
-                    remaining_size -= fragment.size
-                if remaining_size == 0:
-                    # We have allocated the full desired size; no need to look at any more blocks.
-                    break
-            assert (
-                remaining_size == 0
-            )  # We checked availability at the top of the method.
-            return Allocation(fragments)
-        # As far as we know because of the check at the top, there is currently no way to reach
-        # this. This is just defensive programming.
-        except Exception as exc:  # pragma: no cover
-            # Allocation failed halfway; give back any fragments that were taken.
-            for fragment in fragments:
-                fragment.give_back()
-            raise exc
-
-    def delete_fully_used_blocks(self):
-        """
-        Delete fully used PSRD blocks from the pool.
-        """
-        new_blocks = [block for block in self._blocks if not block.is_fully_used()]
-        self._blocks = new_blocks
+        return available
+
+    def _allocation_failure_metric(self, purpose: str) -> CounterChild:
+        metric = self._allocation_failures_metrics.get(purpose)
+        if metric is None:
+            metric = _PSRD_ALLOCATION_FAILURES.labels(
+                self._name, str(self._owner), purpose
+            )
+            self._allocation_failures_metrics[purpose] = metric
+        return metric
+
+    def record_consumed_bytes(self, nr_bytes: int) -> None:
+        """
+        Record in the metrics that PSRD was consumed from this pool.
+        """
+        with self._lock:
+            self._nr_consumed_bytes += nr_bytes
+        self._consumed_bytes_metric.inc(nr_bytes)
+
+    def record_returned_bytes(self, nr_bytes: int) -> None:
+        """
+        Record in the metrics that PSRD was given back to this pool.
+        """
+        with self._lock:
+            self._nr_consumed_bytes -= nr_bytes
+        self._returned_bytes_metric.inc(nr_bytes)
+
+    def _block_fully_used(self, block: Block) -> None:
+        """
+        Called by a block of this pool when its last unused byte has been used.
+        """
+        self._retire_queue.append(block)
+        BLOCK_REAPER.notify(self)
+
+    def retire_fully_used_blocks(self) -> int:
+        """
+        Remove the blocks in the retire queue from the pool, and zeroize and release their data.
+        Blocks that are not fully used anymore (because data was given back to them after they
+        were queued) stay in the pool. Returns the number of retired blocks.
+        """
+        nr_retired_blocks = 0
+        while True:
+            try:
+                block = self._retire_queue.popleft()
+            except IndexError:
+                break
+            with self._lock:
+                sequence_number = self._block_sequence_numbers.get(block.uuid)
+                if sequence_number is None:
+                    # Already retired (a block can be queued more than once)
+                    continue
+                if any(extent.block is block for extent in self._extents.values()):
+                    # The bytes that are reserved in the extent count as used in the block, but
+                    # they have not been consumed yet. The block is queued again when the extent is
+                    # released.
+                    continue
+                if not block.retire():
+                    continue
+                del self._blocks[sequence_number]
+                del self._block_sequence_numbers[block.uuid]
+            nr_retired_blocks += 1
+        return nr_retired_blocks
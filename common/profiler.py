@@ -0,0 +1,257 @@
+"""
+On-demand profiling of a running node.
+
+The management API of a node can profile the node for a fixed time window, under whatever load it
+is serving, and return the result as text (see `Profiler.profile`). There are two modes:
+
+ * sampling: a background thread samples the stacks of all threads of the process at a fixed
+   interval, and the result is the collapsed stacks (one line per distinct stack, with the number
+   of samples), which e.g. flamegraph.pl and speedscope render as a flame graph. This includes the
+   crypto executor threads, which run Shamir secret sharing, one-time-pad encryption, and signing
+   of large payloads, and its overhead does not depend on the number of function calls.
+
+ * cprofile: cProfile traces every function call of the event loop thread, and the result is the
+   pstats report of the functions with the most time. This gives exact call counts, but it only
+   covers the event loop thread, and it slows down the node considerably while it runs.
+
+Profiling is disabled unless the node is started with --enable-profiling.
+"""
+
+import argparse
+import asyncio
+import collections
+import cProfile
+import enum
+import io
+import pstats
+import sys
+import threading
+from types import FrameType
+from .exceptions import ProfilingDisabledError, ProfilingInProgressError
+
+DEFAULT_DURATION = 10.0
+"""By default, profile for this many seconds."""
+
+MAX_DURATION = 300.0
+"""Profile for at most this many seconds."""
+
+DEFAULT_SAMPLING_INTERVAL = 0.005
+"""In sampling mode, sample the stacks this often (in seconds)."""
+
+DEFAULT_NR_FUNCTIONS = 50
+"""In cprofile mode, report this many functions by default."""
+
+
+class Profiler:
+    """
+    Profiles the process on demand, one profile at a time.
+    """
+
+    class Mode(enum.Enum):
+        """
+        How to profile.
+        """
+
+        SAMPLING = "sampling"
+        CPROFILE = "cprofile"
+
+        def __str__(self):
+            return self.value
+
+    class Sort(enum.Enum):
+        """
+        How to sort the functions in a cprofile report.
+        """
+
+        CUMULATIVE = "cumulative"
+        TOTTIME = "tottime"
+        NCALLS = "ncalls"
+
+        def __str__(self):
+            return self.value
+
+    _enabled: bool
+    _sampling_interval: float
+    _running: bool
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        sampling_interval: float = DEFAULT_SAMPLING_INTERVAL,
+    ):
+        self._running = False
+        self.configure(enabled, sampling_interval)
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Is on-demand profiling enabled?
+        """
+        return self._enabled
+
+    def configure(
+        self, enabled: bool, sampling_interval: float = DEFAULT_SAMPLING_INTERVAL
+    ) -> None:
+        """
+        (Re-)configure the profiler.
+        """
+        assert sampling_interval > 0
+        self._enabled = enabled
+        self._sampling_interval = sampling_interval
+
+    async def profile(
+        self,
+        mode: Mode,
+        duration: float,
+        sort: Sort = Sort.CUMULATIVE,
+        nr_functions: int = DEFAULT_NR_FUNCTIONS,
+    ) -> str:
+        """
+        Profile the process for `duration` seconds, and return the collapsed stacks (in sampling
+        mode) or the pstats report of the `nr_functions` functions with the most time by `sort`
+        (in cprofile mode). Raises ProfilingDisabledError if profiling is not enabled, and
+        ProfilingInProgressError if another profile is being taken.
+        """
+        assert 0 < duration <= MAX_DURATION
+        if not self._enabled:
+            raise ProfilingDisabledError()
+        if self._running:
+            raise ProfilingInProgressError()
+        self._running = True
+        try:
+            if mode == self.Mode.SAMPLING:
+                return await self._profile_sampling(duration)
+            return await self._profile_cprofile(duration, sort, nr_functions)
+        finally:
+            self._running = False
+
+    async def _profile_sampling(self, duration: float) -> str:
+        sampler = _StackSampler(self._sampling_interval)
+        sampler.start()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            sampler.stop()
+        return sampler.collapsed_stacks()
+
+    @staticmethod
+    async def _profile_cprofile(duration: float, sort: Sort, nr_functions: int) -> str:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            profiler.disable()
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        stats.sort_stats(sort.value).print_stats(nr_functions)
+        return output.getvalue()
+
+
+class _StackSampler:
+    """
+    Samples the stacks of all other threads in a background thread, and counts the samples per
+    distinct stack.
+    """
+
+    _interval: float
+    _counts: collections.Counter[str]
+    _stop_event: threading.Event
+    _thread: threading.Thread
+
+    def __init__(self, interval: float):
+        self._interval = interval
+        self._counts = collections.Counter()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> None:
+        """
+        Start sampling.
+        """
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop sampling.
+        """
+        self._stop_event.set()
+        self._thread.join()
+
+    def collapsed_stacks(self) -> str:
+        """
+        Get the collapsed stacks: for each distinct stack, the thread name and the functions from
+        the outermost to the innermost, separated by semicolons, followed by the number of samples
+        (most samples first).
+        """
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self._counts.most_common()
+        )
+
+    def _run(self) -> None:
+        own_thread_id = threading.get_ident()
+        while not self._stop_event.wait(self._interval):
+            thread_names = {
+                thread.ident: thread.name for thread in threading.enumerate()
+            }
+            # pylint: disable=protected-access
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread_id:
+                    continue
+                thread_name = thread_names.get(thread_id, str(thread_id))
+                self._counts[_collapse(thread_name, frame)] += 1
+
+
+def _collapse(thread_name: str, frame: FrameType | None) -> str:
+    names = []
+    while frame is not None:
+        module_name = frame.f_globals.get("__name__", "?")
+        names.append(f"{module_name}.{frame.f_code.co_qualname}")
+        frame = frame.f_back
+    names.append(thread_name)
+    names.reverse()
+    return ";".join(names).replace(" ", "_")
+
+
+PROFILER = Profiler()
+"""
+The profiler of this process. It is configured from the command line arguments of the client or
+hub.
+"""
+
+
+def add_command_line_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the command line arguments for configuring on-demand profiling.
+    """
+    parser.add_argument(
+        "--enable-profiling",
+        action="store_true",
+        help="Enable the management API for on-demand profiling (POST .../mgmt/v1/profile)",
+    )
+    parser.add_argument(
+        "--profiling-sampling-interval",
+        type=float,
+        default=DEFAULT_SAMPLING_INTERVAL,
+        help=f"Seconds between stack samples of the sampling profiler "
+        f"(default: {DEFAULT_SAMPLING_INTERVAL})",
+    )
+
+
+def configure_from_command_line_arguments(args: argparse.Namespace) -> None:
+    """
+    Configure the profiler from the parsed command line arguments.
+    """
+    PROFILER.configure(args.enable_profiling, args.profiling_sampling_interval)
+
+
+def command_line_arguments(args: argparse.Namespace) -> list[str]:
+    """
+    Convert the parsed profiling command line arguments back into a list of command line arguments
+    (to pass them on to a child process).
+    """
+    result = []
+    if args.enable_profiling:
+        result += ["--enable-profiling"]
+    result += ["--profiling-sampling-interval", str(args.profiling_sampling_interval)]
+    return result
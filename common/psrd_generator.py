@@ -0,0 +1,339 @@
+"""
+Generator for random data: Pre-Shared Random Data (PSRD) blocks and user keys.
+
+Calling os.urandom inline for a large block stalls the event loop, and its throughput is limited
+by the kernel random number generator. The PSRD generator can instead run a deterministic random
+bit generator (DRBG) that is seeded from os.urandom: SHAKE-256 used as an extendable-output function
+over a secret 256-bit seed and a counter. The seed is replaced by a fresh one from os.urandom after
+every `reseed_interval` bytes.
+
+Large requests are generated in chunks in a dedicated worker thread. Small requests (such as user
+keys and small blocks) are served from a buffer of pre-generated data, which the worker thread
+refills in the background when it runs low.
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import enum
+import hashlib
+import os
+import threading
+import time
+from .metrics import REGISTRY
+
+DEFAULT_CHUNK_SIZE = 1_048_576
+"""
+The number of bytes that the generator produces in one step.
+"""
+
+DEFAULT_BUFFER_SIZE = 1_048_576
+"""
+The number of pre-generated bytes that the generator keeps ready to hand out.
+"""
+
+DEFAULT_RESEED_INTERVAL = 1_073_741_824
+"""
+The number of bytes that the DRBG produces before it is reseeded from os.urandom.
+"""
+
+_SEED_SIZE = 32
+_COUNTER_SIZE = 16
+
+_GENERATED_BYTES = REGISTRY.counter(
+    "dske_psrd_generated_bytes_total",
+    "Random bytes produced by the PSRD generator",
+    ("algorithm",),
+)
+_GENERATION_SECONDS = REGISTRY.counter(
+    "dske_psrd_generation_seconds_total",
+    "Time spent producing random bytes in the PSRD generator",
+    ("algorithm",),
+)
+_SERVED_BYTES = REGISTRY.counter(
+    "dske_psrd_generator_served_bytes_total",
+    "Random bytes handed out by the PSRD generator, by source (buffer or direct)",
+    ("source",),
+)
+_SERVED_FROM_BUFFER = _SERVED_BYTES.labels("buffer")
+_SERVED_DIRECTLY = _SERVED_BYTES.labels("direct")
+
+
+class PSRDGenerator:
+    """
+    Generator for random data, see the module docstring.
+    """
+
+    class Algorithm(enum.Enum):
+        """
+        How random data is generated.
+        """
+
+        URANDOM = "urandom"
+        SHAKE256 = "shake256"
+
+        def __str__(self):
+            return self.value
+
+    _algorithm: Algorithm
+    _chunk_size: int
+    _buffer_size: int
+    _reseed_interval: int
+    _lock: threading.Lock  # Protects all attributes below
+    _buffer: bytearray
+    _seed: bytes
+    _counter: int
+    _nr_bytes_since_reseed: int
+    _nr_generated_bytes: int
+    _generation_seconds: float
+    _nr_bytes_from_buffer: int
+    _nr_bytes_direct: int
+    _executor: concurrent.futures.ThreadPoolExecutor | None
+    _refill_future: concurrent.futures.Future | None
+
+    def __init__(
+        self,
+        algorithm: Algorithm = Algorithm.SHAKE256,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        reseed_interval: int = DEFAULT_RESEED_INTERVAL,
+    ):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._refill_future = None
+        self.configure(algorithm, chunk_size, buffer_size, reseed_interval)
+
+    def configure(
+        self,
+        algorithm: Algorithm,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        reseed_interval: int = DEFAULT_RESEED_INTERVAL,
+    ) -> None:
+        """
+        (Re-)configure the generator. The buffer is emptied and the statistics are reset.
+        """
+        assert chunk_size > 0
+        assert buffer_size >= 0
+        assert reseed_interval > 0
+        self.shutdown(wait=True)
+        with self._lock:
+            self._algorithm = algorithm
+            self._chunk_size = chunk_size
+            self._buffer_size = buffer_size
+            self._reseed_interval = reseed_interval
+            self._buffer = bytearray()
+            self._seed = os.urandom(_SEED_SIZE)
+            self._counter = 0
+            self._nr_bytes_since_reseed = 0
+            self._nr_generated_bytes = 0
+            self._generation_seconds = 0.0
+            self._nr_bytes_from_buffer = 0
+            self._nr_bytes_direct = 0
+
+    @property
+    def algorithm(self) -> Algorithm:
+        """
+        Get the algorithm.
+        """
+        return self._algorithm
+
+    @property
+    def nr_buffered_bytes(self) -> int:
+        """
+        Get the number of pre-generated bytes in the buffer.
+        """
+        return len(self._buffer)
+
+    def _generate_chunk(self, size: int) -> bytes:
+        if self._algorithm == self.Algorithm.URANDOM:
+            return os.urandom(size)
+        with self._lock:
+            if self._nr_bytes_since_reseed >= self._reseed_interval:
+                self._seed = os.urandom(_SEED_SIZE)
+                self._counter = 0
+                self._nr_bytes_since_reseed = 0
+            seed = self._seed
+            counter = self._counter
+            self._counter += 1
+            self._nr_bytes_since_reseed += size
+        # Every chunk is the output of SHAKE-256 for a different (seed, counter) input, so chunks
+        # can be generated concurrently without holding the lock.
+        xof = hashlib.shake_256(seed + counter.to_bytes(_COUNTER_SIZE, "big"))
+        return xof.digest(size)
+
+    def _generate(self, size: int) -> bytearray:
+        """
+        Generate `size` random bytes, in chunks.
+        """
+        start_time = time.perf_counter()
+        data = bytearray()
+        while len(data) < size:
+            data += self._generate_chunk(min(self._chunk_size, size - len(data)))
+        duration = time.perf_counter() - start_time
+        with self._lock:
+            self._nr_generated_bytes += size
+            self._generation_seconds += duration
+        algorithm = str(self._algorithm)
+        _GENERATED_BYTES.labels(algorithm).inc(size)
+        _GENERATION_SECONDS.labels(algorithm).inc(duration)
+        return data
+
+    def _take_from_buffer(self, size: int) -> bytes | None:
+        with self._lock:
+            if len(self._buffer) < size:
+                return None
+            data = bytes(self._buffer[:size])
+            # Deleting from the front of a bytearray does not move the remaining bytes.
+            del self._buffer[:size]
+            self._nr_bytes_from_buffer += size
+        _SERVED_FROM_BUFFER.inc(size)
+        return data
+
+    def _count_direct(self, size: int) -> None:
+        with self._lock:
+            self._nr_bytes_direct += size
+        _SERVED_DIRECTLY.inc(size)
+
+    def fill_buffer(self) -> None:
+        """
+        Fill the buffer up to its size, in the calling thread.
+        """
+        with self._lock:
+            nr_missing_bytes = self._buffer_size - len(self._buffer)
+        if nr_missing_bytes > 0:
+            data = self._generate(nr_missing_bytes)
+            with self._lock:
+                self._buffer += data
+
+    def _start_refill_if_needed(self) -> None:
+        """
+        Start refilling the buffer in the worker thread if it is less than half full.
+        """
+        with self._lock:
+            if 2 * len(self._buffer) >= self._buffer_size:
+                return
+            if self._refill_future is not None and not self._refill_future.done():
+                return
+            self._refill_future = self._get_executor().submit(self.fill_buffer)
+
+    def _get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        # Caller must hold self._lock
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="psrd-generator"
+            )
+        return self._executor
+
+    def generate(self, size: int) -> bytes | bytearray:
+        """
+        Generate `size` random bytes, from the buffer if it holds enough bytes. Otherwise, the bytes
+        are generated directly in the calling thread.
+        """
+        data = self._take_from_buffer(size)
+        if data is None:
+            data = self._generate(size)
+            self._count_direct(size)
+        self._start_refill_if_needed()
+        return data
+
+    async def generate_async(self, size: int) -> bytes | bytearray:
+        """
+        Generate `size` random bytes, from the buffer if it holds enough bytes. Otherwise, the bytes
+        are generated in the worker thread, so that the event loop is not blocked.
+        """
+        data = self._take_from_buffer(size)
+        if data is None:
+            loop = asyncio.get_running_loop()
+            with self._lock:
+                executor = self._get_executor()
+            data = await loop.run_in_executor(executor, self._generate, size)
+            self._count_direct(size)
+        self._start_refill_if_needed()
+        return data
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Shut down the worker thread (if it was created).
+        """
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+            self._refill_future = None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def to_mgmt(self) -> dict:
+        """
+        Get the management status.
+        """
+        with self._lock:
+            if self._generation_seconds > 0:
+                throughput = self._nr_generated_bytes / self._generation_seconds
+            else:
+                throughput = None
+            return {
+                "algorithm": str(self._algorithm),
+                "buffer_size": self._buffer_size,
+                "nr_buffered_bytes": len(self._buffer),
+                "nr_generated_bytes": self._nr_generated_bytes,
+                "generation_seconds": self._generation_seconds,
+                "throughput": throughput,  # In bytes per second
+                "nr_bytes_from_buffer": self._nr_bytes_from_buffer,
+                "nr_bytes_direct": self._nr_bytes_direct,
+            }
+
+
+PSRD_GENERATOR = PSRDGenerator()
+"""
+The generator that is used for all random PSRD blocks and user keys in this process. It is
+configured from the command line arguments of the client or hub.
+"""
+
+REGISTRY.gauge(
+    "dske_psrd_generator_buffered_bytes",
+    "Pre-generated random bytes that the PSRD generator holds ready to hand out",
+).set_function(lambda: PSRD_GENERATOR.nr_buffered_bytes)
+
+
+def add_command_line_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the command line arguments for configuring the PSRD generator.
+    """
+    parser.add_argument(
+        "--psrd-generator",
+        type=str,
+        choices=[str(algorithm) for algorithm in PSRDGenerator.Algorithm],
+        default=str(PSRDGenerator.Algorithm.SHAKE256),
+        help="How random data for PSRD blocks and user keys is generated (default: shake256)",
+    )
+    parser.add_argument(
+        "--psrd-buffer-size",
+        type=int,
+        default=DEFAULT_BUFFER_SIZE,
+        help=f"Number of pre-generated random bytes to keep ready "
+        f"(default: {DEFAULT_BUFFER_SIZE})",
+    )
+
+
+def configure_from_command_line_arguments(args: argparse.Namespace) -> None:
+    """
+    Configure the PSRD generator from the parsed command line arguments.
+    """
+    PSRD_GENERATOR.configure(
+        PSRDGenerator.Algorithm(args.psrd_generator),
+        buffer_size=args.psrd_buffer_size,
+    )
+
+
+def command_line_arguments(args: argparse.Namespace) -> list[str]:
+    """
+    Convert the parsed PSRD generator command line arguments back into a list of command line
+    arguments (to pass them on to a child process).
+    """
+    return [
+        "--psrd-generator",
+        args.psrd_generator,
+        "--psrd-buffer-size",
+        str(args.psrd_buffer_size),
+    ]
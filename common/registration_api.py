@@ -4,6 +4,7 @@ Models for the registration API.
 
 from typing import List
 import pydantic
+from .authenticator import HMAC_SHA256
 
 
 class APIPutRegistrationRequest(pydantic.BaseModel):
@@ -13,9 +14,23 @@ class APIPutRegistrationRequest(pydantic.BaseModel):
 
     client_name: str
     encryptor_names: List[str]
-
-    def __init__(self, client_name: str, encryptor_names: List[str]):
-        super().__init__(client_name=client_name, encryptor_names=encryptor_names)
+    # The message authentication modes that the client supports, in order of preference. Clients
+    # that don't send this only support HMAC-SHA256.
+    authentication_modes: List[str] = [HMAC_SHA256]
+
+    def __init__(
+        self,
+        client_name: str,
+        encryptor_names: List[str],
+        authentication_modes: List[str] | None = None,
+    ):
+        if authentication_modes is None:
+            authentication_modes = [HMAC_SHA256]
+        super().__init__(
+            client_name=client_name,
+            encryptor_names=encryptor_names,
+            authentication_modes=authentication_modes,
+        )
 
 
 class APIPutRegistrationResponse(pydantic.BaseModel):
@@ -24,6 +39,20 @@ class APIPutRegistrationResponse(pydantic.BaseModel):
     """
 
     hub_name: str
-
-    def __init__(self, hub_name: str):
-        super().__init__(hub_name=hub_name)
+    # For a multi-worker hub: the base URL of the worker that owns the client. The client sends all
+    # other requests to this URL instead of the hub URL.
+    worker_url: str | None = None
+    # The message authentication mode that the hub picked from the modes offered by the client.
+    authentication_mode: str = HMAC_SHA256
+
+    def __init__(
+        self,
+        hub_name: str,
+        worker_url: str | None = None,
+        authentication_mode: str = HMAC_SHA256,
+    ):
+        super().__init__(
+            hub_name=hub_name,
+            worker_url=worker_url,
+            authentication_mode=authentication_mode,
+        )
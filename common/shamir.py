@@ -78,9 +78,13 @@ Shamir Secret Sharing (SSS).
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 #
 
+import enum
+import functools
 import hmac
+import itertools
 import secrets  # TODO: Use secrets everywhere instead of os.urandom
-from typing import List, NamedTuple, Sequence, Tuple
+from array import array
+from typing import Callable, List, NamedTuple, Sequence, Tuple
 
 
 DIGEST_LENGTH_BYTES = 4
@@ -90,7 +94,7 @@ MIN_KEY_LENGTH = DIGEST_LENGTH_BYTES
 """The minimum length of the shared secret in bytes."""
 
 MAX_SHARE_COUNT = 16
-"""The maximum number of shares that can be created."""
+"""The maximum number of shares that can be created in GF(256)."""
 
 SECRET_INDEX = 255
 """The index of the share containing the shared secret."""
@@ -98,6 +102,49 @@ SECRET_INDEX = 255
 DIGEST_INDEX = 254
 """The index of the share containing the digest of the shared secret."""
 
+MAX_SHARE_COUNT_GF65536 = 65534
+"""The maximum number of shares that can be created in GF(2^16)."""
+
+SECRET_INDEX_GF65536 = 65535
+"""The index of the share containing the shared secret in GF(2^16)."""
+
+DIGEST_INDEX_GF65536 = 65534
+"""The index of the share containing the digest of the shared secret in GF(2^16)."""
+
+MAX_RECONSTRUCT_ATTEMPTS = 1000
+"""
+When looking for the bad shares in a set of shares, give up after trying this many subsets.
+"""
+
+FORMAT_TAG_SHIFT = 16
+"""
+The share index that is exchanged with the hubs is the x coordinate of the share, with the format
+tag of the share (see `ShareFormat`) in the bits above this bit position. The shares of the
+original GF(256) format have format tag 0, so their share index is just the x coordinate.
+"""
+
+
+class Field(enum.Enum):
+    """
+    The finite field that the secret sharing is done in.
+    """
+
+    GF256 = "gf256"
+    GF65536 = "gf65536"
+
+
+class ShareFormat(enum.IntEnum):
+    """
+    The format tag of a share, which determines how the share is reconstructed.
+    """
+
+    # The original format: the secret is a sequence of GF(256) symbols.
+    GF256 = 0
+    # The secret is a sequence of big-endian GF(2^16) symbols.
+    GF65536 = 1
+    # Same, but the secret has an odd length, and was padded with a zero byte to an even length.
+    GF65536_PADDED = 2
+
 
 class RawShare(NamedTuple):
     """
@@ -136,6 +183,28 @@ def _precompute_exp_log() -> Tuple[List[int], List[int]]:
 EXP_TABLE, LOG_TABLE = _precompute_exp_log()
 
 
+def _precompute_exp_log_gf65536() -> Tuple[array, array]:
+    exp = array("H", bytes(2 * 65535))
+    log = array("H", bytes(2 * 65536))
+
+    poly = 1
+    for i in range(65535):
+        exp[i] = poly
+        log[poly] = i
+
+        # Multiply poly by the polynomial x.
+        poly <<= 1
+
+        # Reduce poly by the primitive polynomial x^16 + x^12 + x^3 + x + 1.
+        if poly & 0x10000:
+            poly ^= 0x1100B
+
+    return exp, log
+
+
+EXP_TABLE_GF65536, LOG_TABLE_GF65536 = _precompute_exp_log_gf65536()
+
+
 def _interpolate(shares: Sequence[RawShare], x: int) -> bytes:
     """
     Returns f(x) given the Shamir shares (x_1, f(x_1)), ... , (x_k, f(x_k)).
@@ -188,12 +257,131 @@ def _interpolate(shares: Sequence[RawShare], x: int) -> bytes:
     return result
 
 
+def _precompute_bit_masks() -> List[int]:
+    # For each bit position, a vector of 256 bytes (as a big integer): byte b is 0xFF if the bit is
+    # set in b, and 0x00 otherwise.
+    return [
+        int.from_bytes(
+            bytes(0xFF if byte >> bit & 1 else 0x00 for byte in range(256)), "big"
+        )
+        for bit in range(8)
+    ]
+
+
+BIT_MASKS = _precompute_bit_masks()
+
+REPEAT_BYTE = int.from_bytes(b"\x01" * 256, "big")
+"""Multiply a byte value by this to get a vector of 256 copies of it (as a big integer)."""
+
+
+@functools.lru_cache(maxsize=4096)
+def _multiplication_tables_gf65536(
+    log_factor: int,
+) -> Tuple[bytes, bytes, bytes, bytes]:
+    """
+    Get the `bytes.translate` tables for multiplying GF(2^16) symbols by the factor with logarithm
+    `log_factor`. A symbol is split into its high byte and its low byte; the tables map the high
+    byte to the high and low byte of its product, and the low byte to the high and low byte of its
+    product. The factors are Lagrange coefficients, which only depend on the x coordinates of the
+    shares, so the same tables are used over and over again.
+
+    Multiplication is linear over the bits of a symbol, so each table is the XOR of the products of
+    the factor with x^i, masked by bit i of the table index. Since x is the generator of the field,
+    the logarithm of that product is `log_factor + i`.
+    """
+    powers = [EXP_TABLE_GF65536[(log_factor + i) % 65535] for i in range(16)]
+
+    def table(first_power: int, shift: int) -> bytes:
+        result = 0
+        for bit, mask in enumerate(BIT_MASKS):
+            result ^= mask & ((powers[first_power + bit] >> shift & 0xFF) * REPEAT_BYTE)
+        return result.to_bytes(256, "big")
+
+    return (table(8, 8), table(8, 0), table(0, 8), table(0, 0))
+
+
+def _multiply_gf65536(data: bytes, log_factor: int) -> Tuple[int, int]:
+    """
+    Multiply the GF(2^16) symbols in `data` by the factor with logarithm `log_factor`. Returns the
+    high bytes and the low bytes of the products, each as a big integer.
+    """
+    high_to_high, high_to_low, low_to_high, low_to_low = _multiplication_tables_gf65536(
+        log_factor
+    )
+    high_bytes = data[0::2]
+    low_bytes = data[1::2]
+    high_products = int.from_bytes(
+        high_bytes.translate(high_to_high), "big"
+    ) ^ int.from_bytes(low_bytes.translate(low_to_high), "big")
+    low_products = int.from_bytes(
+        high_bytes.translate(high_to_low), "big"
+    ) ^ int.from_bytes(low_bytes.translate(low_to_low), "big")
+    return high_products, low_products
+
+
+def _interpolate_gf65536(shares: Sequence[RawShare], x: int) -> bytes:
+    """
+    Same as `_interpolate`, but in GF(2^16): the share data is a sequence of big-endian 16-bit
+    symbols. The symbols are processed as whole vectors: the high and low bytes of all symbols are
+    multiplied with `bytes.translate`, and added with an XOR of big integers.
+    """
+
+    x_coordinates = set(share.x for share in shares)
+
+    if len(x_coordinates) != len(shares):
+        raise ValueError("Invalid set of shares. Share indices must be unique.")
+
+    share_value_lengths = set(len(share.data) for share in shares)
+    if len(share_value_lengths) != 1:
+        raise ValueError(
+            "Invalid set of shares. All share values must have the same length."
+        )
+    share_value_length = share_value_lengths.pop()
+    if share_value_length % 2 != 0:
+        raise ValueError(
+            "Invalid set of shares. Share values must have an even length."
+        )
+
+    if x in x_coordinates:
+        for share in shares:
+            if share.x == x:
+                return share.data
+
+    # Logarithm of the product of (x_i - x) for i = 1, ... , k.
+    log_prod = sum(LOG_TABLE_GF65536[share.x ^ x] for share in shares)
+
+    high_result = 0
+    low_result = 0
+    for share in shares:
+        # The logarithm of the Lagrange basis polynomial evaluated at x.
+        log_basis_eval = (
+            log_prod
+            - LOG_TABLE_GF65536[share.x ^ x]
+            - sum(LOG_TABLE_GF65536[share.x ^ other.x] for other in shares)
+        ) % 65535
+
+        high_products, low_products = _multiply_gf65536(share.data, log_basis_eval)
+        high_result ^= high_products
+        low_result ^= low_products
+
+    result = bytearray(share_value_length)
+    result[0::2] = high_result.to_bytes(share_value_length // 2, "big")
+    result[1::2] = low_result.to_bytes(share_value_length // 2, "big")
+    return bytes(result)
+
+
 def _create_digest(random_data: bytes, shared_secret: bytes) -> bytes:
     return hmac.new(random_data, shared_secret, "sha256").digest()[:DIGEST_LENGTH_BYTES]
 
 
 def _split_secret(
-    threshold: int, share_count: int, shared_secret: bytes
+    threshold: int,
+    share_count: int,
+    shared_secret: bytes,
+    interpolate: Callable[[Sequence[RawShare], int], bytes] = _interpolate,
+    max_share_count: int = MAX_SHARE_COUNT,
+    digest_index: int = DIGEST_INDEX,
+    secret_index: int = SECRET_INDEX,
 ) -> List[RawShare]:
     if len(shared_secret) < MIN_KEY_LENGTH:
         raise ValueError(
@@ -208,9 +396,9 @@ def _split_secret(
             "The requested threshold must not exceed the number of shares."
         )
 
-    if share_count > MAX_SHARE_COUNT:
+    if share_count > max_share_count:
         raise ValueError(
-            f"The requested number of shares must not exceed {MAX_SHARE_COUNT}."
+            f"The requested number of shares must not exceed {max_share_count}."
         )
 
     # TODO: We won't allow a threshold of 1; we will require at least 2 (or even 3?)
@@ -228,24 +416,30 @@ def _split_secret(
     digest = _create_digest(random_part, shared_secret)
 
     base_shares = shares + [
-        RawShare(DIGEST_INDEX, digest + random_part),
-        RawShare(SECRET_INDEX, shared_secret),
+        RawShare(digest_index, digest + random_part),
+        RawShare(secret_index, shared_secret),
     ]
 
     for i in range(random_share_count, share_count):
-        shares.append(RawShare(i, _interpolate(base_shares, i)))
+        shares.append(RawShare(i, interpolate(base_shares, i)))
 
     return shares
 
 
-def _recover_secret(threshold: int, shares: Sequence[RawShare]) -> bytes:
+def _recover_secret(
+    threshold: int,
+    shares: Sequence[RawShare],
+    interpolate: Callable[[Sequence[RawShare], int], bytes] = _interpolate,
+    digest_index: int = DIGEST_INDEX,
+    secret_index: int = SECRET_INDEX,
+) -> bytes:
     # If the threshold is 1, then the digest of the shared secret is not used.
     # TODO: Disallow threshold of 1
     if threshold == 1:
         return next(iter(shares)).data
 
-    shared_secret = _interpolate(shares, SECRET_INDEX)
-    digest_share = _interpolate(shares, DIGEST_INDEX)
+    shared_secret = interpolate(shares, secret_index)
+    digest_share = interpolate(shares, digest_index)
     digest = digest_share[:DIGEST_LENGTH_BYTES]
     random_part = digest_share[DIGEST_LENGTH_BYTES:]
 
@@ -255,25 +449,130 @@ def _recover_secret(threshold: int, shares: Sequence[RawShare]) -> bytes:
     return shared_secret
 
 
+def _split_secret_gf65536(
+    threshold: int, share_count: int, shared_secret: bytes
+) -> Tuple[ShareFormat, List[RawShare]]:
+    share_format = ShareFormat.GF65536
+    if len(shared_secret) % 2 != 0:
+        share_format = ShareFormat.GF65536_PADDED
+        shared_secret += b"\x00"
+    raw_shares = _split_secret(
+        threshold,
+        share_count,
+        shared_secret,
+        _interpolate_gf65536,
+        MAX_SHARE_COUNT_GF65536,
+        DIGEST_INDEX_GF65536,
+        SECRET_INDEX_GF65536,
+    )
+    return share_format, raw_shares
+
+
+def _recover_secret_gf65536(
+    threshold: int, shares: Sequence[RawShare], share_format: ShareFormat
+) -> bytes:
+    shared_secret = _recover_secret(
+        threshold,
+        shares,
+        _interpolate_gf65536,
+        DIGEST_INDEX_GF65536,
+        SECRET_INDEX_GF65536,
+    )
+    if share_format == ShareFormat.GF65536_PADDED:
+        if shared_secret[-1] != 0:
+            raise ValueError("Invalid padding of the shared secret.")
+        shared_secret = shared_secret[:-1]
+    return shared_secret
+
+
 def split_binary_secret_into_shares(
     secret: bytes,
     nr_shares: int,
     min_nr_shares: int,
+    field: Field | None = None,
 ) -> list[(int, bytes)]:
     """
     Split a binary secret into `nr_shares` shares. The minimum number of shares required to
     reconstruct the binary is `min_nr_shares`.
+
+    The secret is shared in GF(256) if `field` is None and there are at most `MAX_SHARE_COUNT`
+    shares (which is the format that all versions can reconstruct), and in GF(2^16) otherwise. The
+    share index of each share is tagged with the format of the share.
     """
+    if field is None:
+        field = Field.GF256 if nr_shares <= MAX_SHARE_COUNT else Field.GF65536
+    match field:
+        case Field.GF256:
+            share_format = ShareFormat.GF256
+            raw_shares = _split_secret(min_nr_shares, nr_shares, secret)
+        case Field.GF65536:
+            share_format, raw_shares = _split_secret_gf65536(
+                min_nr_shares, nr_shares, secret
+            )
     # TODO: Remove this back-and-forth conversion between our tuple and RawShare
-    raw_shares = _split_secret(min_nr_shares, nr_shares, secret)
-    return [(share.x, share.data) for share in raw_shares]
+    format_tag = share_format << FORMAT_TAG_SHIFT
+    return [(format_tag | share.x, share.data) for share in raw_shares]
 
 
 def reconstruct_binary_secret_from_shares(
     min_nr_shares: int, shares: list[(int, bytes)]
 ) -> bytes:
     """
-    Reconstruct a binary secret from shares.
+    Reconstruct a binary secret from shares. The field is determined by the format tag in the share
+    indexes.
+    """
+    format_tags = set(index >> FORMAT_TAG_SHIFT for (index, _data) in shares)
+    if len(format_tags) != 1:
+        raise ValueError("Invalid set of shares. All shares must have the same format.")
+    format_tag = format_tags.pop()
+    try:
+        share_format = ShareFormat(format_tag)
+    except ValueError as exc:
+        raise ValueError(
+            f"Invalid set of shares. Unknown share format {format_tag}."
+        ) from exc
+    raw_shares = [
+        RawShare(index & ((1 << FORMAT_TAG_SHIFT) - 1), data)
+        for (index, data) in shares
+    ]
+    if share_format == ShareFormat.GF256:
+        if any(share.x > SECRET_INDEX for share in raw_shares):
+            raise ValueError("Invalid set of shares. Share index out of range.")
+        return _recover_secret(min_nr_shares, raw_shares)
+    return _recover_secret_gf65536(min_nr_shares, raw_shares, share_format)
+
+
+def reconstruct_binary_secret_excluding_bad_shares(
+    min_nr_shares: int,
+    shares: list[(int, bytes)],
+    max_attempts: int = MAX_RECONSTRUCT_ATTEMPTS,
+) -> tuple[bytes, list[int]]:
+    """
+    Reconstruct a binary secret from shares, some of which may be bad (corrupt or tampered with),
+    as long as at least `min_nr_shares` shares are good. Returns the secret and the positions of the
+    bad shares in `shares`.
+
+    First all shares are tried. If the digest of the secret does not match, all subsets without one
+    share are tried, then all subsets without two shares, and so on. So a single bad share out of
+    _n_ costs at most _n_ more attempts. Raises ValueError if no subset matches within
+    `max_attempts` attempts.
     """
-    raw_shares = [RawShare(x, data) for (x, data) in shares]
-    return _recover_secret(min_nr_shares, raw_shares)
+    nr_attempts = 0
+    first_error = None
+    for nr_excluded in range(max(0, len(shares) - min_nr_shares) + 1):
+        for excluded in itertools.combinations(range(len(shares)), nr_excluded):
+            if nr_attempts == max_attempts:
+                raise ValueError(
+                    f"No subset of the shares is valid after {nr_attempts} attempts: "
+                    f"{first_error}"
+                )
+            nr_attempts += 1
+            subset = [share for i, share in enumerate(shares) if i not in excluded]
+            try:
+                secret = reconstruct_binary_secret_from_shares(min_nr_shares, subset)
+            except ValueError as exc:
+                if first_error is None:
+                    first_error = exc
+                continue
+            return secret, list(excluded)
+    raise ValueError(f"No subset of the shares is valid: {first_error}")
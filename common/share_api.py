@@ -3,7 +3,6 @@ Models for the share key API.
 """
 
 import pydantic
-from common.allocation import APIAllocation
 
 
 class APIPostShareRequest(pydantic.BaseModel):
@@ -16,7 +15,7 @@ class APIPostShareRequest(pydantic.BaseModel):
     slave_sae_id: str
     user_key_id: str
     share_index: int
-    encryption_key_allocation: APIAllocation
+    encryption_key_allocation: str  # Encoded as in Allocation.to_enc_str
     encrypted_share_value: str  # Base64 encoded
 
     def __init__(
@@ -26,7 +25,7 @@ class APIPostShareRequest(pydantic.BaseModel):
         slave_sae_id: str,
         user_key_id: str,
         share_index: int,
-        encryption_key_allocation: APIAllocation,
+        encryption_key_allocation: str,
         encrypted_share_value: str,  # Base64 encoded
     ):
         super().__init__(
@@ -46,13 +45,13 @@ class APIGetShareResponse(pydantic.BaseModel):
     """
 
     share_index: int
-    encryption_key_allocation: APIAllocation
+    encryption_key_allocation: str  # Encoded as in Allocation.to_enc_str
     encrypted_share_value: str  # Base64 encoded
 
     def __init__(
         self,
         share_index: int,
-        encryption_key_allocation: APIAllocation,
+        encryption_key_allocation: str,
         encrypted_share_value: str,
     ):
         super().__init__(
@@ -2,13 +2,24 @@
 The signature for a DSKE in-band protocol message.
 """
 
+import hmac
 from typing import Optional
+from .metrics import REGISTRY
 from .utils import bytes_to_str, str_to_bytes
 
 HEADER_NAME = "DSKE-Signature"
 LOWER_HEADER_NAME = HEADER_NAME.lower()
 _ENCODING_SEPARATOR = "%"
 
+SIGNATURE_FAILURES = REGISTRY.counter(
+    "dske_signature_failures_total",
+    "Messages received from a peer with a missing or invalid signature",
+    ("peer",),
+)
+"""
+Counter of signature failures, shared by the clients and the hubs, labeled by the name of the peer.
+"""
+
 
 class Signature:
     """
@@ -17,10 +28,17 @@ class Signature:
 
     _signing_key_allocation_enc_str: str
     _signature_data: bytes
+    _hash_key_allocation_enc_str: str | None  # Only for Wegman-Carter tags
 
-    def __init__(self, signing_key_allocation_enc_str: str, signature_data: bytes):
+    def __init__(
+        self,
+        signing_key_allocation_enc_str: str,
+        signature_data: bytes,
+        hash_key_allocation_enc_str: str | None = None,
+    ):
         self._signing_key_allocation_enc_str = signing_key_allocation_enc_str
         self._signature_data = signature_data
+        self._hash_key_allocation_enc_str = hash_key_allocation_enc_str
 
     @property
     def signing_key_allocation_enc_str(self) -> str:
@@ -29,6 +47,13 @@ class Signature:
         """
         return self._signing_key_allocation_enc_str
 
+    @property
+    def hash_key_allocation_enc_str(self) -> str | None:
+        """
+        Get the encoded allocation of the Wegman-Carter hash key (None for HMAC-SHA256).
+        """
+        return self._hash_key_allocation_enc_str
+
     def same_as(self, other: "Signature") -> bool:
         """
         Check if this signature is the same as another signature.
@@ -39,34 +64,44 @@ class Signature:
             != other._signing_key_allocation_enc_str
         ):
             return False
-        if self._signature_data != other._signature_data:
+        if self._hash_key_allocation_enc_str != other._hash_key_allocation_enc_str:
             return False
-        return True
+        # Compare in constant time, so that the time taken does not reveal how many leading bytes
+        # of a forged tag are correct.
+        return hmac.compare_digest(self._signature_data, other._signature_data)
 
     @classmethod
     def from_enc_str(cls, enc_str: str) -> "Signature":
         """
         Create a Signature from an encoded string as used in an HTTP header or URL parameter.
-        The format of the string is <allocation-encoded-str>%<signature-data-str>
+        The format of the string is <allocation-encoded-str>%<signature-data-str>, followed by
+        %<hash-key-allocation-encoded-str> for a Wegman-Carter tag.
         """
         split_str = enc_str.split(_ENCODING_SEPARATOR)
-        if len(split_str) != 2:
+        if len(split_str) not in (2, 3):
             assert False  # TODO: Raise an exception instead
         allocation_enc_str = split_str[0]
         signature_data_str = split_str[1]
         signature_data = str_to_bytes(signature_data_str)
-        return Signature(allocation_enc_str, signature_data)
+        hash_key_allocation_enc_str = split_str[2] if len(split_str) == 3 else None
+        return Signature(
+            allocation_enc_str, signature_data, hash_key_allocation_enc_str
+        )
 
     def to_enc_str(self) -> str:
         """
         Encode a Signature as a string that can be used in HTTP headers or URL parameters.
-        The format of the string is <allocation-encoded-str>%<signature-data-str>
+        The format of the string is <allocation-encoded-str>%<signature-data-str>, followed by
+        %<hash-key-allocation-encoded-str> for a Wegman-Carter tag.
         """
-        return (
+        enc_str = (
             f"{self._signing_key_allocation_enc_str}"
             f"{_ENCODING_SEPARATOR}"
             f"{bytes_to_str(self._signature_data)}"
         )
+        if self._hash_key_allocation_enc_str is not None:
+            enc_str += f"{_ENCODING_SEPARATOR}{self._hash_key_allocation_enc_str}"
+        return enc_str
 
     def add_to_headers(self, headers: dict[str, str]):
         """
@@ -5,7 +5,8 @@ The key that is used to sign and to verify the signature on DSKE in-band protoco
 import hashlib
 import hmac
 from .allocation import Allocation
-from .pool import Pool
+from .crypto_executor import CRYPTO_EXECUTOR
+from .pool import Pool, MESSAGE_SIGNING_KEY
 from .signature import Signature
 from .utils import bytes_to_str, str_to_bytes
 
@@ -14,56 +15,193 @@ HEADER_NAME = "DSKE-Signing-Key"
 LOWER_HEADER_NAME = HEADER_NAME.lower()
 
 SIGNING_KEY_SIZE = 32  # bytes
+ONE_TIME_PAD_SIZE = 16  # bytes, for a Wegman-Carter tag
+HASH_KEY_SIZE = 66  # bytes, for a Wegman-Carter hash key (521 bits are used)
 _ENCODING_SEPARATOR = ";"
 
+# The Wegman-Carter hash is evaluated modulo the Mersenne prime 2^521 - 1, which allows a cheap
+# reduction (a shift and an addition) and large chunks (which means few Python operations per byte).
+_WEGMAN_CARTER_PRIME_BITS = 521
+_WEGMAN_CARTER_PRIME = (1 << _WEGMAN_CARTER_PRIME_BITS) - 1
+_WEGMAN_CARTER_CHUNK_SIZE = (
+    64  # bytes, so that a chunk plus its padding byte is less than the prime
+)
+_WEGMAN_CARTER_TAG_MODULUS = 1 << (8 * ONE_TIME_PAD_SIZE)
+
+
+def compute_signature_data(
+    key_data: bytes, signed_data_list: list[bytes | None]
+) -> bytes:
+    """
+    Compute the HMAC-SHA256 over the concatenation of the (non-None) items in `signed_data_list`.
+    """
+    h = hmac.new(key_data, digestmod=hashlib.sha256)
+    for signed_data_item in signed_data_list:
+        if signed_data_item is not None:
+            h.update(signed_data_item)
+    return h.digest()
+
+
+def compute_wegman_carter_tag(
+    hash_key_data: bytes, one_time_pad: bytes, signed_data_list: list[bytes | None]
+) -> bytes:
+    """
+    Compute the Wegman-Carter tag over the concatenation of the (non-None) items in
+    `signed_data_list`: a polynomial hash modulo 2^521 - 1, evaluated at the hash key (with each
+    64-byte chunk of the data padded with a 1 byte, as in Poly1305), truncated to 128 bits, plus the
+    one-time pad modulo 2^128.
+    """
+    data = b"".join(item for item in signed_data_list if item is not None)
+    point = int.from_bytes(hash_key_data, "little") & _WEGMAN_CARTER_PRIME
+    accumulator = 0
+    for start in range(0, len(data), _WEGMAN_CARTER_CHUNK_SIZE):
+        chunk = data[start : start + _WEGMAN_CARTER_CHUNK_SIZE] + b"\x01"
+        accumulator = (accumulator + int.from_bytes(chunk, "little")) * point
+        # Partial reduction modulo 2^521 - 1; the full reduction is done at the end.
+        accumulator = (accumulator & _WEGMAN_CARTER_PRIME) + (
+            accumulator >> _WEGMAN_CARTER_PRIME_BITS
+        )
+    accumulator %= _WEGMAN_CARTER_PRIME
+    tag = (
+        accumulator + int.from_bytes(one_time_pad, "little")
+    ) % _WEGMAN_CARTER_TAG_MODULUS
+    return tag.to_bytes(ONE_TIME_PAD_SIZE, "little")
+
+
+def compute_tag(
+    key_data: bytes,
+    hash_key_data: bytes | None,
+    signed_data_list: list[bytes | None],
+) -> bytes:
+    """
+    Compute the HMAC-SHA256 (if `hash_key_data` is None) or the Wegman-Carter tag (otherwise).
+    """
+    if hash_key_data is None:
+        return compute_signature_data(key_data, signed_data_list)
+    return compute_wegman_carter_tag(hash_key_data, key_data, signed_data_list)
+
+
+class HashKey:
+    """
+    A long-lived Wegman-Carter hash key, taken from a pool (see Authenticator).
+    """
+
+    _allocation_enc_str: str
+    _data: bytes
+
+    def __init__(self, allocation_enc_str: str, data: bytes):
+        self._allocation_enc_str = allocation_enc_str
+        self._data = data
+
+    @property
+    def allocation_enc_str(self) -> str:
+        """
+        Get the encoded allocation of the hash key, which identifies the hash key to the peer.
+        """
+        return self._allocation_enc_str
+
+    @property
+    def data(self) -> bytes:
+        """
+        Get the hash key data.
+        """
+        return self._data
+
 
 class SigningKey:
     """
     A SigningKey is used in the application logic (as opposed to in the FastApi middleware) to sign
     and to verify the signature on DSKE in-band protocol messages.
+
+    Without a hash key, the allocation is an HMAC-SHA256 key. With a hash key, the allocation is the
+    one-time pad of a Wegman-Carter tag.
     """
 
     _allocation: Allocation
-    _key_data: bytes
+    _hash_key: HashKey | None
 
-    def __init__(self, allocation: Allocation) -> "SigningKey":
+    def __init__(
+        self, allocation: Allocation, hash_key: HashKey | None = None
+    ) -> "SigningKey":
         """
         Create a SigningKey from an Allocation that was previously allocated from a Pool.
         """
         self._allocation = allocation
+        self._hash_key = hash_key
+
+    @property
+    def hash_key_allocation_enc_str(self) -> str | None:
+        """
+        Get the encoded allocation of the Wegman-Carter hash key (None for HMAC-SHA256).
+        """
+        return None if self._hash_key is None else self._hash_key.allocation_enc_str
+
+    @property
+    def hash_key_data(self) -> bytes | None:
+        """
+        Get the Wegman-Carter hash key data (None for HMAC-SHA256).
+        """
+        return None if self._hash_key is None else self._hash_key.data
 
     @classmethod
     def from_pool(cls, pool: Pool):
         """
         Allocate a new EncryptionKey from the given pool.
         """
-        allocation = pool.allocate(SIGNING_KEY_SIZE, "message-signing-key")
+        allocation = pool.allocate(SIGNING_KEY_SIZE, MESSAGE_SIGNING_KEY)
         return SigningKey(allocation)
 
     def to_enc_str(self) -> str:
         """
         Encode the SigningKey as a string that can be passed from the application logic to the
         middleware in a temporary header.
-        The format of the string is <allocation-encoded-str>;<signature-data-str>
+        The format of the string is <allocation-encoded-str>;<key-data-str>, followed by
+        ;<hash-key-allocation-encoded-str>;<hash-key-data-str> for a Wegman-Carter key.
         """
-        return (
+        enc_str = (
             f"{self._allocation.to_enc_str()}"
             f"{_ENCODING_SEPARATOR}"
             f"{bytes_to_str(self._allocation.data)}"
         )
+        if self._hash_key is not None:
+            enc_str += (
+                f"{_ENCODING_SEPARATOR}"
+                f"{self._hash_key.allocation_enc_str}"
+                f"{_ENCODING_SEPARATOR}"
+                f"{bytes_to_str(self._hash_key.data)}"
+            )
+        return enc_str
 
     def sign(self, signed_data_list: list[bytes | None]) -> Signature:
         """
         Sign data and return the signature.
         """
-        signing_key_data = self._allocation.data
-        signed_data = b""
-        for signed_date_item in signed_data_list:
-            if signed_date_item is not None:
-                signed_data += signed_date_item
-        h = hmac.new(signing_key_data, signed_data, hashlib.sha256)
-        signature_data = h.digest()
-        return Signature(self._allocation.to_enc_str(), signature_data)
+        signature_data = compute_tag(
+            self._allocation.data, self.hash_key_data, signed_data_list
+        )
+        return Signature(
+            self._allocation.to_enc_str(),
+            signature_data,
+            self.hash_key_allocation_enc_str,
+        )
+
+    async def sign_async(self, signed_data_list: list[bytes | None]) -> Signature:
+        """
+        Sign data and return the signature. Large data is signed in the crypto executor.
+        """
+        size = sum(len(item) for item in signed_data_list if item is not None)
+        signature_data = await CRYPTO_EXECUTOR.run(
+            size,
+            compute_tag,
+            self._allocation.data,
+            self.hash_key_data,
+            signed_data_list,
+        )
+        return Signature(
+            self._allocation.to_enc_str(),
+            signature_data,
+            self.hash_key_allocation_enc_str,
+        )
 
     def add_to_headers(self, headers: dict[str, str]):
         """
@@ -83,13 +221,17 @@ class MiddlewareSigningKey:
     """
 
     def __init__(
-        self, allocation_enc_str: str, key_data: bytes
+        self,
+        allocation_enc_str: str,
+        key_data: bytes,
+        hash_key: HashKey | None = None,
     ) -> "MiddlewareSigningKey":
         """
         Should only be called from class methods from_xxx.
         """
         self._allocation_enc_str = allocation_enc_str
         self._key_data = key_data
+        self._hash_key = hash_key
 
     @classmethod
     def from_enc_str(cls, enc_str: str) -> "SigningKey":
@@ -97,12 +239,15 @@ class MiddlewareSigningKey:
         Create an SigningKey from an encoded string as used the temporary HTTP header.
         """
         split_str = enc_str.split(_ENCODING_SEPARATOR)
-        if len(split_str) != 2:
+        if len(split_str) not in (2, 4):
             assert False  # TODO: Raise an exception instead
         allocation_enc_str = split_str[0]
         key_data_str = split_str[1]
         key_data = str_to_bytes(key_data_str)
-        return MiddlewareSigningKey(allocation_enc_str, key_data)
+        hash_key = None
+        if len(split_str) == 4:
+            hash_key = HashKey(split_str[2], str_to_bytes(split_str[3]))
+        return MiddlewareSigningKey(allocation_enc_str, key_data, hash_key)
 
     @classmethod
     def extract_from_headers(cls, headers: dict[str, str]) -> "SigningKey":
@@ -122,6 +267,28 @@ class MiddlewareSigningKey:
         """
         Sign data and return the signature.
         """
-        h = hmac.new(self._key_data, data, hashlib.sha256)
-        signature_data = h.digest()
-        return Signature(self._allocation_enc_str, signature_data)
+        signature_data = compute_tag(self._key_data, self._hash_key_data(), [data])
+        return Signature(
+            self._allocation_enc_str,
+            signature_data,
+            self._hash_key_allocation_enc_str(),
+        )
+
+    async def sign_async(self, data: bytes) -> Signature:
+        """
+        Sign data and return the signature. Large data is signed in the crypto executor.
+        """
+        signature_data = await CRYPTO_EXECUTOR.run(
+            len(data), compute_tag, self._key_data, self._hash_key_data(), [data]
+        )
+        return Signature(
+            self._allocation_enc_str,
+            signature_data,
+            self._hash_key_allocation_enc_str(),
+        )
+
+    def _hash_key_data(self) -> bytes | None:
+        return None if self._hash_key is None else self._hash_key.data
+
+    def _hash_key_allocation_enc_str(self) -> str | None:
+        return None if self._hash_key is None else self._hash_key.allocation_enc_str
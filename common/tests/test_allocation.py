@@ -3,14 +3,18 @@ Unit tests for the Allocation class.
 """
 
 import pytest
-from common.allocation import Allocation, APIAllocation
+from common.allocation import Allocation, AllocationTransaction, APIAllocation
 from common.exceptions import (
     InvalidBlockUUIDError,
     InvalidEncodedFragment,
     InvalidPSRDIndex,
 )
 from common.fragment import APIFragment, Fragment
-from .unit_test_common import create_test_block, create_test_pool_and_blocks
+from .unit_test_common import (
+    bytes_test_pattern,
+    create_test_block,
+    create_test_pool_and_blocks,
+)
 
 
 def test_init_and_properties():
@@ -234,3 +238,52 @@ def test_from_enc_str_bad_two_fragment():
     assert pool.nr_used_bytes == 0
     assert blocks[0]._data == bytes.fromhex("00010203040506070809")
     assert blocks[1]._data == bytes.fromhex("0001020304")
+
+
+def test_transaction_commit():
+    """
+    Allocations in a committed transaction stay allocated.
+    """
+    pool, _blocks = create_test_pool_and_blocks([10, 20])
+    with AllocationTransaction() as transaction:
+        allocation1 = transaction.reserve(pool, 5, purpose="test1")
+        allocation2 = transaction.reserve(pool, 10, purpose="test2")
+    assert transaction.state == AllocationTransaction.State.COMMITTED
+    assert pool.nr_used_bytes == 15
+    assert len(allocation1.data) == 5
+    assert len(allocation2.data) == 10
+
+
+def test_transaction_rollback():
+    """
+    Allocations in a rolled back transaction are given back to the pool, including allocations
+    that were added to the transaction after being taken on behalf of the peer.
+    """
+    pool, blocks = create_test_pool_and_blocks([10, 20])
+    peer_pool, _peer_blocks = create_test_pool_and_blocks([])
+    peer_pool.add_block(blocks[1])
+    with pytest.raises(RuntimeError):
+        with AllocationTransaction() as transaction:
+            transaction.reserve(pool, 15, purpose="test")
+            transaction.add(
+                Allocation.from_enc_str(f"{blocks[1].uuid}:10:5", peer_pool)
+            )
+            assert pool.nr_used_bytes == 20
+            raise RuntimeError("Operation failed")
+    assert transaction.state == AllocationTransaction.State.ROLLED_BACK
+    assert pool.nr_used_bytes == 0
+    # The data was restored, so the same bytes can be allocated again.
+    allocation = pool.allocate(30, purpose="test")
+    assert allocation.data == bytes_test_pattern(10) + bytes_test_pattern(20)
+
+
+def test_transaction_explicit_rollback():
+    """
+    Explicitly roll back a transaction inside a with block.
+    """
+    pool, _blocks = create_test_pool_and_blocks([10])
+    with AllocationTransaction() as transaction:
+        transaction.reserve(pool, 5, purpose="test")
+        transaction.rollback()
+    assert transaction.state == AllocationTransaction.State.ROLLED_BACK
+    assert pool.nr_used_bytes == 0
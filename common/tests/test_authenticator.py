@@ -0,0 +1,120 @@
+"""
+Unit tests for the authenticator.
+"""
+
+from uuid import uuid4
+import pytest
+from common import authenticator
+from common.authenticator import (
+    HMAC_SHA256,
+    WEGMAN_CARTER,
+    Authenticator,
+    negotiate_mode,
+)
+from common.block import Block
+from common.exceptions import InvalidSignatureError
+from common.pool import Pool
+from common.signing_key import HASH_KEY_SIZE, ONE_TIME_PAD_SIZE, SIGNING_KEY_SIZE
+from .unit_test_common import bytes_test_pattern
+
+
+def create_authenticator_pair(mode: str) -> tuple[Authenticator, Authenticator]:
+    """
+    Create the authenticators of a client and a hub that share PSRD: the local pool of each one
+    holds the same blocks as the peer pool of the other one.
+    """
+    client_pools = {}
+    hub_pools = {}
+    for client_owner, hub_owner in [
+        (Pool.Owner.LOCAL, Pool.Owner.PEER),
+        (Pool.Owner.PEER, Pool.Owner.LOCAL),
+    ]:
+        client_pools[client_owner] = Pool("hank", client_owner)
+        hub_pools[hub_owner] = Pool("carol", hub_owner)
+        block_uuid = uuid4()
+        data = bytes_test_pattern(1000)
+        client_pools[client_owner].add_block(Block(block_uuid, data))
+        hub_pools[hub_owner].add_block(Block(block_uuid, data))
+    client = Authenticator(
+        mode, client_pools[Pool.Owner.LOCAL], client_pools[Pool.Owner.PEER]
+    )
+    hub = Authenticator(mode, hub_pools[Pool.Owner.LOCAL], hub_pools[Pool.Owner.PEER])
+    return (client, hub)
+
+
+def send(
+    sender: Authenticator, receiver: Authenticator, data: bytes, received_data=None
+):
+    """
+    Sign `data` with the sender, and verify the signature on `received_data` (the same data if
+    None) with the receiver. Returns whether the signature is valid.
+    """
+    signature = sender.signing_key().sign([data])
+    if received_data is None:
+        received_data = data
+    verification_key = receiver.verification_key(signature)
+    return signature.same_as(verification_key.sign([received_data]))
+
+
+@pytest.mark.parametrize(
+    "mode, nr_bytes_per_message",
+    [(HMAC_SHA256, SIGNING_KEY_SIZE), (WEGMAN_CARTER, ONE_TIME_PAD_SIZE)],
+)
+def test_sign_and_verify(mode, nr_bytes_per_message):
+    """
+    Messages signed by one side are verified by the other side, and tampered messages are rejected.
+    Wegman-Carter takes the hash key from the pool once, and then only a one-time pad per message.
+    """
+    client, hub = create_authenticator_pair(mode)
+    for index in range(3):
+        assert send(client, hub, b"request %d" % index)
+        assert send(hub, client, b"response %d" % index)
+    assert not send(client, hub, b"request", b"tampered request")
+    assert not send(client, hub, b"", b"\x00")
+    nr_hash_key_bytes = HASH_KEY_SIZE if mode == WEGMAN_CARTER else 0
+    # The client signed 5 messages and verified 3.
+    assert client.to_mgmt()["nr_psrd_bytes"] == 8 * nr_bytes_per_message + (
+        2 * nr_hash_key_bytes
+    )
+
+
+def test_wegman_carter_hash_key_rotation(monkeypatch):
+    """
+    The signer takes a new hash key after the maximum number of uses, and the verifier still
+    accepts messages that were signed with the previous hash key.
+    """
+    monkeypatch.setattr(authenticator, "HASH_KEY_MAX_NR_USES", 2)
+    client, hub = create_authenticator_pair(WEGMAN_CARTER)
+    signatures = [client.signing_key().sign([b"%d" % index]) for index in range(3)]
+    assert signatures[0].hash_key_allocation_enc_str == (
+        signatures[1].hash_key_allocation_enc_str
+    )
+    assert signatures[1].hash_key_allocation_enc_str != (
+        signatures[2].hash_key_allocation_enc_str
+    )
+    for index in [2, 0, 1]:
+        verification_key = hub.verification_key(signatures[index])
+        assert signatures[index].same_as(verification_key.sign([b"%d" % index]))
+
+
+def test_mode_mismatch_is_rejected():
+    """
+    A signature that does not use the negotiated mode is rejected.
+    """
+    client, _hub = create_authenticator_pair(WEGMAN_CARTER)
+    hmac_client, hmac_hub = create_authenticator_pair(HMAC_SHA256)
+    with pytest.raises(InvalidSignatureError):
+        hmac_hub.verification_key(client.signing_key().sign([b"data"]))
+    _client, wegman_carter_hub = create_authenticator_pair(WEGMAN_CARTER)
+    with pytest.raises(InvalidSignatureError):
+        wegman_carter_hub.verification_key(hmac_client.signing_key().sign([b"data"]))
+
+
+def test_negotiate_mode():
+    """
+    The first offered mode that is supported is picked.
+    """
+    assert negotiate_mode([WEGMAN_CARTER, HMAC_SHA256], [HMAC_SHA256]) == HMAC_SHA256
+    supported_modes = [WEGMAN_CARTER, HMAC_SHA256]
+    assert negotiate_mode([HMAC_SHA256, WEGMAN_CARTER], supported_modes) == HMAC_SHA256
+    assert negotiate_mode([WEGMAN_CARTER], [HMAC_SHA256]) is None
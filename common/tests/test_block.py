@@ -146,6 +146,23 @@ def test_allocate_data_full_none():
     assert block.allocate_data(5) is None
 
 
+def test_allocate_contiguous_fragment():
+    """
+    Allocate a contiguous fragment from a block: gaps that are smaller than the minimum size are
+    skipped, and the fragment is at most the desired size.
+    """
+    block = create_test_block(20)
+    block.take_data(3, 5)
+    fragment = block.allocate_contiguous_fragment(4, 8)
+    assert (fragment.start, fragment.size) == (8, 8)
+    fragment = block.allocate_contiguous_fragment(3, 10)
+    assert (fragment.start, fragment.size) == (0, 3)
+    assert block.allocate_contiguous_fragment(5, 5) is None
+    fragment = block.allocate_contiguous_fragment(4, 10)
+    assert (fragment.start, fragment.size) == (16, 4)
+    assert block.is_fully_used()
+
+
 def test_take_data_all_free():
     """
     Take data from block: all requested data is free.
@@ -270,6 +287,35 @@ def test_is_fully_used():
     assert block.is_fully_used()
 
 
+def test_fully_used_callback():
+    """
+    The fully used callback is called when the last unused byte of the block is used.
+    """
+    block = create_test_block(10)
+    fully_used_blocks = []
+    block.set_fully_used_callback(fully_used_blocks.append)
+    block.allocate_data(5)
+    assert not fully_used_blocks
+    block.take_data(5, 5)
+    assert fully_used_blocks == [block]
+
+
+def test_retire():
+    """
+    Retire a block: only a fully used block can be retired, and its data is released.
+    """
+    block = create_test_block(10)
+    assert not block.retire()
+    block.allocate_data(10)
+    assert block.retire()
+    assert block.retired
+    assert block.data == b""
+    assert block.nr_used_bytes == 10
+    assert not block.retire()
+    with pytest.raises(PSRDDataAlreadyUsedError):
+        block.take_data(0, 1)
+
+
 def test_to_api():
     """
     Create an APIBlock for a Block.
@@ -0,0 +1,58 @@
+"""
+Unit tests for the block reaper.
+"""
+
+import asyncio
+from common.block_reaper import BlockReaper
+from .unit_test_common import create_test_pool_and_blocks
+
+
+class PoolStub:
+    """
+    Stands in for a pool: counts how often the reaper asks it to retire blocks.
+    """
+
+    def __init__(self):
+        self.nr_calls = 0
+
+    def retire_fully_used_blocks(self) -> int:
+        """
+        Pretend to retire one block.
+        """
+        self.nr_calls += 1
+        return 1
+
+
+def test_reap():
+    """
+    Reaping retires the blocks of all notified pools, once per notification.
+    """
+    reaper = BlockReaper()
+    pool = PoolStub()
+    reaper.notify(pool)
+    reaper.notify(pool)
+    assert reaper.to_mgmt()["nr_notified_pools"] == 2
+    assert reaper.reap() == 2
+    assert pool.nr_calls == 2
+    assert reaper.reap() == 0
+    assert reaper.to_mgmt() == {"nr_notified_pools": 0, "nr_retired_blocks": 2}
+
+
+def test_reap_in_background():
+    """
+    The background task retires the fully used blocks of a real pool (which notifies the global
+    block reaper).
+    """
+
+    async def run():
+        reaper = BlockReaper(reap_interval=0.01)
+        pool, blocks = create_test_pool_and_blocks([10, 10])
+        _allocation = pool.allocate(10, purpose="test")
+        reaper.notify(pool)
+        reaper.start()
+        await asyncio.sleep(0.05)
+        reaper.stop()
+        assert blocks[0].retired
+        assert not blocks[1].retired
+
+    asyncio.run(run())
@@ -0,0 +1,47 @@
+"""
+Unit tests for the codec.
+"""
+
+from uuid import uuid4
+import pytest
+from common import codec
+from common.block import APIBlock
+from common.registration_api import (
+    APIPutRegistrationRequest,
+    APIPutRegistrationResponse,
+)
+from common.share_api import APIGetShareResponse, APIPostShareRequest
+
+
+@pytest.mark.parametrize(
+    "obj",
+    [
+        APIPostShareRequest(
+            "carol", "sam", "serena", str(uuid4()), 1, f"{uuid4()}:0:32", "AAEC"
+        ),
+        APIGetShareResponse(2, f"{uuid4()}:0:32", "AAEC"),
+        APIBlock(block_uuid=str(uuid4()), data="AAECAwQ="),
+        APIPutRegistrationRequest("carol", ["sam"]),
+        APIPutRegistrationResponse("hank"),
+    ],
+)
+def test_encode_and_decode(obj):
+    """
+    A decoded message is equal to the encoded message, and the encoding is the same as the pydantic
+    JSON encoding.
+    """
+    data = codec.encode(obj)
+    assert data == obj.model_dump_json().encode()
+    assert codec.decode(data, type(obj)) == obj
+
+
+@pytest.mark.parametrize(
+    "data",
+    [b"not json", b"[]", b'{"share_index": "two"}', b'{"share_index": 2}'],
+)
+def test_decode_invalid(data):
+    """
+    Decoding invalid JSON or JSON that does not match the model raises a ValueError.
+    """
+    with pytest.raises(ValueError):
+        codec.decode(data, APIGetShareResponse)
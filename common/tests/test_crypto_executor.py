@@ -0,0 +1,158 @@
+"""
+Unit tests for the crypto executor and the event loop monitor.
+"""
+
+import asyncio
+import os
+import threading
+from common import shamir
+from common.crypto_executor import CryptoExecutor
+from common.encryption_key import xor_bytes
+from common.event_loop_monitor import EventLoopMonitor
+from common.signing_key import compute_signature_data
+
+
+def _current_thread_name(_data: bytes) -> str:
+    return threading.current_thread().name
+
+
+def _current_pid(_data: bytes) -> int:
+    return os.getpid()
+
+
+def test_small_payload_runs_inline():
+    """
+    Operations on payloads below the threshold run on the event loop thread.
+    """
+    executor = CryptoExecutor(CryptoExecutor.Mode.THREAD, offload_threshold=1000)
+    thread_name = asyncio.run(executor.run(999, _current_thread_name, b""))
+    assert thread_name == threading.current_thread().name
+    assert executor.to_mgmt()["nr_inline_operations"] == 1
+    assert executor.to_mgmt()["nr_thread_operations"] == 0
+    executor.shutdown()
+
+
+def test_large_payload_runs_in_thread():
+    """
+    Operations on payloads at or above the threshold run in the thread pool.
+    """
+    executor = CryptoExecutor(CryptoExecutor.Mode.THREAD, offload_threshold=1000)
+    thread_name = asyncio.run(executor.run(1000, _current_thread_name, b""))
+    assert thread_name.startswith("crypto")
+    assert executor.to_mgmt()["nr_thread_operations"] == 1
+    executor.shutdown()
+
+
+def test_inline_mode_never_offloads():
+    """
+    In inline mode, even operations on large payloads run on the event loop thread.
+    """
+    executor = CryptoExecutor(CryptoExecutor.Mode.INLINE, offload_threshold=0)
+    thread_name = asyncio.run(executor.run(10_000_000, _current_thread_name, b""))
+    assert thread_name == threading.current_thread().name
+    executor.shutdown()
+
+
+def test_process_mode():
+    """
+    In process mode, CPU-bound operations run in a separate process, and other operations run in a
+    thread.
+    """
+    executor = CryptoExecutor(
+        CryptoExecutor.Mode.PROCESS, max_workers=1, offload_threshold=0
+    )
+    pid = asyncio.run(executor.run(1, _current_pid, b"", cpu_bound=True))
+    assert pid != os.getpid()
+    pid = asyncio.run(executor.run(1, _current_pid, b""))
+    assert pid == os.getpid()
+    assert executor.to_mgmt()["nr_process_operations"] == 1
+    assert executor.to_mgmt()["nr_thread_operations"] == 1
+    executor.shutdown()
+
+
+def test_shamir_in_process_pool():
+    """
+    Shamir split and reconstruct give the same result in the process pool as inline.
+    """
+    executor = CryptoExecutor(
+        CryptoExecutor.Mode.PROCESS, max_workers=1, offload_threshold=0
+    )
+    secret = os.urandom(1000)
+
+    async def split_and_reconstruct():
+        shares = await executor.run(
+            len(secret),
+            shamir.split_binary_secret_into_shares,
+            secret,
+            5,
+            3,
+            cpu_bound=True,
+        )
+        return await executor.run(
+            len(secret),
+            shamir.reconstruct_binary_secret_from_shares,
+            3,
+            shares[1:4],
+            cpu_bound=True,
+        )
+
+    assert asyncio.run(split_and_reconstruct()) == secret
+    executor.shutdown()
+
+
+def test_exception_is_propagated():
+    """
+    An exception raised by an offloaded operation is raised by run.
+    """
+    executor = CryptoExecutor(CryptoExecutor.Mode.THREAD, offload_threshold=0)
+    try:
+        asyncio.run(executor.run(1, xor_bytes, b"ab", b"abc"))
+    except AssertionError:
+        pass
+    else:
+        assert False, "Expected AssertionError"
+    executor.shutdown()
+
+
+def test_xor_bytes():
+    """
+    XOR of two byte strings, including leading zero bytes in the result.
+    """
+    assert xor_bytes(b"", b"") == b""
+    assert xor_bytes(b"\x0f\xf0\x00", b"\x0f\x0f\xff") == b"\x00\xff\xff"
+    data = os.urandom(1000)
+    key = os.urandom(1000)
+    expected = bytes(d ^ k for d, k in zip(data, key))
+    assert xor_bytes(data, key) == expected
+    assert xor_bytes(expected, key) == data
+
+
+def test_compute_signature_data():
+    """
+    The signature over a list of items is the same as the signature over their concatenation, and
+    None items are skipped.
+    """
+    key = os.urandom(32)
+    assert compute_signature_data(key, [b"abc", None, b"def"]) == (
+        compute_signature_data(key, [b"abcdef"])
+    )
+
+
+def test_event_loop_monitor_detects_blocking():
+    """
+    Blocking the event loop shows up as lag.
+    """
+    monitor = EventLoopMonitor(probe_interval=0.01)
+
+    async def block_loop():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        threading.Event().wait(0.2)  # Block the event loop
+        await asyncio.sleep(0.05)
+        monitor.stop()
+
+    asyncio.run(block_loop())
+    assert monitor.max_lag >= 0.1
+    assert monitor.to_mgmt()["nr_probes"] > 0
+    monitor.reset()
+    assert monitor.max_lag == 0.0
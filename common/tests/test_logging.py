@@ -0,0 +1,106 @@
+"""
+Unit tests for logging.
+"""
+
+import argparse
+import logging
+import threading
+from uuid import uuid4
+from common import logging as dske_logging
+
+
+class _RecordingHandler(logging.Handler):
+    """
+    A log handler that keeps the formatted messages, and the threads that they were handled on.
+    """
+
+    messages: list[str]
+    threads: list[threading.Thread]
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+        self.threads = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append(self.format(record))
+        self.threads.append(threading.current_thread())
+
+
+def test_rate_limit_filter(monkeypatch):
+    """
+    The rate limit filter lets through bursts of up to `rate` records, drops the others, and
+    reports the number of dropped records when it lets records through again.
+    """
+    now = 1000.0
+    monkeypatch.setattr(dske_logging.time, "monotonic", lambda: now)
+    log_filter = dske_logging.RateLimitFilter("http", 2.0)
+    record = logging.makeLogRecord({"msg": "Call %s", "args": ("GET",)})
+    assert log_filter.filter(record)
+    assert log_filter.filter(record)
+    assert not log_filter.filter(record)
+    assert not log_filter.filter(record)
+    assert log_filter.nr_dropped == 2
+    now += 0.5
+    handler = _RecordingHandler()
+    dske_logging.LOGGER.addHandler(handler)
+    try:
+        assert log_filter.filter(record)
+    finally:
+        dske_logging.LOGGER.removeHandler(handler)
+    assert log_filter.nr_dropped == 0
+    assert handler.messages == [
+        "Dropped 2 log records in category http (rate limit 2.0 per second)"
+    ]
+    assert record.getMessage() == "Call GET"
+
+
+def test_queued_logging():
+    """
+    Queued logging formats and writes the records in a background thread, and writes the records
+    that are still in the queue when it is stopped.
+    """
+    uvicorn_logger = logging.getLogger("uvicorn")
+    handler = _RecordingHandler()
+    uvicorn_logger.addHandler(handler)
+    try:
+        dske_logging.start_queued_logging()
+        assert handler not in uvicorn_logger.handlers
+        key_id = uuid4()
+        for index in range(10):
+            dske_logging.KEY_LOGGER.info(
+                "Gathered %s shares for key ID %s", index, key_id
+            )
+        dske_logging.stop_queued_logging()
+        assert handler in uvicorn_logger.handlers
+    finally:
+        dske_logging.stop_queued_logging()
+        uvicorn_logger.removeHandler(handler)
+    assert handler.messages == [
+        f"Gathered {index} shares for key ID {key_id}" for index in range(10)
+    ]
+    assert all(thread != threading.current_thread() for thread in handler.threads)
+
+
+def test_command_line_arguments():
+    """
+    The log levels and the rate limit are configured from the command line arguments, and can be
+    passed on to a child process.
+    """
+    parser = argparse.ArgumentParser()
+    dske_logging.add_command_line_arguments(parser)
+    args = parser.parse_args(
+        ["--log-level", "warning", "--log-level", "http=debug", "--log-rate-limit", "5"]
+    )
+    assert args.log_level == [("dske", logging.WARNING), ("http", logging.DEBUG)]
+    assert parser.parse_args(dske_logging.command_line_arguments(args)) == args
+    try:
+        dske_logging.configure(dict(args.log_level), args.log_rate_limit)
+        assert not dske_logging.KEY_LOGGER.isEnabledFor(logging.INFO)
+        assert dske_logging.HTTP_LOGGER.isEnabledFor(logging.DEBUG)
+        assert len(dske_logging.HTTP_LOGGER.filters) == 1
+    finally:
+        dske_logging.configure(
+            {"dske": logging.DEBUG, "http": logging.NOTSET}, rate_limit=None
+        )
+    assert not dske_logging.HTTP_LOGGER.filters
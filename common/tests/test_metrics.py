@@ -0,0 +1,109 @@
+"""
+Unit tests for metrics.
+"""
+
+from common.metrics import Registry, combine_rendered_metrics
+
+
+def test_counter():
+    """
+    Render a counter with and without labels.
+    """
+    registry = Registry()
+    counter = registry.counter("test_total", "A test counter")
+    counter.inc()
+    counter.inc(2)
+    labeled_counter = registry.counter("test_labeled_total", "Labeled", ("peer",))
+    labeled_counter.labels("hank").inc()
+    labeled_counter.labels("helen").inc(5)
+    labeled_counter.labels("hank").inc()
+    assert registry.render() == (
+        "# HELP test_total A test counter\n"
+        "# TYPE test_total counter\n"
+        "test_total 3\n"
+        "# HELP test_labeled_total Labeled\n"
+        "# TYPE test_labeled_total counter\n"
+        'test_labeled_total{peer="hank"} 2\n'
+        'test_labeled_total{peer="helen"} 5\n'
+    )
+
+
+def test_gauge():
+    """
+    Render a gauge that is set explicitly and a gauge that is computed when rendered.
+    """
+    registry = Registry()
+    gauge = registry.gauge("test_gauge", "A test gauge", ("kind",))
+    gauge.labels("set").set(1.5)
+    values = [7]
+    gauge.labels("function").set_function(lambda: values[0])
+    values[0] = 8
+    assert registry.render() == (
+        "# HELP test_gauge A test gauge\n"
+        "# TYPE test_gauge gauge\n"
+        'test_gauge{kind="set"} 1.5\n'
+        'test_gauge{kind="function"} 8\n'
+    )
+
+
+def test_histogram():
+    """
+    Render a histogram: bucket counts are cumulative.
+    """
+    registry = Registry()
+    histogram = registry.histogram("test_seconds", "A test histogram", (), (0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.1)
+    histogram.observe(0.5)
+    histogram.observe(2.0)
+    assert registry.render() == (
+        "# HELP test_seconds A test histogram\n"
+        "# TYPE test_seconds histogram\n"
+        'test_seconds_bucket{le="0.1"} 2\n'
+        'test_seconds_bucket{le="1"} 3\n'
+        'test_seconds_bucket{le="+Inf"} 4\n'
+        "test_seconds_count 4\n"
+        "test_seconds_sum 2.65\n"
+    )
+
+
+def test_label_value_escaping():
+    """
+    Quotes, backslashes, and newlines in label values are escaped.
+    """
+    registry = Registry()
+    registry.counter("test_total", "Test", ("name",)).labels('a"b\\c\nd').inc()
+    assert 'test_total{name="a\\"b\\\\c\\nd"} 1\n' in registry.render()
+
+
+def test_register_twice():
+    """
+    Registering a metric with the same name twice returns the existing metric.
+    """
+    registry = Registry()
+    counter1 = registry.counter("test_total", "Test", ("peer",))
+    counter2 = registry.counter("test_total", "Test", ("peer",))
+    assert counter1 is counter2
+
+
+def test_combine_rendered_metrics():
+    """
+    Combine the metrics of two processes: the samples of each metric stay together.
+    """
+    registries = [Registry(), Registry()]
+    for index, registry in enumerate(registries):
+        registry.counter("a_total", "A").inc(index + 1)
+        registry.counter("b_total", "B", ("peer",)).labels("hank").inc(10 * (index + 1))
+    combined = combine_rendered_metrics(
+        [registry.render() for registry in registries], "worker"
+    )
+    assert combined == (
+        "# HELP a_total A\n"
+        "# TYPE a_total counter\n"
+        'a_total{worker="0"} 1\n'
+        'a_total{worker="1"} 2\n'
+        "# HELP b_total B\n"
+        "# TYPE b_total counter\n"
+        'b_total{peer="hank",worker="0"} 10\n'
+        'b_total{peer="hank",worker="1"} 20\n'
+    )
@@ -2,12 +2,16 @@
 Unit tests for the Fragment class.
 """
 
+import asyncio
+import random
 from uuid import uuid4
 import pytest
-from common.pool import Pool
+from common.allocation import AllocationTransaction
+from common import pool as pool_module
+from common.pool import MESSAGE_SIGNING_KEY, SHARE_ENCRYPTION_KEY, Pool
 from common.exceptions import InvalidBlockUUIDError, OutOfPreSharedRandomDataError
 from common.utils import bytes_to_str
-from .unit_test_common import create_test_pool_and_blocks
+from .unit_test_common import create_test_block, create_test_pool_and_blocks
 
 
 def test_init():
@@ -58,6 +62,43 @@ def test_to_mgmt():
     }
 
 
+def test_to_mgmt_summary():
+    """
+    Get a summary of the management status.
+    """
+    pool, _blocks = create_test_pool_and_blocks([10, 20])
+    _allocation = pool.allocate(15, purpose="test")
+    assert pool.to_mgmt_summary() == {
+        "owner": "local",
+        "nr_blocks": 2,
+        "size": 30,
+        "nr_used_bytes": 15,
+        "nr_unused_bytes": 15,
+    }
+
+
+def test_blocks_page():
+    """
+    Get the blocks in pages. Deleting blocks between pages does not cause other blocks to be
+    skipped.
+    """
+    pool, blocks = create_test_pool_and_blocks([1, 1, 1, 1, 1])
+    (page, cursor) = pool.blocks_page(None, 2)
+    assert page == blocks[0:2]
+    assert cursor is not None
+    # Use up and delete the first three blocks (one of which has not been returned yet).
+    _allocation = pool.allocate(3, purpose="test")
+    pool.retire_fully_used_blocks()
+    (page, cursor) = pool.blocks_page(cursor, 2)
+    assert page == blocks[3:5]
+    assert cursor is None
+    page_mgmt = pool.to_mgmt_blocks_page(None, 10)
+    assert [block["uuid"] for block in page_mgmt["blocks"]] == [
+        str(block.uuid) for block in blocks[3:5]
+    ]
+    assert page_mgmt["next_cursor"] is None
+
+
 def test_get_block_success():
     """
     Get a block by UUID (block exists).
@@ -137,15 +178,199 @@ def test_allocate_failure_insufficient_space():
     assert pool.nr_used_bytes == 0
 
 
-def test_delete_fully_used_blocks():
+def test_allocate_respects_reserved_bytes():
+    """
+    An allocation for a purpose must leave the bytes that are reserved for that purpose unused, so
+    that higher priority purposes can still allocate the last bytes of the pool.
+    """
+    pool = Pool(
+        name="test_pool",
+        owner=Pool.Owner.LOCAL,
+        reserved_bytes={SHARE_ENCRYPTION_KEY: 40, MESSAGE_SIGNING_KEY: 0},
+    )
+    pool.add_block(create_test_block(50))
+    pool.add_block(create_test_block(50))
+    assert pool.can_allocate(60, SHARE_ENCRYPTION_KEY)
+    assert not pool.can_allocate(61, SHARE_ENCRYPTION_KEY)
+    with pytest.raises(OutOfPreSharedRandomDataError) as exc_info:
+        pool.allocate(61, SHARE_ENCRYPTION_KEY)
+    assert exc_info.value.details["pool_available_bytes"] == 60
+    _allocation = pool.allocate(60, SHARE_ENCRYPTION_KEY)
+    with pytest.raises(OutOfPreSharedRandomDataError):
+        pool.allocate(1, SHARE_ENCRYPTION_KEY)
+    # The reserved bytes are still available for signing keys.
+    _allocation = pool.allocate(40, MESSAGE_SIGNING_KEY)
+    assert pool.nr_unused_bytes == 0
+
+
+def test_allocate_from_extent():
+    """
+    Allocations from an extent are single fragments that are carved from the same contiguous range
+    of a block. Bytes that are reserved in the extent but not carved yet count as unused, and are
+    given back when the extent cannot hold the next allocation.
+    """
+    pool, blocks = create_test_pool_and_blocks([10, 100])
+    allocations = [pool.allocate_from_extent(8, purpose="test") for _ in range(3)]
+    # The first extent is all of the first block, which only has room for one allocation. The
+    # second extent is all of the second block.
+    assert [(a.fragments[0].block, a.fragments[0].start) for a in allocations] == [
+        (blocks[0], 0),
+        (blocks[1], 0),
+        (blocks[1], 8),
+    ]
+    assert all(len(allocation.fragments) == 1 for allocation in allocations)
+    assert pool.nr_used_bytes == 24
+    assert pool.nr_unused_bytes == 86
+    assert blocks[1].nr_used_bytes == 100
+    # The signing key is taken from the first block; the extent is not touched.
+    _allocation = pool.allocate(2, purpose="test2")
+    assert pool.allocate_from_extent(8, purpose="test").fragments[0].start == 16
+    assert pool.nr_used_bytes == 34
+    # In the management status, the bytes that were not carved from the extent count as unused.
+    block_statuses = pool.to_mgmt()["blocks"]
+    assert [status["nr_used_bytes"] for status in block_statuses] == [10, 24]
+    assert [status["nr_unused_bytes"] for status in block_statuses] == [0, 76]
+
+
+def test_allocate_from_extent_gives_back_unused_bytes(monkeypatch):
+    """
+    Rolled back allocations from an extent are given back to the block, and an allocation that
+    needs the bytes that are reserved in an extent releases the extent.
+    """
+    monkeypatch.setattr(pool_module, "EXTENT_SIZE", 20)
+    pool, blocks = create_test_pool_and_blocks([30, 30])
+    with AllocationTransaction() as transaction:
+        transaction.add(pool.allocate_from_extent(5, purpose="test"))
+        transaction.rollback()
+    assert pool.nr_used_bytes == 0
+    # The extent still holds the bytes after the rolled back allocation.
+    assert blocks[0].nr_used_bytes == 15
+    allocation = pool.allocate_from_extent(5, purpose="test")
+    assert allocation.fragments[0].start == 5
+    allocation = pool.allocate(50, purpose="test2")
+    assert len(allocation.fragments) == 3
+    assert pool.nr_used_bytes == 55
+    assert pool.nr_unused_bytes == 5
+    assert blocks[0].nr_used_bytes + blocks[1].nr_used_bytes == 55
+
+
+def test_allocate_from_extent_respects_reserved_bytes():
+    """
+    An extent is never larger than the number of bytes that are available for its purpose, so the
+    reserved bytes stay available for other purposes.
+    """
+    pool = Pool(
+        name="test_pool",
+        owner=Pool.Owner.LOCAL,
+        reserved_bytes={SHARE_ENCRYPTION_KEY: 40, MESSAGE_SIGNING_KEY: 0},
+    )
+    pool.add_block(create_test_block(100))
+    _allocation = pool.allocate_from_extent(10, SHARE_ENCRYPTION_KEY)
+    assert pool.can_allocate(50, SHARE_ENCRYPTION_KEY)
+    assert not pool.can_allocate(51, SHARE_ENCRYPTION_KEY)
+    with pytest.raises(OutOfPreSharedRandomDataError):
+        pool.allocate_from_extent(51, SHARE_ENCRYPTION_KEY)
+    _allocation = pool.allocate_from_extent(50, SHARE_ENCRYPTION_KEY)
+    _allocation = pool.allocate(40, MESSAGE_SIGNING_KEY)
+    assert pool.nr_unused_bytes == 0
+
+
+def test_retire_fully_used_blocks():
     """
-    Delete fully used PSRD blocks from the pool.
+    Retire fully used PSRD blocks: they are removed from the pool and their data is released.
     """
-    pool, _blocks = create_test_pool_and_blocks([10, 11])
+    pool, blocks = create_test_pool_and_blocks([10, 11])
     # Allocate all of the first block and part of the second block.
     _allocation = pool.allocate(15, purpose="test1")
     assert pool.nr_used_bytes == 15
     assert pool.nr_unused_bytes == 6
-    pool.delete_fully_used_blocks()
+    assert pool.retire_fully_used_blocks() == 1
     assert pool.nr_used_bytes == 5
     assert pool.nr_unused_bytes == 6
+    assert blocks[0].retired
+    assert blocks[0].data == b""
+    with pytest.raises(InvalidBlockUUIDError):
+        pool.get_block(blocks[0].uuid)
+    assert pool.retire_fully_used_blocks() == 0
+
+
+def test_retire_block_with_extent(monkeypatch):
+    """
+    A block that holds an extent is not retired while the extent has bytes that were not carved
+    yet, but it is retired after the extent is released.
+    """
+    monkeypatch.setattr(pool_module, "EXTENT_SIZE", 10)
+    pool, blocks = create_test_pool_and_blocks([10, 10])
+    _allocation = pool.allocate_from_extent(5, purpose="test")
+    assert blocks[0].is_fully_used()
+    assert pool.retire_fully_used_blocks() == 0
+    assert pool.nr_unused_bytes == 15
+    _allocation = pool.allocate_from_extent(5, purpose="test")
+    _allocation = pool.allocate_from_extent(5, purpose="test")
+    assert pool.retire_fully_used_blocks() == 1
+    assert blocks[0].retired
+    assert pool.nr_unused_bytes == 5
+
+
+def test_retire_block_with_data_given_back():
+    """
+    A block that was queued for retirement but got data back before it was retired stays in the
+    pool. Data that is given back after a block was retired is dropped.
+    """
+    pool, blocks = create_test_pool_and_blocks([10])
+    allocation1 = pool.allocate(10, purpose="test1")
+    allocation1.give_back()
+    assert pool.retire_fully_used_blocks() == 0
+    assert pool.get_block(blocks[0].uuid) is blocks[0]
+    assert pool.nr_unused_bytes == 10
+    allocation2 = pool.allocate(10, purpose="test2")
+    assert pool.retire_fully_used_blocks() == 1
+    allocation2.give_back()
+    assert pool.nr_unused_bytes == 0
+
+
+def test_concurrent_allocations_stress():
+    """
+    Hammer one pool from 1000 concurrent tasks. Half of the tasks allocate on the event loop, the
+    other half allocate from worker threads. Some transactions are committed and others are rolled
+    back. Check that no byte is ever handed out twice, and that the pool accounting is consistent.
+    """
+    nr_tasks = 1000
+    allocation_size = 7
+    pool, _blocks = create_test_pool_and_blocks([1000] * 10)
+    total_size = pool.nr_unused_bytes
+    committed = []
+
+    def allocate(commit: bool):
+        try:
+            with AllocationTransaction() as transaction:
+                allocation = transaction.reserve(pool, allocation_size, purpose="test")
+                if not commit:
+                    raise RuntimeError("Roll back")
+        except RuntimeError:
+            return
+        committed.append(allocation)
+
+    async def task(task_index: int):
+        await asyncio.sleep(random.random() / 100)
+        commit = task_index % 3 != 0
+        if task_index % 2 == 0:
+            allocate(commit)
+        else:
+            await asyncio.to_thread(allocate, commit)
+
+    async def run_all_tasks():
+        await asyncio.gather(*[task(task_index) for task_index in range(nr_tasks)])
+
+    asyncio.run(run_all_tasks())
+    assert len(committed) == len([i for i in range(nr_tasks) if i % 3 != 0])
+    used_bytes = set()
+    for allocation in committed:
+        assert len(allocation.data) == allocation_size
+        for fragment in allocation.fragments:
+            for offset in range(fragment.start, fragment.start + fragment.size):
+                byte_id = (fragment.block.uuid, offset)
+                assert byte_id not in used_bytes
+                used_bytes.add(byte_id)
+    assert pool.nr_used_bytes == len(committed) * allocation_size
+    assert pool.nr_unused_bytes == total_size - pool.nr_used_bytes
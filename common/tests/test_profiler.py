@@ -0,0 +1,113 @@
+"""
+Unit tests for on-demand profiling.
+"""
+
+import argparse
+import asyncio
+import threading
+import pytest
+from common import profiler
+from common.exceptions import ProfilingDisabledError, ProfilingInProgressError
+from common.profiler import Profiler
+
+
+def work() -> int:
+    """
+    Keep the CPU busy for a moment.
+    """
+    return sum(range(1000))
+
+
+def spin(stop_event: threading.Event) -> None:
+    """
+    Keep the CPU busy until the stop event is set.
+    """
+    while not stop_event.is_set():
+        work()
+
+
+def test_sampling_profile():
+    """
+    The sampling profiler samples the stacks of all threads, including threads other than the event
+    loop thread.
+    """
+
+    async def run():
+        stop_event = threading.Event()
+        thread = threading.Thread(target=spin, args=(stop_event,), name="spinner")
+        thread.start()
+        try:
+            return await Profiler(enabled=True, sampling_interval=0.001).profile(
+                Profiler.Mode.SAMPLING, 0.2
+            )
+        finally:
+            stop_event.set()
+            thread.join()
+
+    collapsed_stacks = asyncio.run(run())
+    lines = collapsed_stacks.splitlines()
+    assert lines
+    spinner_lines = [line for line in lines if line.startswith("spinner;")]
+    assert any(";common.tests.test_profiler.spin;" in line for line in spinner_lines)
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert " " not in stack
+        assert int(count) > 0
+
+
+def test_cprofile_profile():
+    """
+    The cprofile profiler reports the functions that ran on the event loop thread.
+    """
+
+    async def busy():
+        while True:
+            work()
+            await asyncio.sleep(0)
+
+    async def run():
+        task = asyncio.create_task(busy())
+        try:
+            return await Profiler(enabled=True).profile(
+                Profiler.Mode.CPROFILE, 0.2, Profiler.Sort.CUMULATIVE, 20
+            )
+        finally:
+            task.cancel()
+
+    report = asyncio.run(run())
+    assert "test_profiler.py" in report
+    assert "(work)" in report
+
+
+def test_profile_disabled_or_in_progress():
+    """
+    A profile can only be taken if profiling is enabled, and only one at a time.
+    """
+
+    async def run():
+        with pytest.raises(ProfilingDisabledError):
+            await Profiler().profile(Profiler.Mode.SAMPLING, 0.1)
+        enabled_profiler = Profiler(enabled=True)
+        first = asyncio.create_task(
+            enabled_profiler.profile(Profiler.Mode.SAMPLING, 0.1)
+        )
+        await asyncio.sleep(0)
+        with pytest.raises(ProfilingInProgressError):
+            await enabled_profiler.profile(Profiler.Mode.CPROFILE, 0.1)
+        await first
+        await enabled_profiler.profile(Profiler.Mode.CPROFILE, 0.1)
+
+    asyncio.run(run())
+
+
+def test_command_line_arguments():
+    """
+    The profiling command line arguments can be passed on to a child process.
+    """
+    parser = argparse.ArgumentParser()
+    profiler.add_command_line_arguments(parser)
+    for argv in [[], ["--enable-profiling", "--profiling-sampling-interval", "0.01"]]:
+        args = parser.parse_args(argv)
+        assert parser.parse_args(profiler.command_line_arguments(args)) == args
+    assert args.enable_profiling
+    assert args.profiling_sampling_interval == 0.01
@@ -0,0 +1,86 @@
+"""
+Unit tests for the PSRD generator.
+"""
+
+import asyncio
+import os
+import pytest
+from common import psrd_generator
+from common.psrd_generator import PSRDGenerator
+
+
+@pytest.mark.parametrize("algorithm", list(PSRDGenerator.Algorithm))
+def test_generate(algorithm):
+    """
+    Generate random data directly (the buffer is empty) with each algorithm.
+    """
+    generator = PSRDGenerator(algorithm, chunk_size=1000, buffer_size=0)
+    data1 = generator.generate(2500)
+    data2 = generator.generate(2500)
+    assert len(data1) == 2500
+    assert len(data2) == 2500
+    assert data1 != data2
+    mgmt = generator.to_mgmt()
+    assert mgmt["algorithm"] == str(algorithm)
+    assert mgmt["nr_generated_bytes"] == 5000
+    assert mgmt["nr_bytes_direct"] == 5000
+    assert mgmt["nr_bytes_from_buffer"] == 0
+    generator.shutdown()
+
+
+def test_chunks_are_different():
+    """
+    The DRBG produces different data for each chunk.
+    """
+    generator = PSRDGenerator(chunk_size=100, buffer_size=0)
+    data = generator.generate(300)
+    assert len({bytes(data[0:100]), bytes(data[100:200]), bytes(data[200:300])}) == 3
+    generator.shutdown()
+
+
+@pytest.mark.parametrize("reseed_interval, expected_nr_reseeds", [(100, 2), (1000, 0)])
+def test_reseed(monkeypatch, reseed_interval, expected_nr_reseeds):
+    """
+    The DRBG is reseeded from os.urandom once the reseed interval has been used up, and not before.
+    """
+    generator = PSRDGenerator(
+        chunk_size=100, buffer_size=0, reseed_interval=reseed_interval
+    )
+    seeds = []
+    real_urandom = os.urandom
+
+    def counting_urandom(size):
+        seeds.append(real_urandom(size))
+        return seeds[-1]
+
+    monkeypatch.setattr(psrd_generator.os, "urandom", counting_urandom)
+    for _ in range(3):
+        generator.generate(100)
+    assert len(seeds) == expected_nr_reseeds
+    generator.shutdown()
+
+
+def test_buffer():
+    """
+    Small requests are served from the buffer, which is refilled in the background.
+    """
+
+    async def run():
+        generator = PSRDGenerator(buffer_size=1000)
+        # The buffer is empty at first: generated directly.
+        await generator.generate_async(10)
+        generator.shutdown(wait=True)
+        generator.fill_buffer()
+        assert generator.nr_buffered_bytes == 1000
+        # The buffer stays more than half full, so no refill is started.
+        data = await generator.generate_async(400)
+        assert len(data) == 400
+        assert generator.to_mgmt()["nr_bytes_from_buffer"] == 400
+        # More than is left in the buffer: generated directly.
+        data = await generator.generate_async(700)
+        assert len(data) == 700
+        assert generator.to_mgmt()["nr_bytes_direct"] == 710
+        assert generator.nr_buffered_bytes == 600
+        generator.shutdown()
+
+    asyncio.run(run())
@@ -4,6 +4,7 @@ Unit tests for Shamir Secret Sharing.
 
 from os import urandom
 from random import sample
+import pytest
 from common import shamir
 
 
@@ -41,3 +42,141 @@ def test_shamir_split_reconstruct_all_scenarios():
             shamir_split_reconstruct_scenario(size, nr_shares, min_shares)
 
     # TODO: Key length 3 (< MIN_KEY_LENGTH) raises exception
+
+
+def test_shamir_split_reconstruct_gf65536():
+    """
+    Test splitting and reconstructing secrets in GF(2^16), with more shares than GF(256) supports,
+    and with secrets of an odd length (which are padded).
+    """
+    for size in [16, 4, 5, 33]:
+        for nr_shares, min_shares in [
+            (5, 3),
+            (5, 1),
+            (32, 3),
+            (64, 10),
+            (128, 3),
+            (128, 128),
+        ]:
+            shamir_split_reconstruct_scenario(size, nr_shares, min_shares)
+
+
+def test_shamir_gf65536_field():
+    """
+    Test that the GF(2^16) reduction polynomial is primitive, and that the vectorized interpolation
+    agrees with symbol-by-symbol arithmetic.
+    """
+    exp_table = shamir.EXP_TABLE_GF65536
+    log_table = shamir.LOG_TABLE_GF65536
+    assert len(set(exp_table)) == 65535
+    assert all(log_table[exp_table[i]] == i for i in range(65535))
+
+    def multiply(a: int, b: int) -> int:
+        if a == 0 or b == 0:
+            return 0
+        return exp_table[(log_table[a] + log_table[b]) % 65535]
+
+    def divide(a: int, b: int) -> int:
+        if a == 0:
+            return 0
+        return exp_table[(log_table[a] - log_table[b]) % 65535]
+
+    # pylint: disable=protected-access
+    shares = [shamir.RawShare(x, urandom(8)) for x in [3, 1000, 65535]]
+    x = 42
+    expected = []
+    for symbol_index in range(4):
+        value = 0
+        for share in shares:
+            basis = 1
+            for other in shares:
+                if other is not share:
+                    basis = multiply(basis, divide(other.x ^ x, other.x ^ share.x))
+            symbol = int.from_bytes(share.data[2 * symbol_index : 2 * symbol_index + 2])
+            value ^= multiply(basis, symbol)
+        expected.append(value.to_bytes(2, "big"))
+    assert shamir._interpolate_gf65536(shares, x) == b"".join(expected)
+
+
+def test_shamir_format_tag():
+    """
+    Test that the share indexes are tagged with the share format: untagged for GF(256) (the
+    original format, which is used by default for up to MAX_SHARE_COUNT shares), and tagged for
+    GF(2^16).
+    """
+    secret = urandom(16)
+    shares = shamir.split_binary_secret_into_shares(secret, 5, 3)
+    assert [index for (index, _data) in shares] == [0, 1, 2, 3, 4]
+    shares = shamir.split_binary_secret_into_shares(secret, 5, 3, shamir.Field.GF65536)
+    assert [index >> shamir.FORMAT_TAG_SHIFT for (index, _data) in shares] == [1] * 5
+    assert shamir.reconstruct_binary_secret_from_shares(3, shares) == secret
+    shares = shamir.split_binary_secret_into_shares(urandom(15), 17, 3)
+    assert [index >> shamir.FORMAT_TAG_SHIFT for (index, _data) in shares] == [2] * 17
+
+
+def test_shamir_reconstruct_invalid_formats():
+    """
+    Test that reconstructing from shares with mixed or unknown formats raises ValueError.
+    """
+    secret = urandom(16)
+    gf256_shares = shamir.split_binary_secret_into_shares(secret, 5, 3)
+    gf65536_shares = shamir.split_binary_secret_into_shares(
+        secret, 5, 3, shamir.Field.GF65536
+    )
+    with pytest.raises(ValueError):
+        shamir.reconstruct_binary_secret_from_shares(
+            3, gf256_shares[:2] + gf65536_shares[2:3]
+        )
+    unknown_shares = [(index | (7 << 16), data) for (index, data) in gf256_shares]
+    with pytest.raises(ValueError):
+        shamir.reconstruct_binary_secret_from_shares(3, unknown_shares)
+
+
+def corrupt_share(share: tuple[int, bytes]) -> tuple[int, bytes]:
+    """
+    Get a corrupt copy of a share (same index, different value).
+    """
+    (index, data) = share
+    return (index, bytes([data[0] ^ 0x01]) + data[1:])
+
+
+def test_shamir_reconstruct_excluding_bad_shares():
+    """
+    Test that bad shares are excluded when reconstructing from more than the minimum number of
+    shares, in both fields.
+    """
+    secret = urandom(16)
+    for field in shamir.Field:
+        shares = shamir.split_binary_secret_into_shares(secret, 7, 3, field)
+        assert shamir.reconstruct_binary_secret_excluding_bad_shares(3, shares) == (
+            secret,
+            [],
+        )
+        shares[1] = corrupt_share(shares[1])
+        shares[5] = (shares[5][0] ^ 0x03, shares[5][1])
+        with pytest.raises(ValueError):
+            shamir.reconstruct_binary_secret_from_shares(3, shares)
+        assert shamir.reconstruct_binary_secret_excluding_bad_shares(3, shares) == (
+            secret,
+            [1, 5],
+        )
+
+
+def test_shamir_reconstruct_excluding_too_many_bad_shares():
+    """
+    Test that reconstructing raises ValueError when fewer than the minimum number of shares are
+    good, or when the bad shares are not found within the maximum number of attempts.
+    """
+    secret = urandom(16)
+    shares = shamir.split_binary_secret_into_shares(secret, 5, 3)
+    bad_shares = [corrupt_share(share) for share in shares[:3]] + shares[3:]
+    with pytest.raises(ValueError):
+        shamir.reconstruct_binary_secret_excluding_bad_shares(3, bad_shares)
+    bad_shares = [corrupt_share(shares[0])] + shares[1:]
+    with pytest.raises(ValueError):
+        shamir.reconstruct_binary_secret_excluding_bad_shares(
+            3, bad_shares, max_attempts=1
+        )
+    assert shamir.reconstruct_binary_secret_excluding_bad_shares(
+        3, bad_shares, max_attempts=2
+    ) == (secret, [0])
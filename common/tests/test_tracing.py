@@ -0,0 +1,110 @@
+"""
+Unit tests for tracing.
+"""
+
+import argparse
+import json
+import pytest
+from common import tracing
+from common.tracing import Tracer
+
+
+def test_spans():
+    """
+    Child spans have the current span as their parent, and are only created as part of a traced
+    request. Exceptions are recorded in the span.
+    """
+    tracer = Tracer()
+    with tracer.span("not traced") as span:
+        assert span is None
+    assert not tracing.propagation_headers()
+    with tracer.root_span("GET /etsi", node="carol") as root:
+        with tracer.span("scatter key") as child:
+            assert tracing.propagation_headers() == {
+                tracing.TRACEPARENT_HEADER: child.traceparent()
+            }
+            with pytest.raises(ValueError):
+                with tracer.span("split key"):
+                    raise ValueError("Too few shares")
+    assert not tracing.propagation_headers()
+    split_key, scatter_key, get_etsi = tracer.spans()
+    assert get_etsi is root
+    assert get_etsi.parent_span_id is None
+    assert get_etsi.attributes == {"node": "carol"}
+    assert scatter_key.parent_span_id == get_etsi.span_id
+    assert split_key.parent_span_id == scatter_key.span_id
+    assert {span.trace_id for span in tracer.spans()} == {get_etsi.trace_id}
+    assert split_key.error == "ValueError: Too few shares"
+    assert get_etsi.error is None
+    assert get_etsi.duration >= scatter_key.duration >= split_key.duration
+
+
+def test_root_span_continues_trace():
+    """
+    A root span continues the trace of a valid traceparent, and starts a new trace otherwise.
+    """
+    tracer = Tracer()
+    traceparent = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+    with tracer.root_span("POST /dske", traceparent) as span:
+        assert span.trace_id == "0af7651916cd43dd8448eb211c80319c"
+        assert span.parent_span_id == "b7ad6b7169203331"
+    with tracer.root_span("POST /dske", "01-garbage") as span:
+        assert span.trace_id != "0af7651916cd43dd8448eb211c80319c"
+        assert span.parent_span_id is None
+    assert len(tracer.spans("0af7651916cd43dd8448eb211c80319c")) == 1
+
+
+def test_ring_buffer():
+    """
+    The tracer keeps the most recent spans, up to the buffer size, and creates no spans if tracing
+    is disabled.
+    """
+    tracer = Tracer(buffer_size=3)
+    for index in range(5):
+        with tracer.root_span(f"request {index}"):
+            pass
+    assert [span.name for span in tracer.spans()] == [
+        "request 2",
+        "request 3",
+        "request 4",
+    ]
+    assert [span["name"] for span in tracer.to_mgmt(limit=1)["spans"]] == ["request 4"]
+    tracer.configure(buffer_size=0)
+    assert not tracer.enabled
+    with tracer.root_span("request 5") as span:
+        assert span is None
+    assert not tracer.spans()
+
+
+def test_file_exporter(tmp_path):
+    """
+    The tracer writes all spans to the trace file, one JSON object per line.
+    """
+    file_name = str(tmp_path / "trace.jsonl")
+    tracer = Tracer()
+    tracer.configure(buffer_size=0, file_name=file_name)
+    assert tracer.enabled
+    with tracer.root_span("GET /etsi"):
+        with tracer.span("scatter key", key_id="1234"):
+            pass
+    tracer.stop()
+    with open(file_name, encoding="utf-8") as file:
+        spans = [json.loads(line) for line in file]
+    assert [span["name"] for span in spans] == ["scatter key", "GET /etsi"]
+    assert spans[0]["attributes"] == {"key_id": "1234"}
+    assert spans[0]["parent_span_id"] == spans[1]["span_id"]
+
+
+def test_command_line_arguments():
+    """
+    The tracing command line arguments can be passed on to a child process.
+    """
+    parser = argparse.ArgumentParser()
+    tracing.add_command_line_arguments(parser)
+    args = parser.parse_args(["--trace-buffer-size", "0", "--trace-file", "t.jsonl"])
+    assert args.trace_buffer_size == 0
+    assert args.trace_file == "t.jsonl"
+    assert parser.parse_args(tracing.command_line_arguments(args)) == args
+    args = parser.parse_args([])
+    assert args.trace_buffer_size == tracing.DEFAULT_BUFFER_SIZE
+    assert parser.parse_args(tracing.command_line_arguments(args)) == args
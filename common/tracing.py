@@ -0,0 +1,326 @@
+"""
+Request tracing.
+
+A trace follows one request through the nodes of a topology: for example, a Get Key request on the
+master client, the Post Key Share requests that the client makes to the hubs, and the handling of
+those requests by the hubs. A trace consists of spans; each span times one operation, and has the
+span of the operation that it is part of as its parent.
+
+The trace context is propagated between nodes in the W3C `traceparent` HTTP header: the HTTP client
+adds it to the requests that it makes, and the middleware of the receiving node continues the trace
+(see `trace_request`). Spans are exported locally, without an external collector: each node keeps
+its most recent spans in an in-memory ring buffer, which can be dumped with the management API
+(GET /mgmt/v1/traces), and it can also write its spans to a JSON lines file.
+"""
+
+import argparse
+import atexit
+import collections
+import contextlib
+import contextvars
+import dataclasses
+import json
+import queue
+import random
+import re
+import threading
+import time
+from typing import Any, ContextManager
+import fastapi
+
+TRACEPARENT_HEADER = "traceparent"
+"""The HTTP header that carries the trace context (see https://www.w3.org/TR/trace-context/)."""
+
+DEFAULT_BUFFER_SIZE = 10_000
+"""By default, keep this many of the most recent spans in memory."""
+
+_TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+@dataclasses.dataclass
+class Span:
+    """
+    A span: one timed operation in a trace.
+    """
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: str | None
+    start_time: float  # Seconds since the epoch
+    attributes: dict[str, Any]
+    duration: float | None = None  # Seconds; None while the span has not ended
+    error: str | None = None
+
+    def traceparent(self) -> str:
+        """
+        Get the value of the traceparent header for requests that are made as part of this span.
+        """
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_mgmt(self) -> dict:
+        """
+        Get the management status.
+        """
+        return dataclasses.asdict(self)
+
+
+_CURRENT_SPAN: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+def _new_id(nr_bits: int) -> str:
+    # Trace and span IDs only need to be unique, not unpredictable.
+    return f"{random.getrandbits(nr_bits):0{nr_bits // 4}x}"
+
+
+class _FileExporter:
+    """
+    Writes spans to a file, one JSON object per line, in a background thread.
+    """
+
+    _file_name: str
+    _queue: queue.SimpleQueue
+    _thread: threading.Thread
+
+    def __init__(self, file_name: str):
+        self._file_name = file_name
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(
+            target=self._write, name="trace-exporter", daemon=True
+        )
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        """
+        Queue a span to be written.
+        """
+        self._queue.put(span)
+
+    def stop(self) -> None:
+        """
+        Write the spans that are still queued, and stop the background thread.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _write(self) -> None:
+        with open(self._file_name, "a", encoding="utf-8") as file:
+            while (span := self._queue.get()) is not None:
+                file.write(json.dumps(span.to_mgmt()) + "\n")
+                if self._queue.empty():
+                    file.flush()
+
+
+_NO_SPAN = contextlib.nullcontext()
+"""The context manager for operations that are not traced."""
+
+
+class _ActiveSpan:
+    """
+    The context manager of a span: makes the span the current span while it runs, and times it.
+    (This is a class rather than a generator-based context manager because spans are created on
+    hot paths.)
+    """
+
+    _tracer: "Tracer"
+    _span: Span
+    _token: contextvars.Token
+    _start_time: float
+
+    def __init__(self, tracer: "Tracer", span: Span):
+        self._tracer = tracer
+        self._span = span
+
+    def __enter__(self) -> Span:
+        self._token = _CURRENT_SPAN.set(self._span)
+        self._span.start_time = time.time()
+        self._start_time = time.perf_counter()
+        return self._span
+
+    def __exit__(self, exc_type, exc, _traceback) -> None:
+        self._span.duration = time.perf_counter() - self._start_time
+        _CURRENT_SPAN.reset(self._token)
+        if exc is not None:
+            self._span.error = f"{exc_type.__name__}: {exc}"
+        self._tracer.export(self._span)
+
+
+class Tracer:
+    """
+    Creates spans, and keeps the most recent ended spans in a ring buffer. Tracing is disabled if
+    the buffer size is zero and there is no trace file; spans are then not created at all.
+    """
+
+    _buffer: collections.deque[Span]
+    _file_exporter: _FileExporter | None
+    _enabled: bool
+
+    def __init__(self, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        self._file_exporter = None
+        self.configure(buffer_size)
+        atexit.register(self.stop)
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Is tracing enabled?
+        """
+        return self._enabled
+
+    def configure(self, buffer_size: int, file_name: str | None = None) -> None:
+        """
+        (Re-)configure the tracer: keep the `buffer_size` most recent spans in memory, and write
+        all spans to the file `file_name` (if set). The spans in memory are discarded.
+        """
+        assert buffer_size >= 0
+        self.stop()
+        self._buffer = collections.deque(maxlen=buffer_size)
+        if file_name is not None:
+            self._file_exporter = _FileExporter(file_name)
+        self._enabled = buffer_size > 0 or file_name is not None
+
+    def stop(self) -> None:
+        """
+        Write the spans that are still queued for the trace file (if any), and close the file.
+        """
+        if self._file_exporter is not None:
+            self._file_exporter.stop()
+            self._file_exporter = None
+
+    def root_span(
+        self, name: str, traceparent: str | None = None, **attributes
+    ) -> ContextManager[Span | None]:
+        """
+        Start a span for a request that a node received. If the request carries a valid
+        traceparent header value, the span continues the trace of the node that made the request;
+        otherwise, it starts a new trace. The context manager yields the span, or None if tracing
+        is disabled.
+        """
+        if not self._enabled:
+            return _NO_SPAN
+        match = _TRACEPARENT_PATTERN.match(traceparent) if traceparent else None
+        if match is None:
+            trace_id, parent_span_id = _new_id(128), None
+        else:
+            trace_id, parent_span_id = match.group(1), match.group(2)
+        return _ActiveSpan(
+            self, Span(name, trace_id, _new_id(64), parent_span_id, 0.0, attributes)
+        )
+
+    def span(self, name: str, **attributes) -> ContextManager[Span | None]:
+        """
+        Start a span as a child of the current span. The context manager yields the span, or None
+        (and no span is created) if there is no current span, i.e. if the operation is not part of
+        a traced request.
+        """
+        parent = _CURRENT_SPAN.get()
+        if parent is None:
+            return _NO_SPAN
+        return _ActiveSpan(
+            self,
+            Span(name, parent.trace_id, _new_id(64), parent.span_id, 0.0, attributes),
+        )
+
+    def export(self, span: Span) -> None:
+        """
+        Keep an ended span in the ring buffer, and write it to the trace file (if any).
+        """
+        self._buffer.append(span)
+        if self._file_exporter is not None:
+            self._file_exporter.export(span)
+
+    def spans(
+        self, trace_id: str | None = None, limit: int | None = None
+    ) -> list[Span]:
+        """
+        Get the most recent ended spans (oldest first), optionally only those of one trace, and
+        at most `limit` of them.
+        """
+        spans = [
+            span
+            for span in list(self._buffer)
+            if trace_id is None or span.trace_id == trace_id
+        ]
+        if limit is not None:
+            spans = spans[-limit:] if limit > 0 else []
+        return spans
+
+    def to_mgmt(self, trace_id: str | None = None, limit: int | None = None) -> dict:
+        """
+        Get the management status: the most recent spans (see `spans`).
+        """
+        return {"spans": [span.to_mgmt() for span in self.spans(trace_id, limit)]}
+
+
+TRACER = Tracer()
+"""
+The tracer that is used by all nodes in this process. It is configured from the command line
+arguments of the client or hub.
+"""
+
+
+def propagation_headers() -> dict[str, str]:
+    """
+    Get the headers that propagate the trace context to the node that a request is sent to (no
+    headers if the request is not part of a traced request).
+    """
+    span = _CURRENT_SPAN.get()
+    if span is None:
+        return {}
+    return {TRACEPARENT_HEADER: span.traceparent()}
+
+
+async def trace_request(
+    request: fastapi.Request, call_next, node_name: str
+) -> fastapi.Response:
+    """
+    Middleware: handle a request in a root span (see `Tracer.root_span`) that is named after the
+    method and path of the request, and record the status code of the response.
+    """
+    with TRACER.root_span(
+        f"{request.method} {request.url.path}",
+        request.headers.get(TRACEPARENT_HEADER),
+        node=node_name,
+    ) as span:
+        response = await call_next(request)
+        if span is not None:
+            span.attributes["status_code"] = response.status_code
+        return response
+
+
+def add_command_line_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the command line arguments for configuring tracing.
+    """
+    parser.add_argument(
+        "--trace-buffer-size",
+        type=int,
+        default=DEFAULT_BUFFER_SIZE,
+        help=f"Number of recent trace spans to keep in memory for the management API; 0 disables "
+        f"tracing, unless there is a trace file (default: {DEFAULT_BUFFER_SIZE})",
+    )
+    parser.add_argument(
+        "--trace-file",
+        type=str,
+        help="File to append all trace spans to, in JSON lines format (default: none)",
+    )
+
+
+def configure_from_command_line_arguments(args: argparse.Namespace) -> None:
+    """
+    Configure the tracer from the parsed command line arguments.
+    """
+    TRACER.configure(args.trace_buffer_size, args.trace_file)
+
+
+def command_line_arguments(args: argparse.Namespace) -> list[str]:
+    """
+    Convert the parsed tracing command line arguments back into a list of command line arguments
+    (to pass them on to a child process).
+    """
+    result = ["--trace-buffer-size", str(args.trace_buffer_size)]
+    if args.trace_file is not None:
+        result += ["--trace-file", args.trace_file]
+    return result
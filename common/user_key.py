@@ -5,11 +5,13 @@ internally within the DSKE protocol to encrypt key shares and to authenticate in
 messages (see classes EncryptionKey and SigningKey).
 """
 
-import os
 from uuid import UUID, uuid4
+from .crypto_executor import CRYPTO_EXECUTOR
 from .exceptions import ShamirSplitError
+from .psrd_generator import PSRD_GENERATOR
 from .shamir import split_binary_secret_into_shares
 from .share import Share
+from .tracing import TRACER
 
 
 class UserKey:
@@ -46,13 +48,14 @@ class UserKey:
         return len(self._value)
 
     @classmethod
-    def create_random_key(cls, size_in_bytes) -> "UserKey":
+    async def create_random_key(cls, size_in_bytes) -> "UserKey":
         """
         Create a random key, with the given size in bytes.
         """
-        return UserKey(uuid4(), os.urandom(size_in_bytes))
+        value = await PSRD_GENERATOR.generate_async(size_in_bytes)
+        return UserKey(uuid4(), bytes(value))
 
-    def split_into_shares(
+    async def split_into_shares(
         self,
         master_sae_id: str,
         slave_sae_id: str,
@@ -62,12 +65,19 @@ class UserKey:
         """
         Split a key into `nr_shares` shares. The minimum number of shares required to reconstruct
         the key is `min_nr_shares`. The shares do *not* yet have an encryption key or a signing key
-        allocated. This is done later when each share is associated with a peer node.
+        allocated. This is done later when each share is associated with a peer node. Large keys
+        are split in the crypto executor.
         """
         try:
-            share_indexes_and_values = split_binary_secret_into_shares(
-                self._value, nr_shares, min_nr_shares
-            )
+            with TRACER.span("split key", nr_shares=nr_shares):
+                share_indexes_and_values = await CRYPTO_EXECUTOR.run(
+                    len(self._value),
+                    split_binary_secret_into_shares,
+                    self._value,
+                    nr_shares,
+                    min_nr_shares,
+                    cpu_bound=True,
+                )
         except ValueError as exc:
             raise ShamirSplitError(self._key_id, str(exc)) from exc
         shares = []
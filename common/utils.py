@@ -7,6 +7,16 @@ import os
 import pathlib
 from .logging import LOGGER
 
+DEFAULT_PAGE_SIZE = 100
+"""
+The default number of items (blocks or shares) in one page of a paginated management status.
+"""
+
+MAX_PAGE_SIZE = 1000
+"""
+The maximum number of items in one page of a paginated management status.
+"""
+
 
 def bytes_to_str(data: bytes | None, truncate: bool = False) -> str | None:
     """
@@ -3,20 +3,21 @@ Main module for a DSKE security hub.
 """
 
 import argparse
-import fastapi
-import pydantic
+import socket
 import uvicorn
+from common import authenticator
 from common import configuration
+from common import crypto_executor
+from common import logging
+from common import profiler
+from common import psrd_generator
+from common import tracing
 from common import utils
-from common.block import APIBlock
-from common.exceptions import DSKEException
-from common.share_api import APIGetShareResponse, APIPostShareRequest
-from common.signing_key import MiddlewareSigningKey
-from common.registration_api import (
-    APIPutRegistrationRequest,
-    APIPutRegistrationResponse,
-)
+from . import psrd_reserve
+from .app import create_app
 from .hub import Hub
+from .router import HubRouter, create_router_app
+from .share_store import create_share_store, default_share_store_file_name
 
 
 def parse_command_line_arguments():
@@ -32,158 +33,127 @@ def parse_command_line_arguments():
         default=configuration.DEFAULT_BASE_PORT,
         help="Port number",
     )
-    args = parser.parse_args()
-    return args
-
-
-_ARGS = parse_command_line_arguments()
-_HUB = Hub(_ARGS.name)
-_APP = fastapi.FastAPI()
-
-
-@_APP.middleware("http")
-async def dske_authentication(request: fastapi.Request, call_next):
-    """
-    Check the DSKE authentication header in the request. Add the DSKE authentication header to the
-    response.
-    """
-    # Authentication is only done for DSKE in-band protocol messages. Checking the URL path is
-    # an ugly way of achieving this. Mounting sub-applications would have been cleaner, but then
-    # we would get a separate OpenAPI docs page for each sub-application.
-    authenticate = "/dske/api/" in request.url.path
-    # We don't verify the signature in the request here but later in the handler function, because
-    response = await call_next(request)
-    if authenticate:
-        # We do add the signature to the response here because we need access to the encoded
-        # response content. The key that is used for signing was allocated in the application logic
-        # and passed to the middleware in a temporary header.
-        response = await middleware_add_response_signature(response)
-    return response
-
-
-async def middleware_add_response_signature(
-    response: fastapi.Response,
-) -> fastapi.Response:
-    """
-    Add a signature to the response.
-    """
-    signing_key = MiddlewareSigningKey.extract_from_headers(response.headers)
-    if signing_key is None:
-        # Don't sign if the signing key is missing. This could happen, for example, in
-        # error responses. The other side can always reject the response if it doesn't like
-        # the missing signature.
-        return response
-    chunks = []
-    async for chunk in response.body_iterator:
-        chunks.append(chunk)
-    content = b"".join(chunks)
-    signature = signing_key.sign(content)
-    signature.add_to_headers(response.headers)
-    signed_response = fastapi.Response(
-        content=content,
-        status_code=response.status_code,
-        headers=response.headers,
-        media_type=response.media_type,
+    parser.add_argument(
+        "--share-store",
+        type=str,
+        choices=["memory", "sqlite"],
+        default="memory",
+        help="Storage backend for key shares (default: memory)",
     )
-    return signed_response
-
-
-@_APP.exception_handler(DSKEException)
-async def dske_exception_handler(_request: fastapi.Request, exc: DSKEException):
-    """
-    Handle DSKE exceptions.
-    """
-    # Error responses are not signed.
-    return fastapi.responses.JSONResponse(
-        status_code=exc.status_code,
-        content={"message": exc.message, "details": exc.details},
+    parser.add_argument(
+        "--share-store-file",
+        type=str,
+        help="File name for the sqlite share store "
+        "(default: $XDG_STATE_HOME/dske/hub-NAME-shares.db, created accessible to the owner only)",
     )
-
-
-@_APP.put(f"/hub/{_HUB.name}/dske/oob/v1/registration")
-async def put_oob_client_registration(
-    registration_request: APIPutRegistrationRequest,
-) -> APIPutRegistrationResponse:
-    """
-    DSKE Out of band: Register a client.
-    """
-    _peer_client = _HUB.register_client(
-        client_name=registration_request.client_name,
-        encryptor_names=registration_request.encryptor_names,
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes (more than one requires --share-store sqlite)",
     )
-    response = APIPutRegistrationResponse(hub_name=_HUB.name)
-    return response
-
-
-@_APP.get(f"/hub/{_HUB.name}/dske/oob/v1/psrd")
-async def get_oob_psrd(
-    client_name: str,
-    pool_owner: str,
-    size: pydantic.PositiveInt,
-) -> APIBlock:
-    """
-    DSKE Out of band: Get a block of Pre-Shared Random Data (PSRD).
-    """
-    block = _HUB.generate_block_for_client(client_name, pool_owner, size)
-    return block.to_api()
-
-
-@_APP.post(f"/hub/{_HUB.name}/dske/api/v1/key-share")
-async def post_key_share(
-    api_post_share_request: APIPostShareRequest,
-    raw_request: fastapi.Request,
-    headers_temp_response: fastapi.Response,
-):
-    """
-    DSKE API: Post key share.
-    """
-    await _HUB.store_share_received_from_client(
-        api_post_share_request, raw_request, headers_temp_response
+    authenticator.add_command_line_arguments(parser)
+    crypto_executor.add_command_line_arguments(parser)
+    logging.add_command_line_arguments(parser)
+    profiler.add_command_line_arguments(parser)
+    psrd_generator.add_command_line_arguments(parser)
+    tracing.add_command_line_arguments(parser)
+    parser.add_argument(
+        "--psrd-reserve-block-sizes",
+        nargs="*",
+        type=int,
+        default=psrd_reserve.DEFAULT_BLOCK_SIZES,
+        help=f"Sizes of the PSRD blocks to keep in reserve "
+        f"(default: {' '.join(str(size) for size in psrd_reserve.DEFAULT_BLOCK_SIZES)})",
     )
-
-
-@_APP.get(f"/hub/{_HUB.name}/dske/api/v1/key-share")
-async def get_key_share(
-    client_name: str,
-    key_id: str,
-    raw_request: fastapi.Request,
-    headers_temp_response: fastapi.Response,
-) -> APIGetShareResponse:
-    """
-    DSKE API: Get key share.
-    """
-    headers_temp_response = await _HUB.get_share_requested_by_client(
-        client_name, key_id, raw_request, headers_temp_response
+    parser.add_argument(
+        "--psrd-reserve-depth",
+        type=int,
+        default=psrd_reserve.DEFAULT_DEPTH,
+        help=f"Number of PSRD blocks to keep in reserve for each block size "
+        f"(default: {psrd_reserve.DEFAULT_DEPTH})",
     )
-    return headers_temp_response
-
-
-@_APP.get(f"/hub/{_HUB.name}/mgmt/v1/status")
-async def get_mgmt_status():
-    """
-    Management: Get status.
-    """
-    status = _HUB.to_mgmt()
-    return status
+    parser.add_argument(
+        "--worker-fd",
+        type=int,
+        help=argparse.SUPPRESS,  # Only used internally to start worker processes
+    )
+    args = parser.parse_args()
+    if args.profiling_sampling_interval <= 0:
+        parser.error("--profiling-sampling-interval must be positive")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.workers > 1 and args.share_store != "sqlite":
+        parser.error("--workers greater than 1 requires --share-store sqlite")
+    return args
 
 
-@_APP.post(f"/hub/{_HUB.name}/mgmt/v1/stop")
-async def post_mgmt_stop():
-    """
-    Management: Post stop.
-    """
-    _HUB.initiate_stop()
-    return {"result": "Hub stop initiated"}
+_ARGS = parse_command_line_arguments()
+crypto_executor.configure_from_command_line_arguments(_ARGS)
+profiler.configure_from_command_line_arguments(_ARGS)
+psrd_generator.configure_from_command_line_arguments(_ARGS)
+tracing.configure_from_command_line_arguments(_ARGS)
+_SHARE_STORE_FILE = _ARGS.share_store_file
+if _SHARE_STORE_FILE is None and _ARGS.share_store == "sqlite":
+    _SHARE_STORE_FILE = default_share_store_file_name(_ARGS.name)
+
+
+def create_hub() -> Hub:
+    """
+    Create the hub of a worker process, or of a single-process hub. (The router of a multi-worker
+    hub has no hub of its own: it only forwards requests to the workers.)
+    """
+    # Worker processes of a multi-worker hub share the share store, so writes must be visible to
+    # the other workers as soon as the request that stored the share has been answered.
+    return Hub(
+        _ARGS.name,
+        create_share_store(
+            _ARGS.share_store,
+            _SHARE_STORE_FILE,
+            write_through=_ARGS.worker_fd is not None,
+        ),
+        psrd_reserve.PSRDReserve(
+            _ARGS.psrd_reserve_block_sizes, _ARGS.psrd_reserve_depth
+        ),
+        _ARGS.authentication_modes,
+    )
 
 
 def main():
     """
     Main entry point for the hub package.
     """
-    utils.create_pid_file("hub", _HUB.name)
-    config = uvicorn.Config(app=_APP, port=_ARGS.port)
+    sockets = None
+    if _ARGS.worker_fd is not None:
+        # This is a worker process of a multi-worker hub; the router owns the PID file and has
+        # already bound the listening socket of the worker.
+        config = uvicorn.Config(app=create_app(create_hub()))
+        sockets = [socket.socket(fileno=_ARGS.worker_fd)]
+    elif _ARGS.workers > 1:
+        utils.create_pid_file("hub", _ARGS.name)
+        worker_args = [
+            "--share-store",
+            "sqlite",
+            "--share-store-file",
+            _SHARE_STORE_FILE,
+        ]
+        worker_args += authenticator.command_line_arguments(_ARGS)
+        worker_args += crypto_executor.command_line_arguments(_ARGS)
+        worker_args += logging.command_line_arguments(_ARGS)
+        worker_args += profiler.command_line_arguments(_ARGS)
+        worker_args += psrd_generator.command_line_arguments(_ARGS)
+        worker_args += tracing.command_line_arguments(_ARGS)
+        worker_args += ["--psrd-reserve-block-sizes"]
+        worker_args += [str(size) for size in _ARGS.psrd_reserve_block_sizes]
+        worker_args += ["--psrd-reserve-depth", str(_ARGS.psrd_reserve_depth)]
+        router = HubRouter(_ARGS.name, _ARGS.workers, worker_args)
+        config = uvicorn.Config(app=create_router_app(router), port=_ARGS.port)
+    else:
+        utils.create_pid_file("hub", _ARGS.name)
+        config = uvicorn.Config(app=create_app(create_hub()), port=_ARGS.port)
+    logging.configure_from_command_line_arguments(_ARGS)
     server = uvicorn.Server(config)
-    server.run()
+    server.run(sockets=sockets)
 
 
 if __name__ == "__main__":
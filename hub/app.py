@@ -0,0 +1,301 @@
+"""
+The FastAPI application of a DSKE security hub.
+"""
+
+import contextlib
+from typing import Annotated
+import fastapi
+import pydantic
+from common import codec
+from common import crypto_executor
+from common import metrics
+from common import profiler
+from common import psrd_generator
+from common import tracing
+from common import utils
+from common.block import APIBlock
+from common.block_reaper import BLOCK_REAPER
+from common.event_loop_monitor import EVENT_LOOP_MONITOR
+from common.exceptions import DSKEException
+from common.profiler import PROFILER, Profiler
+from common.share_api import APIGetShareResponse, APIPostShareRequest
+from common.signing_key import MiddlewareSigningKey
+from common.tracing import TRACER
+from common.registration_api import (
+    APIPutRegistrationRequest,
+    APIPutRegistrationResponse,
+)
+from .hub import Hub
+
+
+async def middleware_add_response_signature(
+    response: fastapi.Response,
+) -> fastapi.Response:
+    """
+    Add a signature to the response.
+    """
+    signing_key = MiddlewareSigningKey.extract_from_headers(response.headers)
+    if signing_key is None:
+        # Don't sign if the signing key is missing. This could happen, for example, in
+        # error responses. The other side can always reject the response if it doesn't like
+        # the missing signature.
+        return response
+    chunks = []
+    async for chunk in response.body_iterator:
+        chunks.append(chunk)
+    content = b"".join(chunks)
+    with TRACER.span("sign response"):
+        signature = await signing_key.sign_async(content)
+    signature.add_to_headers(response.headers)
+    signed_response = fastapi.Response(
+        content=content,
+        status_code=response.status_code,
+        headers=response.headers,
+        media_type=response.media_type,
+    )
+    return signed_response
+
+
+def create_app(hub: Hub) -> fastapi.FastAPI:
+    """
+    Create the FastAPI application for a hub. The lifespan of the application starts and stops the
+    hub and the background services of the process; it is run by uvicorn, but not by an in-process
+    ASGI transport (see in_process.topology).
+    """
+    # Each route handler is a local variable.
+    # pylint: disable=too-many-locals
+
+    @contextlib.asynccontextmanager
+    async def lifespan(_app: fastapi.FastAPI):
+        """
+        Do the things that need to be done just after startup and just before shutdown.
+        """
+        EVENT_LOOP_MONITOR.start()
+        BLOCK_REAPER.start()
+        hub.start()
+        yield
+        hub.stop()
+        BLOCK_REAPER.stop()
+        EVENT_LOOP_MONITOR.stop()
+        crypto_executor.CRYPTO_EXECUTOR.shutdown()
+        psrd_generator.PSRD_GENERATOR.shutdown()
+        hub.close()
+
+    app = fastapi.FastAPI(lifespan=lifespan)
+
+    @app.middleware("http")
+    async def dske_authentication(request: fastapi.Request, call_next):
+        """
+        Check the DSKE authentication header in the request. Add the DSKE authentication header to
+        the response.
+        """
+        # Authentication is only done for DSKE in-band protocol messages. Checking the URL path is
+        # an ugly way of achieving this. Mounting sub-applications would have been cleaner, but
+        # then we would get a separate OpenAPI docs page for each sub-application.
+        authenticate = "/dske/api/" in request.url.path
+        # We don't verify the signature in the request here but later in the handler function.
+        response = await call_next(request)
+        if authenticate:
+            # We do add the signature to the response here because we need access to the encoded
+            # response content. The key that is used for signing was allocated in the application
+            # logic and passed to the middleware in a temporary header.
+            response = await middleware_add_response_signature(response)
+        return response
+
+    @app.middleware("http")
+    async def trace_dske_requests(request: fastapi.Request, call_next):
+        """
+        Trace DSKE protocol messages, continuing the trace of the client that sent them. (This
+        middleware is added last, so that it also times the signing of the response.)
+        """
+        if "/dske/" not in request.url.path:
+            return await call_next(request)
+        return await tracing.trace_request(request, call_next, hub.name)
+
+    @app.exception_handler(DSKEException)
+    async def dske_exception_handler(_request: fastapi.Request, exc: DSKEException):
+        """
+        Handle DSKE exceptions.
+        """
+        # Error responses are not signed.
+        return fastapi.responses.JSONResponse(
+            status_code=exc.status_code,
+            content={"message": exc.message, "details": exc.details},
+            headers=exc.headers,
+        )
+
+    @app.put(
+        f"/hub/{hub.name}/dske/oob/v1/registration",
+        response_model=APIPutRegistrationResponse,
+        openapi_extra=codec.request_body_openapi(APIPutRegistrationRequest),
+    )
+    async def put_oob_client_registration(
+        raw_request: fastapi.Request,
+    ) -> fastapi.Response:
+        """
+        DSKE Out of band: Register a client.
+        """
+        registration_request = await codec.decode_request(
+            raw_request, APIPutRegistrationRequest
+        )
+        peer_client = hub.register_client(
+            client_name=registration_request.client_name,
+            encryptor_names=registration_request.encryptor_names,
+            authentication_modes=registration_request.authentication_modes,
+        )
+        response = APIPutRegistrationResponse(
+            hub_name=hub.name, authentication_mode=peer_client.authentication_mode
+        )
+        return codec.response(response)
+
+    @app.get(f"/hub/{hub.name}/dske/oob/v1/psrd", response_model=APIBlock)
+    async def get_oob_psrd(
+        client_name: str,
+        pool_owner: str,
+        size: pydantic.PositiveInt,
+    ) -> fastapi.Response:
+        """
+        DSKE Out of band: Get a block of Pre-Shared Random Data (PSRD).
+        """
+        block = await hub.generate_block_for_client(client_name, pool_owner, size)
+        return codec.response(block.to_api())
+
+    @app.post(
+        f"/hub/{hub.name}/dske/api/v1/key-share",
+        openapi_extra=codec.request_body_openapi(APIPostShareRequest),
+    )
+    async def post_key_share(
+        raw_request: fastapi.Request,
+        headers_temp_response: fastapi.Response,
+    ):
+        """
+        DSKE API: Post key share.
+        """
+        api_post_share_request = await codec.decode_request(
+            raw_request, APIPostShareRequest
+        )
+        with TRACER.span(
+            "store share", client=api_post_share_request.master_client_name
+        ):
+            await hub.store_share_received_from_client(
+                api_post_share_request, raw_request, headers_temp_response
+            )
+
+    @app.get(
+        f"/hub/{hub.name}/dske/api/v1/key-share", response_model=APIGetShareResponse
+    )
+    async def get_key_share(
+        client_name: str,
+        key_id: str,
+        raw_request: fastapi.Request,
+        headers_temp_response: fastapi.Response,
+    ) -> fastapi.Response:
+        """
+        DSKE API: Get key share.
+        """
+        with TRACER.span("get share", client=client_name):
+            response = await hub.get_share_requested_by_client(
+                client_name, key_id, raw_request, headers_temp_response
+            )
+        # FastAPI does not copy the headers of the temporary response into a returned response.
+        return codec.response(response, headers_temp_response.headers)
+
+    @app.get(f"/hub/{hub.name}/mgmt/v1/status")
+    async def get_mgmt_status():
+        """
+        Management: Get status.
+        """
+        status = hub.to_mgmt()
+        return status
+
+    @app.get(f"/hub/{hub.name}/mgmt/v1/summary")
+    async def get_mgmt_summary():
+        """
+        Management: Get summary of status.
+        """
+        return hub.to_mgmt_summary()
+
+    @app.get(f"/hub/{hub.name}/mgmt/v1/ready")
+    async def get_mgmt_ready():
+        """
+        Management: Get readiness. A hub does not need to warm up: it is ready as soon as it serves
+        requests.
+        """
+        return {"name": hub.name, "ready": True}
+
+    @app.get(f"/hub/{hub.name}/mgmt/v1/blocks")
+    async def get_mgmt_blocks(
+        client_name: str,
+        pool_owner: str,
+        cursor: int | None = None,
+        limit: Annotated[
+            int, fastapi.Query(ge=1, le=utils.MAX_PAGE_SIZE)
+        ] = utils.DEFAULT_PAGE_SIZE,
+    ):
+        """
+        Management: Get one page of the blocks in a pool for a peer client.
+        """
+        return hub.to_mgmt_blocks_page(client_name, pool_owner, cursor, limit)
+
+    @app.get(f"/hub/{hub.name}/mgmt/v1/shares")
+    async def get_mgmt_shares(
+        cursor: int | None = None,
+        limit: Annotated[
+            int, fastapi.Query(ge=1, le=utils.MAX_PAGE_SIZE)
+        ] = utils.DEFAULT_PAGE_SIZE,
+    ):
+        """
+        Management: Get one page of the stored shares.
+        """
+        return hub.to_mgmt_shares_page(cursor, limit)
+
+    @app.get(f"/hub/{hub.name}/mgmt/v1/metrics")
+    async def get_mgmt_metrics():
+        """
+        Management: Get metrics (in the Prometheus text format).
+        """
+        return fastapi.responses.PlainTextResponse(
+            metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE
+        )
+
+    @app.get(f"/hub/{hub.name}/mgmt/v1/traces")
+    async def get_mgmt_traces(
+        trace_id: str | None = None,
+        limit: Annotated[
+            int, fastapi.Query(ge=1, le=utils.MAX_PAGE_SIZE)
+        ] = utils.DEFAULT_PAGE_SIZE,
+    ):
+        """
+        Management: Get the most recent trace spans (optionally only those of one trace).
+        """
+        return TRACER.to_mgmt(trace_id, limit)
+
+    @app.post(f"/hub/{hub.name}/mgmt/v1/profile")
+    async def post_mgmt_profile(
+        mode: Profiler.Mode = Profiler.Mode.SAMPLING,
+        duration: Annotated[
+            float, fastapi.Query(gt=0, le=profiler.MAX_DURATION)
+        ] = profiler.DEFAULT_DURATION,
+        sort: Profiler.Sort = Profiler.Sort.CUMULATIVE,
+        limit: Annotated[
+            int, fastapi.Query(ge=1, le=utils.MAX_PAGE_SIZE)
+        ] = profiler.DEFAULT_NR_FUNCTIONS,
+    ):
+        """
+        Management: Profile the hub for `duration` seconds, and get the collapsed stacks (in
+        sampling mode) or the pstats report of the `limit` functions with the most time by `sort`
+        (in cprofile mode). Only if the hub was started with --enable-profiling.
+        """
+        return fastapi.responses.PlainTextResponse(
+            await PROFILER.profile(mode, duration, sort, limit)
+        )
+
+    @app.post(f"/hub/{hub.name}/mgmt/v1/stop")
+    async def post_mgmt_stop():
+        """
+        Management: Post stop.
+        """
+        hub.initiate_stop()
+        return {"result": "Hub stop initiated"}
+
+    return app
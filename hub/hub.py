@@ -6,20 +6,40 @@ import asyncio
 from typing import List
 import os
 import signal
-from uuid import UUID
+from uuid import UUID, uuid4
 import fastapi
+from common import authenticator
 from common import exceptions
 from common import utils
-from common.allocation import Allocation
+from common.allocation import Allocation, AllocationTransaction
 from common.block import Block
+from common.crypto_executor import CRYPTO_EXECUTOR
 from common.encryption_key import EncryptionKey
+from common.block_reaper import BLOCK_REAPER
+from common.event_loop_monitor import EVENT_LOOP_MONITOR
 from common.exceptions import EncryptorNotRegisteredForClientError
-from common.logging import LOGGER
+from common.logging import REQUEST_LOGGER
+from common.psrd_generator import PSRD_GENERATOR
+from common.metrics import REGISTRY
 from common.pool import Pool
 from common.share import Share
 from common.share_api import APIGetShareResponse, APIPostShareRequest
 from common.utils import str_to_bytes, bytes_to_str
 from .peer_client import PeerClient
+from .psrd_reserve import PSRDReserve
+from .share_store import ShareStore
+
+
+_SHARES_STORED = REGISTRY.counter(
+    "dske_hub_shares_stored_total",
+    "Key shares posted by a peer client and stored by the hub",
+    ("client",),
+)
+_SHARES_SERVED = REGISTRY.counter(
+    "dske_hub_shares_served_total",
+    "Key shares retrieved by a peer client",
+    ("client",),
+)
 
 
 class Hub:
@@ -29,13 +49,25 @@ class Hub:
 
     _name: str
     _peer_clients: dict[str, PeerClient]  # Indexed by client name
-    _shares: dict[UUID, Share]  # Indexed by key UUID
+    _share_store: ShareStore
+    _psrd_reserve: PSRDReserve
+    _authentication_modes: list[str]  # Supported, in order of preference
     _stop_task: asyncio.Task | None
 
-    def __init__(self, name: str):
+    def __init__(
+        self,
+        name: str,
+        share_store: ShareStore,
+        psrd_reserve: PSRDReserve,
+        authentication_modes: list[str] | None = None,
+    ):
         self._name = name
         self._peer_clients = {}
-        self._shares = {}
+        self._share_store = share_store
+        self._psrd_reserve = psrd_reserve
+        if authentication_modes is None:
+            authentication_modes = authenticator.AUTHENTICATION_MODES
+        self._authentication_modes = authentication_modes
         self._stop_task = None
 
     @property
@@ -54,30 +86,97 @@ class Hub:
             "peer_clients": [
                 peer_client.to_mgmt() for peer_client in self._peer_clients.values()
             ],
-            "shares": [share.to_mgmt() for share in self._shares.values()],
+            "share_store": self._share_store.to_mgmt(),
+            "shares": [share.to_mgmt() for share in self._share_store.shares()],
+            "crypto_executor": CRYPTO_EXECUTOR.to_mgmt(),
+            "psrd_generator": PSRD_GENERATOR.to_mgmt(),
+            "psrd_reserve": self._psrd_reserve.to_mgmt(),
+            "event_loop": EVENT_LOOP_MONITOR.to_mgmt(),
+            "block_reaper": BLOCK_REAPER.to_mgmt(),
+        }
+
+    def to_mgmt_summary(self):
+        """
+        Get a summary of the management status: aggregate counts per pool and the number of
+        stored shares instead of the details of every block and share. This is cheap enough to be
+        polled frequently, even when the hub holds many shares.
+        """
+        return {
+            "name": self._name,
+            "peer_clients": [
+                peer_client.to_mgmt_summary()
+                for peer_client in self._peer_clients.values()
+            ],
+            "share_store": self._share_store.to_mgmt(),
+            "nr_shares": self._share_store.nr_shares(),
+            "crypto_executor": CRYPTO_EXECUTOR.to_mgmt(),
+            "psrd_generator": PSRD_GENERATOR.to_mgmt(),
+            "psrd_reserve": self._psrd_reserve.to_mgmt(),
+            "event_loop": EVENT_LOOP_MONITOR.to_mgmt(),
+            "block_reaper": BLOCK_REAPER.to_mgmt(),
+        }
+
+    def to_mgmt_blocks_page(
+        self, client_name: str, pool_owner_str: str, cursor: int | None, limit: int
+    ) -> dict:
+        """
+        Get the management status for one page of the blocks in the pool for a peer client.
+        """
+        if client_name not in self._peer_clients:
+            REQUEST_LOGGER.warning("Peer client '%s' not found", client_name)
+            raise exceptions.ClientNotRegisteredError(client_name)
+        pool_owner = Pool.Owner.from_str(pool_owner_str)
+        pool = self._peer_clients[client_name].pool(pool_owner)
+        return pool.to_mgmt_blocks_page(cursor, limit)
+
+    def to_mgmt_shares_page(self, cursor: int | None, limit: int) -> dict:
+        """
+        Get the management status for one page of the stored shares.
+        """
+        (shares, next_cursor) = self._share_store.shares_page(cursor, limit)
+        return {
+            "shares": [share.to_mgmt() for share in shares],
+            "next_cursor": next_cursor,
         }
 
     def register_client(
-        self, client_name: str, encryptor_names: List[str]
+        self,
+        client_name: str,
+        encryptor_names: List[str],
+        authentication_modes: List[str],
     ) -> PeerClient:
         """
-        Register a peer client.
+        Register a peer client, using the first of the message authentication modes offered by the
+        client that the hub supports.
         """
+        authentication_mode = authenticator.negotiate_mode(
+            authentication_modes, self._authentication_modes
+        )
+        if authentication_mode is None:
+            REQUEST_LOGGER.warning(
+                "No common authentication mode with client %s: offered %s, supported %s",
+                client_name,
+                authentication_modes,
+                self._authentication_modes,
+            )
+            raise exceptions.NoCommonAuthenticationModeError(
+                client_name, authentication_modes, self._authentication_modes
+            )
         # We don't check whether the client is already registered (this could happen when the
         # client restarts without unregistering first). The registration of the newly started
         # client will overwrite the existing client.
-        peer_client = PeerClient(client_name, encryptor_names)
+        peer_client = PeerClient(client_name, encryptor_names, authentication_mode)
         self._peer_clients[client_name] = peer_client
         return peer_client
 
-    def generate_block_for_client(
+    async def generate_block_for_client(
         self, client_name: str, pool_owner_str: str, size: int
     ) -> Block:
         """
         Generate a block of PSRD for a peer client.
         """
         if client_name not in self._peer_clients:
-            LOGGER.warning(f"Peer client '{client_name}' not found")
+            REQUEST_LOGGER.warning("Peer client '%s' not found", client_name)
             raise exceptions.ClientNotRegisteredError(client_name)
         peer_client = self._peer_clients[client_name]
         match pool_owner_str.lower():
@@ -86,11 +185,14 @@ class Hub:
             case "hub":
                 pool_owner = Pool.Owner.LOCAL
             case _:
-                LOGGER.warning(
-                    f"Invalid pool owner {pool_owner_str} for peer client {client_name}"
+                REQUEST_LOGGER.warning(
+                    "Invalid pool owner %s for peer client %s",
+                    pool_owner_str,
+                    client_name,
                 )
                 raise exceptions.InvalidPoolOwnerError(pool_owner_str)
-        block = peer_client.create_random_block(pool_owner, size)
+        block = Block(uuid4(), await self._psrd_reserve.take(size))
+        peer_client.pool(pool_owner).add_block(block)
         return block
 
     async def store_share_received_from_client(
@@ -105,7 +207,7 @@ class Hub:
         # Lookup the peer client
         client_name = api_post_share_request.master_client_name
         if client_name not in self._peer_clients:
-            LOGGER.warning(f"Peer client {client_name} not found")
+            REQUEST_LOGGER.warning("Peer client %s not found", client_name)
             raise exceptions.ClientNotRegisteredError(client_name)
         peer_client = self._peer_clients[client_name]
         # Verify the request signature
@@ -113,19 +215,20 @@ class Hub:
         # Check that the master encryptor (SAE) is one that was registered for the client
         master_sae_id = api_post_share_request.master_sae_id
         if master_sae_id not in peer_client.encryptor_names:
-            LOGGER.warning(
-                f"Encryptor {master_sae_id} not registered for client {client_name}"
+            REQUEST_LOGGER.warning(
+                "Encryptor %s not registered for client %s", master_sae_id, client_name
             )
             raise EncryptorNotRegisteredForClientError(client_name, master_sae_id)
         # Decrypt the share value
-        encryption_key_allocation = Allocation.from_api(
+        encryption_key_allocation = Allocation.from_enc_str(
             api_post_share_request.encryption_key_allocation, peer_client.peer_pool
         )
         encryption_key = EncryptionKey.from_allocation(encryption_key_allocation)
-        encrypted_share_value = str_to_bytes(
-            api_post_share_request.encrypted_share_value
+        encoded_share_value = api_post_share_request.encrypted_share_value
+        encrypted_share_value = await CRYPTO_EXECUTOR.run(
+            len(encoded_share_value), str_to_bytes, encoded_share_value
         )
-        share_value = encryption_key.decrypt(encrypted_share_value)
+        share_value = await encryption_key.decrypt_async(encrypted_share_value)
         # TODO: Check that master and slave client names match registered client
         share = Share(
             master_sae_id=api_post_share_request.master_sae_id,
@@ -135,10 +238,10 @@ class Hub:
             value=share_value,
         )
         # TODO: Check if the key UUID is already present, and if so, do something sensible
-        self._shares[share.user_key_id] = share
+        self._share_store.store(share)
+        await self._share_store.wait_until_stored(share)
+        _SHARES_STORED.labels(client_name).inc()
         peer_client.add_dske_signing_key_header_to_response(headers_temp_response)
-        # Clean up fully used blocks
-        peer_client.delete_fully_used_blocks()
 
     async def get_share_requested_by_client(
         self,
@@ -152,7 +255,7 @@ class Hub:
         """
         # Lookup the peer client
         if client_name not in self._peer_clients:
-            LOGGER.warning(f"Peer client {client_name} not found")
+            REQUEST_LOGGER.warning("Peer client %s not found", client_name)
             raise exceptions.ClientNotRegisteredError(client_name)
         peer_client = self._peer_clients[client_name]
         # Verify the request signature
@@ -161,27 +264,50 @@ class Hub:
         try:
             key_id = UUID(key_id_str)
         except ValueError as exc:
-            LOGGER.warning(f"Invalid key ID {key_id_str}")
+            REQUEST_LOGGER.warning("Invalid key ID %s", key_id_str)
             raise exceptions.InvalidKeyIDError(key_id_str) from exc
-        try:
-            share = self._shares[key_id]
-        except KeyError as exc:
-            LOGGER.warning(f"No share for key ID {key_id_str}")
-            raise exceptions.UnknownKeyIDError(key_id) from exc
-        # Encrypt the share value
-        encryption_key = EncryptionKey.from_pool(peer_client.local_pool, share.size)
-        encrypted_share_value = encryption_key.encrypt(share.value)
-        # Prepare the response
-        response = APIGetShareResponse(
-            share_index=share.share_index,
-            encryption_key_allocation=encryption_key.allocation.to_api(),
-            encrypted_share_value=bytes_to_str(encrypted_share_value),
-        )
-        peer_client.add_dske_signing_key_header_to_response(headers_temp_response)
-        # Clean up fully used blocks
-        peer_client.delete_fully_used_blocks()
+        share = self._share_store.get(key_id)
+        if share is None:
+            REQUEST_LOGGER.warning("No share for key ID %s", key_id_str)
+            raise exceptions.UnknownKeyIDError(key_id)
+        # If preparing the response fails, the encryption key has not been sent to the peer client
+        # yet and it is given back to the pool.
+        with AllocationTransaction() as transaction:
+            # Encrypt the share value
+            encryption_key = EncryptionKey.from_pool(peer_client.local_pool, share.size)
+            transaction.add(encryption_key.allocation)
+            encrypted_share_value = await encryption_key.encrypt_async(share.value)
+            encoded_share_value = await CRYPTO_EXECUTOR.run(
+                share.size, bytes_to_str, encrypted_share_value
+            )
+            # Prepare the response
+            response = APIGetShareResponse(
+                share_index=share.share_index,
+                encryption_key_allocation=encryption_key.allocation.to_enc_str(),
+                encrypted_share_value=encoded_share_value,
+            )
+            peer_client.add_dske_signing_key_header_to_response(headers_temp_response)
+        _SHARES_SERVED.labels(client_name).inc()
         return response
 
+    def start(self):
+        """
+        Start the background tasks of the hub.
+        """
+        self._psrd_reserve.start()
+
+    def stop(self):
+        """
+        Stop the background tasks of the hub.
+        """
+        self._psrd_reserve.stop()
+
+    def close(self):
+        """
+        Close the hub: make sure that all shares have been persisted.
+        """
+        self._share_store.close()
+
     def initiate_stop(self):
         """
         Initiate stopping the hub.
@@ -4,13 +4,13 @@ A peer DSKE client.
 
 from typing import assert_never, List
 import fastapi
-from common.allocation import Allocation
-from common.block import Block
+from common.authenticator import HMAC_SHA256, Authenticator
 from common.exceptions import InvalidSignatureError
-from common.logging import LOGGER
+from common.logging import REQUEST_LOGGER
+from common.metrics import CounterChild
 from common.pool import Pool
-from common.signature import Signature
-from common.signing_key import SigningKey
+from common.signature import SIGNATURE_FAILURES, Signature
+from common.tracing import TRACER
 
 
 class PeerClient:
@@ -22,12 +22,23 @@ class PeerClient:
     _encryptor_names: List[str]
     _local_pool: Pool
     _peer_pool: Pool
+    _authenticator: Authenticator
+    _signature_failures_metric: CounterChild
 
-    def __init__(self, client_name: str, encryptor_names: List[str]):
+    def __init__(
+        self,
+        client_name: str,
+        encryptor_names: List[str],
+        authentication_mode: str = HMAC_SHA256,
+    ):
         self._client_name = client_name
         self._encryptor_names = encryptor_names
         self._local_pool = Pool(client_name, Pool.Owner.LOCAL)
         self._peer_pool = Pool(client_name, Pool.Owner.PEER)
+        self._authenticator = Authenticator(
+            authentication_mode, self._local_pool, self._peer_pool
+        )
+        self._signature_failures_metric = SIGNATURE_FAILURES.labels(client_name)
 
     @property
     def client_name(self) -> str:
@@ -43,6 +54,13 @@ class PeerClient:
         """
         return self._encryptor_names
 
+    @property
+    def authentication_mode(self) -> str:
+        """
+        Get the message authentication mode that was negotiated with the client.
+        """
+        return self._authenticator.mode
+
     @property
     def local_pool(self) -> Pool:
         """
@@ -64,24 +82,33 @@ class PeerClient:
         return {
             "client_name": self._client_name,
             "encryptor_names": self._encryptor_names,
+            "authentication": self._authenticator.to_mgmt(),
             "local_pool": self._local_pool.to_mgmt(),
             "peer_pool": self._peer_pool.to_mgmt(),
         }
 
-    def create_random_block(self, pool_owner: Pool.Owner, size: int) -> Block:
+    def to_mgmt_summary(self):
+        """
+        Get a summary of the management status.
+        """
+        return {
+            "client_name": self._client_name,
+            "encryptor_names": self._encryptor_names,
+            "local_pool": self._local_pool.to_mgmt_summary(),
+            "peer_pool": self._peer_pool.to_mgmt_summary(),
+        }
+
+    def pool(self, pool_owner: Pool.Owner) -> Pool:
         """
-        Create a block filled ith random data and add it to the specified pool.
+        Get the pool with the given owner.
         """
-        block = Block.new_with_random_data(size)
         match pool_owner:
             case Pool.Owner.LOCAL:
-                pool = self._local_pool
+                return self._local_pool
             case Pool.Owner.PEER:
-                pool = self._peer_pool
+                return self._peer_pool
             case _:
                 assert_never("Invalid pool owner")
-        pool.add_block(block)
-        return block
 
     def add_dske_signing_key_header_to_response(self, response: fastapi.Response):
         """
@@ -89,32 +116,39 @@ class PeerClient:
         and the key value for the authentication key. The signing cannot be done here because we
         need to know the encoded content of the response.
         """
-        signing_key = SigningKey.from_pool(self._local_pool)
+        signing_key = self._authenticator.signing_key()
         signing_key.add_to_headers(response.headers)
 
     async def check_request_signature(self, raw_request: fastapi.Request):
         """
         Check the signature on a FastAPI request. Raise an exception if the signature is invalid.
         """
-        received_signature = Signature.from_headers(raw_request.headers)
-        allocation = Allocation.from_enc_str(
-            received_signature.signing_key_allocation_enc_str, self._peer_pool
-        )
-        signing_key = SigningKey(allocation)
-        query = raw_request.scope.get("query_string", b"")
-        body = await raw_request.body()
-        computed_signature = signing_key.sign([query, body])
-        signature_ok = received_signature.same_as(computed_signature)
-        if not signature_ok:
-            # TODO: Give allocation back to pool
-            LOGGER.warning(
-                f"Invalid signature received from peer client '{self._client_name}'"
-            )
-            raise InvalidSignatureError()
-
-    def delete_fully_used_blocks(self) -> None:
-        """
-        Delete fully used PSRD blocks from the pools.
-        """
-        for pool in (self._local_pool, self._peer_pool):
-            pool.delete_fully_used_blocks()
+        with TRACER.span("check request signature", client=self._client_name):
+            received_signature = Signature.from_headers(raw_request.headers)
+            if received_signature is None:
+                self._signature_failures_metric.inc()
+                REQUEST_LOGGER.warning(
+                    "Missing signature in request from peer client '%s'",
+                    self._client_name,
+                )
+                raise InvalidSignatureError()
+            # The signing key is consumed even if the signature turns out to be invalid: once a key
+            # has been used to verify a received tag, giving it back to the pool would let an
+            # attacker learn about it from repeated guesses. Only the body is read before taking
+            # the key.
+            query = raw_request.scope.get("query_string", b"")
+            body = await raw_request.body()
+            try:
+                signing_key = self._authenticator.verification_key(received_signature)
+            except InvalidSignatureError:
+                self._signature_failures_metric.inc()
+                raise
+            computed_signature = await signing_key.sign_async([query, body])
+            signature_ok = received_signature.same_as(computed_signature)
+            if not signature_ok:
+                self._signature_failures_metric.inc()
+                REQUEST_LOGGER.warning(
+                    "Invalid signature received from peer client '%s'",
+                    self._client_name,
+                )
+                raise InvalidSignatureError()
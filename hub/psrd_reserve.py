@@ -0,0 +1,142 @@
+"""
+A reserve of pre-generated PSRD for the blocks that a hub hands out to its peer clients.
+"""
+
+import asyncio
+from common.logging import LOGGER
+from common.metrics import REGISTRY
+from common.psrd_generator import PSRD_GENERATOR
+
+DEFAULT_BLOCK_SIZES = [2000]
+"""
+The default block sizes to keep in reserve (the size that clients request by default).
+"""
+
+DEFAULT_DEPTH = 8
+"""
+The default number of blocks to keep in reserve for each block size.
+"""
+
+DEFAULT_IDLE_DELAY = 0.05
+"""
+The reserve is only refilled after no block was taken from it for this many seconds, so that
+refilling does not compete with a burst of requests.
+"""
+
+_RESERVE_REQUESTS = REGISTRY.counter(
+    "dske_hub_psrd_reserve_requests_total",
+    "Requests for PSRD blocks, by whether the block was taken from the reserve (hit) or not (miss)",
+    ("block_size", "result"),
+)
+_RESERVE_DEPTH = REGISTRY.gauge(
+    "dske_hub_psrd_reserve_depth",
+    "Number of pre-generated PSRD blocks in the reserve",
+    ("block_size",),
+)
+
+
+class PSRDReserve:
+    """
+    A bounded reserve of pre-generated block data for each configured block size. A request for a
+    block of a configured size is served from the reserve if it is not empty; other requests are
+    generated on demand. A background task tops up the reserve when the hub is idle.
+    """
+
+    _depth: int
+    _idle_delay: float
+    _reserve: dict[int, list[bytearray]]  # Indexed by block size
+    _nr_hits: int
+    _nr_misses: int
+    _taken_event: asyncio.Event | None
+    _task: asyncio.Task | None
+
+    def __init__(
+        self,
+        block_sizes: list[int],
+        depth: int = DEFAULT_DEPTH,
+        idle_delay: float = DEFAULT_IDLE_DELAY,
+    ):
+        assert all(block_size > 0 for block_size in block_sizes)
+        assert depth >= 0
+        self._depth = depth
+        self._idle_delay = idle_delay
+        self._reserve = {block_size: [] for block_size in block_sizes}
+        self._nr_hits = 0
+        self._nr_misses = 0
+        self._taken_event = None
+        self._task = None
+        for block_size, reserve in self._reserve.items():
+            _RESERVE_DEPTH.labels(block_size).set_function(
+                lambda reserve=reserve: len(reserve)
+            )
+
+    async def take(self, size: int) -> bytearray:
+        """
+        Get `size` bytes of random data for a new block, from the reserve if possible.
+        """
+        reserve = self._reserve.get(size)
+        if reserve:
+            self._nr_hits += 1
+            _RESERVE_REQUESTS.labels(size, "hit").inc()
+            data = reserve.pop()
+        else:
+            self._nr_misses += 1
+            _RESERVE_REQUESTS.labels(size, "miss").inc()
+            data = await PSRD_GENERATOR.generate_async(size)
+        if self._taken_event is not None:
+            self._taken_event.set()
+        return data
+
+    async def fill(self) -> None:
+        """
+        Fill the reserve for all block sizes up to the configured depth.
+        """
+        for block_size, reserve in self._reserve.items():
+            while len(reserve) < self._depth:
+                data = await PSRD_GENERATOR.generate_async(block_size)
+                reserve.append(bytearray(data))
+
+    def start(self) -> None:
+        """
+        Start topping up the reserve in a background task.
+        """
+        assert self._task is None
+        self._taken_event = asyncio.Event()
+        self._task = asyncio.create_task(self._refill_task())
+
+    def stop(self) -> None:
+        """
+        Stop topping up the reserve.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._taken_event = None
+
+    async def _refill_task(self) -> None:
+        while True:
+            try:
+                await self.fill()
+            except Exception as exc:  # pylint: disable=broad-except
+                LOGGER.error(f"Failed to fill PSRD reserve: {exc}")
+            await self._taken_event.wait()
+            # Wait until no blocks have been taken for a while before refilling.
+            while self._taken_event.is_set():
+                self._taken_event.clear()
+                await asyncio.sleep(self._idle_delay)
+
+    def to_mgmt(self) -> dict:
+        """
+        Get the management status.
+        """
+        nr_requests = self._nr_hits + self._nr_misses
+        return {
+            "depth": self._depth,
+            "nr_blocks": {
+                str(block_size): len(reserve)
+                for block_size, reserve in self._reserve.items()
+            },
+            "nr_hits": self._nr_hits,
+            "nr_misses": self._nr_misses,
+            "hit_rate": self._nr_hits / nr_requests if nr_requests > 0 else None,
+        }
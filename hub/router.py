@@ -0,0 +1,463 @@
+"""
+Multi-worker mode for a DSKE hub: a router process that spreads the work for the hub over several
+worker processes.
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import zlib
+from typing import Annotated
+import fastapi
+import httpx
+from common import metrics
+from common import utils
+from common.logging import LOGGER
+
+_WORKER_START_TIMEOUT = 30.0
+"""
+How many seconds to wait for a worker process to start accepting requests.
+"""
+
+_WORKER_STOP_TIMEOUT = 5.0
+"""
+How many seconds to wait for a worker process to stop before killing it.
+"""
+
+_HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "host"}
+"""
+Headers that must not be forwarded by the router.
+"""
+
+
+class HubRouter:
+    """
+    The router for a hub that runs in multi-worker mode.
+
+    Each worker process is a complete hub with its own TCP port. The PSRD pools for a client live
+    in exactly one worker (the owner of the client), which is chosen by hashing the client name.
+    A client registers with the router, which forwards the registration to the owning worker and
+    adds the URL of that worker to the registration response. From then on the client sends its
+    PSRD and key share requests directly to the worker, so the router is not a bottleneck: it only
+    handles registrations, management requests, and requests of clients that ignore the worker
+    URL (which it forwards to the owning worker without decoding or re-encoding them, so that the
+    DSKE signatures are preserved).
+
+    The key shares are kept in an SQLite share store that is shared by all workers, because a share
+    is posted by the master client and retrieved by the slave client, which may be owned by
+    different workers.
+    """
+
+    _name: str
+    _host: str
+    _nr_workers: int
+    _worker_args: list[str]
+    _worker_ports: list[int]
+    _worker_processes: list[subprocess.Popen]
+    _worker_clients: list[httpx.AsyncClient]
+    _stop_task: asyncio.Task | None
+
+    def __init__(
+        self,
+        name: str,
+        nr_workers: int,
+        worker_args: list[str],
+        host: str = "127.0.0.1",
+    ):
+        assert nr_workers > 1
+        self._name = name
+        self._host = host
+        self._nr_workers = nr_workers
+        self._worker_args = worker_args
+        self._worker_ports = []
+        self._worker_processes = []
+        self._worker_clients = []
+        self._stop_task = None
+
+    @property
+    def name(self) -> str:
+        """
+        Get the hub name.
+        """
+        return self._name
+
+    def worker_index_for_client(self, client_name: str | None) -> int:
+        """
+        Determine which worker owns a client. Requests that are not related to a specific client
+        are handled by worker 0.
+        """
+        if client_name is None:
+            return 0
+        return zlib.crc32(client_name.encode("utf-8")) % self._nr_workers
+
+    async def start_workers(self) -> None:
+        """
+        Start the worker processes and wait until they accept requests.
+        """
+        for _worker_index in range(self._nr_workers):
+            # The router binds the listening socket of the worker (on a port chosen by the
+            # operating system) and passes it to the worker process, so that the router knows the
+            # port without having to ask the worker.
+            listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listen_socket.bind((self._host, 0))
+            listen_socket.listen(socket.SOMAXCONN)
+            port = listen_socket.getsockname()[1]
+            command = [sys.executable, "-m", "hub", self._name]
+            command += ["--worker-fd", str(listen_socket.fileno())] + self._worker_args
+            # pylint: disable=consider-using-with
+            process = subprocess.Popen(command, pass_fds=[listen_socket.fileno()])
+            listen_socket.close()
+            self._worker_ports.append(port)
+            self._worker_processes.append(process)
+            client = httpx.AsyncClient(
+                base_url=f"http://{self._host}:{port}", timeout=None
+            )
+            self._worker_clients.append(client)
+        await asyncio.gather(
+            *[
+                self._wait_for_worker_started(worker_index)
+                for worker_index in range(self._nr_workers)
+            ]
+        )
+        LOGGER.info(
+            f"Started {self._nr_workers} workers for hub {self._name} on ports "
+            f"{', '.join(str(port) for port in self._worker_ports)}"
+        )
+
+    def worker_url(self, worker_index: int, host: str | None) -> str:
+        """
+        The URL that clients use to send requests directly to a worker. The `host` is the host name
+        that the client used to reach the router.
+        """
+        if host is None:
+            host = self._host
+        return f"http://{host}:{self._worker_ports[worker_index]}/hub/{self._name}"
+
+    async def _wait_for_worker_started(self, worker_index: int) -> None:
+        url = f"/hub/{self._name}/mgmt/v1/status"
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + _WORKER_START_TIMEOUT
+        delay = 0.01
+        while True:
+            try:
+                await self._worker_clients[worker_index].get(url)
+                return
+            except httpx.HTTPError:
+                if loop.time() > deadline:
+                    raise
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, 0.2)
+
+    async def stop_workers(self) -> None:
+        """
+        Stop the worker processes.
+        """
+        for process in self._worker_processes:
+            process.terminate()
+        for process in self._worker_processes:
+            try:
+                await asyncio.to_thread(process.wait, _WORKER_STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        for client in self._worker_clients:
+            await client.aclose()
+        self._worker_ports = []
+        self._worker_processes = []
+        self._worker_clients = []
+
+    @staticmethod
+    def client_name_for_request(request: fastapi.Request, body: bytes) -> str | None:
+        """
+        Determine the name of the client that a request is about. It is either passed in a query
+        parameter or in an attribute of the JSON request body.
+        """
+        client_name = request.query_params.get("client_name")
+        if client_name is not None:
+            return client_name
+        if not body:
+            return None
+        try:
+            body_json = json.loads(body)
+        except ValueError:
+            return None
+        if not isinstance(body_json, dict):
+            return None
+        for attribute in ("client_name", "master_client_name"):
+            if isinstance(body_json.get(attribute), str):
+                return body_json[attribute]
+        return None
+
+    async def forward(self, request: fastapi.Request) -> fastapi.Response:
+        """
+        Forward a request to the worker that owns the client, and return the response of the
+        worker.
+        """
+        body = await request.body()
+        client_name = self.client_name_for_request(request, body)
+        worker_index = self.worker_index_for_client(client_name)
+        return await self._forward_to_worker(worker_index, request, body)
+
+    async def register(self, request: fastapi.Request) -> fastapi.Response:
+        """
+        Forward a registration request to the worker that owns the client, and add the URL of that
+        worker to the registration response.
+        """
+        body = await request.body()
+        client_name = self.client_name_for_request(request, body)
+        worker_index = self.worker_index_for_client(client_name)
+        response = await self._forward_to_worker(worker_index, request, body)
+        if response.status_code != 200:
+            return response
+        registration = json.loads(response.body)
+        registration["worker_url"] = self.worker_url(worker_index, request.url.hostname)
+        return fastapi.responses.JSONResponse(registration)
+
+    async def _forward_to_worker(
+        self, worker_index: int, request: fastapi.Request, body: bytes
+    ) -> fastapi.Response:
+        headers = [
+            (name, value)
+            for name, value in request.headers.items()
+            if name.lower() not in _HOP_BY_HOP_HEADERS | {"content-length"}
+        ]
+        url = request.url.path
+        if request.url.query:
+            url += f"?{request.url.query}"
+        response = await self._worker_clients[worker_index].request(
+            request.method,
+            url,
+            headers=headers,
+            content=body,
+        )
+        response_headers = {
+            name: value
+            for name, value in response.headers.items()
+            if name.lower() not in _HOP_BY_HOP_HEADERS | {"content-length"}
+        }
+        return fastapi.Response(
+            content=response.content,
+            status_code=response.status_code,
+            headers=response_headers,
+        )
+
+    async def mgmt_status(self) -> dict:
+        """
+        Get the management status of the hub by combining the status of all workers.
+        """
+        worker_statuses = await self._get_from_all_workers("mgmt/v1/status")
+        peer_clients = []
+        for worker_status in worker_statuses:
+            peer_clients += worker_status["peer_clients"]
+        # The share store is shared by all workers, so the shares can be taken from any worker.
+        return {
+            "name": self._name,
+            "nr_workers": self._nr_workers,
+            "peer_clients": peer_clients,
+            "share_store": worker_statuses[0]["share_store"],
+            "shares": worker_statuses[0]["shares"],
+        }
+
+    async def mgmt_summary(self) -> dict:
+        """
+        Get a summary of the management status of the hub by combining the summaries of all
+        workers.
+        """
+        worker_summaries = await self._get_from_all_workers("mgmt/v1/summary")
+        peer_clients = []
+        for worker_summary in worker_summaries:
+            peer_clients += worker_summary["peer_clients"]
+        # Each worker only counts the shares that it added itself. All workers opened the share
+        # store before the router accepted the first request, so they counted the same shares when
+        # they opened it.
+        share_stores = [
+            worker_summary["share_store"] for worker_summary in worker_summaries
+        ]
+        nr_shares = share_stores[0]["nr_shares_at_open"] + sum(
+            share_store["nr_shares_added"] for share_store in share_stores
+        )
+        return {
+            "name": self._name,
+            "nr_workers": self._nr_workers,
+            "peer_clients": peer_clients,
+            "share_store": share_stores[0],
+            "nr_shares": nr_shares,
+        }
+
+    async def mgmt_traces(self, trace_id: str | None, limit: int) -> dict:
+        """
+        Get the most recent trace spans of the hub by combining the most recent trace spans of all
+        workers (ordered by start time).
+        """
+        params = {"limit": limit}
+        if trace_id is not None:
+            params["trace_id"] = trace_id
+        worker_traces = await self._get_from_all_workers("mgmt/v1/traces", params)
+        spans = []
+        for worker_trace in worker_traces:
+            spans += worker_trace["spans"]
+        spans.sort(key=lambda span: span["start_time"])
+        return {"spans": spans[-limit:]}
+
+    async def mgmt_profile(self, request: fastapi.Request) -> fastapi.Response:
+        """
+        Profile all workers at the same time, and combine their profiles: the collapsed stacks of
+        each worker get the worker index as their outermost frame, and the pstats reports are
+        concatenated. If any worker fails, its error response is returned instead.
+        """
+        responses = await asyncio.gather(
+            *[
+                client.post(request.url.path, params=request.query_params)
+                for client in self._worker_clients
+            ]
+        )
+        for response in responses:
+            if response.status_code != 200:
+                return fastapi.Response(
+                    content=response.content,
+                    status_code=response.status_code,
+                    media_type=response.headers.get("content-type"),
+                )
+        if request.query_params.get("mode", "sampling") == "sampling":
+            content = "".join(
+                f"worker-{worker_index};{line}\n"
+                for worker_index, response in enumerate(responses)
+                for line in response.text.splitlines()
+            )
+        else:
+            content = "".join(
+                f"Worker {worker_index}:\n{response.text}\n"
+                for worker_index, response in enumerate(responses)
+            )
+        return fastapi.responses.PlainTextResponse(content)
+
+    async def _get_from_all_workers(
+        self, path: str, params: dict | None = None
+    ) -> list[dict]:
+        url = f"/hub/{self._name}/{path}"
+        responses = await asyncio.gather(
+            *[client.get(url, params=params) for client in self._worker_clients]
+        )
+        return [response.json() for response in responses]
+
+    async def mgmt_metrics(self) -> str:
+        """
+        Get the metrics of the hub by combining the metrics of all workers. Each sample gets an
+        additional `worker` label.
+        """
+        url = f"/hub/{self._name}/mgmt/v1/metrics"
+        responses = await asyncio.gather(
+            *[client.get(url) for client in self._worker_clients]
+        )
+        return metrics.combine_rendered_metrics(
+            [response.text for response in responses], "worker"
+        )
+
+    def initiate_stop(self) -> None:
+        """
+        Initiate stopping the hub (the router and all workers).
+        """
+        self._stop_task = asyncio.create_task(self._stop_after_delay())
+
+    async def _stop_after_delay(self):
+        """
+        Stop the hub after a short delay to allow the HTTP response to be sent. The workers are
+        stopped when the router shuts down.
+        """
+        await asyncio.sleep(0.5)
+        utils.delete_pid_file("hub", self._name)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+
+def create_router_app(router: HubRouter) -> fastapi.FastAPI:
+    """
+    Create the FastAPI application for the router of a hub in multi-worker mode.
+    """
+
+    @contextlib.asynccontextmanager
+    async def lifespan(_app: fastapi.FastAPI):
+        await router.start_workers()
+        yield
+        await router.stop_workers()
+
+    app = fastapi.FastAPI(lifespan=lifespan)
+
+    @app.get(f"/hub/{router.name}/mgmt/v1/status")
+    async def get_mgmt_status():
+        """
+        Management: Get status.
+        """
+        return await router.mgmt_status()
+
+    @app.get(f"/hub/{router.name}/mgmt/v1/summary")
+    async def get_mgmt_summary():
+        """
+        Management: Get summary of status.
+        """
+        return await router.mgmt_summary()
+
+    @app.get(f"/hub/{router.name}/mgmt/v1/ready")
+    async def get_mgmt_ready():
+        """
+        Management: Get readiness. The router only serves requests once all workers have started.
+        """
+        return {"name": router.name, "ready": True}
+
+    @app.get(f"/hub/{router.name}/mgmt/v1/metrics")
+    async def get_mgmt_metrics():
+        """
+        Management: Get metrics (in the Prometheus text format).
+        """
+        return fastapi.responses.PlainTextResponse(
+            await router.mgmt_metrics(), media_type=metrics.CONTENT_TYPE
+        )
+
+    @app.get(f"/hub/{router.name}/mgmt/v1/traces")
+    async def get_mgmt_traces(
+        trace_id: str | None = None,
+        limit: Annotated[
+            int, fastapi.Query(ge=1, le=utils.MAX_PAGE_SIZE)
+        ] = utils.DEFAULT_PAGE_SIZE,
+    ):
+        """
+        Management: Get the most recent trace spans (optionally only those of one trace).
+        """
+        return await router.mgmt_traces(trace_id, limit)
+
+    @app.post(f"/hub/{router.name}/mgmt/v1/profile")
+    async def post_mgmt_profile(request: fastapi.Request):
+        """
+        Management: Profile all workers (see the profile endpoint of a hub worker).
+        """
+        return await router.mgmt_profile(request)
+
+    @app.post(f"/hub/{router.name}/mgmt/v1/stop")
+    async def post_mgmt_stop():
+        """
+        Management: Post stop.
+        """
+        router.initiate_stop()
+        return {"result": "Hub stop initiated"}
+
+    @app.put(f"/hub/{router.name}/dske/oob/v1/registration")
+    async def put_oob_client_registration(request: fastapi.Request):
+        """
+        DSKE Out of band: Register a client (with the worker that owns the client).
+        """
+        return await router.register(request)
+
+    @app.api_route(
+        f"/hub/{router.name}/{{path:path}}", methods=["GET", "PUT", "POST", "DELETE"]
+    )
+    async def forward(request: fastapi.Request):
+        """
+        Forward all other requests to the worker that owns the client.
+        """
+        return await router.forward(request)
+
+    return app
@@ -0,0 +1,506 @@
+"""
+Storage for the key shares that a hub holds on behalf of its peer clients.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import os
+import queue
+import sqlite3
+import threading
+from typing import Iterator
+from uuid import UUID
+from common.logging import LOGGER
+from common.share import Share
+
+DEFAULT_BATCH_SIZE = 256
+"""
+The maximum number of shares that the SQLite writer thread commits in one transaction.
+"""
+
+DEFAULT_CACHE_SIZE = 10_000
+"""
+The maximum number of shares that the SQLite share store keeps in its in-memory read cache.
+"""
+
+_MAX_KEY_IDS_PER_QUERY = 500
+"""
+Look up at most this many key UUIDs in one query (SQLite limits the number of query parameters).
+"""
+
+_STOP_WRITER = object()
+"""
+Sentinel that is put in the write queue to tell the SQLite writer thread to stop.
+"""
+
+
+_FILE_MODE = 0o600
+"""
+The share store database (and its write-ahead log) hold plaintext key shares, so only the owner of
+the hub process may read or write them.
+"""
+
+_DIRECTORY_MODE = 0o700
+
+
+def default_share_store_directory() -> str:
+    """
+    The private directory for share store files: $XDG_STATE_HOME/dske, or ~/.local/state/dske if
+    XDG_STATE_HOME is not set. The directory is created (accessible to the owner only) if needed.
+    """
+    state_home = os.environ.get("XDG_STATE_HOME")
+    if not state_home:
+        state_home = os.path.join(os.path.expanduser("~"), ".local", "state")
+    directory = os.path.join(state_home, "dske")
+    os.makedirs(directory, mode=_DIRECTORY_MODE, exist_ok=True)
+    if os.stat(directory).st_mode & 0o077:
+        LOGGER.warning(
+            f"Share store directory {directory} is accessible to other users; restricting it"
+        )
+        os.chmod(directory, _DIRECTORY_MODE)
+    return directory
+
+
+def default_share_store_file_name(hub_name: str) -> str:
+    """
+    The name of the file that is used to store the shares for a hub, if no file name is specified.
+    """
+    return os.path.join(default_share_store_directory(), f"hub-{hub_name}-shares.db")
+
+
+def create_private_file(file_name: str) -> None:
+    """
+    Create the file (if it does not exist yet) so that only the owner can access it. SQLite creates
+    the write-ahead log and shared memory files with the same permissions as the database file.
+    """
+    fd = os.open(file_name, os.O_RDWR | os.O_CREAT, _FILE_MODE)
+    try:
+        if os.fstat(fd).st_mode & 0o077:
+            LOGGER.warning(
+                f"Share store file {file_name} is accessible to other users; restricting it"
+            )
+            os.fchmod(fd, _FILE_MODE)
+    finally:
+        os.close(fd)
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(file_name + suffix):
+            os.chmod(file_name + suffix, _FILE_MODE)
+
+
+class ShareStore:
+    """
+    Base class for share stores. A share store holds the key shares that were posted by a master
+    client until the slave client retrieves them. Shares are indexed by user key UUID.
+    """
+
+    def store(self, share: Share) -> None:
+        """
+        Store a share. If a share for the same key UUID is already stored, it is replaced.
+        """
+        raise NotImplementedError
+
+    async def wait_until_stored(self, share: Share) -> None:
+        """
+        Wait until a stored share is visible to other processes that use the same backend (only
+        relevant for stores that are shared between hub worker processes).
+        """
+
+    def get(self, key_id: UUID) -> Share | None:
+        """
+        Get the share for a key UUID. Returns None if there is no such share.
+        """
+        raise NotImplementedError
+
+    def shares(self) -> Iterator[Share]:
+        """
+        Iterate over all stored shares.
+        """
+        raise NotImplementedError
+
+    def shares_page(
+        self, cursor: int | None, limit: int
+    ) -> tuple[list[Share], int | None]:
+        """
+        Get one page of the stored shares. The `cursor` is None for the first page, and the cursor
+        that was returned with the previous page for the next pages. Returns the shares and the
+        cursor for the next page (None if this is the last page).
+        """
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def nr_shares(self) -> int:
+        """
+        Get the number of stored shares, without waiting for pending writes to the backend. This
+        is cheap enough to be called for every management summary.
+        """
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        """
+        Make sure that all stored shares have been written to the backend.
+        """
+
+    def close(self) -> None:
+        """
+        Flush and close the store. The store must not be used after it has been closed.
+        """
+
+    def to_mgmt(self) -> dict:
+        """
+        Get the management status.
+        """
+        raise NotImplementedError
+
+
+class MemoryShareStore(ShareStore):
+    """
+    A share store that keeps all shares in a dictionary. Shares are lost when the hub restarts.
+    """
+
+    _shares: dict[UUID, Share]  # Indexed by key UUID
+    _key_ids: list[UUID]  # In the order in which the shares were first stored
+
+    def __init__(self):
+        self._shares = {}
+        self._key_ids = []
+
+    def store(self, share: Share) -> None:
+        if share.user_key_id not in self._shares:
+            self._key_ids.append(share.user_key_id)
+        self._shares[share.user_key_id] = share
+
+    def get(self, key_id: UUID) -> Share | None:
+        return self._shares.get(key_id)
+
+    def shares(self) -> Iterator[Share]:
+        return iter(self._shares.values())
+
+    def shares_page(
+        self, cursor: int | None, limit: int
+    ) -> tuple[list[Share], int | None]:
+        # The cursor is the insertion sequence number of the first share on the next page (shares
+        # are never deleted), so that getting a page does not depend on the number of shares on the
+        # previous pages.
+        start = 0 if cursor is None else cursor
+        key_ids = self._key_ids[start : start + limit]
+        shares = [self._shares[key_id] for key_id in key_ids]
+        end = start + len(shares)
+        next_cursor = end if end < len(self._key_ids) else None
+        return (shares, next_cursor)
+
+    def __len__(self) -> int:
+        return len(self._shares)
+
+    def nr_shares(self) -> int:
+        return len(self._shares)
+
+    def to_mgmt(self) -> dict:
+        return {
+            "backend": "memory",
+        }
+
+
+class SqliteShareStore(ShareStore):
+    """
+    A share store that persists shares in an SQLite database in write-ahead-log (WAL) mode, so that
+    shares survive a restart of the hub.
+
+    Writes are done by a background writer thread, which commits all shares that are queued up (up
+    to `batch_size`) in a single transaction. This keeps disk I/O off the event loop. Shares that
+    have been stored but not yet written are kept in a pending dictionary so that they can be read
+    back immediately. Recently stored or read shares are kept in a bounded in-memory read cache;
+    other shares are read from the database on demand, so the number of stored shares is not
+    limited by the amount of memory.
+
+    If `write_through` is set, wait_until_stored waits until the share has been committed (without
+    waiting for shares that were stored later, or by other requests, to be committed). This is
+    needed when several hub worker processes share the same database: a share that is posted to one
+    worker must be visible to the other workers as soon as the POST request has been answered.
+    """
+
+    _file_name: str
+    _batch_size: int
+    _cache_size: int
+    _write_through: bool
+    _lock: threading.Lock
+    _pending: dict[UUID, Share]  # Stored but not yet written, indexed by key UUID
+    _cache: collections.OrderedDict[UUID, Share]  # Least recently used first
+    _write_queue: queue.Queue  # Of (share, write future or None)
+    # Futures that are done when the latest stored share for a key UUID has been committed (only
+    # if write_through is set), indexed by key UUID
+    _write_futures: dict[UUID, concurrent.futures.Future]
+    _reader: sqlite3.Connection
+    # The number of shares in the database when the store was opened, and the number of shares for
+    # new key UUIDs that the writer thread has committed since then
+    _nr_shares_at_open: int
+    _nr_shares_added: int
+    _writer_thread: threading.Thread | None
+
+    def __init__(
+        self,
+        file_name: str,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        write_through: bool = False,
+    ):
+        assert batch_size > 0
+        self._file_name = file_name
+        self._batch_size = batch_size
+        self._cache_size = cache_size
+        self._write_through = write_through
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._cache = collections.OrderedDict()
+        self._write_queue = queue.Queue()
+        self._write_futures = {}
+        # The restrictive umask covers any file that SQLite creates next to the database.
+        old_umask = os.umask(0o077)
+        try:
+            create_private_file(file_name)
+            writer = self._connect()
+            writer.execute(
+                "CREATE TABLE IF NOT EXISTS shares ("
+                "key_id TEXT PRIMARY KEY, "
+                "master_sae_id TEXT NOT NULL, "
+                "slave_sae_id TEXT NOT NULL, "
+                "share_index INTEGER NOT NULL, "
+                "value BLOB NOT NULL)"
+            )
+            writer.commit()
+            self._reader = self._connect()
+            # Count the shares once; after that, the writer thread keeps count.
+            (self._nr_shares_at_open,) = self._reader.execute(
+                "SELECT COUNT(*) FROM shares"
+            ).fetchone()
+            self._nr_shares_added = 0
+        finally:
+            os.umask(old_umask)
+        self._writer_thread = threading.Thread(
+            target=self._writer_main,
+            args=(writer,),
+            name=f"share-store-writer {file_name}",
+            daemon=True,
+        )
+        self._writer_thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Each connection is used by one thread at a time: the writer connection is only used by
+        # the writer thread, and the reader connection is only used while holding self._lock.
+        connection = sqlite3.connect(self._file_name, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode, synchronous=NORMAL is durable across application crashes (but not
+        # necessarily across operating system crashes) and avoids an fsync on every commit.
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _writer_main(self, connection: sqlite3.Connection) -> None:
+        """
+        Main function of the writer thread: commit queued shares in batches.
+        """
+        stop = False
+        while not stop:
+            batch = [self._write_queue.get()]
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            items = [item for item in batch if item is not _STOP_WRITER]
+            stop = len(items) < len(batch)
+            shares = [share for (share, _future) in items]
+            error = None
+            try:
+                with connection:
+                    nr_new_shares = self._count_new_key_ids(connection, shares)
+                    connection.executemany(
+                        "INSERT OR REPLACE INTO shares "
+                        "(key_id, master_sae_id, slave_sae_id, share_index, value) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        [self._share_to_row(share) for share in shares],
+                    )
+            except sqlite3.Error as exc:
+                # The shares stay in the pending dictionary, so they can still be retrieved until
+                # the hub is restarted.
+                LOGGER.error(f"Failed to write {len(shares)} shares: {exc}")
+                error = exc
+            with self._lock:
+                if error is None:
+                    self._nr_shares_added += nr_new_shares
+                for share, future in items:
+                    if error is None and self._pending.get(share.user_key_id) is share:
+                        del self._pending[share.user_key_id]
+                    if future is None:
+                        continue
+                    if self._write_futures.get(share.user_key_id) is future:
+                        del self._write_futures[share.user_key_id]
+                    if error is None:
+                        future.set_result(None)
+                    else:
+                        future.set_exception(error)
+            for _ in batch:
+                self._write_queue.task_done()
+        connection.close()
+
+    @staticmethod
+    def _count_new_key_ids(connection: sqlite3.Connection, shares: list[Share]) -> int:
+        """
+        Count the distinct key UUIDs of the shares that are not yet in the database (a share for a
+        key UUID that is already in the database replaces the existing share).
+        """
+        key_ids = list({str(share.user_key_id) for share in shares})
+        nr_existing = 0
+        for start in range(0, len(key_ids), _MAX_KEY_IDS_PER_QUERY):
+            chunk = key_ids[start : start + _MAX_KEY_IDS_PER_QUERY]
+            placeholders = ", ".join("?" * len(chunk))
+            (count,) = connection.execute(
+                f"SELECT COUNT(*) FROM shares WHERE key_id IN ({placeholders})", chunk
+            ).fetchone()
+            nr_existing += count
+        return len(key_ids) - nr_existing
+
+    @staticmethod
+    def _share_to_row(share: Share) -> tuple:
+        return (
+            str(share.user_key_id),
+            share.master_sae_id,
+            share.slave_sae_id,
+            share.share_index,
+            share.value,
+        )
+
+    @staticmethod
+    def _row_to_share(row: tuple) -> Share:
+        (key_id_str, master_sae_id, slave_sae_id, share_index, value) = row
+        return Share(
+            master_sae_id=master_sae_id,
+            slave_sae_id=slave_sae_id,
+            user_key_id=UUID(key_id_str),
+            share_index=share_index,
+            value=value,
+        )
+
+    def _add_to_cache(self, share: Share) -> None:
+        # Caller must hold self._lock
+        if self._cache_size <= 0:
+            return
+        self._cache[share.user_key_id] = share
+        self._cache.move_to_end(share.user_key_id)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def store(self, share: Share) -> None:
+        future = concurrent.futures.Future() if self._write_through else None
+        with self._lock:
+            self._pending[share.user_key_id] = share
+            self._add_to_cache(share)
+            if future is not None:
+                self._write_futures[share.user_key_id] = future
+        self._write_queue.put((share, future))
+
+    async def wait_until_stored(self, share: Share) -> None:
+        if not self._write_through:
+            return
+        with self._lock:
+            future = self._write_futures.get(share.user_key_id)
+        if future is not None:
+            # If the share was replaced by a newer share for the same key before it was written,
+            # this waits for the newer share.
+            await asyncio.wrap_future(future)
+
+    def get(self, key_id: UUID) -> Share | None:
+        with self._lock:
+            share = self._pending.get(key_id)
+            if share is not None:
+                return share
+            share = self._cache.get(key_id)
+            if share is not None:
+                self._cache.move_to_end(key_id)
+                return share
+            row = self._reader.execute(
+                "SELECT key_id, master_sae_id, slave_sae_id, share_index, value "
+                "FROM shares WHERE key_id = ?",
+                (str(key_id),),
+            ).fetchone()
+            if row is None:
+                return None
+            share = self._row_to_share(row)
+            self._add_to_cache(share)
+            return share
+
+    def shares(self) -> Iterator[Share]:
+        self.flush()
+        with self._lock:
+            rows = self._reader.execute(
+                "SELECT key_id, master_sae_id, slave_sae_id, share_index, value "
+                "FROM shares ORDER BY rowid"
+            ).fetchall()
+        for row in rows:
+            yield self._row_to_share(row)
+
+    def shares_page(
+        self, cursor: int | None, limit: int
+    ) -> tuple[list[Share], int | None]:
+        # The cursor is the rowid of the last share on the previous page. We don't wait for pending
+        # writes: pending shares get a higher rowid than all written shares, so they show up on a
+        # later page once they have been written.
+        with self._lock:
+            rows = self._reader.execute(
+                "SELECT rowid, key_id, master_sae_id, slave_sae_id, share_index, value "
+                "FROM shares WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (-1 if cursor is None else cursor, limit + 1),
+            ).fetchall()
+        shares = [self._row_to_share(row[1:]) for row in rows[:limit]]
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return (shares, next_cursor)
+
+    def __len__(self) -> int:
+        self.flush()
+        return self.nr_shares()
+
+    def nr_shares(self) -> int:
+        # Shares that are still pending are not counted (they are reported separately in the
+        # management status). Shares that other hub worker processes added to the same database
+        # are not counted either (the router adds them up, see HubRouter.mgmt_summary).
+        return self._nr_shares_at_open + self._nr_shares_added
+
+    def flush(self) -> None:
+        self._write_queue.join()
+
+    def close(self) -> None:
+        if self._writer_thread is None:
+            return
+        self._write_queue.put(_STOP_WRITER)
+        self._writer_thread.join()
+        self._writer_thread = None
+        self._reader.close()
+
+    def to_mgmt(self) -> dict:
+        with self._lock:
+            nr_pending_shares = len(self._pending)
+            nr_cached_shares = len(self._cache)
+        return {
+            "backend": "sqlite",
+            "file_name": self._file_name,
+            "nr_pending_shares": nr_pending_shares,
+            "nr_cached_shares": nr_cached_shares,
+            "nr_shares_at_open": self._nr_shares_at_open,
+            "nr_shares_added": self._nr_shares_added,
+        }
+
+
+def create_share_store(
+    backend: str, file_name: str | None = None, write_through: bool = False
+) -> ShareStore:
+    """
+    Create a share store for the given backend ("memory" or "sqlite").
+    """
+    match backend:
+        case "memory":
+            return MemoryShareStore()
+        case "sqlite":
+            assert file_name is not None
+            return SqliteShareStore(file_name, write_through=write_through)
+    raise ValueError(f"Unknown share store backend: {backend}")
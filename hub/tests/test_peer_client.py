@@ -0,0 +1,69 @@
+"""
+Unit tests for the peer client.
+"""
+
+import asyncio
+from uuid import uuid4
+import pytest
+from common.block import Block
+from common.exceptions import InvalidSignatureError
+from common.pool import Pool
+from common.signing_key import SIGNING_KEY_SIZE, SigningKey
+from hub.peer_client import PeerClient
+
+
+class _FakeRequest:
+    """
+    The parts of a FastAPI request that are used to check its signature.
+    """
+
+    def __init__(self, headers: dict[str, str], query: bytes, body: bytes):
+        self.headers = headers
+        self.scope = {"query_string": query}
+        self._body = body
+
+    async def body(self) -> bytes:
+        """
+        Get the request body.
+        """
+        return self._body
+
+
+def _create_peer_client_and_sender_pool() -> tuple[PeerClient, Pool]:
+    """
+    Create a peer client, and a pool that holds the same PSRD as the peer pool of the peer client
+    (as the pool of the real peer client would).
+    """
+    peer_client = PeerClient("carol", ["sam"])
+    sender_pool = Pool("hank", Pool.Owner.LOCAL)
+    block_uuid = uuid4()
+    data = bytes(range(256)) * 4
+    peer_client.peer_pool.add_block(Block(block_uuid, data))
+    sender_pool.add_block(Block(block_uuid, data))
+    return (peer_client, sender_pool)
+
+
+@pytest.mark.parametrize("tampered", [False, True])
+def test_signing_key_stays_consumed(tampered):
+    """
+    The signing key that was used to check a request signature is consumed, also if the signature
+    is invalid.
+    """
+
+    async def run():
+        peer_client, sender_pool = _create_peer_client_and_sender_pool()
+        signing_key = SigningKey.from_pool(sender_pool)
+        signature = signing_key.sign([b"size=32", b"body"])
+        headers = {}
+        signature.add_to_headers(headers)
+        headers = {name.lower(): value for name, value in headers.items()}
+        body = b"tampered body" if tampered else b"body"
+        request = _FakeRequest(headers, b"size=32", body)
+        if tampered:
+            with pytest.raises(InvalidSignatureError):
+                await peer_client.check_request_signature(request)
+        else:
+            await peer_client.check_request_signature(request)
+        assert peer_client.peer_pool.nr_used_bytes == SIGNING_KEY_SIZE
+
+    asyncio.run(run())
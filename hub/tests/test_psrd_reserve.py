@@ -0,0 +1,56 @@
+"""
+Unit tests for the PSRD reserve.
+"""
+
+import asyncio
+from hub.psrd_reserve import PSRDReserve
+
+
+def test_take_hit_and_miss():
+    """
+    Blocks of a configured size are taken from the reserve until it is empty; other sizes are
+    generated on demand.
+    """
+
+    async def run():
+        reserve = PSRDReserve([100, 200], depth=2)
+        await reserve.fill()
+        assert reserve.to_mgmt()["nr_blocks"] == {"100": 2, "200": 2}
+        data1 = await reserve.take(100)
+        data2 = await reserve.take(100)
+        data3 = await reserve.take(100)
+        data4 = await reserve.take(300)
+        assert [len(data) for data in (data1, data2, data3, data4)] == [
+            100,
+            100,
+            100,
+            300,
+        ]
+        assert len({bytes(data1), bytes(data2), bytes(data3)}) == 3
+        mgmt = reserve.to_mgmt()
+        assert mgmt["nr_blocks"] == {"100": 0, "200": 2}
+        assert mgmt["nr_hits"] == 2
+        assert mgmt["nr_misses"] == 2
+        assert mgmt["hit_rate"] == 0.5
+
+    asyncio.run(run())
+
+
+def test_refill_in_background():
+    """
+    The background task fills the reserve, and tops it up after blocks were taken.
+    """
+
+    async def run():
+        reserve = PSRDReserve([100], depth=3, idle_delay=0.01)
+        reserve.start()
+        await asyncio.sleep(0.1)
+        assert reserve.to_mgmt()["nr_blocks"] == {"100": 3}
+        await reserve.take(100)
+        await reserve.take(100)
+        assert reserve.to_mgmt()["nr_blocks"] == {"100": 1}
+        await asyncio.sleep(0.1)
+        assert reserve.to_mgmt()["nr_blocks"] == {"100": 3}
+        reserve.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,269 @@
+"""
+Unit tests for the share stores.
+"""
+
+import asyncio
+import os
+import stat
+from uuid import uuid4
+import pytest
+from common.share import Share
+from hub.share_store import (
+    MemoryShareStore,
+    SqliteShareStore,
+    create_share_store,
+    default_share_store_file_name,
+)
+
+
+def create_test_share(share_index: int = 1) -> Share:
+    """
+    Create a test share with a random key UUID.
+    """
+    return Share(
+        master_sae_id="sam",
+        slave_sae_id="sofia",
+        user_key_id=uuid4(),
+        share_index=share_index,
+        value=bytes([share_index] * 16),
+    )
+
+
+def check_same_share(share: Share, expected_share: Share):
+    """
+    Check that a share retrieved from a store is the same as the share that was stored.
+    """
+    assert share.master_sae_id == expected_share.master_sae_id
+    assert share.slave_sae_id == expected_share.slave_sae_id
+    assert share.user_key_id == expected_share.user_key_id
+    assert share.share_index == expected_share.share_index
+    assert share.value == expected_share.value
+
+
+def test_memory_store_and_get():
+    """
+    Store shares in a memory share store and get them back.
+    """
+    store = MemoryShareStore()
+    shares = [create_test_share(share_index) for share_index in range(5)]
+    for share in shares:
+        store.store(share)
+    assert len(store) == 5
+    for share in shares:
+        check_same_share(store.get(share.user_key_id), share)
+    assert store.get(uuid4()) is None
+    assert list(store.shares()) == shares
+    assert store.to_mgmt() == {"backend": "memory"}
+
+
+def test_sqlite_store_and_get(tmp_path):
+    """
+    Store shares in an SQLite share store and get them back (both before and after they have been
+    written to the database).
+    """
+    store = SqliteShareStore(str(tmp_path / "shares.db"), batch_size=3)
+    shares = [create_test_share(share_index) for share_index in range(10)]
+    for share in shares:
+        store.store(share)
+    for share in shares:
+        check_same_share(store.get(share.user_key_id), share)
+    store.flush()
+    assert len(store) == 10
+    for share in shares:
+        check_same_share(store.get(share.user_key_id), share)
+    assert store.get(uuid4()) is None
+    for share, expected_share in zip(store.shares(), shares):
+        check_same_share(share, expected_share)
+    assert store.to_mgmt()["nr_pending_shares"] == 0
+    store.close()
+
+
+def test_sqlite_persistence(tmp_path):
+    """
+    Shares stored in an SQLite share store are still there after the store is closed and reopened.
+    """
+    file_name = str(tmp_path / "shares.db")
+    store = SqliteShareStore(file_name)
+    shares = [create_test_share(share_index) for share_index in range(10)]
+    for share in shares:
+        store.store(share)
+    store.close()
+    store = SqliteShareStore(file_name)
+    assert len(store) == 10
+    for share in shares:
+        check_same_share(store.get(share.user_key_id), share)
+    store.close()
+
+
+def test_sqlite_nr_shares(tmp_path):
+    """
+    The SQLite share store counts the shares in the database when it is opened, and keeps count of
+    the shares for new key UUIDs that it writes; replaced shares are not counted twice.
+    """
+    file_name = str(tmp_path / "shares.db")
+    store = SqliteShareStore(file_name, batch_size=2)
+    shares = [create_test_share(share_index) for share_index in range(5)]
+    for share in shares:
+        store.store(share)
+    store.flush()
+    assert store.nr_shares() == 5
+    replacement = Share(
+        master_sae_id="sam",
+        slave_sae_id="sofia",
+        user_key_id=shares[0].user_key_id,
+        share_index=7,
+        value=bytes([7] * 16),
+    )
+    store.store(replacement)
+    store.store(replacement)
+    store.flush()
+    assert store.nr_shares() == 5
+    store.close()
+    other_store = SqliteShareStore(file_name)
+    store = SqliteShareStore(file_name)
+    other_store.store(create_test_share())
+    other_store.flush()
+    store.store(create_test_share())
+    store.flush()
+    assert store.nr_shares() == 6
+    assert store.to_mgmt()["nr_shares_at_open"] == 5
+    assert store.to_mgmt()["nr_shares_added"] == 1
+    other_store.close()
+    store.close()
+
+
+def test_sqlite_cache_eviction(tmp_path):
+    """
+    The read cache of the SQLite share store is bounded; evicted shares are read from the database.
+    """
+    store = SqliteShareStore(str(tmp_path / "shares.db"), cache_size=2)
+    shares = [create_test_share(share_index) for share_index in range(5)]
+    for share in shares:
+        store.store(share)
+    store.flush()
+    assert store.to_mgmt()["nr_cached_shares"] == 2
+    for share in shares:
+        check_same_share(store.get(share.user_key_id), share)
+    assert store.to_mgmt()["nr_cached_shares"] == 2
+    store.close()
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_shares_page(tmp_path, backend):
+    """
+    Get the stored shares in pages.
+    """
+    store = create_share_store(backend, str(tmp_path / "shares.db"))
+    shares = [create_test_share(share_index) for share_index in range(5)]
+    for share in shares:
+        store.store(share)
+    store.flush()
+    assert store.nr_shares() == 5
+    (page, cursor) = store.shares_page(None, 2)
+    paged_shares = list(page)
+    while cursor is not None:
+        (page, cursor) = store.shares_page(cursor, 2)
+        assert len(page) <= 2
+        paged_shares += page
+    assert len(paged_shares) == 5
+    for share, expected_share in zip(paged_shares, shares):
+        check_same_share(share, expected_share)
+    (page, cursor) = store.shares_page(None, 5)
+    assert len(page) == 5
+    assert cursor is None
+    store.close()
+
+
+def test_memory_shares_page_keeps_insertion_order():
+    """
+    A share that is replaced keeps its place in the pages of a memory share store, and shares that
+    are stored between pages appear on a later page.
+    """
+    store = MemoryShareStore()
+    shares = [create_test_share(share_index) for share_index in range(3)]
+    for share in shares:
+        store.store(share)
+    (page, cursor) = store.shares_page(None, 2)
+    assert [share.share_index for share in page] == [0, 1]
+    replacement = Share(
+        master_sae_id="sam",
+        slave_sae_id="sofia",
+        user_key_id=shares[2].user_key_id,
+        share_index=7,
+        value=bytes([7] * 16),
+    )
+    store.store(replacement)
+    store.store(create_test_share(3))
+    (page, cursor) = store.shares_page(cursor, 2)
+    assert [share.share_index for share in page] == [7, 3]
+    assert cursor is None
+
+
+def test_create_share_store(tmp_path):
+    """
+    Create share stores by backend name.
+    """
+    assert isinstance(create_share_store("memory"), MemoryShareStore)
+    store = create_share_store("sqlite", str(tmp_path / "shares.db"))
+    assert isinstance(store, SqliteShareStore)
+    store.close()
+    with pytest.raises(ValueError):
+        create_share_store("no-such-backend")
+
+
+def test_sqlite_write_through(tmp_path):
+    """
+    With write-through, a stored share is visible to another store on the same database file (as
+    used by another hub worker process) once wait_until_stored returns.
+    """
+    file_name = str(tmp_path / "shares.db")
+    store = SqliteShareStore(file_name, write_through=True)
+    other_store = SqliteShareStore(file_name)
+    share = create_test_share()
+    store.store(share)
+    asyncio.run(store.wait_until_stored(share))
+    check_same_share(other_store.get(share.user_key_id), share)
+    # Waiting for a share that was replaced waits for the share that replaced it.
+    replaced_share = create_test_share()
+    replacing_share = Share(
+        master_sae_id="sam",
+        slave_sae_id="sofia",
+        user_key_id=replaced_share.user_key_id,
+        share_index=2,
+        value=bytes([2] * 16),
+    )
+    store.store(replaced_share)
+    store.store(replacing_share)
+    asyncio.run(store.wait_until_stored(replaced_share))
+    check_same_share(other_store.get(replaced_share.user_key_id), replacing_share)
+    store.close()
+    other_store.close()
+
+
+def test_sqlite_files_are_private(tmp_path):
+    """
+    The database file and the files that SQLite creates next to it are only accessible to the
+    owner, even if the umask would allow more.
+    """
+    file_name = str(tmp_path / "shares.db")
+    old_umask = os.umask(0o022)
+    try:
+        store = SqliteShareStore(file_name)
+        store.store(create_test_share())
+        store.flush()
+        for suffix in ("", "-wal", "-shm"):
+            assert stat.S_IMODE(os.stat(file_name + suffix).st_mode) == 0o600
+        store.close()
+    finally:
+        os.umask(old_umask)
+
+
+def test_default_file_name_is_in_private_directory(tmp_path, monkeypatch):
+    """
+    The default share store file is in a private directory (not in /tmp).
+    """
+    monkeypatch.setenv("XDG_STATE_HOME", str(tmp_path / "state"))
+    file_name = default_share_store_file_name("hank")
+    directory = os.path.dirname(file_name)
+    assert directory == str(tmp_path / "state" / "dske")
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
@@ -0,0 +1,3 @@
+"""
+An in-process DSKE topology, for fast tests and profiling.
+"""
@@ -0,0 +1,171 @@
+"""
+Tests for the in-process topology.
+"""
+
+import asyncio
+import httpx
+import pytest
+from common.configuration import Configuration
+from common.node import Node, NodeType
+from common.profiler import PROFILER
+from common.share import Share
+from in_process.topology import InProcessTopology
+
+
+def small_topology_nodes() -> list[Node]:
+    """
+    Get the nodes of a small topology: three hubs, and two clients with one encryptor each.
+    """
+    nodes = [Node(NodeType.HUB, name, []) for name in ["hank", "helen", "hilary"]]
+    nodes.append(Node(NodeType.CLIENT, "carol", ["sam"]))
+    nodes.append(Node(NodeType.CLIENT, "celia", ["serena"]))
+    return Configuration(nodes).nodes
+
+
+def test_get_key_pair():
+    """
+    Both encryptors get the same key, through the clients and hubs of the in-process topology.
+    """
+
+    async def run():
+        async with InProcessTopology(small_topology_nodes()) as topology:
+            for _ in range(3):
+                master_key, slave_key = await topology.get_key_pair("sam", "serena")
+                assert master_key == slave_key
+            master_key, slave_key = await topology.get_key_pair("serena", "sam", 64)
+            assert master_key == slave_key
+            assert topology.client("carol").is_ready
+
+    asyncio.run(run())
+
+
+def test_management_api():
+    """
+    The management APIs of the nodes can be called through the HTTP client of the topology.
+    """
+
+    async def run():
+        async with InProcessTopology(small_topology_nodes()) as topology:
+            for node in small_topology_nodes():
+                response = await topology.http_client.get(
+                    f"{node.base_url}/mgmt/v1/ready"
+                )
+                assert response.status_code == 200
+
+    asyncio.run(run())
+
+
+def test_unknown_node():
+    """
+    A request for a node that is not in the topology fails to connect.
+    """
+
+    async def run():
+        async with InProcessTopology(small_topology_nodes()) as topology:
+            with pytest.raises(httpx.ConnectError):
+                await topology.http_client.get(
+                    "http://127.0.0.1:1/hub/nobody/mgmt/v1/ready"
+                )
+
+    asyncio.run(run())
+
+
+def test_bad_share_is_excluded():
+    """
+    Both encryptors still get the same key when one hub serves corrupt key shares, as long as the
+    other hubs serve enough good key shares.
+    """
+
+    def corrupt(share: Share | None) -> Share | None:
+        if share is None:
+            return None
+        return Share(
+            master_sae_id=share.master_sae_id,
+            slave_sae_id=share.slave_sae_id,
+            user_key_id=share.user_key_id,
+            share_index=share.share_index,
+            value=bytes(byte ^ 0xFF for byte in share.value),
+        )
+
+    async def run():
+        nodes = small_topology_nodes()
+        nodes.insert(3, Node(NodeType.HUB, "holly", []))
+        nodes = Configuration(nodes).nodes
+        async with InProcessTopology(nodes) as topology:
+            # pylint: disable=protected-access
+            share_store = topology.hub("helen")._share_store
+            get_share = share_store.get
+            share_store.get = lambda key_id: corrupt(get_share(key_id))
+            for _ in range(3):
+                master_key, slave_key = await topology.get_key_pair("sam", "serena")
+                assert master_key == slave_key
+
+    asyncio.run(run())
+
+
+def test_trace_spans_client_and_hubs():
+    """
+    A Get Key request is traced through the master client and the hubs: the spans of the hubs are
+    in the same trace as the spans of the client, and can be dumped with the management API.
+    """
+
+    async def run():
+        async with InProcessTopology(small_topology_nodes()) as topology:
+            await topology.get_key_pair("sam", "serena")
+            # All nodes of an in-process topology share the tracer of the process.
+            response = await topology.http_client.get(
+                f"{topology.kme_node('serena').base_url}/mgmt/v1/traces",
+                params={"limit": 1},
+            )
+            (get_key_span,) = response.json()["spans"]
+            assert get_key_span["name"].endswith("/dec_keys")
+            response = await topology.http_client.get(
+                f"{topology.kme_node('serena').base_url}/mgmt/v1/traces",
+                params={"limit": 1000, "trace_id": get_key_span["trace_id"]},
+            )
+            spans = response.json()["spans"]
+            spans_by_id = {span["span_id"]: span for span in spans}
+            hub_spans = [
+                span
+                for span in spans
+                if span["name"] == "GET /hub/hank/dske/api/v1/key-share"
+            ]
+            assert len(hub_spans) == 1
+            assert hub_spans[0]["attributes"]["status_code"] == 200
+            assert spans_by_id[hub_spans[0]["parent_span_id"]]["name"] == "http GET"
+            names = {span["name"] for span in spans}
+            assert {"gather key", "get share", "check request signature"} <= names
+            assert {"sign response", "check response signature"} <= names
+            assert "reconstruct key" in names
+            assert any(name.startswith("pool allocate") for name in names)
+
+    asyncio.run(run())
+
+
+def test_profile_endpoint():
+    """
+    The management API of a node takes a profile under load, but only if profiling is enabled.
+    """
+
+    async def run():
+        async with InProcessTopology(small_topology_nodes()) as topology:
+            url = f"{topology.kme_node('sam').base_url}/mgmt/v1/profile"
+            response = await topology.http_client.post(url, params={"duration": 0.1})
+            assert response.status_code == 403
+            PROFILER.configure(enabled=True)
+            try:
+                profile = asyncio.create_task(
+                    topology.http_client.post(
+                        url,
+                        params={"mode": "cprofile", "duration": 0.5, "limit": 1000},
+                    )
+                )
+                while not profile.done():
+                    await topology.get_key_pair("sam", "serena")
+                response = await profile
+            finally:
+                PROFILER.configure(enabled=False)
+            assert response.status_code == 200
+            assert "scatter_key_amongst_peer_hubs" in response.text
+
+    asyncio.run(run())
@@ -0,0 +1,226 @@
+"""
+An in-process DSKE topology: all hubs and clients of a topology run in the current process and
+event loop, and the clients talk to the hubs through an in-memory ASGI transport instead of TCP.
+
+This runs the same application code (the FastAPI applications of the hubs and clients, and the
+HTTP client of the peer hubs) as a topology that is started with manager.py, but without processes,
+ports, or sockets. It is meant for fast tests and for profiling the protocol code.
+"""
+
+import asyncio
+import fastapi
+import httpx
+from client.app import create_app as create_client_app
+from client.client import Client
+from client.peer_hub import DEFAULT_READY_PSRD_BYTES
+from common import configuration
+from common.block_reaper import BLOCK_REAPER
+from common.event_loop_monitor import EVENT_LOOP_MONITOR
+from common.node import Node, NodeType
+from hub import psrd_reserve
+from hub.app import create_app as create_hub_app
+from hub.hub import Hub
+from hub.share_store import create_share_store
+
+DEFAULT_READY_TIMEOUT = 10.0
+"""
+By default, give up if the topology is not ready after this many seconds.
+"""
+
+
+class TopologyTransport(httpx.AsyncBaseTransport):
+    """
+    An httpx transport that delivers each request in memory to the ASGI application of the node
+    that the request is for (determined by the host and port of the URL).
+    """
+
+    _transports: dict[tuple[str, int], httpx.ASGITransport]  # Indexed by host and port
+    _nr_requests: int
+
+    def __init__(self):
+        self._transports = {}
+        self._nr_requests = 0
+
+    @property
+    def nr_requests(self) -> int:
+        """
+        Get the number of requests that were delivered so far.
+        """
+        return self._nr_requests
+
+    def add_node(self, node: Node, app: fastapi.FastAPI) -> None:
+        """
+        Deliver the requests for the base URL of the node to its application.
+        """
+        url = httpx.URL(node.base_url)
+        self._transports[(url.host, url.port)] = httpx.ASGITransport(app)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        transport = self._transports.get((request.url.host, request.url.port))
+        if transport is None:
+            raise httpx.ConnectError(f"No node at {request.url}", request=request)
+        self._nr_requests += 1
+        return await transport.handle_async_request(request)
+
+
+class InProcessTopology:
+    """
+    Runs all hubs and clients of a topology in the current process and event loop.
+
+    Use it as an asynchronous context manager: the topology is started (and ready) when the context
+    is entered, and stopped when it is exited.
+    """
+
+    _nodes: list[Node]
+    _ready_psrd_bytes: int
+    _authentication_modes: list[str] | None
+    _transport: TopologyTransport
+    _hubs: dict[str, Hub]  # Indexed by hub name
+    _clients: dict[str, Client]  # Indexed by client name
+    _kme_nodes: dict[str, Node]  # Indexed by SAE ID (encryptor name)
+    _http_client: httpx.AsyncClient | None
+
+    def __init__(
+        self,
+        nodes: list[Node] | None = None,
+        ready_psrd_bytes: int = DEFAULT_READY_PSRD_BYTES,
+        authentication_modes: list[str] | None = None,
+    ):
+        if nodes is None:
+            nodes = configuration.parse_configuration_file().nodes
+        self._nodes = nodes
+        self._ready_psrd_bytes = ready_psrd_bytes
+        self._authentication_modes = authentication_modes
+        self._transport = TopologyTransport()
+        self._hubs = {}
+        self._clients = {}
+        self._kme_nodes = {}
+        self._http_client = None
+
+    async def __aenter__(self) -> "InProcessTopology":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_exc_info) -> None:
+        await self.stop()
+
+    @property
+    def transport(self) -> TopologyTransport:
+        """
+        Get the transport that delivers the requests to the nodes.
+        """
+        return self._transport
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """
+        Get an HTTP client for calling the APIs of the nodes (e.g. ETSI QKD 014 or management).
+        """
+        assert self._http_client is not None, "Topology is not started"
+        return self._http_client
+
+    def hub(self, name: str) -> Hub:
+        """
+        Get the hub with the given name.
+        """
+        return self._hubs[name]
+
+    def client(self, name: str) -> Client:
+        """
+        Get the client with the given name.
+        """
+        return self._clients[name]
+
+    def kme_node(self, sae_id: str) -> Node:
+        """
+        Get the client node (KME) that an encryptor (SAE) is attached to.
+        """
+        return self._kme_nodes[sae_id]
+
+    async def start(self, ready_timeout: float = DEFAULT_READY_TIMEOUT) -> None:
+        """
+        Start all nodes, and wait until all clients are ready (registered with all hubs, and filled
+        with the initial PSRD). Raises TimeoutError if that takes more than `ready_timeout` seconds.
+        """
+        EVENT_LOOP_MONITOR.start()
+        BLOCK_REAPER.start()
+        hub_urls = [node.base_url for node in self._nodes if node.type == NodeType.HUB]
+        for node in self._nodes:
+            match node.type:
+                case NodeType.HUB:
+                    hub = Hub(
+                        node.name,
+                        create_share_store("memory"),
+                        psrd_reserve.PSRDReserve(psrd_reserve.DEFAULT_BLOCK_SIZES),
+                        self._authentication_modes,
+                    )
+                    self._hubs[node.name] = hub
+                    self._transport.add_node(node, create_hub_app(hub))
+                    hub.start()
+                case NodeType.CLIENT:
+                    client = Client(
+                        node.name,
+                        node.encryptor_names,
+                        hub_urls,
+                        authentication_modes=self._authentication_modes,
+                        ready_psrd_bytes=self._ready_psrd_bytes,
+                        transport=self._transport,
+                    )
+                    self._clients[node.name] = client
+                    self._transport.add_node(node, create_client_app(client))
+                    for sae_id in node.encryptor_names:
+                        self._kme_nodes[sae_id] = node
+        self._http_client = httpx.AsyncClient(transport=self._transport)
+        for client in self._clients.values():
+            client.start_all_peer_hubs()
+        try:
+            await asyncio.wait_for(self._wait_until_ready(), ready_timeout)
+        except TimeoutError:
+            await self.stop()
+            raise
+
+    async def _wait_until_ready(self) -> None:
+        while not all(client.is_ready for client in self._clients.values()):
+            await asyncio.sleep(0.01)
+
+    async def stop(self) -> None:
+        """
+        Stop all nodes.
+        """
+        for client in self._clients.values():
+            client.stop_all_peer_hubs()
+        for hub in self._hubs.values():
+            hub.stop()
+            hub.close()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+        BLOCK_REAPER.stop()
+        EVENT_LOOP_MONITOR.stop()
+
+    async def get_key_pair(
+        self, master_sae_id: str, slave_sae_id: str, size: int | None = None
+    ) -> tuple[dict, dict]:
+        """
+        Get a key for the master SAE (ETSI QKD 014 Get Key), and then the same key for the slave SAE
+        (Get Key with Key IDs). Returns both keys (a dict with the key ID and the key value).
+        Raises httpx.HTTPStatusError if either call fails.
+        """
+        master_kme_node = self.kme_node(master_sae_id)
+        slave_kme_node = self.kme_node(slave_sae_id)
+        params = {} if size is None else {"size": size}
+        response = await self.http_client.get(
+            f"{master_kme_node.base_url}/etsi/api/v1/keys/{slave_sae_id}/enc_keys",
+            params=params,
+            headers={"Authorization": master_sae_id},
+        )
+        response.raise_for_status()
+        master_key = response.json()["keys"]
+        response = await self.http_client.get(
+            f"{slave_kme_node.base_url}/etsi/api/v1/keys/{master_sae_id}/dec_keys",
+            params={"key_ID": master_key["key_ID"]},
+            headers={"Authorization": slave_sae_id},
+        )
+        response.raise_for_status()
+        slave_key = response.json()["keys"][0]
+        return (master_key, slave_key)
@@ -5,6 +5,8 @@ Main entry point for the topology package.
 """
 
 import argparse
+import asyncio
+import itertools
 import json
 import os
 import subprocess
@@ -12,9 +14,31 @@ import sys
 import time
 import typing
 import httpx
+from benchmarks.etsi_load import EncryptorPair, LoadGenerator
 from common import configuration
 from common.node import Node, NodeType
 
+_WAIT_TIMEOUT = 75.0
+"""
+How many seconds to wait for all nodes to be ready or stopped before giving up.
+"""
+
+_MIN_PROBE_DELAY = 0.05
+"""
+The delay in seconds before probing the nodes again, the first time that a node does not meet the
+condition that we are waiting for. The delay doubles after each probe, up to _MAX_PROBE_DELAY.
+"""
+
+_MAX_PROBE_DELAY = 0.5
+"""
+The maximum delay in seconds between probes of the nodes.
+"""
+
+_WAIT_REPORT_INTERVAL = 3.0
+"""
+While waiting, report the nodes that we are still waiting for every this many seconds.
+"""
+
 
 class Manager:
     """
@@ -43,6 +67,8 @@ class Manager:
                 self.status_topology()
             case "etsi-qkd":
                 self.etsi_qkd()
+            case "bench":
+                self.bench()
 
     @staticmethod
     def error(message: str):
@@ -77,10 +103,15 @@ class Manager:
             "stop",
             help="Stop all hubs and clients",
         )
-        _status_parser = subparsers.add_parser(
+        status_parser = subparsers.add_parser(
             "status",
             help="Report status for all hubs and clients",
         )
+        status_parser.add_argument(
+            "--summary",
+            help="Only report a summary (aggregate counts instead of all blocks and shares)",
+            action="store_true",
+        )
         etsi_qkd_parser = subparsers.add_parser(
             "etsi-qkd",
             help="ETSI QKD operations",
@@ -110,7 +141,52 @@ class Manager:
         etsi_get_key_pair_parser.add_argument(
             "--size", help="Key size in bits", type=int
         )
+        bench_parser = subparsers.add_parser(
+            "bench",
+            help="Measure the key throughput and latency of a running topology",
+        )
+        bench_parser.add_argument(
+            "--duration",
+            help="Duration of the measurement in seconds (default: 10)",
+            type=float,
+            default=10.0,
+        )
+        bench_parser.add_argument(
+            "--concurrency",
+            help="Number of key pairs in flight; the maximum number with --rate (default: 8)",
+            type=int,
+            default=8,
+        )
+        bench_parser.add_argument(
+            "--rate",
+            help="Start key pairs at this rate per second, instead of keeping --concurrency key "
+            "pairs in flight",
+            type=float,
+        )
+        bench_parser.add_argument("--size", help="Key size in bits", type=int)
+        bench_parser.add_argument(
+            "--timeout",
+            help="Timeout for each ETSI call in seconds (default: 10)",
+            type=float,
+            default=10.0,
+        )
+        bench_parser.add_argument(
+            "--pair",
+            help="Only use this master and slave encryptor pair (default: all pairs of encryptors "
+            "of different clients)",
+            nargs=2,
+            metavar=("MASTER_SAE_ID", "SLAVE_SAE_ID"),
+            action="append",
+        )
+        bench_parser.add_argument(
+            "--output", help="Write the results as JSON to this file"
+        )
         self._args = parser.parse_args()
+        if self._args.command == "bench":
+            if self._args.concurrency < 1:
+                parser.error("--concurrency must be at least 1")
+            if self._args.rate is not None and self._args.rate <= 0:
+                parser.error("--rate must be positive")
 
     def parse_configuration(self):
         """
@@ -170,7 +246,7 @@ class Manager:
                 self.start_node(node)
             else:
                 self.start_node(node, client_extra_args)
-        self.wait_for_selected_nodes_started()
+        self.wait_for_selected_nodes_ready()
 
     def start_node(self, node: Node, extra_args: list | None = None):
         """
@@ -198,20 +274,40 @@ class Manager:
         """
         Stop all nodes.
         """
-        # Stop the clients first, in case we implement unregistration at some point
-        for node in self.selected_nodes(reverse_order=True):
-            self.stop_node(node)
+        asyncio.run(self.stop_nodes())
         self.wait_for_selected_nodes_stopped()
 
-    def stop_node(self, node: Node):
+    async def stop_nodes(self):
+        """
+        Stop the selected nodes, all clients at the same time and then all hubs at the same time.
+        """
+        # Stop the clients first, in case we implement unregistration at some point
+        nodes = self.selected_nodes(reverse_order=True)
+        for node_type in [NodeType.CLIENT, NodeType.HUB]:
+            nodes_of_type = [node for node in nodes if node.type == node_type]
+            failures = await asyncio.gather(
+                *[self.stop_node(node) for node in nodes_of_type]
+            )
+            for node, failure in zip(nodes_of_type, failures):
+                print(f"Stopping {node.type} {node.name} on port {node.port}")
+                if failure is not None:
+                    print(failure)
+
+    @staticmethod
+    async def stop_node(node: Node) -> str | None:
         """
-        Stop a node.
+        Stop a node. Returns a failure message, or None if the stop was initiated.
         """
-        print(f"Stopping {node.type} {node.name} on port {node.port}")
         url = f"{node.base_url}/mgmt/v1/stop"
-        self.http_request(
-            "POST", url, f"stop {node.type} {node.name}", quiet_success=True
-        )
+        action = f"stop {node.type} {node.name}"
+        try:
+            async with httpx.AsyncClient(timeout=1.0) as http_client:
+                response = await http_client.post(url)
+        except httpx.HTTPError as exc:
+            return f"Failed to {action}: POST {url} raised exception {exc}"
+        if response.status_code != 200:
+            return f"Failed to {action}: POST {url} returned status code {response.status_code}"
+        return None
 
     def selected_nodes_description(self):
         """
@@ -233,53 +329,81 @@ class Manager:
         return description
 
     def wait_for_selected_nodes_condition(
-        self, condition_func: typing.Callable[[Node], bool], condition_description: str
-    ):
+        self,
+        condition_func: typing.Callable[[Node], typing.Awaitable[bool]],
+        condition_description: str,
+    ) -> bool:
         """
         Wait for some condition to be true for all nodes (or give up if it takes too long)
         """
         which_nodes = self.selected_nodes_description()
         print(f"Waiting for {which_nodes} to be {condition_description}")
-        max_attempts = 25
-        seconds_between_attempts = 3.0
-        total_time = max_attempts * seconds_between_attempts
-        assert total_time > 60
-        first_check = True
-        for _ in range(max_attempts):
-            selected_nodes_meet_condition = True
-            for node in self.selected_nodes():
-                if not condition_func(node):
-                    selected_nodes_meet_condition = False
-                    if not first_check:
-                        print(
-                            f"Still waiting for {node.type} {node.name} "
-                            f"to be {condition_description}"
-                        )
-            if selected_nodes_meet_condition:
-                return True
-            time.sleep(seconds_between_attempts)
-            first_check = False
+        if asyncio.run(
+            self.wait_for_nodes_condition(
+                self.selected_nodes(), condition_func, condition_description
+            )
+        ):
+            return True
         print(
             f"Giving up on waiting for {which_nodes} to be {condition_description} "
-            f"after waiting for {total_time} seconds"
+            f"after waiting for {_WAIT_TIMEOUT} seconds"
         )
         return False
 
-    def wait_for_selected_nodes_started(self):
-        """
-        Wait for all nodes to be started (or fail if it takes too long)
+    @staticmethod
+    async def wait_for_nodes_condition(
+        nodes: list[Node],
+        condition_func: typing.Callable[[Node], typing.Awaitable[bool]],
+        condition_description: str,
+    ) -> bool:
+        """
+        Probe the condition for all nodes at the same time, with an increasing delay between
+        probes, until it is true for all nodes. Returns False if it is not true for all nodes
+        within _WAIT_TIMEOUT seconds.
+        """
+        start_time = time.monotonic()
+        next_report_time = start_time + _WAIT_REPORT_INTERVAL
+        delay = _MIN_PROBE_DELAY
+        waiting_nodes = nodes
+        while True:
+            results = await asyncio.gather(
+                *[condition_func(node) for node in waiting_nodes]
+            )
+            waiting_nodes = [
+                node for node, result in zip(waiting_nodes, results) if not result
+            ]
+            if not waiting_nodes:
+                return True
+            now = time.monotonic()
+            if now - start_time >= _WAIT_TIMEOUT:
+                return False
+            if now >= next_report_time:
+                for node in waiting_nodes:
+                    print(
+                        f"Still waiting for {node.type} {node.name} "
+                        f"to be {condition_description}"
+                    )
+                next_report_time = now + _WAIT_REPORT_INTERVAL
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, _MAX_PROBE_DELAY)
+
+    def wait_for_selected_nodes_ready(self):
+        """
+        Wait for all nodes to be started and ready (or fail if it takes too long)
         """
         return self.wait_for_selected_nodes_condition(
-            lambda node: node.is_started(), "started"
+            lambda node: node.is_ready(), "ready"
         )
 
     def wait_for_selected_nodes_stopped(self):
         """
         Wait for all nodes to be stopped (or fail if it takes too long)
         """
-        return self.wait_for_selected_nodes_condition(
-            lambda node: node.is_stopped(), "stopped"
-        )
+
+        async def is_stopped(node: Node) -> bool:
+            return node.is_stopped()
+
+        return self.wait_for_selected_nodes_condition(is_stopped, "stopped")
 
     def status_topology(self):
         """
@@ -293,8 +417,12 @@ class Manager:
         Report status for a node.
         """
         print(f"Status for {node.type} {node.name} on port {node.port}")
-        url = f"{node.base_url}/mgmt/v1/status"
-        self.http_request("GET", url, "Management get status")
+        if self._args.summary:
+            url = f"{node.base_url}/mgmt/v1/summary"
+            self.http_request("GET", url, "Management get summary")
+        else:
+            url = f"{node.base_url}/mgmt/v1/status"
+            self.http_request("GET", url, "Management get status")
 
     def etsi_qkd(self):
         """
@@ -470,6 +598,68 @@ class Manager:
         else:
             print("Key values do not match")
 
+    def bench(self):
+        """
+        Drive ETSI QKD key pairs against the clients of a running topology, and report the key
+        throughput, latency, errors, and PSRD consumption.
+        """
+        client_nodes = [
+            node for node in self.selected_nodes() if node.type == NodeType.CLIENT
+        ]
+        if self._args.pair is None:
+            pairs = [
+                EncryptorPair(master_sae_id, slave_sae_id, master_node, slave_node)
+                for master_node, slave_node in itertools.permutations(client_nodes, 2)
+                for master_sae_id in master_node.encryptor_names
+                for slave_sae_id in slave_node.encryptor_names
+            ]
+        else:
+            pairs = [
+                EncryptorPair(
+                    master_sae_id,
+                    slave_sae_id,
+                    self.find_kme_node_for_sae_id(master_sae_id),
+                    self.find_kme_node_for_sae_id(slave_sae_id),
+                )
+                for master_sae_id, slave_sae_id in self._args.pair
+            ]
+        if not pairs:
+            self.fatal_error("There are no encryptor pairs to benchmark")
+        mode = (
+            f"at {self._args.rate} key pairs/s (at most {self._args.concurrency} in flight)"
+            if self._args.rate is not None
+            else f"with {self._args.concurrency} key pairs in flight"
+        )
+        print(
+            f"Benchmarking {len(pairs)} encryptor pairs for {self._args.duration} seconds {mode}"
+        )
+        load_generator = LoadGenerator(
+            pairs, client_nodes, self._args.size, self._args.timeout
+        )
+        results = asyncio.run(
+            load_generator.run(
+                self._args.duration, self._args.concurrency, self._args.rate
+            )
+        )
+        print(f"Keys: {results['nr_keys']} ({results['keys_per_second']:.1f} keys/s)")
+        for name, latency in results["latency_ms"].items():
+            if latency["p50"] is None:
+                continue
+            print(
+                f"Latency {name} (ms): p50 {latency['p50']:.1f} p99 {latency['p99']:.1f} "
+                f"p999 {latency['p999']:.1f} max {latency['max']:.1f}"
+            )
+        print(f"Errors: {results['nr_errors']}")
+        for description, count in results["errors"].items():
+            print(f"  {description}: {count}")
+        if results["psrd_bytes_per_key"] is not None:
+            print(f"PSRD consumed per key: {results['psrd_bytes_per_key']:.1f} bytes")
+        if self._args.output is not None:
+            with open(self._args.output, "w", encoding="utf-8") as file:
+                json.dump(results, file, indent=2)
+                file.write("\n")
+            print(f"Results written to {self._args.output}")
+
     def http_request(
         self,
         method: str,
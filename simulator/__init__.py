@@ -0,0 +1,3 @@
+"""
+A discrete-event simulator for capacity planning of DSKE topologies.
+"""
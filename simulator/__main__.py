@@ -0,0 +1,190 @@
+"""
+Simulate a DSKE topology for capacity planning: replay a key request workload on a simulated
+topology, and report the PSRD consumption, the PSRD refill traffic, the out-of-PSRD events, and the
+key latency distributions.
+
+Usage: python -m simulator [topology.yaml | --hubs 5 --clients 100] [--keys 100000 --rate 1000 |
+                           --workload FILE] [options]
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import random
+from common import configuration
+from common.authenticator import AUTHENTICATION_MODES
+from common.crypto_executor import CRYPTO_EXECUTOR, CryptoExecutor
+from common.logging import LOGGER
+from common.node import Node, NodeType
+from .network import HubOutage, Network
+from .simulation import Parameters, Simulation
+from .workload import DEFAULT_KEY_SIZE, poisson_workload, replay_workload
+
+
+def parse_command_line_arguments():
+    """
+    Parse command line arguments.
+    """
+    defaults = Parameters()
+    parser = argparse.ArgumentParser(description="DSKE capacity planning simulator")
+    parser.add_argument(
+        "configfile",
+        nargs="?",
+        default=configuration.DEFAULT_CONFIGURATION_FILE,
+        help="Configuration filename (ignored if --hubs and --clients are given)",
+    )
+    parser.add_argument("--hubs", type=int, help="Generate a topology with N hubs")
+    parser.add_argument(
+        "--clients",
+        type=int,
+        help="Generate a topology with N clients (with one encryptor each)",
+    )
+    parser.add_argument(
+        "--workload", help="Replay the key requests in FILE (JSON lines)"
+    )
+    parser.add_argument(
+        "--keys", type=int, default=10_000, help="Number of generated key requests"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=100.0,
+        help="Generated key requests per second (all encryptor pairs together)",
+    )
+    parser.add_argument(
+        "--size",
+        type=int,
+        default=DEFAULT_KEY_SIZE,
+        help="Key size in bits (of the generated key requests)",
+    )
+    parser.add_argument(
+        "--slave-delay",
+        type=float,
+        default=0.0,
+        help="Seconds between getting a key and getting it with its key ID",
+    )
+    parser.add_argument(
+        "--min-nr-shares",
+        type=int,
+        default=defaults.min_nr_shares,
+        help="Minimum number of shares to reconstruct a key",
+    )
+    parser.add_argument(
+        "--block-size",
+        type=int,
+        default=defaults.block_size,
+        help="Size of the PSRD blocks that clients request from hubs",
+    )
+    parser.add_argument(
+        "--start-threshold",
+        type=int,
+        default=defaults.start_request_psrd_threshold,
+        help="Start requesting PSRD when a pool has fewer unused bytes",
+    )
+    parser.add_argument(
+        "--stop-threshold",
+        type=int,
+        default=defaults.stop_request_psrd_threshold,
+        help="Stop requesting PSRD when a pool has this many unused bytes",
+    )
+    parser.add_argument(
+        "--initial-psrd",
+        type=int,
+        default=defaults.initial_psrd_bytes,
+        help="Unused bytes in each pool at the start",
+    )
+    parser.add_argument(
+        "--authentication-mode",
+        choices=AUTHENTICATION_MODES,
+        default=defaults.authentication_mode,
+        help="Message authentication mode",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.001,
+        help="One-way network latency in seconds",
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="Mean of the exponential network jitter in seconds",
+    )
+    parser.add_argument(
+        "--loss", type=float, default=0.0, help="Probability that a message is lost"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=defaults.request_timeout,
+        help="Request timeout in seconds",
+    )
+    parser.add_argument(
+        "--hub-outage",
+        type=HubOutage.from_str,
+        action="append",
+        default=[],
+        metavar="NAME:START:END",
+        help="Hub NAME is down from START until END seconds (can be repeated)",
+    )
+    parser.add_argument("--seed", type=int, help="Random seed")
+    return parser.parse_args()
+
+
+def topology_nodes(args) -> list[Node]:
+    """
+    Get the nodes of the topology: generated, or from the configuration file.
+    """
+    if args.hubs is None and args.clients is None:
+        return configuration.parse_configuration_file(args.configfile).nodes
+    nodes = [Node(NodeType.HUB, f"hub-{index}", []) for index in range(args.hubs or 0)]
+    nodes += [
+        Node(NodeType.CLIENT, f"client-{index}", [f"sae-{index}"])
+        for index in range(args.clients or 0)
+    ]
+    return nodes
+
+
+def main():
+    """
+    Main entry point for the simulator.
+    """
+    args = parse_command_line_arguments()
+    # Allocation failures are counted in the report; don't log each of them.
+    LOGGER.setLevel(logging.CRITICAL)
+    CRYPTO_EXECUTOR.configure(CryptoExecutor.Mode.INLINE)
+    rng = random.Random(args.seed)
+    nodes = topology_nodes(args)
+    parameters = Parameters(
+        min_nr_shares=args.min_nr_shares,
+        block_size=args.block_size,
+        start_request_psrd_threshold=args.start_threshold,
+        stop_request_psrd_threshold=args.stop_threshold,
+        initial_psrd_bytes=args.initial_psrd,
+        authentication_mode=args.authentication_mode,
+        request_timeout=args.timeout,
+    )
+    network = Network(args.latency, args.jitter, args.loss, args.hub_outage, rng)
+    if args.workload is not None:
+        workload = replay_workload(args.workload)
+    else:
+        client_nodes = [node for node in nodes if node.type == NodeType.CLIENT]
+        sae_pairs = [
+            (master_sae_id, slave_sae_id)
+            for master_node, slave_node in itertools.permutations(client_nodes, 2)
+            for master_sae_id in master_node.encryptor_names
+            for slave_sae_id in slave_node.encryptor_names
+        ]
+        if not sae_pairs:
+            raise SystemExit("The topology has no encryptor pairs on different clients")
+        workload = poisson_workload(
+            sae_pairs, args.rate, args.keys, args.size, args.slave_delay, rng
+        )
+    simulation = Simulation(nodes, parameters, network)
+    print(json.dumps(simulation.run(workload), indent=2))
+
+
+if __name__ == "__main__":
+    main()
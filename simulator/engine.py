@@ -0,0 +1,74 @@
+"""
+The event queue of the simulator: a simulated clock, and the callbacks that are scheduled to run at
+a simulated time.
+"""
+
+import heapq
+import itertools
+from typing import Any, Callable
+
+
+class EventQueue:
+    """
+    Runs scheduled callbacks in the order of their simulated time (and, for the same time, in the
+    order in which they were scheduled). The simulated clock jumps from one event to the next, so
+    simulated time passes as fast as the callbacks run.
+    """
+
+    _now: float
+    _events: list[tuple[float, int, Callable, tuple]]  # A heap
+    _sequence_numbers: itertools.count
+    _nr_processed_events: int
+
+    def __init__(self):
+        self._now = 0.0
+        self._events = []
+        self._sequence_numbers = itertools.count()
+        self._nr_processed_events = 0
+
+    @property
+    def now(self) -> float:
+        """
+        Get the current simulated time, in seconds.
+        """
+        return self._now
+
+    @property
+    def nr_pending_events(self) -> int:
+        """
+        Get the number of events that are scheduled but have not run yet.
+        """
+        return len(self._events)
+
+    @property
+    def nr_processed_events(self) -> int:
+        """
+        Get the number of events that have run so far.
+        """
+        return self._nr_processed_events
+
+    def schedule(self, delay: float, callback: Callable, *args: Any) -> None:
+        """
+        Run `callback(*args)` after `delay` simulated seconds.
+        """
+        assert delay >= 0.0
+        heapq.heappush(
+            self._events,
+            (self._now + delay, next(self._sequence_numbers), callback, args),
+        )
+
+    def schedule_at(self, time: float, callback: Callable, *args: Any) -> None:
+        """
+        Run `callback(*args)` at simulated time `time` (or now, if that time has passed).
+        """
+        self.schedule(max(0.0, time - self._now), callback, *args)
+
+    def run(self) -> None:
+        """
+        Run events until no events are left.
+        """
+        events = self._events
+        while events:
+            (self._now, _sequence_number, callback, args) = heapq.heappop(events)
+            self._nr_processed_events += 1
+            callback(*args)
@@ -0,0 +1,86 @@
+"""
+The network model of the simulator: the latency and loss of the messages between clients and hubs,
+and the outages of hubs.
+"""
+
+import dataclasses
+import random
+
+
+@dataclasses.dataclass
+class HubOutage:
+    """
+    A hub is down (does not accept connections) from simulated time `start` until `end`.
+    """
+
+    hub_name: str
+    start: float
+    end: float
+
+    @classmethod
+    def from_str(cls, outage_str: str) -> "HubOutage":
+        """
+        Parse a hub outage from a string NAME:START:END (times in seconds).
+        """
+        try:
+            (hub_name, start, end) = outage_str.split(":")
+            outage = HubOutage(hub_name, float(start), float(end))
+        except ValueError as exc:
+            raise ValueError(f"Invalid hub outage {outage_str!r}") from exc
+        if outage.end < outage.start:
+            raise ValueError(f"Hub outage {outage_str!r} ends before it starts")
+        return outage
+
+
+class Network:
+    """
+    The one-way delay of a message is the latency plus an exponentially distributed jitter (with
+    the given mean). Each message is lost with the given probability. A request to a hub that is
+    down fails after one round trip (the connection is refused).
+    """
+
+    _latency: float
+    _jitter: float
+    _loss: float
+    _outages: dict[str, list[HubOutage]]  # Indexed by hub name
+    _random: random.Random
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        loss: float = 0.0,
+        outages: list[HubOutage] | None = None,
+        rng: random.Random | None = None,
+    ):
+        assert latency >= 0.0 and jitter >= 0.0 and 0.0 <= loss < 1.0
+        self._latency = latency
+        self._jitter = jitter
+        self._loss = loss
+        self._outages = {}
+        for outage in outages or []:
+            self._outages.setdefault(outage.hub_name, []).append(outage)
+        self._random = rng if rng is not None else random.Random()
+
+    def delay(self) -> float:
+        """
+        Get the one-way delay of a message, in seconds.
+        """
+        if self._jitter == 0.0:
+            return self._latency
+        return self._latency + self._random.expovariate(1.0 / self._jitter)
+
+    def is_lost(self) -> bool:
+        """
+        Decide whether a message is lost.
+        """
+        return self._loss > 0.0 and self._random.random() < self._loss
+
+    def is_hub_down(self, hub_name: str, time: float) -> bool:
+        """
+        Check whether a hub is down at the given simulated time.
+        """
+        return any(
+            outage.start <= time < outage.end
+            for outage in self._outages.get(hub_name, ())
+        )
@@ -0,0 +1,610 @@
+"""
+A simulated DSKE topology, for capacity planning.
+
+The simulation uses the real PSRD classes (`Pool`, `Block`, `Allocation`, `EncryptionKey`, and the
+`Authenticator` for the signing keys) and the real key classes (`UserKey`, `Share`, and Shamir
+secret sharing), but it replaces the event loop by a simulated clock (see engine.py) and HTTP by a
+network model (see network.py). The requests between the clients and the hubs follow the protocol of
+the real nodes: each key is split into one share per hub and scattered to all hubs by the client of
+the master encryptor, and gathered from all hubs by the client of the slave encryptor. The PSRD
+pools are refilled as by PeerHub: when a pool drops below the start threshold, the client requests
+blocks from the hub until the pool reaches the stop threshold.
+
+Each client and hub share one pair of pools, which stands for both copies of the PSRD (in the client
+and in the hub): the signatures and the share encryption keys of the hub are allocated from the
+client's peer pool, by an authenticator with the pools swapped. Processing times are not simulated
+(only network delays), the PSRD reserves of the hubs are unlimited, and a hub outage makes the hub
+unreachable without losing its state.
+"""
+
+import dataclasses
+import time
+from typing import Any, Callable, Iterable, Iterator
+from uuid import UUID, uuid4
+from benchmarks.etsi_load import percentiles
+from client import peer_hub
+from common.authenticator import AUTHENTICATION_MODES, Authenticator
+from common.block import Block
+from common.block_reaper import BLOCK_REAPER, DEFAULT_REAP_INTERVAL
+from common.encryption_key import EncryptionKey
+from common.exceptions import OutOfPreSharedRandomDataError
+from common.node import Node, NodeType
+from common.pool import MESSAGE_SIGNING_KEY, SHARE_ENCRYPTION_KEY, Pool
+from common.psrd_generator import PSRD_GENERATOR
+from common.shamir import reconstruct_binary_secret_from_shares
+from common.share import Share
+from common.user_key import UserKey
+from .engine import EventQueue
+from .network import Network
+from .workload import KeyRequest
+
+DEFAULT_MIN_NR_SHARES = 3
+"""
+By default, a key is reconstructed from at least this many shares (as in the client).
+"""
+
+DEFAULT_REQUEST_TIMEOUT = 5.0
+"""
+By default, a request to a hub fails if there is no response after this many seconds (the timeout
+of the HTTP client of the peer hubs).
+"""
+
+DEFAULT_REQUEST_PSRD_RETRY_DELAY = 1.0
+"""
+By default, if a request for a PSRD block fails, retry after this many seconds (as in PeerHub).
+"""
+
+
+@dataclasses.dataclass
+class Parameters:
+    """
+    The parameters of the DSKE protocol that the simulation is meant to size. The defaults are the
+    values that the real nodes use.
+    """
+
+    min_nr_shares: int = DEFAULT_MIN_NR_SHARES
+    block_size: int = peer_hub.GET_PSRD_BLOCK_SIZE
+    start_request_psrd_threshold: int = peer_hub.START_REQUEST_PSRD_THRESHOLD
+    stop_request_psrd_threshold: int = peer_hub.STOP_REQUEST_PSRD_THRESHOLD
+    initial_psrd_bytes: int = peer_hub.DEFAULT_READY_PSRD_BYTES
+    authentication_mode: str = AUTHENTICATION_MODES[0]
+    request_timeout: float = DEFAULT_REQUEST_TIMEOUT
+    request_psrd_retry_delay: float = DEFAULT_REQUEST_PSRD_RETRY_DELAY
+
+
+def run_without_waiting(coroutine) -> Any:
+    """
+    Run a coroutine that never waits (such as a crypto executor operation that runs inline), without
+    an event loop.
+    """
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coroutine.close()
+    raise RuntimeError("Coroutine waited (configure the crypto executor as inline)")
+
+
+class _Statistics:
+    """
+    The outcomes, latencies, and PSRD traffic of a simulation.
+    """
+
+    outcomes: dict[str, int]  # Indexed by outcome
+    enc_latencies: list[float]
+    dec_latencies: list[float]
+    pair_latencies: list[float]
+    nr_allocation_failures: int
+    nr_request_psrd: int
+    nr_failed_request_psrd: int
+    refill_bytes: dict[str, int]  # Indexed by hub name
+
+    def __init__(self):
+        self.outcomes = {}
+        self.enc_latencies = []
+        self.dec_latencies = []
+        self.pair_latencies = []
+        self.nr_allocation_failures = 0
+        self.nr_request_psrd = 0
+        self.nr_failed_request_psrd = 0
+        self.refill_bytes = {}
+
+    def count(self, outcome: str) -> None:
+        """
+        Count the outcome of a key request.
+        """
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+
+class _SimulatedHub:
+    """
+    A hub: it stores the shares that clients post, until they are gathered.
+    """
+
+    name: str
+    shares: dict[UUID, Share]  # Indexed by user key ID
+
+    def __init__(self, name: str):
+        self.name = name
+        self.shares = {}
+
+
+class _SimulatedPeerHub:
+    """
+    The pools that a client shares with a hub, and the request PSRD state of the client for the
+    hub (see PeerHub).
+    """
+
+    hub: _SimulatedHub
+    local_pool: Pool
+    peer_pool: Pool
+    client_authenticator: Authenticator  # Signs with keys from the local pool
+    hub_authenticator: Authenticator  # Signs with keys from the peer pool
+    _simulation: "Simulation"
+    _request_psrd_targets: dict[Pool.Owner, int]
+    _requesting_psrd: set[Pool.Owner]
+
+    def __init__(self, simulation: "Simulation", hub: _SimulatedHub):
+        parameters = simulation.parameters
+        self.hub = hub
+        self.local_pool = Pool(hub.name, Pool.Owner.LOCAL)
+        self.peer_pool = Pool(hub.name, Pool.Owner.PEER)
+        mode = parameters.authentication_mode
+        self.client_authenticator = Authenticator(mode, self.local_pool, self.peer_pool)
+        self.hub_authenticator = Authenticator(mode, self.peer_pool, self.local_pool)
+        self._simulation = simulation
+        self._request_psrd_targets = {}
+        self._requesting_psrd = set()
+        for pool in [self.local_pool, self.peer_pool]:
+            self._request_psrd_targets[pool.owner] = (
+                parameters.stop_request_psrd_threshold
+            )
+            while pool.nr_unused_bytes < parameters.initial_psrd_bytes:
+                pool.add_block(Block.new_with_random_data(parameters.block_size))
+
+    def has_psrd_for_request(self, share_size: int) -> bool:
+        """
+        Check whether the pools have enough unused PSRD for a request, and request PSRD if not (see
+        PeerHub.has_psrd_for_request).
+        """
+        local_purpose = SHARE_ENCRYPTION_KEY if share_size > 0 else MESSAGE_SIGNING_KEY
+        nr_local_bytes_needed = self.local_pool.nr_bytes_needed(
+            share_size + self.client_authenticator.nr_signing_bytes_needed(),
+            local_purpose,
+        )
+        nr_peer_bytes_needed = self.peer_pool.nr_bytes_needed(
+            self.client_authenticator.nr_verification_bytes_needed(),
+            MESSAGE_SIGNING_KEY,
+        )
+        if (
+            self.local_pool.nr_unused_bytes >= nr_local_bytes_needed
+            and self.peer_pool.nr_unused_bytes >= nr_peer_bytes_needed
+        ):
+            return True
+        self.start_request_psrd_if_needed(nr_local_bytes_needed, nr_peer_bytes_needed)
+        return False
+
+    def start_request_psrd_if_needed(
+        self, nr_local_bytes_needed: int = 0, nr_peer_bytes_needed: int = 0
+    ) -> None:
+        """
+        Start requesting PSRD for a pool if the number of unused bytes is below the start threshold,
+        or below the number of bytes that is needed for a request (see
+        PeerHub.start_request_psrd_task_if_needed).
+        """
+        for pool, nr_bytes_needed in [
+            (self.local_pool, nr_local_bytes_needed),
+            (self.peer_pool, nr_peer_bytes_needed),
+        ]:
+            self._request_psrd_targets[pool.owner] = max(
+                self._request_psrd_targets[pool.owner], nr_bytes_needed
+            )
+            if pool.owner in self._requesting_psrd:
+                continue
+            nr_unused_bytes = pool.nr_unused_bytes
+            if (
+                nr_unused_bytes
+                < self._simulation.parameters.start_request_psrd_threshold
+                or nr_unused_bytes < nr_bytes_needed
+            ):
+                self._requesting_psrd.add(pool.owner)
+                self._request_psrd(pool)
+
+    def _request_psrd(self, pool: Pool) -> None:
+        if pool.nr_unused_bytes >= self._request_psrd_targets[pool.owner]:
+            self._requesting_psrd.discard(pool.owner)
+            self._request_psrd_targets[pool.owner] = (
+                self._simulation.parameters.stop_request_psrd_threshold
+            )
+            return
+        self._simulation.exchange(
+            self.hub, lambda: True, lambda result: self._psrd_received(pool, result)
+        )
+
+    def _psrd_received(self, pool: Pool, result: bool | None) -> None:
+        simulation = self._simulation
+        statistics = simulation.statistics
+        statistics.nr_request_psrd += 1
+        if result is None:
+            statistics.nr_failed_request_psrd += 1
+            simulation.events.schedule(
+                simulation.parameters.request_psrd_retry_delay,
+                self._request_psrd,
+                pool,
+            )
+            return
+        block_size = simulation.parameters.block_size
+        pool.add_block(Block.new_with_random_data(block_size))
+        statistics.refill_bytes[self.hub.name] = (
+            statistics.refill_bytes.get(self.hub.name, 0) + block_size
+        )
+        self._request_psrd(pool)
+
+
+class _SimulatedClient:
+    """
+    A client, and its peer hubs (one for every hub of the topology).
+    """
+
+    name: str
+    peer_hubs: list[_SimulatedPeerHub]
+
+    def __init__(self, name: str, peer_hubs: list[_SimulatedPeerHub]):
+        self.name = name
+        self.peer_hubs = peer_hubs
+
+    def nr_peer_hubs_with_psrd(self, share_size: int) -> int:
+        """
+        Get the number of peer hubs that have enough PSRD for a request (see
+        Client.check_enough_peer_hubs_with_psrd).
+        """
+        return sum(
+            1
+            for peer_hub_ in self.peer_hubs
+            if peer_hub_.has_psrd_for_request(share_size)
+        )
+
+
+class _Gather:
+    """
+    Collects the results of the requests to all peer hubs of a client, and calls `on_done` with
+    the successful results once all requests are done (like asyncio.gather).
+    """
+
+    __slots__ = ["_nr_pending", "_results", "_on_done"]
+
+    def __init__(self, nr_requests: int, on_done: Callable[[list], None]):
+        self._nr_pending = nr_requests
+        self._results = []
+        self._on_done = on_done
+
+    def request_done(self, result: Any | None) -> None:
+        """
+        Record the result of one request (None if it failed).
+        """
+        if result is not None:
+            self._results.append(result)
+        self._nr_pending -= 1
+        if self._nr_pending == 0:
+            self._on_done(self._results)
+
+
+class Simulation:
+    """
+    A simulated DSKE topology: all clients are connected to all hubs.
+    """
+
+    parameters: Parameters
+    events: EventQueue
+    statistics: _Statistics
+    _network: Network
+    _hubs: list[_SimulatedHub]
+    _clients: list[_SimulatedClient]
+    _clients_by_sae_id: dict[str, _SimulatedClient]
+    _workload: Iterator[KeyRequest] | None
+
+    def __init__(
+        self,
+        nodes: list[Node],
+        parameters: Parameters | None = None,
+        network: Network | None = None,
+    ):
+        self.parameters = parameters if parameters is not None else Parameters()
+        self.events = EventQueue()
+        self.statistics = _Statistics()
+        self._network = network if network is not None else Network()
+        self._hubs = [
+            _SimulatedHub(node.name) for node in nodes if node.type == NodeType.HUB
+        ]
+        self._clients = []
+        self._clients_by_sae_id = {}
+        for node in nodes:
+            if node.type != NodeType.CLIENT:
+                continue
+            client = _SimulatedClient(
+                node.name, [_SimulatedPeerHub(self, hub) for hub in self._hubs]
+            )
+            self._clients.append(client)
+            for sae_id in node.encryptor_names:
+                self._clients_by_sae_id[sae_id] = client
+        self._workload = None
+
+    def exchange(
+        self,
+        hub: _SimulatedHub,
+        handle_request: Callable[[], Any | None],
+        on_done: Callable[[Any | None], None],
+    ) -> None:
+        """
+        Send a request to a hub. When the request arrives, `handle_request` runs at the hub and
+        returns the result (None if the hub responds with an error). When the response arrives,
+        `on_done` is called with the result; it is called with None if the request fails (the hub
+        is down, or the request or the response is lost or late, and the request times out).
+        """
+        if self._network.is_lost():
+            self.events.schedule(self.parameters.request_timeout, on_done, None)
+            return
+        self.events.schedule(
+            self._network.delay(),
+            self._request_arrived,
+            self.events.now,
+            hub,
+            handle_request,
+            on_done,
+        )
+
+    def _request_arrived(
+        self,
+        start_time: float,
+        hub: _SimulatedHub,
+        handle_request: Callable[[], Any | None],
+        on_done: Callable[[Any | None], None],
+    ) -> None:
+        timeout_time = start_time + self.parameters.request_timeout
+        now = self.events.now
+        if self._network.is_hub_down(hub.name, now):
+            # The connection is refused.
+            response_time = now + self._network.delay()
+            self.events.schedule_at(min(response_time, timeout_time), on_done, None)
+            return
+        result = handle_request()
+        response_time = now + self._network.delay()
+        if self._network.is_lost() or response_time > timeout_time:
+            self.events.schedule_at(timeout_time, on_done, None)
+            return
+        self.events.schedule_at(response_time, on_done, result)
+
+    def _allocation_failed(self, peer_hub_: _SimulatedPeerHub) -> None:
+        self.statistics.nr_allocation_failures += 1
+        peer_hub_.start_request_psrd_if_needed()
+
+    def _start_next_key_request(self) -> None:
+        request = next(self._workload, None)
+        if request is not None:
+            self.events.schedule_at(request.time, self._get_key, request)
+
+    def _get_key(self, request: KeyRequest) -> None:
+        """
+        The master encryptor gets a key (see Client.etsi_get_key).
+        """
+        self._start_next_key_request()
+        client = self._clients_by_sae_id[request.master_sae_id]
+        size_in_bytes = request.size // 8
+        if client.nr_peer_hubs_with_psrd(size_in_bytes) < self.parameters.min_nr_shares:
+            self.statistics.count("enc_no_psrd")
+            return
+        key = UserKey(uuid4(), bytes(PSRD_GENERATOR.generate(size_in_bytes)))
+        shares = run_without_waiting(
+            key.split_into_shares(
+                request.master_sae_id,
+                request.slave_sae_id,
+                len(client.peer_hubs),
+                self.parameters.min_nr_shares,
+            )
+        )
+        gather = _Gather(
+            len(shares),
+            lambda results: self._key_scattered(request, key, client, results),
+        )
+        for peer_hub_, share in zip(client.peer_hubs, shares):
+            self._post_share(peer_hub_, share, gather)
+
+    def _post_share(
+        self, peer_hub_: _SimulatedPeerHub, share: Share, gather: _Gather
+    ) -> None:
+        """
+        Post a key share to a hub (see PeerHub.post_share).
+        """
+        try:
+            EncryptionKey.from_pool(peer_hub_.local_pool, share.size)
+            peer_hub_.client_authenticator.signing_key()
+        except OutOfPreSharedRandomDataError:
+            self._allocation_failed(peer_hub_)
+            gather.request_done(None)
+            return
+
+        def handle_request() -> bool | None:
+            peer_hub_.hub.shares[share.user_key_id] = share
+            try:
+                peer_hub_.hub_authenticator.signing_key()
+            except OutOfPreSharedRandomDataError:
+                self._allocation_failed(peer_hub_)
+                return None
+            return True
+
+        def on_done(result: bool | None) -> None:
+            peer_hub_.start_request_psrd_if_needed()
+            gather.request_done(result)
+
+        self.exchange(peer_hub_.hub, handle_request, on_done)
+
+    def _key_scattered(
+        self,
+        request: KeyRequest,
+        key: UserKey,
+        client: _SimulatedClient,
+        results: list[bool],
+    ) -> None:
+        if len(results) < self.parameters.min_nr_shares:
+            self.statistics.count("enc_scatter_failed")
+            self._delete_shares(key.key_id, client)
+            return
+        self.statistics.enc_latencies.append(self.events.now - request.time)
+        self.events.schedule(
+            request.slave_delay, self._get_key_with_key_id, request, key, client
+        )
+
+    def _get_key_with_key_id(
+        self, request: KeyRequest, key: UserKey, master_client: _SimulatedClient
+    ) -> None:
+        """
+        The slave encryptor gets the key with its key ID (see Client.etsi_get_key_with_key_ids).
+        """
+        client = self._clients_by_sae_id[request.slave_sae_id]
+        if client.nr_peer_hubs_with_psrd(0) < self.parameters.min_nr_shares:
+            self.statistics.count("dec_no_psrd")
+            self._delete_shares(key.key_id, master_client)
+            return
+        start_time = self.events.now
+        gather = _Gather(
+            len(client.peer_hubs),
+            lambda shares: self._key_gathered(
+                request, key, master_client, start_time, shares
+            ),
+        )
+        for peer_hub_ in client.peer_hubs:
+            self._get_share(peer_hub_, key.key_id, gather)
+
+    def _get_share(
+        self, peer_hub_: _SimulatedPeerHub, key_id: UUID, gather: _Gather
+    ) -> None:
+        """
+        Get a key share from a hub (see PeerHub.get_share).
+        """
+        try:
+            peer_hub_.client_authenticator.signing_key()
+        except OutOfPreSharedRandomDataError:
+            self._allocation_failed(peer_hub_)
+            gather.request_done(None)
+            return
+
+        def handle_request() -> Share | None:
+            share = peer_hub_.hub.shares.get(key_id)
+            if share is None:
+                return None
+            try:
+                EncryptionKey.from_pool(peer_hub_.peer_pool, share.size)
+                peer_hub_.hub_authenticator.signing_key()
+            except OutOfPreSharedRandomDataError:
+                self._allocation_failed(peer_hub_)
+                return None
+            return share
+
+        def on_done(result: Share | None) -> None:
+            peer_hub_.start_request_psrd_if_needed()
+            gather.request_done(result)
+
+        self.exchange(peer_hub_.hub, handle_request, on_done)
+
+    def _key_gathered(
+        self,
+        request: KeyRequest,
+        key: UserKey,
+        master_client: _SimulatedClient,
+        start_time: float,
+        shares: list[Share],
+    ) -> None:
+        self._delete_shares(key.key_id, master_client)
+        if len(shares) < self.parameters.min_nr_shares:
+            self.statistics.count("dec_gather_failed")
+            return
+        try:
+            value = reconstruct_binary_secret_from_shares(
+                self.parameters.min_nr_shares,
+                [(share.share_index, share.value) for share in shares],
+            )
+        except ValueError:
+            self.statistics.count("dec_reconstruct_failed")
+            return
+        if value != key.value:
+            self.statistics.count("key_mismatch")
+            return
+        self.statistics.count("delivered")
+        now = self.events.now
+        self.statistics.dec_latencies.append(now - start_time)
+        self.statistics.pair_latencies.append(now - request.time)
+
+    @staticmethod
+    def _delete_shares(key_id: UUID, master_client: _SimulatedClient) -> None:
+        for peer_hub_ in master_client.peer_hubs:
+            peer_hub_.hub.shares.pop(key_id, None)
+
+    def _reap_blocks(self) -> None:
+        BLOCK_REAPER.reap()
+        if self.events.nr_pending_events > 0:
+            self.events.schedule(DEFAULT_REAP_INTERVAL, self._reap_blocks)
+
+    def run(self, workload: Iterable[KeyRequest]) -> dict:
+        """
+        Run the key requests of the workload (ordered by time) until all of them are done, and
+        return the report.
+        """
+        start_time = time.perf_counter()
+        self._workload = iter(workload)
+        self._start_next_key_request()
+        self.events.schedule(DEFAULT_REAP_INTERVAL, self._reap_blocks)
+        self.events.run()
+        return self.report(time.perf_counter() - start_time)
+
+    def report(self, wall_time: float) -> dict:
+        """
+        Get the report: the outcomes of the key requests, the key latencies, the PSRD consumption,
+        and the PSRD refill traffic.
+        """
+        statistics = self.statistics
+        nr_requests = sum(statistics.outcomes.values())
+        nr_delivered = statistics.outcomes.get("delivered", 0)
+        nr_consumed_bytes = 0
+        nr_authentication_bytes = 0
+        for client in self._clients:
+            for peer_hub_ in client.peer_hubs:
+                nr_consumed_bytes += peer_hub_.local_pool.nr_consumed_bytes
+                nr_consumed_bytes += peer_hub_.peer_pool.nr_consumed_bytes
+                for authenticator in [
+                    peer_hub_.client_authenticator,
+                    peer_hub_.hub_authenticator,
+                ]:
+                    nr_authentication_bytes += authenticator.to_mgmt()["nr_psrd_bytes"]
+        nr_refill_bytes = sum(statistics.refill_bytes.values())
+
+        def per_key(value: int) -> float | None:
+            return value / nr_delivered if nr_delivered else None
+
+        return {
+            "parameters": dataclasses.asdict(self.parameters),
+            "nr_hubs": len(self._hubs),
+            "nr_clients": len(self._clients),
+            "simulated_time": self.events.now,
+            "wall_time": wall_time,
+            "nr_events": self.events.nr_processed_events,
+            "nr_key_requests": nr_requests,
+            "outcomes": dict(sorted(statistics.outcomes.items())),
+            "latency_ms": {
+                "enc_keys": percentiles(statistics.enc_latencies),
+                "dec_keys": percentiles(statistics.dec_latencies),
+                "pair": percentiles(statistics.pair_latencies),
+            },
+            "psrd": {
+                "nr_consumed_bytes": nr_consumed_bytes,
+                "nr_authentication_bytes": nr_authentication_bytes,
+                "consumed_bytes_per_key": per_key(nr_consumed_bytes),
+                "nr_allocation_failures": statistics.nr_allocation_failures,
+            },
+            "refill": {
+                "nr_requests": statistics.nr_request_psrd,
+                "nr_failed_requests": statistics.nr_failed_request_psrd,
+                "nr_bytes": nr_refill_bytes,
+                "bytes_per_key": per_key(nr_refill_bytes),
+                "nr_bytes_per_hub": dict(sorted(statistics.refill_bytes.items())),
+            },
+        }
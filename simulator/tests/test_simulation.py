@@ -0,0 +1,147 @@
+"""
+Unit tests for the simulator.
+"""
+
+import json
+import random
+import pytest
+from common.node import Node, NodeType
+from simulator.engine import EventQueue
+from simulator.network import HubOutage, Network
+from simulator.simulation import Parameters, Simulation
+from simulator.workload import KeyRequest, poisson_workload, replay_workload
+
+
+def topology_nodes(nr_hubs: int = 5, nr_clients: int = 3) -> list[Node]:
+    """
+    Get the nodes of a topology with one encryptor per client.
+    """
+    nodes = [Node(NodeType.HUB, f"hub-{index}", []) for index in range(nr_hubs)]
+    nodes += [
+        Node(NodeType.CLIENT, f"client-{index}", [f"sae-{index}"])
+        for index in range(nr_clients)
+    ]
+    return nodes
+
+
+def workload(nr_keys: int, rate: float = 100.0) -> list[KeyRequest]:
+    """
+    Get a reproducible workload between the encryptors of the first two clients.
+    """
+    pairs = [("sae-0", "sae-1"), ("sae-1", "sae-0")]
+    return list(poisson_workload(pairs, rate, nr_keys, rng=random.Random(1)))
+
+
+def test_event_queue_order():
+    """
+    Events run in the order of their time, and in the order in which they were scheduled for the
+    same time.
+    """
+    events = EventQueue()
+    log = []
+    events.schedule(2.0, log.append, "c")
+    events.schedule(1.0, log.append, "a")
+    events.schedule(1.0, log.append, "b")
+    events.schedule(1.5, lambda: events.schedule(0.0, log.append, "nested"))
+    events.run()
+    assert log == ["a", "b", "nested", "c"]
+    assert events.now == 2.0
+    assert events.nr_processed_events == 5
+
+
+def test_all_keys_delivered():
+    """
+    Without loss or outages, all keys are delivered, and the consumed PSRD is refilled.
+    """
+    network = Network(latency=0.01, rng=random.Random(1))
+    simulation = Simulation(topology_nodes(), network=network)
+    report = simulation.run(workload(200))
+    assert report["outcomes"] == {"delivered": 200}
+    # Two round trips for the master, and two for the slave.
+    assert report["latency_ms"]["pair"]["max"] == pytest.approx(40.0)
+    assert report["psrd"]["nr_allocation_failures"] == 0
+    assert report["psrd"]["consumed_bytes_per_key"] > 0
+    assert report["refill"]["nr_bytes"] > 0
+    assert set(report["refill"]["nr_bytes_per_hub"]) == {
+        f"hub-{index}" for index in range(5)
+    }
+
+
+def test_hub_outages():
+    """
+    Keys are delivered as long as the minimum number of hubs is up.
+    """
+    outages = [HubOutage(f"hub-{index}", 0.0, 1000.0) for index in range(2)]
+    simulation = Simulation(topology_nodes(), network=Network(outages=outages))
+    report = simulation.run(workload(50))
+    assert report["outcomes"] == {"delivered": 50}
+    assert "hub-0" not in report["refill"]["nr_bytes_per_hub"]
+    outages.append(HubOutage("hub-2", 0.0, 1000.0))
+    simulation = Simulation(topology_nodes(), network=Network(outages=outages))
+    report = simulation.run(workload(50))
+    assert report["outcomes"] == {"enc_scatter_failed": 50}
+
+
+def test_out_of_psrd():
+    """
+    If the PSRD is consumed faster than it is refilled, key requests are rejected.
+    """
+    parameters = Parameters(block_size=200, initial_psrd_bytes=400)
+    network = Network(latency=0.5)
+    simulation = Simulation(topology_nodes(), parameters, network)
+    report = simulation.run(workload(200, rate=1000.0))
+    assert report["outcomes"]["enc_no_psrd"] > 0
+    assert report["outcomes"]["delivered"] > 0
+
+
+def test_message_loss():
+    """
+    Lost messages make requests time out, but keys are still delivered if enough shares get
+    through. The pools are large enough to never need a refill.
+    """
+    parameters = Parameters(
+        start_request_psrd_threshold=10_000,
+        stop_request_psrd_threshold=20_000,
+        initial_psrd_bytes=20_000,
+        request_timeout=1.0,
+    )
+    network = Network(latency=0.01, loss=0.05, rng=random.Random(1))
+    simulation = Simulation(topology_nodes(), parameters, network)
+    report = simulation.run(workload(200))
+    assert report["outcomes"]["delivered"] > 180
+    assert report["latency_ms"]["enc_keys"]["max"] == pytest.approx(1000.0)
+    assert report["refill"]["nr_requests"] == 0
+
+
+def test_hub_outage_from_str():
+    """
+    Parse hub outages.
+    """
+    assert HubOutage.from_str("hank:1.5:3") == HubOutage("hank", 1.5, 3.0)
+    with pytest.raises(ValueError):
+        HubOutage.from_str("hank:3")
+    with pytest.raises(ValueError):
+        HubOutage.from_str("hank:3:1")
+
+
+def test_replay_workload(tmp_path):
+    """
+    Replay a workload from a file.
+    """
+    file_name = tmp_path / "workload.jsonl"
+    requests = [
+        {"time": 0.5, "master_sae_id": "sae-0", "slave_sae_id": "sae-1"},
+        {"time": 1.0, "master_sae_id": "sae-1", "slave_sae_id": "sae-2", "size": 256},
+    ]
+    file_name.write_text("\n".join(json.dumps(request) for request in requests))
+    assert list(replay_workload(file_name)) == [
+        KeyRequest(0.5, "sae-0", "sae-1"),
+        KeyRequest(1.0, "sae-1", "sae-2", 256),
+    ]
+    report = Simulation(topology_nodes()).run(replay_workload(file_name))
+    assert report["outcomes"] == {"delivered": 2}
+    file_name.write_text(
+        "\n".join(json.dumps(request) for request in reversed(requests))
+    )
+    with pytest.raises(ValueError):
+        list(replay_workload(file_name))
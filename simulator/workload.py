@@ -0,0 +1,69 @@
+"""
+Key request workloads for the simulator: generated (Poisson arrivals) or replayed from a file.
+"""
+
+import dataclasses
+import json
+import random
+from typing import Iterator
+
+DEFAULT_KEY_SIZE = 128
+"""
+The default key size in bits (the default of the ETSI QKD 014 Get Key API of a client).
+"""
+
+
+@dataclasses.dataclass
+class KeyRequest:
+    """
+    A key request of an encryptor pair: at simulated time `time`, the master encryptor gets a key
+    of `size` bits (ETSI Get Key), and once it has the key, the slave encryptor gets the same key
+    (ETSI Get Key with Key IDs) after a further `slave_delay` seconds.
+    """
+
+    time: float
+    master_sae_id: str
+    slave_sae_id: str
+    size: int = DEFAULT_KEY_SIZE
+    slave_delay: float = 0.0
+
+
+def poisson_workload(
+    sae_pairs: list[tuple[str, str]],
+    rate: float,
+    nr_keys: int,
+    size: int = DEFAULT_KEY_SIZE,
+    slave_delay: float = 0.0,
+    rng: random.Random | None = None,
+) -> Iterator[KeyRequest]:
+    """
+    Generate `nr_keys` key requests that arrive at `rate` requests per second (a Poisson process),
+    each for an encryptor pair that is chosen at random.
+    """
+    assert sae_pairs and rate > 0.0
+    rng = rng if rng is not None else random.Random()
+    time = 0.0
+    for _ in range(nr_keys):
+        time += rng.expovariate(rate)
+        (master_sae_id, slave_sae_id) = rng.choice(sae_pairs)
+        yield KeyRequest(time, master_sae_id, slave_sae_id, size, slave_delay)
+
+
+def replay_workload(file_name: str) -> Iterator[KeyRequest]:
+    """
+    Read key requests from a file with one JSON object per line, with the fields of KeyRequest
+    (`size` and `slave_delay` are optional). The requests must be ordered by time.
+    """
+    with open(file_name, "r", encoding="utf-8") as file:
+        previous_time = 0.0
+        for line_nr, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                request = KeyRequest(**json.loads(line))
+            except (TypeError, ValueError) as exc:
+                raise ValueError(f"{file_name}:{line_nr}: invalid key request") from exc
+            if request.time < previous_time:
+                raise ValueError(f"{file_name}:{line_nr}: key requests out of order")
+            previous_time = request.time
+            yield request
@@ -23,7 +23,7 @@ def start_topology():
     for node in config.nodes:
         expected_line = rf"Starting {node.type} {node.name} on port {node.port}"
         assert next_output_matches(output, expected_line)
-    check_wait_for_all_nodes_started_output(output)
+    check_wait_for_all_nodes_ready_output(output)
     check_no_more_output(output)
 
 
@@ -147,15 +147,15 @@ def check_wait_for_all_nodes_stopped_output(output):
     assert not next_output_matches(output, r"Giving up on waiting for .* to be stopped")
 
 
-def check_wait_for_all_nodes_started_output(output):
+def check_wait_for_all_nodes_ready_output(output):
     """
-    Check the output of the manager for the part where it waits for all nodes to be started.
+    Check the output of the manager for the part where it waits for all nodes to be ready.
     """
-    assert next_output_matches(output, r"Waiting for all nodes to be started")
-    while next_output_matches(output, r"Still waiting for .* to be started"):
+    assert next_output_matches(output, r"Waiting for all nodes to be ready")
+    while next_output_matches(output, r"Still waiting for .* to be ready"):
         pass
     assert not next_output_matches(
-        output, r"Giving up on waiting for all nodes to be started"
+        output, r"Giving up on waiting for all nodes to be ready"
     )
 
 
@@ -306,6 +306,26 @@ def get_key_pair(
     check_output(output, 200, [r"Key values match"])
 
 
+def bench(output_file: str, extra_args: List[str] | None = None) -> dict:
+    """
+    Run the manager bench command for a short time, and return the results.
+    """
+    args = [
+        configuration.DEFAULT_CONFIGURATION_FILE,
+        "bench",
+        "--duration",
+        "2",
+        "--output",
+        output_file,
+    ]
+    if extra_args is not None:
+        args += extra_args
+    output = _run_manager(args)
+    assert some_output_matches(output, r"Keys: [0-9]+")
+    with open(output_file, encoding="utf-8") as file:
+        return json.load(file)
+
+
 def _run_manager(args):
     """
     Run the manager.
@@ -0,0 +1,42 @@
+"""
+System test for the manager bench command.
+"""
+
+import pytest
+from . import system_test_common
+
+
+@pytest.fixture(autouse=True)
+def setup_and_teardown():
+    """
+    Setup and teardown for each test.
+    """
+    system_test_common.start_topology()
+    yield
+    system_test_common.stop_topology()
+
+
+def test_bench_closed_loop(tmp_path):
+    """
+    Benchmark all encryptor pairs with a fixed number of key pairs in flight.
+    """
+    results = system_test_common.bench(str(tmp_path / "bench.json"))
+    assert results["config"]["mode"] == "closed-loop"
+    assert len(results["config"]["pairs"]) == 18
+    assert results["nr_keys"] > 0
+    assert results["nr_errors"] == 0
+    assert results["latency_ms"]["pair"]["p50"] > 0
+    assert results["psrd_bytes_per_key"] > 0
+
+
+def test_bench_open_loop(tmp_path):
+    """
+    Benchmark one encryptor pair at a fixed rate.
+    """
+    results = system_test_common.bench(
+        str(tmp_path / "bench.json"),
+        ["--rate", "5", "--pair", "sam", "sofia"],
+    )
+    assert results["config"]["mode"] == "open-loop"
+    assert results["config"]["pairs"] == ["sam->sofia"]
+    assert results["nr_keys"] > 0
@@ -5,7 +5,7 @@ System test for usage of PSRD.
 from time import sleep
 from typing import List
 import pytest
-from common.signing_key import SIGNING_KEY_SIZE
+from common.signing_key import HASH_KEY_SIZE, ONE_TIME_PAD_SIZE
 from client.peer_hub import START_REQUEST_PSRD_THRESHOLD
 from . import system_test_common
 
@@ -16,6 +16,10 @@ from . import system_test_common
 # START_REQUEST_PSRD_THRESHOLD = 500
 # STOP_REQUEST_PSRD_THRESHOLD = 2000
 # GET_PSRD_BLOCK_SIZE = 2000
+#
+# Messages are authenticated in Wegman-Carter mode (the preferred authentication mode): the first
+# message to a peer takes a hash key and a one-time pad from the pool, and every later message only
+# takes a one-time pad.
 
 
 _CLIENTS = ["carol", "celia", "cindy", "connie", "curtis"]
@@ -114,8 +118,8 @@ def test_psrd_usage_one_small_key():
     system_test_common.get_key_pair("sam", "sofia", size=key_size_in_bits)
 
     # Check PSRD consumption on master client carol
-    sign_size = SIGNING_KEY_SIZE
-    sign_and_encrypt_size = SIGNING_KEY_SIZE + key_size_in_bytes
+    sign_size = HASH_KEY_SIZE + ONE_TIME_PAD_SIZE
+    sign_and_encrypt_size = sign_size + key_size_in_bytes
     _check_client_psrd_consumption("carol", "*", "local", [sign_and_encrypt_size])
     _check_client_psrd_consumption("carol", "*", "peer", [sign_size])
 
@@ -150,10 +154,8 @@ def test_psrd_usage_two_small_keys():
     system_test_common.get_key_pair("serena", "sunny", size=key_2_size_in_bits)
 
     # Check PSRD consumption on master client Carol
-    sign_size = 2 * SIGNING_KEY_SIZE
-    sign_and_encrypt_size = (
-        2 * SIGNING_KEY_SIZE + key_1_size_in_bytes + key_2_size_in_bytes
-    )
+    sign_size = HASH_KEY_SIZE + 2 * ONE_TIME_PAD_SIZE
+    sign_and_encrypt_size = sign_size + key_1_size_in_bytes + key_2_size_in_bytes
     _check_client_psrd_consumption("celia", "*", "local", [sign_and_encrypt_size])
     _check_client_psrd_consumption("celia", "*", "peer", [sign_size])
 
@@ -191,8 +193,8 @@ def test_psrd_usage_refresh():
     sleep(1.0)
 
     # Check PSRD consumption on master client Carol
-    sign_size = SIGNING_KEY_SIZE
-    sign_and_encrypt_size = SIGNING_KEY_SIZE + key_size_in_bytes
+    sign_size = HASH_KEY_SIZE + ONE_TIME_PAD_SIZE
+    sign_and_encrypt_size = sign_size + key_size_in_bytes
     assert sign_size < START_REQUEST_PSRD_THRESHOLD
     assert sign_and_encrypt_size > START_REQUEST_PSRD_THRESHOLD
     _check_client_psrd_consumption("curtis", "*", "local", [sign_and_encrypt_size, 0])